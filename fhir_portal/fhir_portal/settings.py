@@ -1,6 +1,9 @@
+import json
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'dummy-secret-key-for-fhir-portal'
 DEBUG = True
@@ -55,6 +58,8 @@ else:
         }
     }
 
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -65,4 +70,203 @@ STATIC_URL = 'static/'
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
     'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['services.authentication.TokenAuthentication'],
+}
+
+# HL7 batch ingestion: batches larger than the inline limit are parsed in a
+# process pool in the background, ``HL7_BATCH_CHUNK_SIZE`` messages per task.
+HL7_BATCH_WORKERS = int(os.environ.get('HL7_BATCH_WORKERS', os.cpu_count() or 1))
+HL7_BATCH_CHUNK_SIZE = int(os.environ.get('HL7_BATCH_CHUNK_SIZE', 500))
+HL7_BATCH_INLINE_LIMIT = int(os.environ.get('HL7_BATCH_INLINE_LIMIT', 100))
+
+# Patient and bulk data exports are written under EXPORT_ROOT and kept for
+# EXPORT_TTL_HOURS. When EXPORT_SENDFILE_HEADER is set (e.g. X-Accel-Redirect)
+# downloads are handed to the front-end server under EXPORT_SENDFILE_PREFIX.
+EXPORT_ROOT = Path(os.environ.get('EXPORT_ROOT', BASE_DIR / 'exports'))
+EXPORT_TTL_HOURS = int(os.environ.get('EXPORT_TTL_HOURS', 24))
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+EXPORT_SENDFILE_HEADER = os.environ.get('EXPORT_SENDFILE_HEADER', '')
+EXPORT_SENDFILE_PREFIX = os.environ.get('EXPORT_SENDFILE_PREFIX', '/protected-exports/')
+
+# FHIR read cache: serialized resources keyed by (type, id, versionId) are
+# kept in an in-process LRU of FHIR_READ_CACHE_SIZE entries in front of the
+# ``fhir`` cache. Point FHIR_CACHE_URL at Redis (or FHIR_CACHE_DIR at a
+# directory) to share it between worker processes.
+FHIR_READ_CACHE_ALIAS = 'fhir'
+FHIR_READ_CACHE_SIZE = int(os.environ.get('FHIR_READ_CACHE_SIZE', 10000))
+FHIR_READ_CACHE_TTL = int(os.environ.get('FHIR_READ_CACHE_TTL', 3600))
+
+if os.environ.get('FHIR_CACHE_URL'):
+    _FHIR_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['FHIR_CACHE_URL'],
+    }
+elif os.environ.get('FHIR_CACHE_DIR'):
+    _FHIR_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['FHIR_CACHE_DIR'],
+    }
+else:
+    _FHIR_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fhir-read-cache',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    FHIR_READ_CACHE_ALIAS: {**_FHIR_CACHE, 'TIMEOUT': FHIR_READ_CACHE_TTL},
+}
+
+# Whether every worker process sees the same ``fhir`` cache. If not, the
+# current version of a resource is read from the database on each request and
+# only serialized versions are cached, so no process serves a stale body.
+FHIR_READ_CACHE_SHARED = os.environ.get(
+    'FHIR_READ_CACHE_SHARED', str(bool(os.environ.get('FHIR_CACHE_URL') or os.environ.get('FHIR_CACHE_DIR')))
+).lower() in ('1', 'true', 'yes')
+
+# /fhir/R4/metadata is built once per process; clients may reuse it for this
+# many seconds before revalidating with its ETag.
+FHIR_METADATA_MAX_AGE = int(os.environ.get('FHIR_METADATA_MAX_AGE', 86400))
+
+# Observation trends read raw samples (downsampled in Python) only when the
+# requested range holds at most this many; otherwise hourly rollups are used.
+OBSERVATION_TREND_RAW_LIMIT = int(os.environ.get('OBSERVATION_TREND_RAW_LIMIT', 50000))
+
+# Observation alert rules are cached in memory; each process checks the
+# database for rule changes made elsewhere at most this often.
+OBSERVATION_ALERT_RELOAD_SECONDS = float(os.environ.get('OBSERVATION_ALERT_RELOAD_SECONDS', 5))
+
+# Bulk vital-sign uploads (POST /api/v1/observations/bulk) are written this
+# many NDJSON lines per transaction.
+VITALS_INGEST_BATCH_SIZE = int(os.environ.get('VITALS_INGEST_BATCH_SIZE', 1000))
+
+# Appointment availability is computed in units of this many minutes (UTC
+# days). Per-practitioner day bitmaps are cached in the shared ``fhir`` cache
+# for up to AVAILABILITY_CACHE_TTL seconds; bookings evict them on commit.
+AVAILABILITY_SLOT_MINUTES = int(os.environ.get('AVAILABILITY_SLOT_MINUTES', 15))
+AVAILABILITY_CACHE_TTL = int(os.environ.get('AVAILABILITY_CACHE_TTL', 3600))
+AVAILABILITY_MAX_DAYS = int(os.environ.get('AVAILABILITY_MAX_DAYS', 31))
+AVAILABILITY_MAX_PRACTITIONERS = int(os.environ.get('AVAILABILITY_MAX_PRACTITIONERS', 500))
+
+# The waitlist index is held in memory; each process checks the database for
+# entries added elsewhere at most this often.
+WAITLIST_RELOAD_SECONDS = float(os.environ.get('WAITLIST_RELOAD_SECONDS', 5))
+
+# Bearer tokens (services.auth_tokens) are HS256 JWTs. Verified tokens are kept
+# in an in-process LRU; revoked token ids are held in a Bloom filter that is
+# reloaded from the database when any process revokes a token (checked at most
+# every AUTH_REVOCATION_RELOAD_SECONDS). SECRET_KEY is checked into the
+# repository, so it only stands in for AUTH_TOKEN_SECRET while DEBUG is on.
+AUTH_TOKEN_SECRET = os.environ.get('AUTH_TOKEN_SECRET') or (SECRET_KEY if DEBUG else '')
+if not AUTH_TOKEN_SECRET:
+    raise ImproperlyConfigured('Set AUTH_TOKEN_SECRET to sign bearer tokens when DEBUG is off.')
+AUTH_ACCESS_TOKEN_TTL = int(os.environ.get('AUTH_ACCESS_TOKEN_TTL', 3600))
+AUTH_REFRESH_TOKEN_TTL = int(os.environ.get('AUTH_REFRESH_TOKEN_TTL', 14 * 86400))
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 50000))
+AUTH_REVOCATION_BLOOM_BITS = int(os.environ.get('AUTH_REVOCATION_BLOOM_BITS', 1 << 20))
+AUTH_REVOCATION_BLOOM_HASHES = int(os.environ.get('AUTH_REVOCATION_BLOOM_HASHES', 7))
+AUTH_REVOCATION_RELOAD_SECONDS = float(os.environ.get('AUTH_REVOCATION_RELOAD_SECONDS', 5))
+
+# Authentication events are queued in process and written by a background
+# thread in batches of AUTH_EVENT_BATCH_SIZE, or AUTH_EVENT_FLUSH_SECONDS after
+# the first queued event. Events beyond AUTH_EVENT_QUEUE_SIZE are dropped.
+AUTH_EVENT_BUFFERED = os.environ.get('AUTH_EVENT_BUFFERED', 'true').lower() in ('1', 'true', 'yes')
+AUTH_EVENT_QUEUE_SIZE = int(os.environ.get('AUTH_EVENT_QUEUE_SIZE', 10000))
+AUTH_EVENT_BATCH_SIZE = int(os.environ.get('AUTH_EVENT_BATCH_SIZE', 500))
+AUTH_EVENT_FLUSH_SECONDS = float(os.environ.get('AUTH_EVENT_FLUSH_SECONDS', 1))
+
+# Role catalogue for services.rbac: role -> permissions (``<action>:<section>``,
+# ``<action>:*`` or ``*``). RBAC_ROLES_JSON replaces it with a JSON object.
+# Effective permission masks are cached for RBAC_CACHE_SIZE users; processes
+# check the database for assignment changes at most every RBAC_RELOAD_SECONDS.
+# Set RBAC_ENFORCE to require a granting role on every API view that does not
+# choose its own permission classes.
+RBAC_ROLES = json.loads(os.environ['RBAC_ROLES_JSON']) if os.environ.get('RBAC_ROLES_JSON') else {
+    'admin': ['*'],
+    'department_head': ['read:*', 'write:roles', 'write:audit'],
+    'doctor': [
+        'read:*',
+        'write:patients',
+        'write:observations',
+        'write:appointments',
+        'write:telemedicine',
+        'write:notifications',
+    ],
+    'nurse': [
+        'read:patients',
+        'read:observations',
+        'write:observations',
+        'read:appointments',
+        'write:appointments',
+        'read:telemedicine',
+        'read:notifications',
+    ],
 }
+RBAC_CACHE_SIZE = int(os.environ.get('RBAC_CACHE_SIZE', 100000))
+RBAC_RELOAD_SECONDS = float(os.environ.get('RBAC_RELOAD_SECONDS', 5))
+if os.environ.get('RBAC_ENFORCE', '').lower() in ('1', 'true', 'yes'):
+    REST_FRAMEWORK['DEFAULT_PERMISSION_CLASSES'] = ['services.rbac.RolePermission']
+
+# ABAC policies for services.abac, tried in order; the first that applies
+# decides and anything else is denied. ABAC_POLICIES_JSON replaces them with a
+# JSON list. Decisions are cached for ABAC_CACHE_TTL seconds per distinct set
+# of the attributes the policies read. Every denial and an
+# ABAC_LOG_SAMPLE_RATE fraction of permits are written to AbacEvaluationRecord
+# in the background.
+ABAC_POLICIES = json.loads(os.environ['ABAC_POLICIES_JSON']) if os.environ.get('ABAC_POLICIES_JSON') else [
+    {
+        'id': 'emergency-access',
+        'effect': 'permit',
+        'description': 'Emergency access is permitted and reported',
+        'condition': {'attr': 'environment.emergency', 'op': 'eq', 'value': True},
+        'obligations': ['log_access', 'notify_privacy_officer'],
+    },
+    {
+        'id': 'other-facility',
+        'effect': 'deny',
+        'description': 'Records of another facility are not accessible',
+        'condition': {'attr': 'subject.facility', 'op': 'ne', 'ref': 'resource.attributes.facility'},
+    },
+    {
+        'id': 'department-clinicians',
+        'effect': 'permit',
+        'description': 'Clinicians may access records of their own department',
+        'actions': ['read', 'write'],
+        'condition': {
+            'all': [
+                {'attr': 'subject.roles', 'op': 'intersects', 'value': ['doctor', 'nurse']},
+                {'attr': 'subject.department', 'op': 'eq', 'ref': 'resource.attributes.department'},
+            ]
+        },
+        'obligations': ['log_access', 'session_timeout'],
+    },
+    {
+        'id': 'department-heads-office-hours',
+        'effect': 'permit',
+        'description': 'Department heads may read records of their facility during office hours',
+        'actions': ['read'],
+        'condition': {
+            'all': [
+                {'attr': 'subject.roles', 'op': 'contains', 'value': 'department_head'},
+                {'attr': 'environment.hour', 'op': 'between', 'value': [7, 19]},
+            ]
+        },
+        'obligations': ['log_access'],
+    },
+]
+ABAC_CACHE_SIZE = int(os.environ.get('ABAC_CACHE_SIZE', 100000))
+ABAC_CACHE_TTL = float(os.environ.get('ABAC_CACHE_TTL', 60))
+ABAC_LOG_SAMPLE_RATE = float(os.environ.get('ABAC_LOG_SAMPLE_RATE', 0.01))
+ABAC_LOG_BUFFERED = os.environ.get('ABAC_LOG_BUFFERED', 'true').lower() in ('1', 'true', 'yes')
+ABAC_LOG_QUEUE_SIZE = int(os.environ.get('ABAC_LOG_QUEUE_SIZE', 10000))
+ABAC_LOG_BATCH_SIZE = int(os.environ.get('ABAC_LOG_BATCH_SIZE', 500))
+ABAC_LOG_FLUSH_SECONDS = float(os.environ.get('ABAC_LOG_FLUSH_SECONDS', 1))
+
+# Role assignments: bulk requests (POST /api/v1/roles/assign/bulk) take at most
+# ROLE_ASSIGNMENT_BULK_LIMIT assignments, inserted ROLE_ASSIGNMENT_BATCH_SIZE
+# rows per statement. The expiry sweeper revokes expired assignments
+# ROLE_ASSIGNMENT_SWEEP_BATCH_SIZE rows per transaction.
+ROLE_ASSIGNMENT_BULK_LIMIT = int(os.environ.get('ROLE_ASSIGNMENT_BULK_LIMIT', 5000))
+ROLE_ASSIGNMENT_BATCH_SIZE = int(os.environ.get('ROLE_ASSIGNMENT_BATCH_SIZE', 500))
+ROLE_ASSIGNMENT_SWEEP_BATCH_SIZE = int(os.environ.get('ROLE_ASSIGNMENT_SWEEP_BATCH_SIZE', 1000))
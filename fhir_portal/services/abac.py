@@ -0,0 +1,299 @@
+"""Attribute-based access decisions for ``/roles/abac/evaluate``.
+
+Policies are defined in ``settings.ABAC_POLICIES``. Each one has an ``id``, an
+``effect`` (``permit`` or ``deny``), optional ``actions`` and
+``resourceTypes`` targets, optional ``obligations`` and a ``condition``::
+
+    {"all": [
+        {"attr": "subject.roles", "op": "intersects", "value": ["doctor", "nurse"]},
+        {"attr": "subject.department", "op": "eq", "ref": "resource.attributes.department"},
+    ]}
+
+Conditions nest with ``all``, ``any`` and ``not``. The leaves compare an
+attribute path with a literal ``value`` or another attribute (``ref``) using
+one of :data:`OPERATORS`. A missing attribute never satisfies an ordered
+comparison, ``in``/``not_in`` or a comparison with another attribute, so a
+request that leaves attributes out cannot match a policy by accident. Besides
+the request's own attributes, a condition can use ``environment.hour`` and
+``environment.weekday`` (UTC, taken from ``environment.time`` or the current
+time). Policies are tried in order, and the first one that applies decides.
+If none applies, the request is denied.
+
+When the policies are loaded, each one is compiled into closures over the
+positions of the attributes it reads. Evaluating a request then reads just
+those attributes into a tuple. That tuple, together with the action and
+resource type, is also the key of a decision cache. Two requests that agree on
+every attribute any policy looks at get the same decision from the cache for
+``settings.ABAC_CACHE_TTL`` seconds.
+
+Decisions are logged to :class:`~services.models.AbacEvaluationRecord` through
+a :class:`~services.buffered_writer.BufferedWriter`. Every denial is logged,
+and so is a ``settings.ABAC_LOG_SAMPLE_RATE`` fraction of permits.
+"""
+
+from __future__ import annotations
+
+import atexit
+import operator
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable
+
+from django.conf import settings
+from django.utils import timezone
+
+from .buffered_writer import BufferedWriter
+from .fhir_utils import instant
+from .models import AbacEvaluationRecord
+from .resource_cache import LRUCache
+
+PERMIT = "permit"
+DENY = "deny"
+
+Predicate = Callable[[tuple], bool]
+
+
+class PolicyError(ValueError):
+    """Raised for policies that cannot be compiled."""
+
+
+def _ordered(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    def check(left: Any, right: Any) -> bool:
+        if left is None or right is None:
+            return False
+        try:
+            return compare(left, right)
+        except TypeError:
+            return False
+
+    return check
+
+
+def _between(value: Any, bounds: Any) -> bool:
+    low, high = bounds
+    return low <= value < high
+
+
+def _as_tuple(value: Any) -> tuple:
+    return value if isinstance(value, tuple) else () if value is None else (value,)
+
+
+OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "in": _ordered(lambda value, options: value in options),
+    "not_in": _ordered(lambda value, options: value not in options),
+    "contains": lambda values, value: value in _as_tuple(values),
+    "intersects": lambda values, options: not set(_as_tuple(values)).isdisjoint(_as_tuple(options)),
+    "gt": _ordered(operator.gt),
+    "gte": _ordered(operator.ge),
+    "lt": _ordered(operator.lt),
+    "lte": _ordered(operator.le),
+    "between": _ordered(_between),
+    "exists": lambda value, expected: (value is not None) == bool(expected),
+}
+
+
+def freeze(value: Any) -> Any:
+    """Return a hashable copy of an attribute value; lists become tuples in a canonical order."""
+
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((freeze(item) for item in value), key=repr))
+    return value
+
+
+@dataclass(frozen=True)
+class Decision:
+    decision: str
+    policy_id: str
+    obligations: tuple[str, ...]
+    explanation: str
+
+
+@dataclass(frozen=True)
+class CompiledPolicy:
+    policy_id: str
+    actions: frozenset[str] | None
+    resource_types: frozenset[str] | None
+    condition: Predicate
+    decision: Decision
+
+    def targets(self, action: str, resource_type: str) -> bool:
+        return (self.actions is None or action in self.actions) and (
+            self.resource_types is None or resource_type in self.resource_types
+        )
+
+
+def _environment(environment: dict[str, Any], name: str) -> Any:
+    if name in ("hour", "weekday"):
+        moment: datetime = instant(environment.get("time")) or timezone.now()
+        moment = moment.astimezone(dt_timezone.utc)
+        return moment.hour if name == "hour" else moment.weekday()
+    return environment.get(name)
+
+
+def attribute(request: dict[str, Any], path: str) -> Any:
+    """Return the value at a dotted ``path`` of an evaluation request, or ``None``."""
+
+    head, _, rest = path.partition(".")
+    if head == "environment" and rest in ("hour", "weekday"):
+        return _environment(request.get("environment") or {}, rest)
+    value: Any = request
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class PolicySet:
+    """Policies compiled into closures over a shared attribute tuple."""
+
+    def __init__(self, policies: list[dict[str, Any]]) -> None:
+        self.source = policies
+        self.paths: list[str] = []
+        self._slots: dict[str, int] = {}
+        self.policies = [self._compile(policy) for policy in policies]
+        self._applicable: dict[tuple[str, str], list[CompiledPolicy]] = {}
+        self.cache = LRUCache(settings.ABAC_CACHE_SIZE)
+
+    def _slot(self, path: Any) -> int:
+        if not isinstance(path, str) or not path:
+            raise PolicyError(f"Attribute paths must be non-empty strings, not {path!r}")
+        if path not in self._slots:
+            self._slots[path] = len(self.paths)
+            self.paths.append(path)
+        return self._slots[path]
+
+    def _condition(self, node: Any) -> Predicate:
+        if node is None:
+            return lambda values: True
+        if not isinstance(node, dict):
+            raise PolicyError(f"Conditions must be objects, not {node!r}")
+        if "all" in node:
+            parts = [self._condition(part) for part in node["all"]]
+            return lambda values: all(part(values) for part in parts)
+        if "any" in node:
+            parts = [self._condition(part) for part in node["any"]]
+            return lambda values: any(part(values) for part in parts)
+        if "not" in node:
+            part = self._condition(node["not"])
+            return lambda values: not part(values)
+        compare = OPERATORS.get(node.get("op"))
+        if compare is None:
+            raise PolicyError(f"Unknown operator {node.get('op')!r}; expected one of {', '.join(OPERATORS)}")
+        left = self._slot(node.get("attr"))
+        if "ref" in node:
+            right = self._slot(node["ref"])
+            return lambda values: (
+                values[left] is not None and values[right] is not None and compare(values[left], values[right])
+            )
+        value = node.get("value")
+        value = tuple(value) if isinstance(value, list) else freeze(value)
+        return lambda values: compare(values[left], value)
+
+    def _compile(self, policy: dict[str, Any]) -> CompiledPolicy:
+        effect = policy.get("effect")
+        if effect not in (PERMIT, DENY):
+            raise PolicyError(f"Policy {policy.get('id')!r} must have effect permit or deny")
+        policy_id = str(policy.get("id") or "")
+        actions, resource_types = policy.get("actions"), policy.get("resourceTypes")
+        return CompiledPolicy(
+            policy_id=policy_id,
+            actions=frozenset(actions) if actions else None,
+            resource_types=frozenset(resource_types) if resource_types else None,
+            condition=self._condition(policy.get("condition")),
+            decision=Decision(
+                effect,
+                policy_id,
+                tuple(policy.get("obligations") or ()),
+                str(policy.get("description") or f"Matched policy {policy_id}"),
+            ),
+        )
+
+    def applicable(self, action: str, resource_type: str) -> list[CompiledPolicy]:
+        key = (action, resource_type)
+        policies = self._applicable.get(key)
+        if policies is None:
+            policies = [policy for policy in self.policies if policy.targets(action, resource_type)]
+            self._applicable[key] = policies
+        return policies
+
+    def decide(self, request: dict[str, Any]) -> tuple[Decision, bool]:
+        """Return the decision for ``request`` and whether it came from the cache."""
+
+        action = str(request.get("action") or "")
+        resource_type = str((request.get("resource") or {}).get("type") or "")
+        values = tuple(freeze(attribute(request, path)) for path in self.paths)
+        key = (action, resource_type, values)
+        cached = self.cache.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[1] > now:
+            return cached[0], True
+        decision = next(
+            (policy.decision for policy in self.applicable(action, resource_type) if policy.condition(values)),
+            NOT_APPLICABLE,
+        )
+        self.cache.set(key, (decision, now + settings.ABAC_CACHE_TTL))
+        return decision, False
+
+
+NOT_APPLICABLE = Decision(DENY, "", (), "No policy permits this request")
+
+_compiled: PolicySet | None = None
+_compile_lock = threading.Lock()
+
+
+def policies() -> PolicySet:
+    """Return the compiled ``settings.ABAC_POLICIES``, compiling them when they change."""
+
+    global _compiled
+    compiled = _compiled
+    if compiled is None or compiled.source is not settings.ABAC_POLICIES:
+        with _compile_lock:
+            if _compiled is None or _compiled.source is not settings.ABAC_POLICIES:
+                _compiled = PolicySet(settings.ABAC_POLICIES)
+            compiled = _compiled
+    return compiled
+
+
+writer = BufferedWriter(
+    AbacEvaluationRecord,
+    max_size=settings.ABAC_LOG_QUEUE_SIZE,
+    batch_size=settings.ABAC_LOG_BATCH_SIZE,
+    flush_seconds=settings.ABAC_LOG_FLUSH_SECONDS,
+)
+atexit.register(writer.stop, settings.ABAC_LOG_FLUSH_SECONDS * 2)
+
+
+def _log(request: dict[str, Any], decision: Decision, cached: bool) -> None:
+    if decision.decision != DENY and random.random() >= settings.ABAC_LOG_SAMPLE_RATE:
+        return
+    subject = request.get("subject") or {}
+    resource = request.get("resource") or {}
+    record = AbacEvaluationRecord(
+        user_id=str(subject.get("userId") or "")[:64],
+        resource_type=str(resource.get("type") or "")[:64],
+        resource_id=str(resource.get("id") or "")[:64],
+        action=str(request.get("action") or "")[:32],
+        decision=decision.decision,
+        context={"policy": decision.policy_id, "obligations": list(decision.obligations), "cached": cached},
+    )
+    if not settings.ABAC_LOG_BUFFERED:
+        record.save()
+        return
+    writer.start()
+    writer.submit(record)
+
+
+def evaluate(request: dict[str, Any]) -> Decision:
+    """Decide an evaluation request of ``{subject, resource, action, environment}``."""
+
+    decision, cached = policies().decide(request)
+    _log(request, decision, cached)
+    return decision
@@ -0,0 +1,349 @@
+"""Free appointment slots per practitioner and day.
+
+A day is divided into ``settings.AVAILABILITY_SLOT_MINUTES`` units (UTC), and
+a practitioner's availability on that day is one integer bitmap with a bit
+set for every free unit:
+
+* the weekly :class:`~services.models.PractitionerSchedule` windows set bits;
+* booked :class:`~services.models.AppointmentRecord` intervals clear them. They
+  are sorted and merged once per request, then each day finds its overlapping
+  intervals with a binary search.
+
+Bitmaps are cached in the shared ``settings.FHIR_READ_CACHE_ALIAS`` cache, so
+a page of 200 practitioners x 14 days is two ``get_many`` calls when warm,
+plus two queries for the practitioners that missed. Day keys embed a
+per-practitioner generation token. Booking writes delete the keys of the days
+they touch once their transaction commits, and schedule changes replace the
+token. A bitmap computed concurrently with a booking can still be cached
+after the delete; ``settings.AVAILABILITY_CACHE_TTL`` bounds how long, and
+booking checks conflicts against the database itself.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Any, Iterable
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import AppointmentRecord, PractitionerSchedule
+from .resource_cache import shared_cache
+
+PRACTITIONER_PREFIX = "Practitioner/"
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# Appointments in these states do not occupy their slot.
+RELEASED_STATUSES = ("cancelled", "noshow", "entered-in-error")
+
+
+class AvailabilityError(ValueError):
+    """Raised for availability requests or schedules that cannot be used."""
+
+
+@dataclass
+class Slot:
+    practitioner_id: str
+    start: datetime
+    end: datetime
+
+
+def practitioner_id(reference: str) -> str:
+    return reference[len(PRACTITIONER_PREFIX):] if reference.startswith(PRACTITIONER_PREFIX) else reference
+
+
+def _unit() -> timedelta:
+    return timedelta(minutes=settings.AVAILABILITY_SLOT_MINUTES)
+
+
+def _units_per_day() -> int:
+    return timedelta(days=1) // _unit()
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def _index(moment: datetime, day_start: datetime, *, round_up: bool) -> int:
+    units, remainder = divmod(moment - day_start, _unit())
+    return max(0, min(_units_per_day(), units + (1 if round_up and remainder else 0)))
+
+
+def _bits(first: int, last: int) -> int:
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def schedule_bits(windows: Iterable[tuple[time, time]]) -> int:
+    """Return the bitmap of the units that lie wholly inside the ``(start, end)`` windows of a day.
+
+    An end of ``00:00`` means midnight at the end of the day.
+    """
+
+    unit = settings.AVAILABILITY_SLOT_MINUTES
+    bitmap = 0
+    for start, end in windows:
+        first = -(-(start.hour * 60 + start.minute) // unit)
+        last = _units_per_day() if end == time.min else (end.hour * 60 + end.minute) // unit
+        bitmap |= _bits(first, last)
+    return bitmap
+
+
+def merge_intervals(intervals: Iterable[tuple[datetime, datetime]]) -> tuple[list[datetime], list[datetime]]:
+    """Sort and merge overlapping intervals; return their starts and ends as parallel lists."""
+
+    starts: list[datetime] = []
+    ends: list[datetime] = []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+def booked_bits(starts: list[datetime], ends: list[datetime], day: date) -> int:
+    """Return the bitmap of the units of ``day`` that overlap the merged intervals."""
+
+    day_start = _day_start(day)
+    day_end = day_start + timedelta(days=1)
+    bitmap = 0
+    # Merged intervals are disjoint, so their ends are sorted too.
+    position = bisect_right(ends, day_start)
+    while position < len(starts) and starts[position] < day_end:
+        first = _index(starts[position], day_start, round_up=False)
+        last = _index(ends[position], day_start, round_up=True)
+        bitmap |= _bits(first, last)
+        position += 1
+    return bitmap
+
+
+def slot_starts(bitmap: int, length: int) -> list[int]:
+    """Return the unit indexes at which ``length`` consecutive free units begin."""
+
+    candidates = bitmap
+    for shift in range(1, length):
+        candidates &= bitmap >> shift
+    indexes = []
+    while candidates:
+        lowest = candidates & -candidates
+        indexes.append(lowest.bit_length() - 1)
+        candidates ^= lowest
+    return indexes
+
+
+def _generation_key(practitioner: str) -> str:
+    return f"availability:{practitioner}:generation"
+
+
+def _day_key(practitioner: str, generation: str, day: date) -> str:
+    return f"availability:{practitioner}:{generation}:{day.isoformat()}"
+
+
+def _generations(practitioners: list[str]) -> dict[str, str]:
+    cache = shared_cache()
+    keys = {_generation_key(practitioner): practitioner for practitioner in practitioners}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+    for key in missing:
+        cache.add(key, uuid4().hex, timeout=None)
+    if missing:
+        found.update(cache.get_many(missing))
+    return {keys[key]: generation for key, generation in found.items()}
+
+
+def _compute(practitioners: list[str], days: list[date]) -> dict[tuple[str, date], int]:
+    windows: dict[tuple[str, int], list[tuple[time, time]]] = {}
+    rows = PractitionerSchedule.objects.filter(practitioner_id__in=practitioners).values_list(
+        "practitioner_id", "weekday", "start_time", "end_time"
+    )
+    for practitioner, weekday, start, end in rows:
+        windows.setdefault((practitioner, weekday), []).append((start, end))
+
+    intervals: dict[str, list[tuple[datetime, datetime]]] = {}
+    booked = (
+        AppointmentRecord.objects.filter(
+            practitioner_reference__in=[PRACTITIONER_PREFIX + practitioner for practitioner in practitioners],
+            start__lt=_day_start(days[-1]) + timedelta(days=1),
+            end__gt=_day_start(days[0]),
+        )
+        .exclude(status__in=RELEASED_STATUSES)
+        .values_list("practitioner_reference", "start", "end")
+    )
+    for reference, start, end in booked:
+        intervals.setdefault(practitioner_id(reference), []).append((start, end))
+
+    bitmaps = {}
+    for practitioner in practitioners:
+        weekly = {weekday: schedule_bits(windows.get((practitioner, weekday), ())) for weekday in range(7)}
+        starts, ends = merge_intervals(intervals.get(practitioner, ()))
+        for day in days:
+            bitmaps[(practitioner, day)] = weekly[day.weekday()] & ~booked_bits(starts, ends, day)
+    return bitmaps
+
+
+def day_bitmaps(practitioners: list[str], days: list[date]) -> dict[tuple[str, date], int]:
+    """Return the free-unit bitmap of every ``(practitioner, day)``, from the cache where possible."""
+
+    cache = shared_cache()
+    generations = _generations(practitioners)
+    keys = {
+        _day_key(practitioner, generations[practitioner], day): (practitioner, day)
+        for practitioner in practitioners
+        for day in days
+    }
+    cached = cache.get_many(list(keys))
+    bitmaps = {keys[key]: bitmap for key, bitmap in cached.items()}
+    missed = [
+        practitioner for practitioner in practitioners if any((practitioner, day) not in bitmaps for day in days)
+    ]
+    if missed:
+        computed = _compute(missed, days)
+        cache.set_many(
+            {
+                _day_key(practitioner, generations[practitioner], day): bitmap
+                for (practitioner, day), bitmap in computed.items()
+            },
+            timeout=settings.AVAILABILITY_CACHE_TTL,
+        )
+        bitmaps.update(computed)
+    return bitmaps
+
+
+def available_slots(
+    practitioners: list[str], start: date, *, days: int = 1, duration: int | None = None
+) -> list[Slot]:
+    """Return each practitioner's free slots of ``duration`` minutes over ``days`` days from ``start``."""
+
+    unit = settings.AVAILABILITY_SLOT_MINUTES
+    duration = duration or unit
+    if not practitioners:
+        raise AvailabilityError("practitioner is required")
+    if len(practitioners) > settings.AVAILABILITY_MAX_PRACTITIONERS:
+        limit = settings.AVAILABILITY_MAX_PRACTITIONERS
+        raise AvailabilityError(f"At most {limit} practitioners may be requested")
+    if not 1 <= days <= settings.AVAILABILITY_MAX_DAYS:
+        raise AvailabilityError(f"days must be between 1 and {settings.AVAILABILITY_MAX_DAYS}")
+    if duration <= 0 or duration % unit or duration > 24 * 60:
+        raise AvailabilityError(f"duration must be a positive multiple of {unit} minutes")
+
+    practitioners = list(dict.fromkeys(practitioner_id(practitioner) for practitioner in practitioners))
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    bitmaps = day_bitmaps(practitioners, dates)
+    step = _unit()
+    length = timedelta(minutes=duration)
+    slots = []
+    for practitioner in practitioners:
+        for day in dates:
+            day_start = _day_start(day)
+            for index in slot_starts(bitmaps[(practitioner, day)], duration // unit):
+                slot_start = day_start + index * step
+                slots.append(Slot(practitioner, slot_start, slot_start + length))
+    return slots
+
+
+def days_spanned(start: datetime | None, end: datetime | None) -> list[date]:
+    """Return the UTC days that the interval ``[start, end)`` overlaps."""
+
+    if start is None or end is None or end <= start:
+        return []
+    first = start.astimezone(dt_timezone.utc).date()
+    last = (end - timedelta(microseconds=1)).astimezone(dt_timezone.utc).date()
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def appointment_days(records: Iterable[Any]) -> set[tuple[str, date]]:
+    """Return the ``(practitioner, day)`` pairs occupied by appointment records."""
+
+    return {
+        (practitioner_id(record.practitioner_reference), day)
+        for record in records
+        if record.practitioner_reference
+        for day in days_spanned(record.start, record.end)
+    }
+
+
+def invalidate(days: Iterable[tuple[str, date]]) -> None:
+    """Drop the cached bitmaps of the given ``(practitioner, day)`` pairs."""
+
+    days = set(days)
+    if not days:
+        return
+    cache = shared_cache()
+    practitioners = {practitioner for practitioner, _ in days}
+    keys = {_generation_key(practitioner): practitioner for practitioner in practitioners}
+    generations = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    cache.delete_many(
+        [
+            _day_key(practitioner, generations[practitioner], day)
+            for practitioner, day in days
+            if practitioner in generations
+        ]
+    )
+
+
+def invalidate_on_commit(days: Iterable[tuple[str, date]]) -> None:
+    days = set(days)
+    if days:
+        transaction.on_commit(lambda: invalidate(days))
+
+
+def _parse_time(value: Any, name: str) -> time:
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise AvailabilityError(f"{name} must be a time such as 09:00:00") from None
+
+
+def parse_available_time(available_time: Any) -> list[tuple[int, time, time]]:
+    """Return ``(weekday, start, end)`` windows from a FHIR ``availableTime`` list."""
+
+    if not isinstance(available_time, list):
+        raise AvailabilityError("availableTime must be a list")
+    windows = []
+    for item in available_time:
+        if not isinstance(item, dict):
+            raise AvailabilityError("availableTime entries must be objects")
+        days = item.get("daysOfWeek") or []
+        if not isinstance(days, list) or not days or any(day not in WEEKDAYS for day in days):
+            raise AvailabilityError(f"daysOfWeek must list days from {', '.join(WEEKDAYS)}")
+        if item.get("allDay"):
+            start, end = time.min, time.min
+        else:
+            start = _parse_time(item.get("availableStartTime"), "availableStartTime")
+            end = _parse_time(item.get("availableEndTime"), "availableEndTime")
+            if end != time.min and end <= start:
+                raise AvailabilityError("availableEndTime must be after availableStartTime")
+        windows.extend((WEEKDAYS.index(day), start, end) for day in days)
+    return windows
+
+
+def set_schedule(practitioner: str, available_time: Any) -> list[PractitionerSchedule]:
+    """Replace the weekly schedule of a practitioner and start a new cache generation for it."""
+
+    practitioner = practitioner_id(practitioner)
+    windows = parse_available_time(available_time)
+    with transaction.atomic():
+        PractitionerSchedule.objects.filter(practitioner_id=practitioner).delete()
+        rows = PractitionerSchedule.objects.bulk_create(
+            PractitionerSchedule(practitioner_id=practitioner, weekday=weekday, start_time=start, end_time=end)
+            for weekday, start, end in windows
+        )
+        transaction.on_commit(
+            lambda: shared_cache().set(_generation_key(practitioner), uuid4().hex, timeout=None)
+        )
+    return rows
+
+
+def available_time(rows: Iterable[PractitionerSchedule]) -> list[dict[str, Any]]:
+    return [
+        {
+            "daysOfWeek": [WEEKDAYS[row.weekday]],
+            "availableStartTime": row.start_time.isoformat(),
+            "availableEndTime": row.end_time.isoformat(),
+        }
+        for row in sorted(rows, key=lambda row: (row.weekday, row.start_time))
+    ]
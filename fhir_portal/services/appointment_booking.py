@@ -0,0 +1,236 @@
+"""Conflict-free appointment booking.
+
+Every practitioner day has an :class:`~services.models.AppointmentLock` row.
+A booking locks the rows of the days it spans with ``SELECT ... FOR UPDATE``
+(in day order, so bookings spanning midnight cannot deadlock). While holding
+the locks it checks for overlapping appointments and inserts its own. Two
+bookings for the same practitioner day therefore run one after the other,
+and bookings for other practitioners or days do not wait at all.
+
+The lock rows are created beforehand in autocommit mode. The locking read is
+then the first statement of the booking transaction, so under MySQL's
+``REPEATABLE READ`` the reads that follow see every booking committed by the
+transaction that held the lock before.
+
+Clients may send an ``Idempotency-Key``. The key is stored with the created
+Appointment in the same transaction. A retry with the same key and body gets
+the stored response back instead of a conflict with its own booking. A retry
+with the same key and a different body is rejected.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from . import appointment_availability
+from .fhir_utils import first_code, instant
+from .models import AppointmentLock, AppointmentRecord, IdempotencyKey
+
+SCOPE = "appointment.book"
+
+
+class BookingError(ValueError):
+    """Raised for appointments that cannot be booked as requested."""
+
+
+class SlotUnavailable(BookingError):
+    """Raised when the practitioner already has an appointment in the requested interval."""
+
+
+class IdempotencyMismatch(BookingError):
+    """Raised when an idempotency key is reused with a different request."""
+
+
+@dataclass
+class BookingResult:
+    appointment: dict[str, Any]
+    replayed: bool = False
+
+
+def record_fields(resource: dict[str, Any]) -> dict[str, Any]:
+    participants = resource.get("participant") or []
+    if not isinstance(participants, list):
+        raise BookingError("Appointment.participant must be a list")
+    references = []
+    for participant in participants:
+        if not isinstance(participant, dict):
+            continue
+        actor = participant.get("actor") or {}
+        if not isinstance(actor, dict):
+            raise BookingError("Appointment.participant.actor must be a Reference object")
+        references.append(str(actor.get("reference") or ""))
+
+    def actor(prefix: str) -> str:
+        return next((reference for reference in references if reference.startswith(prefix)), "")[:128]
+
+    return {
+        "status": str(resource.get("status") or "")[:32],
+        "start": instant(resource.get("start")),
+        "end": instant(resource.get("end")),
+        "patient_reference": actor("Patient/"),
+        "practitioner_reference": actor("Practitioner/"),
+        "service_category": first_code(resource.get("serviceCategory"))[:128],
+        "appointment_type": first_code(resource.get("appointmentType"))[:128],
+        "data": resource,
+    }
+
+
+def request_hash(payload: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _stored(key: str, digest: str) -> BookingResult | None:
+    stored = IdempotencyKey.objects.filter(scope=SCOPE, key=key).first()
+    if stored is None:
+        return None
+    if stored.request_hash != digest:
+        raise IdempotencyMismatch(f"Idempotency-Key {key!r} was already used for a different request")
+    return BookingResult(stored.response, replayed=True)
+
+
+def _lock_days(practitioner: str, days: list[date]) -> None:
+    # Runs in autocommit mode, before the booking transaction starts.
+    AppointmentLock.objects.bulk_create(
+        [AppointmentLock(practitioner_id=practitioner, day=day) for day in days], ignore_conflicts=True
+    )
+
+
+def conflicts(records: Iterable[AppointmentRecord]) -> dict[str, str]:
+    """Lock the practitioner days of unsaved ``records`` and find the ones that overlap.
+
+    Call it inside the transaction that will write the records. Returns the
+    id of every record that overlaps a stored appointment, or an earlier one
+    of ``records``, mapped to the appointment it overlaps. A record is not
+    compared with the stored version it replaces.
+    """
+
+    active = [
+        record
+        for record in records
+        if appointment_availability.practitioner_id(record.practitioner_reference)
+        and appointment_availability.days_spanned(record.start, record.end)
+        and record.status not in appointment_availability.RELEASED_STATUSES
+    ]
+    if not active:
+        return {}
+    days: dict[str, set[date]] = {}
+    for record in active:
+        practitioner = appointment_availability.practitioner_id(record.practitioner_reference)
+        days.setdefault(practitioner, set()).update(appointment_availability.days_spanned(record.start, record.end))
+    for practitioner, spanned in days.items():
+        _lock_days(practitioner, sorted(spanned))
+    locks = Q()
+    for practitioner, spanned in days.items():
+        locks |= Q(practitioner_id=practitioner, day__in=spanned)
+    list(
+        AppointmentLock.objects.select_for_update()
+        .filter(locks)
+        .order_by("practitioner_id", "day")
+        .values_list("pk", flat=True)
+    )
+    # A locking read sees appointments committed after this transaction's
+    # snapshot was taken, which the earlier reads of a Bundle may have done.
+    booked = list(
+        AppointmentRecord.objects.select_for_update()
+        .filter(
+            practitioner_reference__in={record.practitioner_reference for record in active},
+            start__lt=max(record.end for record in active),
+            end__gt=min(record.start for record in active),
+        )
+        .exclude(status__in=appointment_availability.RELEASED_STATUSES)
+        .only("appointment_id", "practitioner_reference", "start", "end")
+    )
+    found = {}
+    for record in active:
+        overlapping = next(
+            (
+                other.appointment_id
+                for other in booked
+                if other.appointment_id != record.appointment_id
+                and other.practitioner_reference == record.practitioner_reference
+                and other.start < record.end
+                and other.end > record.start
+            ),
+            None,
+        )
+        if overlapping is None:
+            booked = [other for other in booked if other.appointment_id != record.appointment_id]
+            booked.append(record)
+        else:
+            found[record.appointment_id] = overlapping
+    return found
+
+
+def book(resource: dict[str, Any], *, idempotency_key: str = "", digest: str = "") -> BookingResult:
+    """Store ``resource`` as a booked Appointment unless its practitioner is busy at that time.
+
+    ``digest`` identifies the client request an ``idempotency_key`` belongs to;
+    it defaults to a hash of ``resource``.
+    """
+
+    fields = record_fields(resource)
+    practitioner = appointment_availability.practitioner_id(fields["practitioner_reference"])
+    if not practitioner:
+        raise BookingError("Appointment.participant must include a Practitioner actor")
+    start, end = fields["start"], fields["end"]
+    if start is None or end is None:
+        raise BookingError("Appointment.start and Appointment.end must be valid instants")
+    if end <= start:
+        raise BookingError("Appointment.end must be after Appointment.start")
+    if fields["status"] in appointment_availability.RELEASED_STATUSES:
+        raise BookingError(f"Cannot book an appointment with status {fields['status']!r}")
+
+    digest = digest or request_hash(resource)
+    if idempotency_key:
+        replay = _stored(idempotency_key, digest)
+        if replay is not None:
+            return replay
+
+    days = appointment_availability.days_spanned(start, end)
+    _lock_days(practitioner, days)
+    try:
+        with transaction.atomic():
+            list(
+                AppointmentLock.objects.select_for_update()
+                .filter(practitioner_id=practitioner, day__in=days)
+                .order_by("day")
+                .values_list("pk", flat=True)
+            )
+            if idempotency_key:
+                # A concurrent retry with the same key may have committed while we waited.
+                replay = _stored(idempotency_key, digest)
+                if replay is not None:
+                    return replay
+            overlapping = (
+                AppointmentRecord.objects.filter(
+                    practitioner_reference=fields["practitioner_reference"], start__lt=end, end__gt=start
+                )
+                .exclude(status__in=appointment_availability.RELEASED_STATUSES)
+                .values_list("appointment_id", flat=True)
+                .first()
+            )
+            if overlapping is not None:
+                raise SlotUnavailable(
+                    f"Practitioner/{practitioner} already has Appointment/{overlapping} at that time"
+                )
+            record = AppointmentRecord.objects.create(appointment_id=resource["id"], **fields)
+            if idempotency_key:
+                IdempotencyKey.objects.create(
+                    scope=SCOPE, key=idempotency_key, request_hash=digest, response=resource
+                )
+            appointment_availability.invalidate_on_commit(appointment_availability.appointment_days([record]))
+    except IntegrityError:
+        if idempotency_key:
+            replay = _stored(idempotency_key, digest)
+            if replay is not None:
+                return replay
+        raise BookingError(f"Appointment/{resource['id']} already exists") from None
+    return BookingResult(resource)
+
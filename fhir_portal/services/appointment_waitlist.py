@@ -0,0 +1,291 @@
+"""Refill cancelled appointment slots from the waitlist.
+
+Waiting :class:`~services.models.WaitlistEntry` rows are held in an
+in-process index of heaps ordered by ``(priority, age)``. There is one heap
+per ``(practitioner, preferred date, preferred time band)``, and entries
+without a date or band preference go under ``None``. An entry with several
+preferences is pushed onto several heaps.
+
+A freed slot on date ``d`` in band ``b`` only looks at the tops of four heaps:
+``(d, b)``, ``(d, None)``, ``(None, b)`` and ``(None, None)``. Taking the best
+entry is therefore ``O(log n)`` rather than a scan of the waitlist. Entries
+that were already taken through another heap are skipped lazily when they
+reach a top.
+
+The chosen entry is claimed in the database with a conditional ``UPDATE``,
+so two processes never fill a slot from the same entry. Its patient is then
+booked into the slot through :func:`services.appointment_booking.book`, and
+a notification is queued. Like the alert index, the index reloads when
+another process adds an entry, checking the waitlist's generation (see
+:mod:`services.generations`) at most every ``settings.WAITLIST_RELOAD_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone as dt_timezone
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import generations
+from .appointment_availability import PRACTITIONER_PREFIX, RELEASED_STATUSES, practitioner_id
+from .appointment_booking import BookingError, book
+from .models import NotificationMessage, WaitlistEntry
+from .sample_utils import generate_identifier, isoformat
+
+logger = logging.getLogger(__name__)
+
+GENERATION = "appointment-waitlist"
+TEMPLATE = "waitlist_slot_filled"
+
+WAITING = "waiting"
+CLAIMED = "claimed"
+BOOKED = "booked"
+
+# FHIR request priorities, most urgent first.
+PRIORITIES = ("stat", "asap", "urgent", "routine")
+
+# Time-of-day bands (UTC hours, end exclusive) accepted in ``preferred_times``.
+TIME_BANDS = {"morning": (0, 12), "afternoon": (12, 17), "evening": (17, 24)}
+
+
+class WaitlistError(ValueError):
+    """Raised for waitlist entries that cannot be stored."""
+
+
+@dataclass(frozen=True)
+class Interval:
+    practitioner_id: str
+    start: datetime
+    end: datetime
+
+
+def booked_interval(record: Any) -> Interval | None:
+    """Return the interval an appointment record occupies, if it occupies one."""
+
+    if (
+        record.status in RELEASED_STATUSES
+        or not record.practitioner_reference
+        or record.start is None
+        or record.end is None
+    ):
+        return None
+    return Interval(practitioner_id(record.practitioner_reference), record.start, record.end)
+
+
+def band(moment: datetime) -> str:
+    hour = moment.astimezone(dt_timezone.utc).hour
+    return next(name for name, (first, last) in TIME_BANDS.items() if first <= hour < last)
+
+
+def parse_preferences(dates: Any, times: Any) -> tuple[list[str], list[str]]:
+    if not isinstance(dates, (list, tuple)) or not isinstance(times, (list, tuple)):
+        raise WaitlistError("preferredDates and preferredTimes must be lists")
+    try:
+        dates = [date.fromisoformat(value).isoformat() for value in dates]
+    except (TypeError, ValueError):
+        raise WaitlistError("preferredDates must be YYYY-MM-DD dates") from None
+    if any(value not in TIME_BANDS for value in times):
+        raise WaitlistError(f"preferredTimes must be from {', '.join(TIME_BANDS)}")
+    return dates, list(times)
+
+
+class WaitlistIndex:
+    """Heaps of waiting entries keyed by ``(practitioner, date or None, band or None)``."""
+
+    def __init__(self) -> None:
+        self._heaps: dict[tuple[str, str | None, str | None], list[tuple[int, float, int]]] = {}
+        self._waiting: dict[int, WaitlistEntry] = {}
+        self._generation: int | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.RLock()
+
+    def push(self, entry: WaitlistEntry) -> None:
+        rank = PRIORITIES.index(entry.priority) if entry.priority in PRIORITIES else len(PRIORITIES)
+        item = (rank, entry.created_at.timestamp(), entry.pk)
+        with self._lock:
+            self._waiting[entry.pk] = entry
+            for day in entry.preferred_dates or [None]:
+                for name in entry.preferred_times or [None]:
+                    heapq.heappush(self._heaps.setdefault((entry.practitioner_id, day, name), []), item)
+
+    def load(self) -> None:
+        with self._lock:
+            self._heaps = {}
+            self._waiting = {}
+            for entry in WaitlistEntry.objects.filter(status=WAITING).exclude(practitioner_id="").iterator():
+                self.push(entry)
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < settings.WAITLIST_RELOAD_SECONDS:
+            return
+        with self._lock:
+            generation = generations.current(GENERATION)
+            if self._stale or generation != self._generation:
+                self._stale = False
+                self._generation = generation
+                self.load()
+            self._checked_at = now
+
+    def _top(self, key: tuple[str, str | None, str | None]) -> tuple[int, float, int] | None:
+        heap = self._heaps.get(key)
+        while heap and heap[0][2] not in self._waiting:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def pop(self, slot: Interval) -> WaitlistEntry | None:
+        """Remove and return the best entry that would take ``slot``."""
+
+        day, name = slot.start.astimezone(dt_timezone.utc).date().isoformat(), band(slot.start)
+        with self._lock:
+            tops = [
+                item
+                for key in ((day, name), (day, None), (None, name), (None, None))
+                if (item := self._top((slot.practitioner_id, *key))) is not None
+            ]
+            if not tops:
+                return None
+            return self._waiting.pop(min(tops)[2])
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+
+index = WaitlistIndex()
+
+
+def add_entry(
+    appointment_id: str,
+    patient_id: str,
+    *,
+    practitioner: str,
+    preferred_dates: Any = (),
+    preferred_times: Any = (),
+    priority: str = "routine",
+    notification_preferences: dict[str, Any] | None = None,
+) -> WaitlistEntry:
+    if not patient_id:
+        raise WaitlistError("patientId is required")
+    if not practitioner:
+        raise WaitlistError("practitioner is required when the appointment has none")
+    if priority not in PRIORITIES:
+        raise WaitlistError(f"priority must be one of {', '.join(PRIORITIES)}")
+    dates, times = parse_preferences(preferred_dates, preferred_times)
+    entry = WaitlistEntry.objects.create(
+        appointment_id=appointment_id,
+        patient_id=patient_id,
+        practitioner_id=practitioner_id(practitioner),
+        preferred_dates=dates,
+        preferred_times=times,
+        priority=priority,
+        notification_preferences=notification_preferences or {},
+    )
+    generations.bump(GENERATION)
+    transaction.on_commit(index.mark_stale)
+    return entry
+
+
+def _claim(entry: WaitlistEntry) -> bool:
+    return bool(WaitlistEntry.objects.filter(pk=entry.pk, status=WAITING).update(status=CLAIMED))
+
+
+def _appointment(entry: WaitlistEntry, slot: Interval) -> dict[str, Any]:
+    return {
+        "resourceType": "Appointment",
+        "id": generate_identifier("appt"),
+        "status": "booked",
+        "start": isoformat(slot.start),
+        "end": isoformat(slot.end),
+        "participant": [
+            {"actor": {"reference": PRACTITIONER_PREFIX + slot.practitioner_id}, "status": "accepted"},
+            {"actor": {"reference": f"Patient/{entry.patient_id}"}, "status": "needs-action"},
+        ],
+    }
+
+
+def _notification(entry: WaitlistEntry, appointment: dict[str, Any]) -> NotificationMessage:
+    preferences = entry.notification_preferences or {}
+    return NotificationMessage(
+        notification_id=generate_identifier("waitlist"),
+        recipient_id=entry.patient_id,
+        template=TEMPLATE,
+        channels=[channel for channel in ("email", "sms", "push") if preferences.get(channel)],
+        status="queued",
+        scheduled_at=timezone.now(),
+        data={
+            "appointmentId": appointment["id"],
+            "waitlistAppointmentId": entry.appointment_id,
+            "start": appointment["start"],
+            "end": appointment["end"],
+        },
+    )
+
+
+def _release(entry: WaitlistEntry) -> None:
+    """Put a claimed entry back on the waitlist."""
+
+    try:
+        WaitlistEntry.objects.filter(pk=entry.pk, status=CLAIMED).update(status=WAITING)
+    except DatabaseError:
+        logger.exception("Waitlist entry %s is left claimed", entry.pk)
+        return
+    entry.status = WAITING
+    index.push(entry)
+
+
+def fill(slot: Interval) -> WaitlistEntry | None:
+    """Book the best waiting patient into ``slot``; return their entry, if any."""
+
+    index.refresh()
+    while (entry := index.pop(slot)) is not None:
+        if not _claim(entry):
+            # Taken by another process since the index was loaded.
+            continue
+        appointment = _appointment(entry, slot)
+        try:
+            book(appointment)
+        except BookingError as exc:
+            logger.info("Waitlist slot %s was not filled: %s", slot, exc)
+            _release(entry)
+            return None
+        except Exception:
+            logger.exception("Waitlist slot %s could not be booked", slot)
+            _release(entry)
+            return None
+        WaitlistEntry.objects.filter(pk=entry.pk).update(status=BOOKED, updated_at=timezone.now())
+        NotificationMessage.objects.bulk_create([_notification(entry, appointment)])
+        entry.status = BOOKED
+        return entry
+    return None
+
+
+def _fill_all(slots: list[Interval]) -> None:
+    # Runs after the freeing transaction has committed: a failure here must
+    # neither reach the client nor stop the remaining slots from being offered.
+    for slot in slots:
+        try:
+            fill(slot)
+        except Exception:
+            logger.exception("Waitlist slot %s was not offered", slot)
+
+
+def occupied(records: Iterable[Any]) -> set[Interval]:
+    return {interval for record in records if (interval := booked_interval(record)) is not None}
+
+
+def fill_on_commit(slots: Iterable[Interval]) -> None:
+    slots = sorted(slots, key=lambda slot: (slot.start, slot.practitioner_id))
+    if slots:
+        transaction.on_commit(lambda: _fill_all(slots))
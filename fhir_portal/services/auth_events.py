@@ -0,0 +1,72 @@
+"""Recording of authentication events (:class:`~services.models.AuthEvent`).
+
+Events are not inserted by the request that produces them. :func:`record`
+hands them to a :class:`~services.buffered_writer.BufferedWriter`, which
+writes them in batches of ``settings.AUTH_EVENT_BATCH_SIZE`` or every
+``settings.AUTH_EVENT_FLUSH_SECONDS``. A burst of logins therefore costs one
+INSERT per batch rather than one per login. At most
+``settings.AUTH_EVENT_QUEUE_SIZE`` events wait in the queue; any more are
+dropped and counted, and the queue is drained when the process exits.
+:func:`stats` reports the queue depth and the written, dropped and failed
+counts. Set ``settings.AUTH_EVENT_BUFFERED`` to ``False`` to insert each event
+synchronously.
+"""
+
+from __future__ import annotations
+
+import atexit
+from typing import Any
+
+from django.conf import settings
+
+from .buffered_writer import BufferedWriter
+from .models import AuthEvent
+
+LOGIN = "login"
+LOGIN_FAILED = "login_failed"
+LOGOUT = "logout"
+REFRESH = "token_refresh"
+REGISTER = "register"
+PASSWORD_RESET = "password_reset"
+
+writer = BufferedWriter(
+    AuthEvent,
+    max_size=settings.AUTH_EVENT_QUEUE_SIZE,
+    batch_size=settings.AUTH_EVENT_BATCH_SIZE,
+    flush_seconds=settings.AUTH_EVENT_FLUSH_SECONDS,
+)
+atexit.register(writer.stop, settings.AUTH_EVENT_FLUSH_SECONDS * 2)
+
+
+def stats() -> dict[str, int]:
+    return writer.stats()
+
+
+def device_info(request, payload: dict[str, Any]) -> dict[str, Any]:
+    info = payload.get("deviceInfo")
+    if isinstance(info, dict):
+        return info
+    return {"userAgent": request.META.get("HTTP_USER_AGENT", "")[:512]}
+
+
+def record(
+    event_type: str,
+    *,
+    user_id: str = "",
+    username: str = "",
+    device: dict[str, Any] | None = None,
+    metadata: dict[str, Any] | None = None,
+) -> AuthEvent:
+    event = AuthEvent(
+        user_id=user_id[:64],
+        event_type=event_type,
+        username=username[:256],
+        device_info=device or {},
+        metadata=metadata or {},
+    )
+    if not settings.AUTH_EVENT_BUFFERED:
+        event.save()
+        return event
+    writer.start()
+    writer.submit(event)
+    return event
@@ -0,0 +1,211 @@
+"""Signed bearer tokens for the API.
+
+Tokens are compact JWTs (``HS256``) signed with ``settings.AUTH_TOKEN_SECRET``.
+They carry the user id and name, the token type (``access`` or ``refresh``),
+a random ``jti`` and the expiry. Verifying a token needs no database access:
+
+* the decoded claims of recently seen tokens are kept in an in-process LRU
+  (``settings.AUTH_TOKEN_CACHE_SIZE`` entries), so the signature is checked
+  once per token rather than once per request; the expiry is still checked
+  on every request;
+* revoked ``jti`` values are loaded into an in-process Bloom filter. A token
+  that is not in the filter is certainly not revoked. The rare token that
+  is in it, revoked or a false positive, is confirmed against
+  :class:`~services.models.RevokedToken`.
+
+Revocations made by this process go into its filter immediately. Every
+revocation also bumps the revocation list's generation (see
+:mod:`services.generations`), and other processes reload their filter from
+the table when it moves, checking at most every
+``settings.AUTH_REVOCATION_RELOAD_SECONDS``.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import generations
+from .models import RevokedToken
+from .resource_cache import LRUCache
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+GENERATION = "revoked-tokens"
+HEADER = {"alg": "HS256", "typ": "JWT"}
+
+
+class TokenError(ValueError):
+    """Raised for tokens that are malformed, badly signed, expired or revoked."""
+
+
+@dataclass(frozen=True)
+class Claims:
+    user_id: str
+    username: str
+    token_type: str
+    jti: str
+    issued_at: int
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(signing_input: bytes) -> bytes:
+    return hmac.new(settings.AUTH_TOKEN_SECRET.encode(), signing_input, hashlib.sha256).digest()
+
+
+_ENCODED_HEADER = _b64encode(json.dumps(HEADER, separators=(",", ":")).encode())
+
+
+def issue(
+    user_id: str, username: str = "", *, token_type: str = ACCESS, ttl: int | None = None
+) -> tuple[str, Claims]:
+    """Return a new signed token and its claims."""
+
+    if ttl is None:
+        ttl = settings.AUTH_ACCESS_TOKEN_TTL if token_type == ACCESS else settings.AUTH_REFRESH_TOKEN_TTL
+    now = int(time.time())
+    claims = Claims(str(user_id), username, token_type, uuid4().hex, now, now + ttl)
+    payload = {
+        "sub": claims.user_id,
+        "name": claims.username,
+        "typ": claims.token_type,
+        "jti": claims.jti,
+        "iat": claims.issued_at,
+        "exp": claims.expires_at,
+    }
+    signing_input = f"{_ENCODED_HEADER}.{_b64encode(json.dumps(payload, separators=(',', ':')).encode())}"
+    return f"{signing_input}.{_b64encode(_signature(signing_input.encode()))}", claims
+
+
+def decode(token: str) -> Claims:
+    """Check the signature of ``token`` and return its claims; expiry and revocation are not checked."""
+
+    try:
+        header, payload, signature = token.split(".")
+        if not hmac.compare_digest(_b64decode(signature), _signature(f"{header}.{payload}".encode())):
+            raise TokenError("Invalid token signature")
+        if json.loads(_b64decode(header)) != HEADER:
+            raise TokenError("Unsupported token algorithm")
+        data = json.loads(_b64decode(payload))
+        return Claims(
+            user_id=str(data["sub"]),
+            username=str(data.get("name", "")),
+            token_type=str(data["typ"]),
+            jti=str(data["jti"]),
+            issued_at=int(data["iat"]),
+            expires_at=int(data["exp"]),
+        )
+    except TokenError:
+        raise
+    except (ValueError, KeyError, TypeError):
+        raise TokenError("Malformed token") from None
+
+
+class RevocationFilter:
+    """Bloom filter of revoked token ids, backed by the ``RevokedToken`` table."""
+
+    def __init__(self) -> None:
+        # (size in bits, bits). A reload builds a new pair and swaps it in with
+        # one assignment, so unlocked readers never see a half-filled filter.
+        self._filter: tuple[int, bytearray] = (0, bytearray(0))
+        self._generation: int | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _positions(jti: str, size: int) -> list[int]:
+        digest = hashlib.blake2b(jti.encode(), digest_size=8 * settings.AUTH_REVOCATION_BLOOM_HASHES).digest()
+        return [int.from_bytes(digest[offset:offset + 8], "little") % size for offset in range(0, len(digest), 8)]
+
+    @classmethod
+    def _set(cls, bits: bytearray, size: int, jti: str) -> None:
+        for position in cls._positions(jti, size):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def add(self, jti: str) -> None:
+        size, bits = self._filter
+        self._set(bits, size, jti)
+
+    def might_contain(self, jti: str) -> bool:
+        size, bits = self._filter
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(jti, size))
+
+    def load(self) -> None:
+        size = settings.AUTH_REVOCATION_BLOOM_BITS
+        bits = bytearray(-(-size // 8))
+        revoked = RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list("jti", flat=True)
+        for jti in revoked.iterator():
+            self._set(bits, size, jti)
+        self._filter = (size, bits)
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < settings.AUTH_REVOCATION_RELOAD_SECONDS:
+            return
+        with self._lock:
+            generation = generations.current(GENERATION)
+            if self._stale or generation != self._generation:
+                self._stale = False
+                self._generation = generation
+                self.load()
+            self._checked_at = now
+
+    def is_revoked(self, jti: str) -> bool:
+        self.refresh()
+        return self.might_contain(jti) and RevokedToken.objects.filter(jti=jti).exists()
+
+
+revocations = RevocationFilter()
+verified = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+
+def verify(token: str, *, token_type: str = ACCESS) -> Claims:
+    """Return the claims of a valid, unexpired, unrevoked token of ``token_type``."""
+
+    claims = verified.get(token)
+    if claims is None:
+        claims = decode(token)
+        verified.set(token, claims)
+    if claims.token_type != token_type:
+        raise TokenError(f"Expected an {token_type} token")
+    if claims.expires_at <= time.time():
+        raise TokenError("Token has expired")
+    if revocations.is_revoked(claims.jti):
+        raise TokenError("Token has been revoked")
+    return claims
+
+
+def revoke(claims: Claims) -> None:
+    """Revoke a token until it expires."""
+
+    expires_at = datetime.fromtimestamp(claims.expires_at, tz=dt_timezone.utc)
+    with transaction.atomic():
+        _, created = RevokedToken.objects.get_or_create(jti=claims.jti, defaults={"expires_at": expires_at})
+        if created:
+            generations.bump(GENERATION)
+    revocations.refresh()
+    revocations.add(claims.jti)
@@ -0,0 +1,53 @@
+"""DRF authentication with the signed bearer tokens of :mod:`services.auth_tokens`."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from rest_framework import authentication, exceptions
+
+from .auth_tokens import Claims, TokenError, verify
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    """The user a verified access token was issued to. No database row is loaded."""
+
+    id: str
+    username: str
+
+    is_authenticated = True
+    is_anonymous = False
+
+    @property
+    def pk(self) -> str:
+        return self.id
+
+
+class TokenAuthentication(authentication.BaseAuthentication):
+    """Authenticate ``Authorization: Bearer <token>`` requests.
+
+    Requests without a bearer token stay anonymous; views that require a user
+    say so with their permission classes.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        if not header:
+            return None
+        keyword, _, token = header.partition(" ")
+        if keyword != self.keyword:
+            return None
+        token = token.strip()
+        if not token:
+            raise exceptions.AuthenticationFailed("Bearer token is missing")
+        try:
+            claims: Claims = verify(token)
+        except TokenError as exc:
+            raise exceptions.AuthenticationFailed(str(exc)) from None
+        return TokenUser(claims.user_id, claims.username), claims
+
+    def authenticate_header(self, request) -> str:
+        return f'{self.keyword} realm="api"'
@@ -0,0 +1,136 @@
+"""Batched background inserts for append-only log tables.
+
+A :class:`BufferedWriter` takes unsaved model instances on a bounded
+in-process queue. A background thread writes them with ``bulk_create`` once
+``batch_size`` rows are waiting or ``flush_seconds`` have passed since the
+first one was queued, so a burst of writes costs one INSERT per batch.
+When the queue is full, new rows are dropped and counted instead of blocking
+the caller. :meth:`BufferedWriter.stop` drains the queue, and owners register
+it with :mod:`atexit`. Rows are stamped by ``auto_now_add`` when they are
+written, so ``created_at`` may lag by up to ``flush_seconds``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Model
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """Bounded queue of unsaved ``model`` instances, written in batches by a background thread."""
+
+    def __init__(self, model: type[Model], *, max_size: int, batch_size: int, flush_seconds: float) -> None:
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue[Model] = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, obj: Model) -> bool:
+        """Queue ``obj``; return ``False`` if the queue is full and it was dropped."""
+
+        try:
+            self._queue.put_nowait(obj)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("%s queue is full; dropped a row", self.model.__name__)
+            return False
+        return True
+
+    def start(self) -> None:
+        """Start the writer thread unless this process already runs one."""
+
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            # Threads do not survive a fork, so a pre-forked worker starts its own.
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._pid = os.getpid()
+            name = f"{self.model._meta.model_name}-writer"
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop the writer thread and write everything still queued."""
+
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def _take(self, batch: list[Model], deadline: float) -> None:
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                return
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                return
+
+    def _run(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                try:
+                    batch = [self._queue.get(timeout=self.flush_seconds)]
+                except queue.Empty:
+                    continue
+                self._take(batch, time.monotonic() + self.flush_seconds)
+                self._write(batch)
+        finally:
+            connection.close()
+
+    def _write(self, batch: list[Model]) -> None:
+        close_old_connections()
+        try:
+            self.model.objects.bulk_create(batch, batch_size=self.batch_size)
+        except DatabaseError:
+            logger.exception("Could not write %d %s rows", len(batch), self.model.__name__)
+            with self._lock:
+                self.failed += len(batch)
+        else:
+            with self._lock:
+                self.written += len(batch)
+
+    def flush(self) -> int:
+        """Write everything queued from the calling thread; return how many rows were taken."""
+
+        taken = 0
+        while True:
+            batch: list[Model] = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return taken
+            taken += len(batch)
+            self._write(batch)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
@@ -0,0 +1,284 @@
+"""FHIR Bulk Data ``$export`` at system and group level.
+
+A kick-off records a :class:`~services.models.BulkExportJob` that runs on a
+background thread and writes one NDJSON file per resource type under
+``settings.EXPORT_ROOT/bulk/<job_id>/``. Rows are read in primary-key order
+in keyset pages of ``settings.EXPORT_CHUNK_SIZE`` rows (``pk > last``) rather
+than with ``OFFSET`` or a single cursor. MySQL's client library buffers a
+whole result set even for ``.iterator()``, so keyset paging is what keeps
+memory flat on tables with tens of millions of rows.
+
+Cancelling a running job only marks it ``cancelled``. The job checks its
+status before every page and resource type, and once it sees the mark it
+stops and removes its files and its row itself, so nothing is written after
+the cleanup. Jobs whose files have expired are removed by
+:func:`sweep_expired` (``python manage.py sweep_exports``).
+"""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, QuerySet, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import AppointmentRecord, BulkExportJob, ObservationRecord, PatientGroup, PatientRecord
+from .patient_export import iter_ndjson, iter_stored, write_file
+from .sample_utils import generate_identifier, isoformat
+
+logger = logging.getLogger(__name__)
+
+SYSTEM = "system"
+GROUP = "group"
+
+# Resource type -> (model, logical id column).
+EXPORT_TYPES = {
+    "Patient": (PatientRecord, "patient_id"),
+    "Observation": (ObservationRecord, "observation_id"),
+    "Appointment": (AppointmentRecord, "appointment_id"),
+}
+
+OUTPUT_FORMATS = ("application/fhir+ndjson", "application/ndjson", "ndjson")
+
+QUEUED = "queued"
+IN_PROGRESS = "in-progress"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class BulkExportError(ValueError):
+    """Raised for kick-off requests that cannot be accepted."""
+
+
+class ExportCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+def parse_types(value: str | None) -> list[str]:
+    if not value:
+        return list(EXPORT_TYPES)
+    types = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in types if item not in EXPORT_TYPES]
+    if unknown:
+        raise BulkExportError(f"Unsupported _type: {', '.join(unknown)}")
+    return list(dict.fromkeys(types))
+
+
+def parse_since(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise BulkExportError(f"Invalid _since value: {value!r}") from None
+    if timezone.is_naive(since):
+        raise BulkExportError("_since must include a timezone offset")
+    return since
+
+
+def job_directory(job: BulkExportJob) -> Path:
+    return Path(settings.EXPORT_ROOT) / "bulk" / job.job_id
+
+
+def file_path(job: BulkExportJob, resource_type: str) -> Path:
+    return job_directory(job) / f"{resource_type}.ndjson"
+
+
+def kick_off(
+    *,
+    level: str = SYSTEM,
+    group_id: str = "",
+    types: str | None = None,
+    since: str | None = None,
+    output_format: str | None = None,
+    request_url: str = "",
+) -> BulkExportJob:
+    """Validate an ``$export`` request and record a queued job."""
+
+    if output_format and output_format not in OUTPUT_FORMATS:
+        raise BulkExportError(f"Unsupported _outputFormat: {output_format!r}")
+    if level == GROUP and not PatientGroup.objects.filter(group_id=group_id).exists():
+        raise PatientGroup.DoesNotExist(f"Group {group_id} not found")
+    return BulkExportJob.objects.create(
+        job_id=generate_identifier("bulk"),
+        level=level,
+        group_id=group_id,
+        resource_types=parse_types(types),
+        since=parse_since(since),
+        request_url=request_url,
+        transaction_time=timezone.now(),
+    )
+
+
+def export_queryset(job: BulkExportJob, resource_type: str) -> QuerySet:
+    """Return the rows of ``resource_type`` included in ``job``."""
+
+    model, _ = EXPORT_TYPES[resource_type]
+    queryset = model.objects.all()
+    if job.since:
+        queryset = queryset.filter(updated_at__gte=job.since)
+    # Only rows written before the kick-off belong to the export.
+    queryset = queryset.filter(updated_at__lte=job.transaction_time)
+    if job.level == GROUP:
+        members = PatientRecord.objects.filter(groups__group_id=job.group_id)
+        if model is PatientRecord:
+            queryset = queryset.filter(pk__in=members.values("pk"))
+        else:
+            references = members.annotate(reference=Concat(Value("Patient/"), "patient_id"))
+            queryset = queryset.filter(
+                Q(patient_reference__in=references.values("reference"))
+                | Q(patient_reference__in=members.values("patient_id"))
+            )
+    return queryset
+
+
+def iter_resources(queryset: QuerySet, resource_type: str, *, chunk_size: int) -> Iterator[dict[str, Any]]:
+    """Yield resources in primary-key order, fetching one keyset page at a time."""
+
+    _, id_field = EXPORT_TYPES[resource_type]
+    return iter_stored(queryset, resource_type, id_field, chunk_size=chunk_size)
+
+
+def cancelled(job: BulkExportJob) -> bool:
+    return not BulkExportJob.objects.filter(pk=job.pk).exclude(status=CANCELLED).exists()
+
+
+def _checked(
+    job: BulkExportJob, resources: Iterator[dict[str, Any]], counter: list[int], chunk_size: int
+) -> Iterator[dict[str, Any]]:
+    """Count ``resources`` and check for cancellation between pages of them."""
+
+    for resource in resources:
+        if counter[0] and counter[0] % chunk_size == 0 and cancelled(job):
+            raise ExportCancelled(job.job_id)
+        counter[0] += 1
+        yield resource
+
+
+def remove_files(job: BulkExportJob) -> None:
+    shutil.rmtree(job_directory(job), ignore_errors=True)
+
+
+def _discard(job: BulkExportJob) -> BulkExportJob:
+    remove_files(job)
+    BulkExportJob.objects.filter(pk=job.pk).delete()
+    job.status = CANCELLED
+    return job
+
+
+def run_job(job: BulkExportJob, *, chunk_size: int | None = None) -> BulkExportJob:
+    """Write every requested resource type of ``job`` and record the manifest."""
+
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    active = BulkExportJob.objects.filter(pk=job.pk, status=IN_PROGRESS)
+    if not BulkExportJob.objects.filter(pk=job.pk, status=QUEUED).update(
+        status=IN_PROGRESS, updated_at=timezone.now()
+    ):
+        # Cancelled before it started.
+        return _discard(job)
+    output = []
+    try:
+        for resource_type in job.resource_types:
+            if cancelled(job):
+                raise ExportCancelled(job.job_id)
+            counter = [0]
+            resources = iter_resources(export_queryset(job, resource_type), resource_type, chunk_size=chunk_size)
+            write_file(file_path(job, resource_type), iter_ndjson(_checked(job, resources, counter, chunk_size)))
+            output.append({"type": resource_type, "count": counter[0]})
+            active.update(output=output, updated_at=timezone.now())
+    except ExportCancelled:
+        return _discard(job)
+    except Exception as exc:
+        logger.exception("Bulk export %s failed", job.job_id)
+        finished = active.update(status=FAILED, errors=[str(exc)], updated_at=timezone.now())
+    else:
+        finished = active.update(
+            status=COMPLETED,
+            expires_at=timezone.now() + timedelta(hours=settings.EXPORT_TTL_HOURS),
+            updated_at=timezone.now(),
+        )
+    if not finished:
+        # Cancelled after the last check.
+        return _discard(job)
+    job.refresh_from_db()
+    return job
+
+
+def start_job(job: BulkExportJob) -> threading.Thread:
+    """Run ``job`` on a background thread."""
+
+    def run() -> None:
+        try:
+            run_job(job)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name=f"bulk-export-{job.job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def delete_job(job: BulkExportJob) -> None:
+    """Cancel the job and remove any files it has written.
+
+    A queued or running job is only marked ``cancelled`` and cleans up after
+    itself when it next checks. Should its thread never get there, the mark
+    expires immediately and :func:`sweep_expired` removes it.
+    """
+
+    now = timezone.now()
+    if BulkExportJob.objects.filter(pk=job.pk, status__in=(QUEUED, IN_PROGRESS)).update(
+        status=CANCELLED, expires_at=now, updated_at=now
+    ):
+        return
+    _discard(job)
+
+
+def sweep_expired(*, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Remove the files and rows of jobs that have expired; return how many."""
+
+    swept = 0
+    while True:
+        jobs = list(
+            BulkExportJob.objects.filter(expires_at__lte=timezone.now()).only("pk", "job_id")[:batch_size]
+        )
+        for job in jobs:
+            remove_files(job)
+        BulkExportJob.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+        swept += len(jobs)
+        if len(jobs) < batch_size:
+            return swept
+
+
+def progress(job: BulkExportJob) -> str:
+    return f"{len(job.output)}/{len(job.resource_types)} resource types"
+
+
+def manifest(job: BulkExportJob, base_url: str) -> dict[str, Any]:
+    """Return the completion manifest of a finished job.
+
+    ``base_url`` is the absolute URL files are served under, without a
+    trailing slash.
+    """
+
+    return {
+        "transactionTime": isoformat(job.transaction_time),
+        "request": job.request_url,
+        "requiresAccessToken": False,
+        "output": [
+            {"type": item["type"], "url": f"{base_url}/{item['type']}.ndjson", "count": item["count"]}
+            for item in job.output
+        ],
+        "error": [],
+    }
@@ -0,0 +1,167 @@
+"""CapabilityStatement generated from the FHIR URL configuration.
+
+The statement is derived from the routes in :mod:`services.fhir_urls` and
+the HTTP methods their views accept, plus the search parameters each
+resource type supports. It is built and serialized to bytes once per
+process, so ``/metadata`` only has to compare an ``ETag`` or copy bytes.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from django.urls import URLPattern, URLResolver
+from django.utils import timezone
+
+from .patient_search import PARAMETER_TYPES as PATIENT_PARAMETER_TYPES
+
+FHIR_VERSION = "4.0.1"
+SOFTWARE_NAME = "FHIR Patient Portal"
+SOFTWARE_VERSION = "1.0.0"
+PUBLISHER = "Healthcare Organization"
+
+SEARCH_PARAMETERS = {
+    "Patient": PATIENT_PARAMETER_TYPES,
+}
+
+# Features that cannot be read off the routes.
+RESOURCE_FEATURES = {
+    "Patient": {"versioning": "versioned", "readHistory": False, "conditionalRead": "not-match"},
+}
+
+# (route shape, HTTP method) -> interaction code. ``{id}`` stands for any
+# path converter and ``{Type}`` for a resource type.
+INSTANCE_INTERACTIONS = {
+    ("{Type}/{id}", "GET"): "read",
+    ("{Type}/{id}", "PUT"): "update",
+    ("{Type}/{id}", "PATCH"): "patch",
+    ("{Type}/{id}", "DELETE"): "delete",
+    ("{Type}/{id}/_history", "GET"): "history-instance",
+    ("{Type}/{id}/_history/{id}", "GET"): "vread",
+    ("{Type}/_history", "GET"): "history-type",
+    ("{Type}", "GET"): "search-type",
+    ("{Type}", "POST"): "create",
+}
+
+OPERATION_DEFINITIONS = {
+    "export": "http://hl7.org/fhir/uv/bulkdata/OperationDefinition/export",
+}
+
+SYSTEM_INTERACTIONS = {
+    ("", "POST"): ("transaction", "batch"),
+    ("_history", "GET"): ("history-system",),
+}
+
+
+@dataclass(frozen=True)
+class Capability:
+    body: bytes
+    etag: str
+
+
+def _routes(patterns: Iterable[Any], prefix: str = "") -> Iterable[tuple[str, Any]]:
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _routes(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern):
+            yield prefix + str(pattern.pattern), pattern.callback
+
+
+def _methods(callback: Any) -> set[str]:
+    view_class = getattr(callback, "cls", None)
+    names = getattr(view_class, "http_method_names", None) or ["get"]
+    return {name.upper() for name in names} - {"OPTIONS", "HEAD"}
+
+
+def _shape(route: str) -> tuple[str, str]:
+    """Return ``(resource type, shape)`` for a route such as ``Patient/<str:id>``."""
+
+    parts = route.strip("/").split("/") if route else []
+    resource_type = parts[0] if parts and parts[0][:1].isupper() else ""
+    shape = [
+        "{Type}" if index == 0 and resource_type else "{id}" if part.startswith("<") else part
+        for index, part in enumerate(parts)
+    ]
+    return resource_type, "/".join(shape)
+
+
+def _operation(name: str) -> dict[str, str]:
+    return {"name": name, "definition": OPERATION_DEFINITIONS.get(name, f"OperationDefinition/{name}")}
+
+
+def build_statement(patterns: Iterable[Any]) -> dict[str, Any]:
+    """Return a CapabilityStatement for the FHIR routes in ``patterns``."""
+
+    resources: dict[str, dict[str, Any]] = {}
+    system: list[str] = []
+    operations: list[dict[str, str]] = []
+    for route, callback in _routes(patterns):
+        resource_type, shape = _shape(route)
+        methods = _methods(callback)
+        last = shape.rsplit("/", 1)[-1]
+        if not resource_type:
+            if last.startswith("$"):
+                operations.append(_operation(last[1:]))
+            for method in sorted(methods):
+                system.extend(SYSTEM_INTERACTIONS.get((shape, method), ()))
+            continue
+        resource = resources.setdefault(resource_type, {"type": resource_type, "interaction": []})
+        if last.startswith("$"):
+            resource.setdefault("operation", []).append(_operation(last[1:]))
+            continue
+        for method in sorted(methods):
+            code = INSTANCE_INTERACTIONS.get((shape, method))
+            if code and {"code": code} not in resource["interaction"]:
+                resource["interaction"].append({"code": code})
+
+    for resource_type, resource in resources.items():
+        resource["interaction"].sort(key=lambda item: item["code"])
+        resource.update(RESOURCE_FEATURES.get(resource_type, {}))
+        if any(item["code"] == "history-instance" for item in resource["interaction"]):
+            resource["readHistory"] = True
+        if any(item["code"] == "search-type" for item in resource["interaction"]):
+            resource["searchParam"] = [
+                {"name": name, "type": kind}
+                for name, kind in SEARCH_PARAMETERS.get(resource_type, {}).items()
+            ]
+
+    return {
+        "resourceType": "CapabilityStatement",
+        "status": "active",
+        "date": timezone.now().date().isoformat(),
+        "publisher": PUBLISHER,
+        "kind": "instance",
+        "software": {"name": SOFTWARE_NAME, "version": SOFTWARE_VERSION},
+        "fhirVersion": FHIR_VERSION,
+        "format": ["json"],
+        "rest": [
+            {
+                "mode": "server",
+                "resource": [resources[name] for name in sorted(resources)],
+                "interaction": [{"code": code} for code in dict.fromkeys(system)],
+                "operation": operations,
+            }
+        ],
+    }
+
+
+@functools.cache
+def capability() -> Capability:
+    """Return the serialized CapabilityStatement, building it on first use.
+
+    The ``ETag`` ignores ``date`` so that every worker process, whenever it
+    started, answers a revalidation for the same deployment with ``304``.
+    """
+
+    from . import fhir_urls
+
+    statement = build_statement(fhir_urls.urlpatterns)
+    stable = json.dumps({**statement, "date": None}, separators=(",", ":"), sort_keys=True)
+    return Capability(
+        body=json.dumps(statement, separators=(",", ":")).encode(),
+        etag=f'"{hashlib.sha256(stable.encode()).hexdigest()[:32]}"',
+    )
@@ -0,0 +1,437 @@
+"""FHIR ``transaction`` and ``batch`` Bundle processing.
+
+Entries are grouped by resource type and written with one ``bulk_create``
+and one ``bulk_update`` per type instead of a save per entry. ``urn:uuid``
+references between entries are rewritten to the ids assigned by the server
+before anything is written.
+
+Observation writes also refresh the numeric time series behind the trends
+endpoint (:mod:`services.observation_series`), and new observations are
+checked against the alert rules (:mod:`services.observation_alerts`).
+Appointment writes take the practitioner day locks of
+:mod:`services.appointment_booking`, and an appointment that would overlap
+another fails with 409. They evict the cached availability of the practitioner
+days they touch (:mod:`services.appointment_availability`), and slots freed by
+cancelled, moved or deleted appointments are offered to the waitlist
+(:mod:`services.appointment_waitlist`).
+
+Transactions run in a single database transaction and fail as a whole.
+Batch entries are independent: each resource type is written in its own
+savepoint, and if a bulk write raises anything the entries of that type are
+retried one by one so that a single bad entry only fails itself. Every entry is
+logged to :class:`~services.models.FhirGatewayRequest` with one bulk insert.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from uuid import uuid4
+
+from django.db import DatabaseError, models, transaction
+from django.utils import timezone
+
+from . import (
+    appointment_availability,
+    appointment_booking,
+    appointment_waitlist,
+    observation_alerts,
+    observation_series,
+    resource_cache,
+    resource_history,
+)
+from .appointment_booking import record_fields as appointment_fields
+from .fhir_utils import first_code, instant, operation_outcome
+from .models import (
+    AppointmentRecord,
+    FhirGatewayRequest,
+    ObservationRecord,
+    PatientNameToken,
+    PatientRecord,
+)
+from .patient_matching import name_tokens
+from .patient_records import cache_on_commit, history_change, record_fields as patient_fields
+from .sample_utils import generate_identifier
+
+TRANSACTION = "transaction"
+BATCH = "batch"
+
+# Entries are processed in the order required for transactions.
+METHOD_ORDER = ("DELETE", "POST", "PUT", "GET")
+
+STATUS_TEXT = {
+    200: "200 OK",
+    201: "201 Created",
+    204: "204 No Content",
+    400: "400 Bad Request",
+    404: "404 Not Found",
+    409: "409 Conflict",
+    500: "500 Internal Server Error",
+}
+
+BULK_BATCH_SIZE = 500
+
+
+class BundleError(ValueError):
+    """Raised for bundles that cannot be processed at all."""
+
+
+def observation_fields(resource: dict[str, Any]) -> dict[str, Any]:
+    subject = resource.get("subject") or {}
+    if not isinstance(subject, dict):
+        raise ValueError("Observation.subject must be a Reference object")
+    return {
+        "patient_reference": str(subject.get("reference") or "")[:128],
+        "category": first_code(resource.get("category"))[:64],
+        "code": first_code(resource.get("code"))[:64],
+        "status": str(resource.get("status") or "")[:32],
+        "effective_datetime": instant(resource.get("effectiveDateTime")),
+        "data": resource,
+    }
+
+
+@dataclass(frozen=True)
+class ResourceType:
+    model: type[models.Model]
+    id_field: str
+    fields: Callable[[dict[str, Any]], dict[str, Any]]
+    versioned: bool = False
+
+    @property
+    def update_fields(self) -> list[str]:
+        extra = ["updated_at", "version_id"] if self.versioned else ["updated_at"]
+        return [*self.fields({}), *extra]
+
+
+RESOURCE_TYPES = {
+    "Patient": ResourceType(PatientRecord, "patient_id", patient_fields, versioned=True),
+    "Observation": ResourceType(ObservationRecord, "observation_id", observation_fields),
+    "Appointment": ResourceType(AppointmentRecord, "appointment_id", appointment_fields),
+}
+
+
+@dataclass
+class Entry:
+    index: int
+    method: str
+    resource_type: str = ""
+    resource_id: str = ""
+    resource: dict[str, Any] | None = None
+    full_url: str = ""
+    status: int = 0
+    outcome: dict[str, Any] | None = None
+
+    def fail(self, status: int, diagnostics: str) -> None:
+        self.status = status
+        self.outcome = operation_outcome(diagnostics, code="processing")
+
+    @property
+    def failed(self) -> bool:
+        return self.status >= 400
+
+    def response(self) -> dict[str, Any]:
+        response: dict[str, Any] = {"status": STATUS_TEXT.get(self.status, str(self.status))}
+        if self.status in (200, 201) and self.method != "GET":
+            response["location"] = f"{self.resource_type}/{self.resource_id}"
+        if self.outcome is not None:
+            response["outcome"] = self.outcome
+        entry: dict[str, Any] = {"response": response}
+        if self.full_url:
+            entry["fullUrl"] = self.full_url
+        if self.method == "GET" and self.resource is not None and not self.failed:
+            entry["resource"] = self.resource
+        return entry
+
+
+@dataclass
+class BundleResult:
+    bundle_type: str
+    entries: list[Entry] = field(default_factory=list)
+    error: str = ""
+
+    def as_bundle(self) -> dict[str, Any]:
+        return {
+            "resourceType": "Bundle",
+            "id": str(uuid4()),
+            "type": f"{self.bundle_type}-response",
+            "entry": [entry.response() for entry in self.entries],
+        }
+
+
+def _parse_entry(index: int, raw: Any) -> Entry:
+    if not isinstance(raw, dict):
+        entry = Entry(index, "")
+        entry.fail(400, "Bundle entry must be an object")
+        return entry
+    request = raw.get("request") or {}
+    if not isinstance(request, dict):
+        entry = Entry(index, "")
+        entry.fail(400, "Bundle entry request must be an object")
+        return entry
+    method = str(request.get("method") or "").upper()
+    url = str(request.get("url") or "").split("?", 1)[0].strip("/")
+    entry = Entry(index, method, full_url=str(raw.get("fullUrl") or ""))
+    resource_type, _, resource_id = url.partition("/")
+    entry.resource_type, entry.resource_id = resource_type, resource_id
+    if method not in METHOD_ORDER:
+        entry.fail(400, f"Unsupported request method: {method or '(missing)'}")
+    elif resource_type not in RESOURCE_TYPES:
+        entry.fail(400, f"Unsupported resource type: {resource_type or '(missing)'}")
+    elif method == "POST":
+        entry.resource_id = uuid4().hex
+    elif not resource_id or "/" in resource_id:
+        entry.fail(400, f"{method} requires a url of the form {resource_type}/<id>")
+
+    if method in ("POST", "PUT") and not entry.failed:
+        resource = raw.get("resource")
+        if not isinstance(resource, dict) or resource.get("resourceType") != resource_type:
+            entry.fail(400, f"Entry resource must be a {resource_type}")
+            return entry
+        try:
+            RESOURCE_TYPES[resource_type].fields(resource)
+        except ValueError as exc:
+            entry.fail(400, str(exc))
+            return entry
+        except (AttributeError, TypeError):
+            entry.fail(400, f"Entry resource is not a valid {resource_type}")
+            return entry
+        entry.resource = {**resource, "id": entry.resource_id}
+    return entry
+
+
+def _rewrite_references(value: Any, mapping: dict[str, str]) -> Any:
+    if isinstance(value, dict):
+        return {
+            key: mapping.get(item, item) if key == "reference" and isinstance(item, str)
+            else _rewrite_references(item, mapping)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_rewrite_references(item, mapping) for item in value]
+    return value
+
+
+def _resolve_references(entries: list[Entry]) -> None:
+    """Point ``urn:uuid`` references at the ids assigned to created entries."""
+
+    mapping = {
+        entry.full_url: f"{entry.resource_type}/{entry.resource_id}"
+        for entry in entries
+        if entry.full_url.startswith("urn:uuid:") and entry.resource is not None
+    }
+    if not mapping:
+        return
+    for entry in entries:
+        if entry.resource is not None:
+            entry.resource = _rewrite_references(entry.resource, mapping)
+
+
+def _reject_duplicates(entries: list[Entry]) -> None:
+    seen = set()
+    for entry in entries:
+        if entry.failed or entry.method == "GET":
+            continue
+        key = (entry.resource_type, entry.resource_id)
+        if key in seen:
+            entry.fail(400, f"Bundle contains more than one entry for {entry.resource_type}/{entry.resource_id}")
+        seen.add(key)
+
+
+def _reindex_patients(patient_ids: list[str]) -> None:
+    """Rebuild the name index of written patients with two bulk statements."""
+
+    records = PatientRecord.objects.filter(patient_id__in=patient_ids).only("pk", "data")
+    PatientNameToken.objects.filter(patient__patient_id__in=patient_ids).delete()
+    PatientNameToken.objects.bulk_create(
+        (
+            PatientNameToken(patient_id=record.pk, part=part, normalized=normalized, phonetic=phonetic)
+            for record in records
+            for part, normalized, phonetic in name_tokens(record.data)
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def _write(resource_type: str, entries: list[Entry]) -> None:
+    """Apply the DELETE, POST and PUT entries of one resource type in bulk."""
+
+    spec = RESOURCE_TYPES[resource_type]
+    manager = spec.model.objects
+    deletes = [entry for entry in entries if entry.method == "DELETE"]
+    writes = [entry for entry in entries if entry.method in ("POST", "PUT")]
+    now = timezone.now()
+    if deletes:
+        deleted = manager.filter(**{f"{spec.id_field}__in": [entry.resource_id for entry in deletes]})
+        if spec.versioned:
+            versions = dict(deleted.values_list(spec.id_field, "version_id"))
+            resource_history.record(
+                resource_history.Change(resource_type, resource_id, version + 1, now, None)
+                for resource_id, version in versions.items()
+            )
+            resource_cache.evict_on_commit(resource_type, versions)
+        if spec.model is ObservationRecord:
+            observation_series.sync_observations(deleted_ids=[entry.resource_id for entry in deletes])
+        elif spec.model is AppointmentRecord:
+            removed = list(deleted.only("practitioner_reference", "start", "end", "status"))
+            appointment_availability.invalidate_on_commit(appointment_availability.appointment_days(removed))
+            appointment_waitlist.fill_on_commit(appointment_waitlist.occupied(removed))
+        deleted.delete()
+        for entry in deletes:
+            entry.status = 204
+    if spec.model is AppointmentRecord and writes:
+        overlapping = appointment_booking.conflicts(
+            AppointmentRecord(appointment_id=entry.resource_id, **spec.fields(entry.resource)) for entry in writes
+        )
+        for entry in writes:
+            if entry.resource_id in overlapping:
+                entry.fail(409, f"Overlaps Appointment/{overlapping[entry.resource_id]} of the same practitioner")
+        writes = [entry for entry in writes if not entry.failed]
+    if not writes:
+        return
+
+    existing = manager.in_bulk([entry.resource_id for entry in writes], field_name=spec.id_field)
+    # What updated appointments occupied before this write.
+    vacated, released = set(), set()
+    if spec.model is AppointmentRecord:
+        vacated = appointment_availability.appointment_days(existing.values())
+        released = appointment_waitlist.occupied(existing.values())
+    created_ids = [entry.resource_id for entry in writes if entry.resource_id not in existing]
+    first_versions = resource_history.next_versions(resource_type, created_ids) if spec.versioned else {}
+    creates, updates, previous = [], [], {}
+    for entry in writes:
+        values = spec.fields(entry.resource)
+        record = existing.get(entry.resource_id)
+        if record is None:
+            record = spec.model(**{spec.id_field: entry.resource_id}, **values)
+            if spec.versioned:
+                record.version_id = first_versions[entry.resource_id]
+            creates.append(record)
+            entry.status = 201
+        else:
+            previous[entry.resource_id] = record.data
+            for name, value in values.items():
+                setattr(record, name, value)
+            record.updated_at = now
+            if spec.versioned:
+                record.version_id += 1
+            updates.append(record)
+            entry.status = 200
+    manager.bulk_create(creates, batch_size=BULK_BATCH_SIZE)
+    manager.bulk_update(updates, spec.update_fields, batch_size=BULK_BATCH_SIZE)
+    if spec.model is PatientRecord:
+        _reindex_patients([entry.resource_id for entry in writes])
+        resource_history.record(
+            history_change(record, previous.get(record.patient_id)) for record in creates + updates
+        )
+        cache_on_commit(creates + updates)
+    elif spec.model is ObservationRecord:
+        samples = observation_series.sync_observations(creates + updates)
+        if created_ids:
+            created = set(created_ids)
+            observation_alerts.enqueue_alerts(sample for sample in samples if sample.observation_id in created)
+    elif spec.model is AppointmentRecord:
+        occupied = appointment_availability.appointment_days(creates + updates)
+        appointment_availability.invalidate_on_commit(vacated | occupied)
+        appointment_waitlist.fill_on_commit(released - appointment_waitlist.occupied(creates + updates))
+
+
+def _read(resource_type: str, entries: list[Entry]) -> None:
+    spec = RESOURCE_TYPES[resource_type]
+    found = dict(
+        spec.model.objects.filter(
+            **{f"{spec.id_field}__in": [entry.resource_id for entry in entries]}
+        ).values_list(spec.id_field, "data")
+    )
+    for entry in entries:
+        if entry.resource_id in found:
+            entry.resource = {**found[entry.resource_id], "resourceType": resource_type, "id": entry.resource_id}
+            entry.status = 200
+        else:
+            entry.fail(404, f"{resource_type}/{entry.resource_id} not found")
+
+
+def _by_type(entries: list[Entry], methods: tuple[str, ...]) -> dict[str, list[Entry]]:
+    groups: dict[str, list[Entry]] = {}
+    for entry in entries:
+        if not entry.failed and entry.method in methods:
+            groups.setdefault(entry.resource_type, []).append(entry)
+    return groups
+
+
+def _execute(entries: list[Entry], *, independent: bool) -> None:
+    for resource_type, group in _by_type(entries, ("DELETE", "POST", "PUT")).items():
+        if not independent:
+            _write(resource_type, group)
+            continue
+        try:
+            with transaction.atomic():
+                _write(resource_type, group)
+        except Exception:
+            # Isolate the failing entries of this type.
+            for entry in group:
+                if entry.failed:
+                    continue
+                try:
+                    with transaction.atomic():
+                        _write(resource_type, [entry])
+                except Exception as exc:
+                    entry.fail(500, str(exc))
+    for resource_type, group in _by_type(entries, ("GET",)).items():
+        _read(resource_type, group)
+
+
+def _log(result: BundleResult) -> None:
+    FhirGatewayRequest.objects.bulk_create(
+        (
+            FhirGatewayRequest(
+                request_id=generate_identifier("request"),
+                resource_type=entry.resource_type[:64],
+                resource_id=entry.resource_id[:64],
+                method=entry.method[:16],
+                status_code=entry.status,
+                response_payload=entry.response()["response"],
+            )
+            for entry in result.entries
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def process_bundle(bundle: dict[str, Any]) -> BundleResult:
+    """Process a ``transaction`` or ``batch`` Bundle and return the per-entry outcome."""
+
+    bundle_type = bundle.get("type") if isinstance(bundle, dict) else None
+    if not isinstance(bundle, dict) or bundle.get("resourceType") != "Bundle":
+        raise BundleError("Request body must be a Bundle")
+    if bundle_type not in (TRANSACTION, BATCH):
+        raise BundleError(f"Unsupported Bundle type: {bundle_type!r}")
+    raw_entries = bundle.get("entry") or []
+    if not isinstance(raw_entries, list):
+        raise BundleError("Bundle.entry must be a list")
+
+    entries = [_parse_entry(index, raw) for index, raw in enumerate(raw_entries)]
+    _reject_duplicates(entries)
+    _resolve_references(entries)
+    result = BundleResult(bundle_type, entries)
+
+    if bundle_type == BATCH:
+        _execute(entries, independent=True)
+    else:
+        failed = next((entry for entry in entries if entry.failed), None)
+        if failed is not None:
+            result.error = f"Entry {failed.index} is invalid; the transaction was not applied"
+        else:
+            try:
+                with transaction.atomic():
+                    _execute(entries, independent=False)
+                    failed = next((entry for entry in entries if entry.failed), None)
+                    if failed is not None:
+                        raise BundleError(f"Entry {failed.index} failed; the transaction was rolled back")
+            except (BundleError, DatabaseError) as exc:
+                result.error = str(exc)
+        if result.error:
+            for entry in entries:
+                if not entry.failed:
+                    entry.fail(409, "Not applied because the transaction failed")
+    _log(result)
+    return result
@@ -1,8 +1,17 @@
 from django.urls import path
-from .views import fhir_gateway
+from .views import fhir_gateway, patients
 
 urlpatterns = [
     path('metadata', fhir_gateway.get_capability_statement),
+    path('Patient', patients.search),
+    path('Patient/_history', fhir_gateway.patient_type_history),
+    path('Patient/<str:patient_id>/_history', fhir_gateway.patient_history),
+    path('Patient/<str:patient_id>/_history/<int:version_id>', fhir_gateway.get_patient_version),
     path('Patient/<str:patient_id>', fhir_gateway.get_patient),
+    path('$export', fhir_gateway.system_export),
+    path('Group/<str:group_id>/$export', fhir_gateway.group_export),
+    path('Group/<str:group_id>', fhir_gateway.group),
+    path('bulk-status/<str:job_id>', fhir_gateway.bulk_status),
+    path('bulk-files/<str:job_id>/<str:resource_type>.ndjson', fhir_gateway.bulk_file),
     path('', fhir_gateway.batch_operations),
 ]
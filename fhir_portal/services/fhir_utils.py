@@ -0,0 +1,41 @@
+"""Small helpers shared by the FHIR-facing views."""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone as dt_timezone
+from typing import Any
+
+from django.utils import timezone
+
+from .models import parse_date
+
+
+def operation_outcome(diagnostics: str, *, code: str = "invalid", severity: str = "error") -> dict:
+    """Return a single-issue FHIR ``OperationOutcome``."""
+
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": severity, "code": code, "diagnostics": diagnostics}],
+    }
+
+
+def first_code(value: Any) -> str:
+    """Return the first ``coding.code`` (or ``text``) of a CodeableConcept or list of them."""
+
+    if isinstance(value, list):
+        value = value[0] if value else {}
+    if not isinstance(value, dict):
+        return ""
+    for coding in value.get("coding") or []:
+        if isinstance(coding, dict) and coding.get("code"):
+            return str(coding["code"])
+    return str(value.get("text") or "")
+
+
+def instant(value: Any) -> datetime | None:
+    """Parse a FHIR ``instant``/``dateTime`` string; naive values are taken as UTC."""
+
+    parsed = parse_date(value) if isinstance(value, str) else None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
@@ -0,0 +1,29 @@
+"""Change counters for the in-process indexes.
+
+Several modules keep a table in process memory: alert rules, the
+appointment waitlist, role assignments and revoked tokens. Every change to
+one of those tables also increments the :class:`~services.models.IndexGeneration`
+row named after it, in the same transaction. Each process reads the counter
+at most once per reload interval, which is a single indexed lookup, and
+rebuilds its index when the counter has moved. Changes therefore reach every
+worker whatever cache backend is configured.
+"""
+
+from __future__ import annotations
+
+from django.db.models import F
+
+from .models import IndexGeneration
+
+
+def current(name: str) -> int:
+    generation = IndexGeneration.objects.filter(name=name).values_list("generation", flat=True).first()
+    return generation or 0
+
+
+def bump(name: str) -> None:
+    """Record a change to the rows behind index ``name``."""
+
+    if not IndexGeneration.objects.filter(name=name).update(generation=F("generation") + 1):
+        IndexGeneration.objects.bulk_create([IndexGeneration(name=name, generation=0)], ignore_conflicts=True)
+        IndexGeneration.objects.filter(name=name).update(generation=F("generation") + 1)
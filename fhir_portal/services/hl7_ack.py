@@ -0,0 +1,108 @@
+"""HL7 v2 acknowledgement (ACK/MSA) generation.
+
+Single messages are answered with an original-mode ``ACK``. Batches are
+answered with an HL7 batch acknowledgement: a ``BHS`` header, one ``ACK`` per
+message and a ``BTS`` trailer carrying the message count.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Iterator
+from uuid import uuid4
+
+from django.utils import timezone
+
+from .hl7_parser import HL7ParseError, iter_segments
+
+ACCEPT = "AA"
+ERROR = "AE"
+REJECT = "AR"
+
+DEFAULT_ENCODING = "^~\\&"
+DEFAULT_VERSION = "2.5.1"
+
+
+def _timestamp() -> str:
+    return timezone.now().strftime("%Y%m%d%H%M%S")
+
+
+def _control_id() -> str:
+    # MSH-10 and BHS-11 are limited to 20 characters.
+    return uuid4().hex[:20]
+
+
+def ack_code(status: str) -> str:
+    """Map a stored :class:`~services.models.HL7Message` status to MSA-1."""
+
+    return ACCEPT if status == "processed" else ERROR
+
+
+def build_ack(raw: str, code: str = ACCEPT, text: str = "", *, timestamp: str | None = None) -> str:
+    """Return an ACK for ``raw`` with acknowledgement ``code`` in MSA-1.
+
+    Sending and receiving application/facility are swapped from the original
+    MSH and MSA-2 echoes its control id. Messages without a readable MSH
+    segment are acknowledged with default delimiters and an empty MSA-2.
+    Only the MSH segment of ``raw`` is scanned.
+    """
+
+    try:
+        msh = next(iter_segments(raw))
+    except (HL7ParseError, StopIteration):
+        msh = None
+
+    if msh is not None and msh.name == "MSH":
+        separator = msh.field(1)
+        encoding = msh.field(2)
+        receiving = (msh.value(5), msh.value(6))
+        sending = (msh.value(3), msh.value(4))
+        trigger = msh.value(9, 2)
+        control_id = msh.value(10)
+        processing_id = msh.value(11) or "P"
+        version = msh.value(12) or DEFAULT_VERSION
+    else:
+        separator, encoding = "|", DEFAULT_ENCODING
+        receiving = sending = ("", "")
+        trigger = control_id = ""
+        processing_id, version = "P", DEFAULT_VERSION
+
+    component = encoding[0] if encoding else "^"
+    message_type = component.join(("ACK", trigger, "ACK")) if trigger else "ACK"
+    header = separator.join(
+        (
+            "MSH",
+            encoding,
+            *receiving,
+            *sending,
+            timestamp or _timestamp(),
+            "",
+            message_type,
+            _control_id(),
+            processing_id,
+            version,
+        )
+    )
+    msa = separator.join(("MSA", code, control_id, text.replace(separator, " ")))
+    return f"{header}\r{msa}\r"
+
+
+def iter_batch_ack(
+    reference_batch_id: str,
+    outcomes: Iterable[tuple[str, str, str]],
+) -> Iterator[str]:
+    """Yield a batch acknowledgement for ``(raw, code, text)`` outcomes.
+
+    The output is produced incrementally, so very large batches can be
+    streamed to the sender without building the whole document in memory.
+    ``BHS-12`` references the batch being acknowledged.
+    """
+
+    timestamp = _timestamp()
+    yield "|".join(
+        ("BHS", DEFAULT_ENCODING, "", "", "", "", timestamp, "", "", "", _control_id(), reference_batch_id)
+    ) + "\r"
+    count = 0
+    for raw, code, text in outcomes:
+        count += 1
+        yield build_ack(raw, code, text, timestamp=timestamp)
+    yield f"BTS|{count}\r"
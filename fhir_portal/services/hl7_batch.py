@@ -0,0 +1,177 @@
+"""Batch HL7 v2 ingestion backed by a process pool.
+
+Parsing is CPU bound, so large batches are split into chunks that are parsed
+in worker processes (outside the GIL) while the parent process writes each
+finished chunk with a single ``bulk_create`` and advances the counters on
+:class:`~services.models.HL7BatchRequest`.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import Sequence
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .hl7_parser import parse_many
+from .models import HL7BatchRequest, HL7Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_UPDATE_FIELDS = [
+    "correlation_id",
+    "status",
+    "raw_message",
+    "fhir_resources",
+    "errors",
+    "processed_at",
+    "updated_at",
+]
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the shared worker pool, creating it on first use.
+
+    Workers are spawned rather than forked so that they never inherit the
+    parent's database connections.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.HL7_BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _chunks(messages: Sequence[tuple[str, str]], size: int):
+    for start in range(0, len(messages), size):
+        yield messages[start:start + size]
+
+
+def store_outcomes(
+    batch: HL7BatchRequest,
+    chunk: Sequence[tuple[str, str]],
+    outcomes: Sequence[tuple[str, str, str, list, list]],
+) -> None:
+    """Persist one parsed chunk and advance the batch counters atomically."""
+
+    now = timezone.now()
+    rows: dict[tuple[str, str], HL7Message] = {}
+    failed = 0
+    for (_, raw), (message_id, sender, status, resources, errors) in zip(chunk, outcomes):
+        failed += status == "failed"
+        rows[sender, message_id] = HL7Message(
+            sender=sender,
+            message_id=message_id,
+            correlation_id=batch.batch_id,
+            status=status,
+            raw_message=raw,
+            fhir_resources=resources,
+            errors=errors,
+            processed_at=now,
+        )
+    options = {"update_conflicts": True, "update_fields": MESSAGE_UPDATE_FIELDS}
+    if connection.features.supports_update_conflicts_with_target:
+        options["unique_fields"] = ["sender", "message_id"]
+    with transaction.atomic():
+        HL7Message.objects.bulk_create(list(rows.values()), **options)
+        HL7BatchRequest.objects.filter(pk=batch.pk).update(
+            processed=F("processed") + (len(outcomes) - failed),
+            failed=F("failed") + failed,
+            status="processing",
+        )
+
+
+def process_batch(
+    batch: HL7BatchRequest,
+    messages: Sequence[tuple[str, str]],
+    *,
+    executor: Executor | None = None,
+) -> HL7BatchRequest:
+    """Parse and store ``messages`` (``(message_id, raw)`` pairs) for ``batch``.
+
+    Without an ``executor`` the chunks are parsed in the calling thread. With
+    one, at most two chunks per worker are kept in flight so that a very large
+    batch is never pickled to the workers all at once.
+    """
+
+    started = time.perf_counter()
+    chunks = _chunks(messages, settings.HL7_BATCH_CHUNK_SIZE)
+    status = "completed"
+    try:
+        if executor is None:
+            for chunk in chunks:
+                store_outcomes(batch, chunk, parse_many(chunk))
+        else:
+            in_flight_limit = 2 * max(settings.HL7_BATCH_WORKERS, 1)
+            pending = {}
+            for chunk in chunks:
+                if len(pending) >= in_flight_limit:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        store_outcomes(batch, pending.pop(future), future.result())
+                pending[executor.submit(parse_many, chunk)] = chunk
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store_outcomes(batch, pending.pop(future), future.result())
+    except Exception:
+        logger.exception("HL7 batch %s failed", batch.batch_id)
+        status = "failed"
+        if executor is _executor:
+            _reset_executor()
+
+    HL7BatchRequest.objects.filter(pk=batch.pk).update(
+        status=status,
+        processing_time=f"{time.perf_counter() - started:.2f}s",
+    )
+    batch.refresh_from_db()
+    return batch
+
+
+def start_batch(batch: HL7BatchRequest, messages: Sequence[tuple[str, str]]) -> threading.Thread:
+    """Process ``batch`` on a background thread using the shared worker pool."""
+
+    def run() -> None:
+        try:
+            process_batch(batch, messages, executor=get_executor())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name=f"hl7-batch-{batch.batch_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def serialize_batch(batch: HL7BatchRequest) -> dict:
+    """Render a batch in the ``/hl7-parser/batch`` response shape."""
+
+    return {
+        "batchId": batch.batch_id,
+        "totalMessages": batch.total_messages,
+        "processed": batch.processed,
+        "failed": batch.failed,
+        "processingTime": batch.processing_time or "0s",
+        "status": batch.status,
+    }
@@ -0,0 +1,114 @@
+"""Persistence path shared by every HL7 v2 entry point.
+
+Whatever transport delivers a message, it ends up here: the raw text is
+parsed with :mod:`services.hl7_parser` and the outcome is written to
+:class:`~services.models.HL7Message`.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Iterator
+
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .hl7_ack import REJECT, ack_code, build_ack, iter_batch_ack
+from .hl7_parser import HL7ParseError, parse_message
+from .models import HL7Message
+from .sample_utils import generate_identifier, isoformat
+
+logger = logging.getLogger(__name__)
+
+ACK_PAGE_SIZE = 2000
+
+
+def ingest_message(raw: str, *, correlation_id: str = "") -> HL7Message:
+    """Parse ``raw`` and persist the result, returning the stored message.
+
+    Messages that fail to parse are stored with ``status="failed"`` so that
+    ``parse-status`` can report the error back to the sender. Without an
+    explicit ``correlation_id`` the sender's own control id (MSH-10) is used.
+    A repeated control id replaces the stored message only when it comes from
+    the same sending application and facility (MSH-3/MSH-4).
+    """
+
+    try:
+        parsed = parse_message(raw)
+    except HL7ParseError as exc:
+        return HL7Message.objects.create(
+            message_id=generate_identifier("msg"),
+            correlation_id=correlation_id,
+            status="failed",
+            raw_message=raw,
+            errors=[str(exc)],
+            processed_at=timezone.now(),
+        )
+
+    message, _ = HL7Message.objects.update_or_create(
+        sender=parsed.sender,
+        message_id=parsed.control_id or generate_identifier("msg"),
+        defaults={
+            "correlation_id": correlation_id or parsed.control_id,
+            "status": "processed",
+            "raw_message": raw,
+            "fhir_resources": parsed.resources,
+            "errors": [],
+            "processed_at": timezone.now(),
+        },
+    )
+    return message
+
+
+def ingest_with_ack(raw: str) -> str:
+    """Ingest ``raw`` and return the ACK (``AA``) or NAK (``AE``) for it.
+
+    A storage failure is answered with ``AR`` so that the sender retries.
+    """
+
+    try:
+        message = ingest_message(raw)
+    except DatabaseError:
+        logger.exception("Failed to store HL7 message")
+        return build_ack(raw, REJECT, "Message could not be stored")
+    return build_ack(raw, ack_code(message.status), "; ".join(message.errors))
+
+
+def _correlated_outcomes(correlation_id: str) -> Iterator[tuple[str, str, str]]:
+    last_pk = 0
+    while True:
+        rows = list(
+            HL7Message.objects.filter(correlation_id=correlation_id, pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "raw_message", "status", "errors")[:ACK_PAGE_SIZE]
+        )
+        for _, raw, status, errors in rows:
+            yield raw, ack_code(status), "; ".join(errors)
+        if len(rows) < ACK_PAGE_SIZE:
+            return
+        last_pk = rows[-1][0]
+
+
+def iter_correlated_acks(correlation_id: str) -> Iterator[str]:
+    """Stream a batch acknowledgement for every message with ``correlation_id``.
+
+    Rows are read through the ``correlation_id`` index in keyset pages of
+    ``ACK_PAGE_SIZE`` (``pk > last``). MySQL's client library buffers a whole
+    result set even for ``.iterator()``, so paging is what keeps a large
+    batch out of memory.
+    """
+
+    return iter_batch_ack(correlation_id, _correlated_outcomes(correlation_id))
+
+
+def serialize_message(message: HL7Message) -> dict:
+    """Render a stored message in the ``/hl7-parser/ingest`` response shape."""
+
+    return {
+        "messageId": message.message_id,
+        "correlationId": message.correlation_id,
+        "status": message.status,
+        "timestamp": isoformat(message.processed_at or message.created_at),
+        "fhirResources": message.fhir_resources,
+        "errors": message.errors,
+    }
@@ -0,0 +1,562 @@
+"""Incremental HL7 v2 parser that maps segments onto FHIR resources.
+
+The parser walks the raw message exactly once per segment, recording the
+offsets of field separators instead of splitting the text into lists of
+strings. Field, repetition and component values are sliced out lazily only
+when a mapper asks for them, which keeps the per-message allocation count low
+on the ingest hot path.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+from .sample_utils import generate_identifier
+
+LOINC_SYSTEM = "http://loinc.org"
+UCUM_SYSTEM = "http://unitsofmeasure.org"
+
+CODING_SYSTEMS = {
+    "LN": LOINC_SYSTEM,
+    "LOINC": LOINC_SYSTEM,
+    "SCT": "http://snomed.info/sct",
+    "SNM": "http://snomed.info/sct",
+    "I10": "http://hl7.org/fhir/sid/icd-10",
+    "UCUM": UCUM_SYSTEM,
+}
+
+GENDERS = {"M": "male", "F": "female", "O": "other", "A": "other", "U": "unknown"}
+
+OBSERVATION_STATUSES = {
+    "F": "final",
+    "P": "preliminary",
+    "C": "corrected",
+    "X": "cancelled",
+    "D": "entered-in-error",
+    "W": "entered-in-error",
+    "R": "registered",
+    "I": "registered",
+}
+
+ORDER_STATUSES = {
+    "CM": "completed",
+    "CA": "revoked",
+    "DC": "revoked",
+    "HD": "on-hold",
+    "IP": "active",
+    "SC": "active",
+    "A": "active",
+}
+
+
+class HL7ParseError(ValueError):
+    """Raised when a payload cannot be interpreted as an HL7 v2 message."""
+
+
+class Delimiters:
+    """Encoding characters declared in MSH-1 and MSH-2."""
+
+    __slots__ = ("field", "component", "repetition", "escape", "subcomponent")
+
+    def __init__(self, field: str, encoding: str) -> None:
+        self.field = field
+        self.component = encoding[0] if len(encoding) > 0 else "^"
+        self.repetition = encoding[1] if len(encoding) > 1 else "~"
+        self.escape = encoding[2] if len(encoding) > 2 else "\\"
+        self.subcomponent = encoding[3] if len(encoding) > 3 else "&"
+
+
+class Segment:
+    """A view over one segment of the raw message.
+
+    Only the start offsets of each field are stored. Values are sliced from
+    the shared message text on demand.
+    """
+
+    __slots__ = ("name", "_text", "_bounds", "_delims", "_shift")
+
+    def __init__(self, text: str, start: int, end: int, delims: Delimiters) -> None:
+        find = text.find
+        separator = delims.field
+        bounds = [start]
+        index = find(separator, start, end)
+        while index != -1:
+            bounds.append(index + 1)
+            index = find(separator, index + 1, end)
+        bounds.append(end + 1)
+        self.name = text[start:start + 3]
+        self._text = text
+        self._bounds = bounds
+        self._delims = delims
+        # MSH-1 is the field separator itself, so MSH fields are shifted by one.
+        self._shift = 1 if self.name == "MSH" else 0
+
+    def _span(self, index: int) -> tuple[int, int]:
+        position = index - self._shift
+        bounds = self._bounds
+        if position < 0 or position + 1 >= len(bounds):
+            return 0, 0
+        return bounds[position], bounds[position + 1] - 1
+
+    def _piece(self, separator: str, start: int, end: int, number: int) -> tuple[int, int]:
+        find = self._text.find
+        while number > 1:
+            index = find(separator, start, end)
+            if index == -1:
+                return end, end
+            start = index + 1
+            number -= 1
+        index = find(separator, start, end)
+        return start, end if index == -1 else index
+
+    def _decode(self, start: int, end: int) -> str:
+        value = self._text[start:end]
+        if self._delims.escape in value:
+            return unescape(value, self._delims)
+        return value
+
+    def field(self, index: int) -> str:
+        """Return the raw text of field ``index`` (HL7 1-based numbering)."""
+
+        if self._shift and index == 1:
+            return self._delims.field
+        start, end = self._span(index)
+        return self._decode(start, end)
+
+    def repetition_count(self, index: int) -> int:
+        start, end = self._span(index)
+        if start == end:
+            return 0
+        return self._text.count(self._delims.repetition, start, end) + 1
+
+    def value(
+        self,
+        index: int,
+        component: int = 1,
+        repetition: int = 1,
+        subcomponent: int | None = None,
+    ) -> str:
+        """Return a single component, optionally narrowed to a subcomponent."""
+
+        position = index - self._shift
+        bounds = self._bounds
+        if position < 0 or position + 1 >= len(bounds):
+            return ""
+        start = bounds[position]
+        end = bounds[position + 1] - 1
+        if start == end:
+            return ""
+        if self._shift and index == 2:
+            return self._text[start:end]
+        delims = self._delims
+        if component == 1 and repetition == 1 and subcomponent is None:
+            # Fast path: the first component ends at whichever separator comes first.
+            find = self._text.find
+            stop = find(delims.component, start, end)
+            if stop != -1:
+                end = stop
+            stop = find(delims.repetition, start, end)
+            if stop != -1:
+                end = stop
+            return self._decode(start, end)
+        start, end = self._piece(delims.repetition, start, end, repetition)
+        start, end = self._piece(delims.component, start, end, component)
+        if subcomponent is not None:
+            start, end = self._piece(delims.subcomponent, start, end, subcomponent)
+        return self._decode(start, end)
+
+    def components(self, index: int, count: int, repetition: int = 1) -> tuple[str, ...]:
+        """Return the first ``count`` components of a field in one scan."""
+
+        start, end = self._span(index)
+        if start == end:
+            return ("",) * count
+        delims = self._delims
+        start, end = self._piece(delims.repetition, start, end, repetition)
+        find = self._text.find
+        values = []
+        for _ in range(count):
+            index_ = find(delims.component, start, end)
+            stop = end if index_ == -1 else index_
+            values.append(self._decode(start, stop))
+            start = end if index_ == -1 else index_ + 1
+        return tuple(values)
+
+
+def unescape(value: str, delims: Delimiters) -> str:
+    """Resolve the standard HL7 escape sequences (``\\F\\``, ``\\S\\`` ...)."""
+
+    escape = delims.escape
+    replacements = {
+        "F": delims.field,
+        "S": delims.component,
+        "T": delims.subcomponent,
+        "R": delims.repetition,
+        "E": escape,
+        ".br": "\n",
+    }
+    parts = []
+    position = 0
+    while True:
+        start = value.find(escape, position)
+        if start == -1:
+            break
+        end = value.find(escape, start + 1)
+        if end == -1:
+            break
+        token = value[start + 1:end]
+        if token in replacements:
+            parts.append(value[position:start])
+            parts.append(replacements[token])
+        else:
+            parts.append(value[position:end + 1])
+        position = end + 1
+    if not parts:
+        return value
+    parts.append(value[position:])
+    return "".join(parts)
+
+
+def _delimiters(raw: str) -> tuple[int, Delimiters]:
+    start = raw.find("MSH")
+    if start == -1 or len(raw) < start + 8:
+        raise HL7ParseError("Message does not start with an MSH segment")
+    separator = raw[start + 3]
+    encoding_end = raw.find(separator, start + 4)
+    if encoding_end == -1:
+        raise HL7ParseError("MSH segment is missing its encoding characters")
+    return start, Delimiters(separator, raw[start + 4:encoding_end])
+
+
+def _segment_spans(raw: str, start: int) -> Iterator[tuple[int, int]]:
+    terminator = "\r" if "\r" in raw else "\n"
+    find = raw.find
+    length = len(raw)
+    while start < length:
+        end = find(terminator, start)
+        if end == -1:
+            end = length
+        # Skip blank lines and the ``\n`` half of ``\r\n`` pairs.
+        while start < end and raw[start] in "\r\n":
+            start += 1
+        if end - start >= 3:
+            yield start, end
+        start = end + 1
+
+
+def iter_segments(raw: str) -> Iterator[Segment]:
+    """Yield segments of ``raw`` lazily.
+
+    Segments may be terminated by ``\\r`` (the standard), ``\\n`` or ``\\r\\n``.
+    """
+
+    start, delims = _delimiters(raw)
+    for segment_start, segment_end in _segment_spans(raw, start):
+        yield Segment(raw, segment_start, segment_end, delims)
+
+
+def hl7_datetime(value: str) -> str | None:
+    """Convert an HL7 DTM value (``YYYYMMDD[HHMM[SS]][+ZZZZ]``) to ISO 8601."""
+
+    if not value:
+        return None
+    offset = ""
+    for sign in ("+", "-"):
+        index = value.find(sign)
+        if index != -1:
+            zone = value[index + 1:]
+            offset = f"{sign}{zone[:2]}:{zone[2:4]}" if len(zone) >= 4 else ""
+            value = value[:index]
+            break
+    value = value.split(".", 1)[0]
+    if len(value) < 8 or not value.isdigit():
+        return None
+    date = f"{value[0:4]}-{value[4:6]}-{value[6:8]}"
+    if len(value) < 12:
+        return date
+    seconds = value[12:14] if len(value) >= 14 else "00"
+    return f"{date}T{value[8:10]}:{value[10:12]}:{seconds}{offset or 'Z'}"
+
+
+def _coding(code: str, display: str, system: str) -> dict[str, str]:
+    coding = {"code": code}
+    if display:
+        coding["display"] = display
+    if system:
+        coding["system"] = CODING_SYSTEMS.get(system, system)
+    return coding
+
+
+class HL7ParsedMessage:
+    """Header details and FHIR resources produced from one HL7 message."""
+
+    __slots__ = (
+        "control_id",
+        "message_type",
+        "trigger_event",
+        "sending_application",
+        "sending_facility",
+        "timestamp",
+        "version",
+        "resources",
+    )
+
+    def __init__(self) -> None:
+        self.control_id = ""
+        self.message_type = ""
+        self.trigger_event = ""
+        self.sending_application = ""
+        self.sending_facility = ""
+        self.timestamp: str | None = None
+        self.version = ""
+        self.resources: list[dict[str, Any]] = []
+
+    @property
+    def sender(self) -> str:
+        """``MSH-3|MSH-4``, the scope within which MSH-10 is unique."""
+
+        return f"{self.sending_application}|{self.sending_facility}"[:128]
+
+
+class _Context:
+    __slots__ = ("message", "patient_reference", "order")
+
+    def __init__(self, message: HL7ParsedMessage) -> None:
+        self.message = message
+        self.patient_reference: str | None = None
+        self.order: dict[str, Any] | None = None
+
+
+def _map_msh(segment: Segment, context: _Context) -> None:
+    message = context.message
+    message.sending_application = segment.value(3)
+    message.sending_facility = segment.value(4)
+    message.timestamp = hl7_datetime(segment.value(7))
+    message.message_type, message.trigger_event = segment.components(9, 2)
+    message.control_id = segment.value(10)
+    message.version = segment.value(12)
+
+
+def _map_pid(segment: Segment, context: _Context) -> None:
+    patient: dict[str, Any] = {
+        "resourceType": "Patient",
+        "id": generate_identifier("patient"),
+    }
+    identifiers = []
+    for repetition in range(1, segment.repetition_count(3) + 1):
+        value, _, _, authority, type_code = segment.components(3, 5, repetition)
+        if not value:
+            continue
+        identifier: dict[str, Any] = {"value": value}
+        if type_code:
+            identifier["type"] = {
+                "coding": [
+                    {
+                        "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
+                        "code": type_code,
+                    }
+                ]
+            }
+        if authority:
+            identifier["assigner"] = {"display": authority}
+        identifiers.append(identifier)
+    if identifiers:
+        patient["identifier"] = identifiers
+
+    names = []
+    for repetition in range(1, segment.repetition_count(5) + 1):
+        family, given, middle, suffix, prefix = segment.components(5, 5, repetition)
+        if not (family or given):
+            continue
+        name: dict[str, Any] = {"family": family, "given": [v for v in (given, middle) if v]}
+        if prefix:
+            name["prefix"] = [prefix]
+        if suffix:
+            name["suffix"] = [suffix]
+        names.append(name)
+    if names:
+        patient["name"] = names
+
+    birth_date = hl7_datetime(segment.value(7))
+    if birth_date:
+        patient["birthDate"] = birth_date[:10]
+    patient["gender"] = GENDERS.get(segment.value(8), "unknown")
+
+    line, other, city, state, postal_code, country = segment.components(11, 6)
+    if line or city:
+        patient["address"] = [
+            {
+                "line": [v for v in (line, other) if v],
+                "city": city,
+                "state": state,
+                "postalCode": postal_code,
+                "country": country,
+            }
+        ]
+    phone = segment.value(13)
+    if phone:
+        patient["telecom"] = [{"system": "phone", "value": phone, "use": "home"}]
+
+    context.patient_reference = f"Patient/{patient['id']}"
+    context.message.resources.append(patient)
+
+
+def _map_orc(segment: Segment, context: _Context) -> None:
+    order: dict[str, Any] = {
+        "resourceType": "ServiceRequest",
+        "id": generate_identifier("order"),
+        "status": ORDER_STATUSES.get(segment.value(5), "active"),
+        "intent": "order",
+    }
+    identifiers = []
+    for index, type_code in ((2, "PLAC"), (3, "FILL")):
+        value = segment.value(index)
+        if value:
+            identifiers.append(
+                {
+                    "type": {
+                        "coding": [
+                            {
+                                "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
+                                "code": type_code,
+                            }
+                        ]
+                    },
+                    "value": value,
+                }
+            )
+    if identifiers:
+        order["identifier"] = identifiers
+    authored = hl7_datetime(segment.value(9))
+    if authored:
+        order["authoredOn"] = authored
+    if context.patient_reference:
+        order["subject"] = {"reference": context.patient_reference}
+    context.order = order
+    context.message.resources.append(order)
+
+
+def _map_obr(segment: Segment, context: _Context) -> None:
+    if context.order is None:
+        _map_orc(segment, context)
+    code, display, system = segment.components(4, 3)
+    if code and context.order is not None:
+        context.order["code"] = {"coding": [_coding(code, display, system)]}
+
+
+def _map_obx(segment: Segment, context: _Context) -> None:
+    value_type = segment.value(2)
+    code, display, system = segment.components(3, 3)
+    observation: dict[str, Any] = {
+        "resourceType": "Observation",
+        "id": generate_identifier("obs"),
+        "status": OBSERVATION_STATUSES.get(segment.value(11), "final"),
+        "code": {"coding": [_coding(code, display, system)]},
+    }
+    if display:
+        observation["code"]["text"] = display
+
+    raw_value = segment.field(5)
+    if value_type in ("NM", "SN"):
+        unit = segment.value(6)
+        try:
+            quantity: dict[str, Any] = {"value": float(raw_value)}
+        except ValueError:
+            observation["valueString"] = raw_value
+        else:
+            if unit:
+                quantity.update({"unit": unit, "system": UCUM_SYSTEM, "code": unit})
+            observation["valueQuantity"] = quantity
+    elif value_type in ("CE", "CWE", "CNE"):
+        value_code, value_display, value_system = segment.components(5, 3)
+        observation["valueCodeableConcept"] = {
+            "coding": [_coding(value_code, value_display, value_system)]
+        }
+    elif raw_value:
+        observation["valueString"] = raw_value
+
+    reference_range = segment.value(7)
+    if reference_range:
+        low, separator, high = reference_range.partition("-")
+        try:
+            bounds = {}
+            if low:
+                bounds["low"] = {"value": float(low)}
+            if separator and high:
+                bounds["high"] = {"value": float(high)}
+            observation["referenceRange"] = [bounds] if bounds else [{"text": reference_range}]
+        except ValueError:
+            observation["referenceRange"] = [{"text": reference_range}]
+
+    flag = segment.value(8)
+    if flag:
+        observation["interpretation"] = [
+            {
+                "coding": [
+                    {
+                        "system": "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
+                        "code": flag,
+                    }
+                ]
+            }
+        ]
+
+    effective = hl7_datetime(segment.value(14)) or context.message.timestamp
+    if effective:
+        observation["effectiveDateTime"] = effective
+    if context.patient_reference:
+        observation["subject"] = {"reference": context.patient_reference}
+    if context.order is not None:
+        observation["basedOn"] = [{"reference": f"ServiceRequest/{context.order['id']}"}]
+    context.message.resources.append(observation)
+
+
+SEGMENT_MAPPERS = {
+    "MSH": _map_msh,
+    "PID": _map_pid,
+    "ORC": _map_orc,
+    "OBR": _map_obr,
+    "OBX": _map_obx,
+}
+
+
+def parse_message(raw: str) -> HL7ParsedMessage:
+    """Parse ``raw`` and return its header details and FHIR resources.
+
+    Segments without a registered mapper (EVN, PV1, NTE ...) are skipped
+    without their fields ever being sliced.
+    """
+
+    if not raw or not raw.strip():
+        raise HL7ParseError("Message is empty")
+    start, delims = _delimiters(raw)
+    message = HL7ParsedMessage()
+    context = _Context(message)
+    mappers = SEGMENT_MAPPERS
+    for segment_start, segment_end in _segment_spans(raw, start):
+        mapper = mappers.get(raw[segment_start:segment_start + 3])
+        if mapper is not None:
+            mapper(Segment(raw, segment_start, segment_end, delims), context)
+    if not message.message_type:
+        raise HL7ParseError("MSH-9 message type is required")
+    return message
+
+
+def parse_many(messages: list[tuple[str, str]]) -> list[tuple[str, str, str, list, list]]:
+    """Parse ``(message_id, raw)`` pairs, returning one outcome per message.
+
+    Each outcome is ``(message_id, sender, status, resources, errors)``. The function
+    only depends on this module so that it can run inside a process pool
+    worker without configuring Django there.
+    """
+
+    outcomes = []
+    for message_id, raw in messages:
+        try:
+            parsed = parse_message(raw)
+        except HL7ParseError as exc:
+            outcomes.append((message_id or generate_identifier("msg"), "", "failed", [], [str(exc)]))
+        else:
+            message_id = message_id or parsed.control_id or generate_identifier("msg")
+            outcomes.append((message_id, parsed.sender, "processed", parsed.resources, []))
+    return outcomes
@@ -0,0 +1,265 @@
+"""Vectorized reference range interpretation for lab result Bundles.
+
+The values, units and reference ranges of every Observation in a Bundle are
+gathered into NumPy arrays once, and all comparisons are done as array
+operations, so the cost per result is a few array elements rather than a
+Python-level evaluation.
+
+Units are matched against a UCUM table compiled at import time. Every
+distinct unit string in the Bundle is looked up once (``np.unique``), and a
+value is only compared with a bound of the same dimension after both are
+converted to that dimension's base unit. Unknown units are compared only
+with bounds written in exactly the same unit.
+
+Interpretation codes follow the v3 ObservationInterpretation code system:
+
+* ``LL``/``HH`` - outside a ``referenceRange`` whose ``type`` is ``critical``;
+* ``L``/``H`` - outside the first other ``referenceRange``;
+* ``N`` - within the ranges given.
+
+An ``interpretation`` sent by the lab is kept as it is.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+import numpy as np
+
+from .fhir_utils import first_code
+
+UCUM_SYSTEM = "http://unitsofmeasure.org"
+INTERPRETATION_SYSTEM = "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation"
+
+NORMAL = "N"
+LOW = "L"
+HIGH = "H"
+CRITICAL_LOW = "LL"
+CRITICAL_HIGH = "HH"
+
+DISPLAYS = {
+    NORMAL: "Normal",
+    LOW: "Low",
+    HIGH: "High",
+    CRITICAL_LOW: "Critical low",
+    CRITICAL_HIGH: "Critical high",
+}
+
+# UCUM code -> (dimension, factor to the dimension's base unit).
+UCUM_UNITS = {
+    # Mass concentration, base g/L.
+    "g/L": ("mass/volume", 1.0),
+    "g/dL": ("mass/volume", 10.0),
+    "mg/dL": ("mass/volume", 1e-2),
+    "mg/L": ("mass/volume", 1e-3),
+    "ug/mL": ("mass/volume", 1e-3),
+    "ug/dL": ("mass/volume", 1e-5),
+    "ug/L": ("mass/volume", 1e-6),
+    "ng/mL": ("mass/volume", 1e-6),
+    "ng/dL": ("mass/volume", 1e-8),
+    "ng/L": ("mass/volume", 1e-9),
+    "pg/mL": ("mass/volume", 1e-9),
+    # Substance concentration, base mmol/L.
+    "mol/L": ("substance/volume", 1e3),
+    "mmol/L": ("substance/volume", 1.0),
+    "umol/L": ("substance/volume", 1e-3),
+    "nmol/L": ("substance/volume", 1e-6),
+    "pmol/L": ("substance/volume", 1e-9),
+    "meq/L": ("charge/volume", 1.0),
+    # Catalytic activity, base U/L.
+    "U/L": ("activity/volume", 1.0),
+    "[IU]/L": ("activity/volume", 1.0),
+    "U/mL": ("activity/volume", 1e3),
+    "m[IU]/L": ("activity/volume", 1e-3),
+    # Number concentration, base 10*9/L.
+    "10*9/L": ("count/volume", 1.0),
+    "10*3/uL": ("count/volume", 1.0),
+    "10*12/L": ("count/volume", 1e3),
+    "10*6/uL": ("count/volume", 1e3),
+    "/uL": ("count/volume", 1e-3),
+    "/mm3": ("count/volume", 1e-3),
+    # Fractions, base %.
+    "%": ("fraction", 1.0),
+    "1": ("ratio", 1.0),
+    # Volume and mass of single cells.
+    "fL": ("volume", 1.0),
+    "pg": ("mass", 1.0),
+    # Rates and pressures seen alongside lab panels.
+    "/min": ("rate", 1.0),
+    "mm[Hg]": ("pressure", 1.0),
+    "Cel": ("temperature", 1.0),
+}
+
+UNIT_ALIASES = {
+    "mg/dl": "mg/dL",
+    "g/dl": "g/dL",
+    "ug/dl": "ug/dL",
+    "µg/dl": "ug/dL",
+    "µg/l": "ug/L",
+    "µg/ml": "ug/mL",
+    "mcg/ml": "ug/mL",
+    "mcg/l": "ug/L",
+    "ng/dl": "ng/dL",
+    "µmol/l": "umol/L",
+    "mmol/l": "mmol/L",
+    "meq/l": "meq/L",
+    "iu/l": "[IU]/L",
+    "miu/l": "m[IU]/L",
+    "u/l": "U/L",
+    "k/ul": "10*3/uL",
+    "x10^3/ul": "10*3/uL",
+    "x10e3/ul": "10*3/uL",
+    "10^3/ul": "10*3/uL",
+    "x10^9/l": "10*9/L",
+    "10^9/l": "10*9/L",
+    "x10^12/l": "10*12/L",
+    "10^12/l": "10*12/L",
+    "m/ul": "10*6/uL",
+    "x10^6/ul": "10*6/uL",
+    "cells/ul": "/uL",
+    "bpm": "/min",
+    "mmhg": "mm[Hg]",
+    "degc": "Cel",
+    "°c": "Cel",
+}
+
+
+def _compile(units: dict[str, tuple[str, float]], aliases: dict[str, str]) -> dict[str, tuple[str, int, float]]:
+    """Map every spelling (case-insensitive) to ``(UCUM code, dimension id, factor)``."""
+
+    names = dict.fromkeys(dimension for dimension, _ in units.values())
+    dimensions = {dimension: index for index, dimension in enumerate(names)}
+    table = {}
+    for code, (dimension, factor) in units.items():
+        table[code.lower()] = (code, dimensions[dimension], factor)
+    for alias, code in aliases.items():
+        table[alias] = table[code.lower()]
+    return table
+
+
+UNIT_TABLE = _compile(UCUM_UNITS, UNIT_ALIASES)
+
+
+def normalize_unit(unit: str) -> str | None:
+    """Return the UCUM code for ``unit``, or ``None`` if it is not in the table."""
+
+    known = UNIT_TABLE.get(unit.strip().lower())
+    return known[0] if known else None
+
+
+def _resolve_units(units: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Return ``(dimension ids, factors)`` for ``units``, looking up each distinct spelling once.
+
+    Unknown units get a dimension of their own, so they only match the same spelling.
+    """
+
+    distinct, inverse = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+    dimensions = np.empty(len(distinct), dtype=np.int64)
+    factors = np.ones(len(distinct), dtype=np.float64)
+    for index, unit in enumerate(distinct.tolist()):
+        known = UNIT_TABLE.get(unit.strip().lower())
+        if known:
+            dimensions[index], factors[index] = known[1], known[2]
+        else:
+            dimensions[index] = -1 - index
+    return dimensions[inverse], factors[inverse]
+
+
+def _quantity(value: Any, default_unit: str = "") -> tuple[float, str]:
+    if not isinstance(value, dict):
+        return np.nan, default_unit
+    number = value.get("value")
+    if isinstance(number, bool) or not isinstance(number, (int, float)):
+        return np.nan, default_unit
+    return float(number), str(value.get("code") or value.get("unit") or default_unit)
+
+
+def _ranges(observation: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Return the ``(normal, critical)`` reference ranges of an observation."""
+
+    normal: dict[str, Any] = {}
+    critical: dict[str, Any] = {}
+    reference_ranges = observation.get("referenceRange")
+    if not isinstance(reference_ranges, list):
+        return normal, critical
+    for reference_range in reference_ranges:
+        if not isinstance(reference_range, dict):
+            continue
+        if first_code(reference_range.get("type")).lower() == "critical":
+            critical = critical or reference_range
+        else:
+            normal = normal or reference_range
+    return normal, critical
+
+
+def evaluate(observations: list[dict[str, Any]]) -> list[str]:
+    """Return the interpretation code of each observation (``""`` when none applies)."""
+
+    if not observations:
+        return []
+    values = np.full(len(observations), np.nan)
+    # Rows: low, high, critical low, critical high.
+    bounds = np.full((4, len(observations)), np.nan)
+    units: list[str] = [""] * (5 * len(observations))
+    for index, observation in enumerate(observations):
+        value, unit = _quantity(observation.get("valueQuantity"))
+        values[index] = value
+        units[index] = unit
+        normal, critical = _ranges(observation)
+        for row, quantity in enumerate(
+            (normal.get("low"), normal.get("high"), critical.get("low"), critical.get("high"))
+        ):
+            bounds[row, index], units[(row + 1) * len(observations) + index] = _quantity(quantity, unit)
+
+    dimensions, factors = _resolve_units(units)
+    dimensions = dimensions.reshape(5, -1)
+    factors = factors.reshape(5, -1)
+    values = values * factors[0]
+    bounds = np.where(dimensions[1:] == dimensions[0], bounds * factors[1:], np.nan)
+    low, high, critical_low, critical_high = bounds
+
+    codes = np.select(
+        [
+            values < critical_low,
+            values > critical_high,
+            values < low,
+            values > high,
+            ~np.isnan(values) & ~(np.isnan(low) & np.isnan(high)),
+        ],
+        [CRITICAL_LOW, CRITICAL_HIGH, LOW, HIGH, NORMAL],
+        default="",
+    )
+    return codes.tolist()
+
+
+def _observations(bundle: dict[str, Any]) -> Iterable[dict[str, Any]]:
+    entries = bundle.get("entry")
+    if not isinstance(entries, list):
+        return
+    for entry in entries:
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if isinstance(resource, dict) and resource.get("resourceType") == "Observation":
+            yield resource
+
+
+def interpret_bundle(bundle: dict[str, Any]) -> int:
+    """Add UCUM codes and ``interpretation`` to the Observations of ``bundle`` in place.
+
+    Returns the number of observations that were given an interpretation.
+    """
+
+    observations = list(_observations(bundle))
+    interpreted = 0
+    for observation, code in zip(observations, evaluate(observations)):
+        quantity = observation.get("valueQuantity")
+        if isinstance(quantity, dict):
+            ucum = normalize_unit(str(quantity.get("code") or quantity.get("unit") or ""))
+            if ucum:
+                quantity.update({"system": UCUM_SYSTEM, "code": ucum})
+                quantity.setdefault("unit", ucum)
+        if code and not observation.get("interpretation"):
+            observation["interpretation"] = [
+                {"coding": [{"system": INTERPRETATION_SYSTEM, "code": code, "display": DISPLAYS[code]}]}
+            ]
+            interpreted += 1
+    return interpreted
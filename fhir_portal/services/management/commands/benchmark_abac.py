@@ -0,0 +1,69 @@
+"""Measure ABAC decision throughput with and without the decision cache."""
+
+from __future__ import annotations
+
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.abac import PolicySet, policies
+
+DEPARTMENTS = ['cardiology', 'oncology', 'neurology', 'radiology']
+ROLES = [['doctor'], ['nurse'], ['department_head'], ['doctor', 'department_head']]
+
+
+def _requests(count: int, users: int) -> list[dict]:
+    rng = random.Random(0)
+    requests = []
+    for n in range(count):
+        user = rng.randrange(users)
+        requests.append(
+            {
+                'subject': {
+                    'userId': f'user-{user}',
+                    'roles': ROLES[user % len(ROLES)],
+                    'department': DEPARTMENTS[user % len(DEPARTMENTS)],
+                    'facility': 'facility-1',
+                },
+                'resource': {
+                    'type': 'Patient',
+                    'id': f'patient-{n}',
+                    'attributes': {'department': rng.choice(DEPARTMENTS), 'facility': 'facility-1'},
+                },
+                'action': rng.choice(['read', 'read', 'read', 'write']),
+                'environment': {'time': f'2024-03-04T{rng.randrange(24):02d}:15:00Z'},
+            }
+        )
+    return requests
+
+
+class Command(BaseCommand):
+    help = 'Evaluate synthetic chart-access requests against ABAC_POLICIES and report decisions per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--min-per-second', type=float, default=20000.0)
+
+    def handle(self, *args, **options):
+        requests = _requests(options['requests'], options['users'])
+        compiled = PolicySet(policies().source)
+
+        started = time.perf_counter()
+        for request in requests:
+            compiled.cache.clear()
+            compiled.decide(request)
+        uncached = len(requests) / (time.perf_counter() - started)
+
+        compiled.cache.clear()
+        started = time.perf_counter()
+        hits = sum(compiled.decide(request)[1] for request in requests)
+        cached = len(requests) / (time.perf_counter() - started)
+
+        self.stdout.write(
+            f'{len(requests)} decisions: {uncached:,.0f}/s without the cache, {cached:,.0f}/s with it '
+            f'({hits / len(requests):.0%} hits)'
+        )
+        if cached < options['min_per_second']:
+            raise CommandError(f"{cached:,.0f} decisions/s is below {options['min_per_second']:,.0f}")
@@ -0,0 +1,49 @@
+"""Measure the per-request cost of bearer token authentication."""
+
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from services.auth_tokens import issue, verified
+from services.authentication import TokenAuthentication
+
+
+class Command(BaseCommand):
+    help = 'Authenticate synthetic requests with bearer tokens and report microseconds per request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--tokens', type=int, default=1000)
+        parser.add_argument('--max-us', type=float, default=50.0)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        tokens = [issue(f'bench-{n}', f'bench-{n}')[0] for n in range(options['tokens'])]
+        requests = [Request(factory.get('/api/v1/patients/', HTTP_AUTHORIZATION=f'Bearer {token}')) for token in tokens]
+        authenticator = TokenAuthentication()
+
+        verified.clear()
+        started = time.perf_counter()
+        for request in requests:
+            authenticator.authenticate(request)
+        cold = (time.perf_counter() - started) / len(requests) * 1e6
+
+        total = options['requests']
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for n in range(total):
+                authenticator.authenticate(requests[n % len(requests)])
+            warm = (time.perf_counter() - started) / total * 1e6
+
+        self.stdout.write(
+            f'first use of a token: {cold:.1f}us; cached: {warm:.1f}us per request over {total} requests '
+            f'({len(queries)} queries)'
+        )
+        if warm > options['max_us']:
+            raise CommandError(f"Cached authentication took {warm:.1f}us, above {options['max_us']:.0f}us")
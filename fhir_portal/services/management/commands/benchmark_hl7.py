@@ -0,0 +1,51 @@
+"""Measure HL7 v2 parser throughput in messages per second."""
+
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from services.hl7_parser import parse_message
+
+SAMPLE_MESSAGES = {
+    'adt': (
+        'MSH|^~\\&|ADT|HOSP|EHR|HOSP|20230901123045||ADT^A01|MSG{n}|P|2.5.1\r'
+        'EVN||20230901123045|||USER123\r'
+        'PID|1||MRN{n}^^^HOSP^MR||Doe^John^M||19800115|M|||123 Main St^^City^ST^12345^USA||5551234567\r'
+        'PV1||I|ICU^101^A|||DOC123^Smith^Jane^MD\r'
+    ),
+    'oru': (
+        'MSH|^~\\&|LAB|HOSP|EHR|HOSP|20230901123045||ORU^R01|MSG{n}|P|2.5.1\r'
+        'PID|1||MRN{n}^^^HOSP^MR||Roe^Jane||19700101|F\r'
+        'ORC|RE|PL{n}|FL{n}||CM\r'
+        'OBR|1|PL{n}|FL{n}|24323-8^Comprehensive metabolic panel^LN\r'
+        'OBX|1|NM|2345-7^Glucose^LN||182|mg/dL|70-99|H|||F|||20230901120000\r'
+        'OBX|2|NM|2160-0^Creatinine^LN||1.1|mg/dL|0.6-1.3|N|||F|||20230901120000\r'
+        'OBX|3|NM|2951-2^Sodium^LN||139|mmol/L|135-145|N|||F|||20230901120000\r'
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Parse synthetic HL7 v2 messages and report parser throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50000)
+        parser.add_argument('--kind', choices=sorted(SAMPLE_MESSAGES), default='adt')
+
+    def handle(self, *args, **options):
+        template = SAMPLE_MESSAGES[options['kind']]
+        messages = [template.format(n=n) for n in range(options['messages'])]
+
+        started = time.perf_counter()
+        resources = 0
+        for raw in messages:
+            resources += len(parse_message(raw).resources)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{options['kind']}: parsed {len(messages)} messages "
+            f"({resources} resources) in {elapsed:.3f}s -> "
+            f"{len(messages) / elapsed:,.0f} messages/sec"
+        )
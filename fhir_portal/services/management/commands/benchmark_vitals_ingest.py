@@ -0,0 +1,79 @@
+"""Compare vital-sign ingest throughput one POST per observation and in bulk NDJSON uploads."""
+
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from services.models import ObservationRecord, ObservationRollup, ObservationSample
+from services.views.observations import bulk_vitals, create_vital_sign
+
+PATIENT_ID = 'benchmark-vitals'
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _line(n: int) -> str:
+    return json.dumps(
+        {
+            'resourceType': 'Observation',
+            'code': {'coding': [{'system': 'http://loinc.org', 'code': '8867-4'}]},
+            'subject': {'reference': f'Patient/{PATIENT_ID}'},
+            'effectiveDateTime': (START + timedelta(seconds=n)).isoformat(),
+            'valueQuantity': {'value': 60 + n % 40, 'unit': '/min'},
+        }
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Ingest synthetic per-second heart rates through POST /observations/ one at a time and through '
+        '/observations/bulk in batches, and report observations per second.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--observations', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def _single(self, factory, lines):
+        created = 0
+        for line in lines:
+            response = create_vital_sign(factory.post('/api/v1/observations/', line, content_type='application/json'))
+            created += response.status_code == 201
+        return created
+
+    def _bulk(self, factory, lines, batch_size):
+        with override_settings(VITALS_INGEST_BATCH_SIZE=batch_size):
+            request = factory.post(
+                '/api/v1/observations/bulk', '\n'.join(lines), content_type='application/fhir+ndjson'
+            )
+            body = b''.join(bulk_vitals(request).streaming_content)
+        return sum(json.loads(outcome)['status'] == 'created' for outcome in body.splitlines())
+
+    def _run(self, label, lines, batch_size):
+        factory = RequestFactory()
+        started = time.perf_counter()
+        if batch_size == 1:
+            created = self._single(factory, lines)
+        else:
+            created = self._bulk(factory, lines, batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label}: stored {created} of {len(lines)} observations in {elapsed:.3f}s -> '
+            f'{len(lines) / elapsed:,.0f} observations/sec'
+        )
+        self._clean_up()
+
+    def _clean_up(self):
+        ObservationRecord.objects.filter(patient_reference=f'Patient/{PATIENT_ID}').delete()
+        ObservationSample.objects.filter(patient_id=PATIENT_ID).delete()
+        ObservationRollup.objects.filter(patient_id=PATIENT_ID).delete()
+
+    def handle(self, *args, **options):
+        lines = [_line(n) for n in range(options['observations'])]
+        self._clean_up()
+        self._run('single POST', lines, 1)
+        self._run(f"bulk (batch size {options['batch_size']})", lines, options['batch_size'])
@@ -0,0 +1,119 @@
+"""Book one slot from many concurrent clients and check that exactly one wins."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+from services.appointment_booking import BookingError, SlotUnavailable, book
+from services.models import AppointmentLock, AppointmentRecord, IdempotencyKey
+
+PRACTITIONER_ID = 'loadtest-booking'
+SLOT_START = datetime(2099, 1, 5, 9, 0, tzinfo=timezone.utc)
+
+BOOKED = 'booked'
+CONFLICT = 'conflict'
+ERROR = 'error'
+
+
+def _appointment(n: int) -> dict:
+    return {
+        'resourceType': 'Appointment',
+        'id': f'{PRACTITIONER_ID}-{uuid4().hex}',
+        'status': 'booked',
+        'start': SLOT_START.isoformat(),
+        'end': (SLOT_START + timedelta(minutes=15)).isoformat(),
+        'participant': [
+            {'actor': {'reference': f'Practitioner/{PRACTITIONER_ID}'}},
+            {'actor': {'reference': f'Patient/{PRACTITIONER_ID}-{n}'}},
+        ],
+    }
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Book the same appointment slot from many concurrent clients and check that exactly one succeeds '
+        'within the p99 latency bound. Run it against MySQL; SQLite does not lock rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--max-p99-ms', type=float, default=1000.0)
+        parser.add_argument(
+            '--url', default='', help='Base URL of a running server; books through the API instead of in-process.'
+        )
+
+    def _book_in_process(self, n: int) -> str:
+        try:
+            book(_appointment(n), idempotency_key=f'{PRACTITIONER_ID}-{n}-{uuid4().hex}')
+        except SlotUnavailable:
+            return CONFLICT
+        except (BookingError, DatabaseError):
+            return ERROR
+        finally:
+            connections.close_all()
+        return BOOKED
+
+    def _book_over_http(self, url: str, n: int) -> str:
+        request = urllib.request.Request(
+            f"{url.rstrip('/')}/api/v1/appointments/",
+            data=json.dumps(_appointment(n)).encode(),
+            headers={'Content-Type': 'application/json', 'Idempotency-Key': f'{PRACTITIONER_ID}-{n}-{uuid4().hex}'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return BOOKED if response.status == 201 else ERROR
+        except urllib.error.HTTPError as exc:
+            return CONFLICT if exc.code == 409 else ERROR
+        except OSError:
+            return ERROR
+
+    def _clean_up(self):
+        AppointmentRecord.objects.filter(practitioner_reference=f'Practitioner/{PRACTITIONER_ID}').delete()
+        AppointmentLock.objects.filter(practitioner_id=PRACTITIONER_ID).delete()
+        IdempotencyKey.objects.filter(key__startswith=f'{PRACTITIONER_ID}-').delete()
+
+    def handle(self, *args, **options):
+        clients = options['clients']
+        url = options['url']
+        barrier = threading.Barrier(clients)
+
+        def client(n: int) -> tuple[str, float]:
+            barrier.wait()
+            started = time.perf_counter()
+            outcome = self._book_over_http(url, n) if url else self._book_in_process(n)
+            return outcome, time.perf_counter() - started
+
+        self._clean_up()
+        try:
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                results = list(executor.map(client, range(clients)))
+        finally:
+            self._clean_up()
+
+        outcomes = [outcome for outcome, _ in results]
+        latencies = [elapsed * 1000 for _, elapsed in results]
+        p50, p99 = _percentile(latencies, 0.50), _percentile(latencies, 0.99)
+        self.stdout.write(
+            f'{clients} clients: {outcomes.count(BOOKED)} booked, {outcomes.count(CONFLICT)} conflicts, '
+            f'{outcomes.count(ERROR)} errors; latency p50 {p50:.1f}ms, p99 {p99:.1f}ms, max {max(latencies):.1f}ms'
+        )
+        if outcomes.count(BOOKED) != 1 or outcomes.count(ERROR):
+            raise CommandError('Expected exactly one booking and no errors')
+        if p99 > options['max_p99_ms']:
+            raise CommandError(f"p99 latency {p99:.1f}ms exceeds {options['max_p99_ms']:.0f}ms")
@@ -0,0 +1,55 @@
+"""Run an MLLP listener that ingests HL7 v2 messages and returns ACKs."""
+
+from __future__ import annotations
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from services.hl7_ingest import ingest_with_ack
+from services.mllp import MLLPServer
+
+
+def ingest(raw: str) -> str:
+    # Worker threads outlive any request cycle, so drop connections that the
+    # server closed or that exceeded CONN_MAX_AGE around every message.
+    close_old_connections()
+    try:
+        return ingest_with_ack(raw)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Accept MLLP-framed HL7 v2 messages over TCP and acknowledge each one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=2575)
+        parser.add_argument(
+            '--window', type=int, default=64, help='Unacknowledged messages allowed per connection.'
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Threads used for parsing and writes.')
+
+    def handle(self, *args, **options):
+        server = MLLPServer(
+            ingest,
+            host=options['host'],
+            port=options['port'],
+            window=options['window'],
+            workers=options['workers'],
+        )
+        try:
+            asyncio.run(self._serve(server))
+        except KeyboardInterrupt:
+            self.stdout.write('MLLP listener stopped.')
+
+    async def _serve(self, server: MLLPServer) -> None:
+        await server.start()
+        for sock in server.sockets:
+            self.stdout.write(f'MLLP listener accepting connections on {sock.getsockname()}')
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
@@ -0,0 +1,33 @@
+"""Rebuild the observation samples and rollups from ObservationRecord."""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from services.models import ObservationRecord
+from services.observation_series import sync_observations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ObservationSample and ObservationRollup rows for every ObservationRecord in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ('pk', 'observation_id', 'patient_reference', 'code', 'effective_datetime', 'data')
+        last_pk = 0
+        synced = 0
+        while True:
+            batch = list(
+                ObservationRecord.objects.only(*fields).filter(pk__gt=last_pk).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                sync_observations(batch)
+            synced += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f'Synced {synced} observation records.')
@@ -0,0 +1,40 @@
+"""Rebuild the normalized/phonetic patient name index from PatientRecord."""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from services.models import PatientNameToken, PatientRecord
+from services.patient_matching import name_tokens
+
+
+class Command(BaseCommand):
+    help = 'Rebuild PatientNameToken rows for every PatientRecord in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        indexed = 0
+        while True:
+            batch = list(PatientRecord.objects.only('pk', 'data').filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            indexed += self._reindex(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(f'Indexed {indexed} patient records.')
+
+    @staticmethod
+    def _reindex(records) -> int:
+        tokens = [
+            PatientNameToken(patient=record, part=part, normalized=normalized, phonetic=phonetic)
+            for record in records
+            for part, normalized, phonetic in name_tokens(record.data)
+        ]
+        with transaction.atomic():
+            PatientNameToken.objects.filter(patient__in=records).delete()
+            PatientNameToken.objects.bulk_create(tokens)
+        return len(records)
@@ -0,0 +1,30 @@
+"""Remove expired patient and bulk data exports from disk and the database."""
+
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from services import bulk_export, patient_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the files and jobs of patient and bulk data exports whose EXPORT_TTL_HOURS have passed. '
+        'Run it from cron, or pass --interval to keep sweeping.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0, help='Sweep again every INTERVAL seconds instead of exiting.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            exports = patient_export.sweep_expired()
+            jobs = bulk_export.sweep_expired()
+            self.stdout.write(f'Removed {exports} patient exports and {jobs} bulk export jobs')
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+"""Revoke role assignments whose expiry date has passed."""
+
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from services.role_assignments import sweep_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Revoke expired role assignments in batches and drop the affected users\' cached permissions. '
+        'Run it from cron, or pass --interval to keep sweeping.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--interval', type=float, default=0, help='Sweep again every INTERVAL seconds instead of exiting.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            revoked = sweep_expired(batch_size=options['batch_size'])
+            self.stdout.write(f'Revoked {revoked} expired role assignments')
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
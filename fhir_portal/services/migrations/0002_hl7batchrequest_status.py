@@ -0,0 +1,16 @@
+# Generated manually to track HL7 batch progress.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hl7batchrequest",
+            name="status",
+            field=models.CharField(default="pending", max_length=32),
+        ),
+    ]
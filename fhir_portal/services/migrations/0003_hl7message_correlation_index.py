@@ -0,0 +1,16 @@
+# Generated manually to index HL7 messages by correlation id.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0002_hl7batchrequest_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="hl7message",
+            name="correlation_id",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
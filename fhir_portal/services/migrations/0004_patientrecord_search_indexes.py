@@ -0,0 +1,27 @@
+# Generated manually to back FHIR Patient search with indexes.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0003_hl7message_correlation_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="patientrecord",
+            index=models.Index(fields=["identifier"], name="patient_identifier_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientrecord",
+            index=models.Index(fields=["name"], name="patient_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientrecord",
+            index=models.Index(fields=["birth_date"], name="patient_birth_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="patientrecord",
+            index=models.Index(fields=["gender", "birth_date"], name="patient_gender_birth_idx"),
+        ),
+    ]
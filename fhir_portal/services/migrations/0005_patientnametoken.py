@@ -0,0 +1,37 @@
+# Generated manually to add the normalized/phonetic patient name index.
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0004_patientrecord_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientNameToken",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("part", models.CharField(max_length=16)),
+                ("normalized", models.CharField(max_length=128)),
+                ("phonetic", models.CharField(max_length=8)),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="name_tokens",
+                        to="services.patientrecord",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["normalized"], name="name_token_normalized_idx"),
+                    models.Index(fields=["phonetic", "part"], name="name_token_phonetic_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated manually to index observation and appointment patient references.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0005_patientnametoken"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="observationrecord",
+            name="patient_reference",
+            field=models.CharField(blank=True, db_index=True, max_length=128),
+        ),
+        migrations.AlterField(
+            model_name="appointmentrecord",
+            name="patient_reference",
+            field=models.CharField(blank=True, db_index=True, max_length=128),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated manually to add FHIR bulk data export jobs and patient groups.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0006_patient_reference_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientGroup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("group_id", models.CharField(max_length=64, unique=True)),
+                ("name", models.CharField(blank=True, max_length=256)),
+                (
+                    "members",
+                    models.ManyToManyField(blank=True, related_name="groups", to="services.patientrecord"),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BulkExportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("job_id", models.CharField(max_length=64, unique=True)),
+                ("level", models.CharField(max_length=16)),
+                ("group_id", models.CharField(blank=True, max_length=64)),
+                ("resource_types", models.JSONField(blank=True, default=list)),
+                ("since", models.DateTimeField(blank=True, null=True)),
+                ("status", models.CharField(default="queued", max_length=32)),
+                ("request_url", models.TextField(blank=True)),
+                ("transaction_time", models.DateTimeField(blank=True, null=True)),
+                ("output", models.JSONField(blank=True, default=list)),
+                ("errors", models.JSONField(blank=True, default=list)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated manually to version PatientRecord writes.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0007_bulk_export"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientrecord",
+            name="version_id",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated manually to add append-only FHIR resource history.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0008_patientrecord_version_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceVersion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("resource_type", models.CharField(max_length=64)),
+                ("resource_id", models.CharField(max_length=64)),
+                ("version_id", models.PositiveIntegerField()),
+                ("method", models.CharField(max_length=8)),
+                ("last_updated", models.DateTimeField()),
+                ("snapshot", models.JSONField(blank=True, null=True)),
+                ("delta", models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["resource_type", "last_updated"], name="resource_version_updated_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("resource_type", "resource_id", "version_id"), name="resource_version_unique"
+                    ),
+                ],
+            },
+        ),
+    ]
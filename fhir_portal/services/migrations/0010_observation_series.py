@@ -0,0 +1,50 @@
+# Generated manually to add the observation time-series and rollup tables.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0009_resourceversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ObservationSample",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("observation_id", models.CharField(db_index=True, max_length=64)),
+                ("patient_id", models.CharField(max_length=64)),
+                ("code", models.CharField(max_length=64)),
+                ("timestamp", models.DateTimeField()),
+                ("value", models.FloatField()),
+                ("unit", models.CharField(blank=True, max_length=32)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["patient_id", "code", "timestamp"], name="observation_sample_series_idx"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ObservationRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("patient_id", models.CharField(max_length=64)),
+                ("code", models.CharField(max_length=64)),
+                ("granularity", models.CharField(max_length=8)),
+                ("bucket_start", models.DateTimeField()),
+                ("count", models.PositiveIntegerField()),
+                ("total", models.FloatField()),
+                ("minimum", models.FloatField()),
+                ("maximum", models.FloatField()),
+                ("unit", models.CharField(blank=True, max_length=32)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("patient_id", "code", "granularity", "bucket_start"), name="observation_rollup_unique"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated manually to add practitioner schedules and index appointments by practitioner.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0010_observation_series"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointmentrecord",
+            index=models.Index(fields=["practitioner_reference", "start"], name="appointment_practitioner_idx"),
+        ),
+        migrations.CreateModel(
+            name="PractitionerSchedule",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("practitioner_id", models.CharField(db_index=True, max_length=64)),
+                ("weekday", models.PositiveSmallIntegerField()),
+                ("start_time", models.TimeField()),
+                ("end_time", models.TimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated manually to add appointment booking locks and idempotency keys.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0011_practitioner_schedule"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentLock",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("practitioner_id", models.CharField(max_length=64)),
+                ("day", models.DateField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=["practitioner_id", "day"], name="appointment_lock_unique"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("scope", models.CharField(max_length=64)),
+                ("key", models.CharField(max_length=128)),
+                ("request_hash", models.CharField(max_length=64)),
+                ("response", models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=["scope", "key"], name="idempotency_key_unique"),
+                ],
+            },
+        ),
+    ]
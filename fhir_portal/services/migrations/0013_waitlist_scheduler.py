@@ -0,0 +1,25 @@
+# Generated manually to track the practitioner and status of waitlist entries.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0012_appointment_booking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="waitlistentry",
+            name="practitioner_id",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="waitlistentry",
+            name="status",
+            field=models.CharField(default="waiting", max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name="waitlistentry",
+            index=models.Index(fields=["status", "practitioner_id"], name="waitlist_status_idx"),
+        ),
+    ]
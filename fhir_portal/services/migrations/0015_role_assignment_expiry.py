@@ -0,0 +1,24 @@
+# Generated manually to revoke expired role assignments from an expiry index.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0014_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="roleassignmentrecord",
+            name="revoked_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="roleassignmentrecord",
+            index=models.Index(fields=["user_id"], name="role_assignment_user_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="roleassignmentrecord",
+            index=models.Index(fields=["revoked_at", "expiry_date"], name="role_assignment_expiry_idx"),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated manually to track in-process index generations in the database.
+from django.db import migrations, models
+
+INDEXES = ("observation-alerts", "appointment-waitlist", "role-assignments", "revoked-tokens")
+
+
+def create_generations(apps, schema_editor):
+    IndexGeneration = apps.get_model("services", "IndexGeneration")
+    IndexGeneration.objects.bulk_create([IndexGeneration(name=name) for name in INDEXES])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0015_role_assignment_expiry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexGeneration",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=64, unique=True)),
+                ("generation", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generations, migrations.RunPython.noop),
+    ]
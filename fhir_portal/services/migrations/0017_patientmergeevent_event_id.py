@@ -0,0 +1,31 @@
+# Generated manually to give merge events an identifier assigned before insert.
+from django.db import migrations, models
+
+
+def backfill_event_ids(apps, schema_editor):
+    PatientMergeEvent = apps.get_model("services", "PatientMergeEvent")
+    events = list(PatientMergeEvent.objects.only("pk"))
+    for event in events:
+        # Matches the auditId that was reported for existing events.
+        event.event_id = f"merge-{event.pk}"
+    PatientMergeEvent.objects.bulk_update(events, ["event_id"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0016_indexgeneration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patientmergeevent",
+            name="event_id",
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_event_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="patientmergeevent",
+            name="event_id",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated manually to key HL7 messages on sender and control id.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0017_patientmergeevent_event_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hl7message",
+            name="sender",
+            field=models.CharField(blank=True, default="", max_length=128),
+        ),
+        migrations.AlterField(
+            model_name="hl7message",
+            name="message_id",
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="hl7message",
+            constraint=models.UniqueConstraint(fields=("sender", "message_id"), name="hl7_message_sender_unique"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated manually to give every existing patient a history snapshot of its current version.
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def snapshot_current_versions(apps, schema_editor):
+    PatientRecord = apps.get_model("services", "PatientRecord")
+    ResourceVersion = apps.get_model("services", "ResourceVersion")
+    last = 0
+    while True:
+        records = list(
+            PatientRecord.objects.filter(pk__gt=last)
+            .order_by("pk")
+            .only("pk", "patient_id", "version_id", "updated_at", "data")[:BATCH_SIZE]
+        )
+        if not records:
+            break
+        last = records[-1].pk
+        rows = {
+            (row.resource_id, row.version_id): row
+            for row in ResourceVersion.objects.filter(
+                resource_type="Patient", resource_id__in=[record.patient_id for record in records]
+            )
+        }
+        creates, updates = [], []
+        for record in records:
+            row = rows.get((record.patient_id, record.version_id))
+            if row is None:
+                # Patients written before history existed: later updates are deltas against this.
+                creates.append(
+                    ResourceVersion(
+                        resource_type="Patient",
+                        resource_id=record.patient_id,
+                        version_id=record.version_id,
+                        method="POST" if record.version_id == 1 else "PUT",
+                        last_updated=record.updated_at,
+                        snapshot=record.data,
+                    )
+                )
+            elif row.snapshot is None:
+                # A delta whose base version was never recorded cannot be rebuilt.
+                row.snapshot, row.delta = record.data, None
+                updates.append(row)
+        ResourceVersion.objects.bulk_create(creates)
+        ResourceVersion.objects.bulk_update(updates, ["snapshot", "delta"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0018_hl7message_sender"),
+    ]
+
+    operations = [
+        migrations.RunPython(snapshot_current_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated manually to serialize writes to each observation series.
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("services", "0019_patient_history_snapshots"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ObservationSeriesLock",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("patient_id", models.CharField(max_length=64)),
+                ("code", models.CharField(max_length=64)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("patient_id", "code"), name="observation_series_lock_unique"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,162 @@
+"""Lower Layer Protocol (MLLP) framing and an asyncio MLLP listener.
+
+Each HL7 message on the wire is wrapped as ``<VT> message <FS><CR>``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+from .hl7_ack import REJECT, build_ack
+
+logger = logging.getLogger(__name__)
+
+START_BLOCK = "\x0b"
+END_BLOCK = "\x1c"
+CARRIAGE_RETURN = "\r"
+
+START_BYTE = START_BLOCK.encode()
+END_BYTES = (END_BLOCK + CARRIAGE_RETURN).encode()
+
+
+def frame(message: str) -> str:
+    """Wrap ``message`` in an MLLP envelope."""
+
+    return f"{START_BLOCK}{message}{END_BLOCK}{CARRIAGE_RETURN}"
+
+
+def iter_frames(data: str) -> Iterator[str]:
+    """Yield the messages contained in a string of MLLP frames.
+
+    Bytes between frames are ignored, as is a trailing partial frame.
+    """
+
+    find = data.find
+    position = 0
+    while True:
+        start = find(START_BLOCK, position)
+        if start == -1:
+            return
+        end = find(END_BLOCK, start + 1)
+        if end == -1:
+            return
+        yield data[start + 1:end]
+        position = end + 1
+
+
+class MLLPServer:
+    """Asyncio TCP server that hands each framed message to ``handler``.
+
+    ``handler`` receives the decoded message text and returns the
+    acknowledgement to send back. It runs on a thread pool so that blocking
+    work (parsing, ORM writes) never stalls the event loop. Each connection
+    keeps at most ``window`` messages in flight: reads pause once the window
+    is full, which lets TCP flow control push back on the sender. ACKs are
+    written in the order the messages arrived. If ``handler`` raises, the
+    message is answered with an ``AR`` built from its MSH so that the sender
+    retries it.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str], str],
+        *,
+        host: str = "127.0.0.1",
+        port: int = 2575,
+        window: int = 64,
+        workers: int = 4,
+        encoding: str = "utf-8",
+        max_message_size: int = 1 << 20,
+    ) -> None:
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.window = window
+        self.encoding = encoding
+        self.max_message_size = max_message_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mllp")
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    async def start(self) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=self.max_message_size
+        )
+        return self._server
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server else ()
+
+    async def serve_forever(self) -> None:
+        server = self._server or await self.start()
+        async with server:
+            await server.serve_forever()
+
+    async def close(self) -> None:
+        """Stop accepting connections and let open ones flush their ACKs."""
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+        loop = asyncio.get_running_loop()
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.window)
+        ack_writer = asyncio.create_task(self._write_acks(pending, writer))
+        try:
+            while True:
+                try:
+                    data = await reader.readuntil(END_BYTES)
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    logger.warning("Dropping MLLP connection: message exceeds %s bytes", self.max_message_size)
+                    break
+                start = data.find(START_BYTE)
+                if start == -1:
+                    continue
+                raw = data[start + 1:-len(END_BYTES)].decode(self.encoding, errors="replace")
+                await pending.put((raw, loop.run_in_executor(self._executor, self.handler, raw)))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await ack_writer
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _write_acks(self, pending: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        connected = True
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            raw, future = item
+            try:
+                ack = await future
+            except Exception:
+                logger.exception("MLLP handler failed")
+                ack = build_ack(raw, REJECT, "Message could not be processed")
+            if not connected:
+                continue
+            try:
+                writer.write(frame(ack).encode(self.encoding))
+                await writer.drain()
+            except ConnectionError:
+                # Keep consuming results so the reader is never blocked on a full window.
+                connected = False
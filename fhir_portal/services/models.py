@@ -16,14 +16,21 @@ class TimestampedModel(models.Model):
 
 
 class HL7Message(TimestampedModel):
-    message_id = models.CharField(max_length=64, unique=True)
-    correlation_id = models.CharField(max_length=64, blank=True)
+    # MSH-10 is only unique per sender, so messages are keyed on both.
+    sender = models.CharField(max_length=128, blank=True, default="")
+    message_id = models.CharField(max_length=64, db_index=True)
+    correlation_id = models.CharField(max_length=64, blank=True, db_index=True)
     status = models.CharField(max_length=32)
     raw_message = models.TextField()
     fhir_resources = models.JSONField(default=list, blank=True)
     errors = models.JSONField(default=list, blank=True)
     processed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sender", "message_id"], name="hl7_message_sender_unique"),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover - human-readable representation
         return f"HL7Message(message_id={self.message_id})"
 
@@ -34,6 +41,7 @@ class HL7BatchRequest(TimestampedModel):
     processed = models.PositiveIntegerField(default=0)
     failed = models.PositiveIntegerField(default=0)
     processing_time = models.CharField(max_length=32, blank=True)
+    status = models.CharField(max_length=32, default="pending")
     payload = models.JSONField(default=dict, blank=True)
 
     def __str__(self) -> str:  # pragma: no cover
@@ -47,12 +55,68 @@ class PatientRecord(TimestampedModel):
     birth_date = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=32, blank=True)
     data = models.JSONField(default=dict, blank=True)
+    version_id = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["identifier"], name="patient_identifier_idx"),
+            models.Index(fields=["name"], name="patient_name_idx"),
+            models.Index(fields=["birth_date"], name="patient_birth_date_idx"),
+            models.Index(fields=["gender", "birth_date"], name="patient_gender_birth_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"PatientRecord(patient_id={self.patient_id})"
 
 
+class PatientNameToken(TimestampedModel):
+    patient = models.ForeignKey(PatientRecord, on_delete=models.CASCADE, related_name="name_tokens")
+    part = models.CharField(max_length=16)
+    normalized = models.CharField(max_length=128)
+    phonetic = models.CharField(max_length=8)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["normalized"], name="name_token_normalized_idx"),
+            models.Index(fields=["phonetic", "part"], name="name_token_phonetic_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"PatientNameToken(patient={self.patient_id}, normalized={self.normalized})"
+
+
+class ResourceVersion(models.Model):
+    """Append-only history of FHIR resource versions.
+
+    Rows hold either a full ``snapshot`` of the resource or a ``delta``
+    against the previous version; deletions have neither.
+    """
+
+    resource_type = models.CharField(max_length=64)
+    resource_id = models.CharField(max_length=64)
+    version_id = models.PositiveIntegerField()
+    method = models.CharField(max_length=8)
+    last_updated = models.DateTimeField()
+    snapshot = models.JSONField(null=True, blank=True)
+    delta = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["resource_type", "resource_id", "version_id"], name="resource_version_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["resource_type", "last_updated"], name="resource_version_updated_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"ResourceVersion({self.resource_type}/{self.resource_id}/_history/{self.version_id})"
+
+
 class PatientMergeEvent(TimestampedModel):
+    # Assigned before the bulk insert, which does not return primary keys on MySQL.
+    event_id = models.CharField(max_length=64, unique=True)
     source_patient_id = models.CharField(max_length=64)
     target_patient_id = models.CharField(max_length=64)
     reason = models.TextField(blank=True)
@@ -77,9 +141,35 @@ class PatientExportJob(TimestampedModel):
         return f"PatientExportJob(export_id={self.export_id})"
 
 
+class PatientGroup(TimestampedModel):
+    group_id = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=256, blank=True)
+    members = models.ManyToManyField(PatientRecord, related_name="groups", blank=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"PatientGroup(group_id={self.group_id})"
+
+
+class BulkExportJob(TimestampedModel):
+    job_id = models.CharField(max_length=64, unique=True)
+    level = models.CharField(max_length=16)
+    group_id = models.CharField(max_length=64, blank=True)
+    resource_types = models.JSONField(default=list, blank=True)
+    since = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=32, default="queued")
+    request_url = models.TextField(blank=True)
+    transaction_time = models.DateTimeField(null=True, blank=True)
+    output = models.JSONField(default=list, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"BulkExportJob(job_id={self.job_id})"
+
+
 class ObservationRecord(TimestampedModel):
     observation_id = models.CharField(max_length=64, unique=True)
-    patient_reference = models.CharField(max_length=128, blank=True)
+    patient_reference = models.CharField(max_length=128, blank=True, db_index=True)
     category = models.CharField(max_length=64, blank=True)
     code = models.CharField(max_length=64, blank=True)
     status = models.CharField(max_length=32, blank=True)
@@ -90,6 +180,68 @@ class ObservationRecord(TimestampedModel):
         return f"ObservationRecord(observation_id={self.observation_id})"
 
 
+class ObservationSample(models.Model):
+    """One numeric value of an observation, kept narrow for time-range scans.
+
+    Observations with components (e.g. blood pressure) have one sample per
+    component, under the component's code.
+    """
+
+    observation_id = models.CharField(max_length=64, db_index=True)
+    patient_id = models.CharField(max_length=64)
+    code = models.CharField(max_length=64)
+    timestamp = models.DateTimeField()
+    value = models.FloatField()
+    unit = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient_id", "code", "timestamp"], name="observation_sample_series_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"ObservationSample({self.patient_id}, {self.code}, {self.timestamp})"
+
+
+class ObservationRollup(models.Model):
+    """Count, sum, min and max of the samples in one hour or day (UTC)."""
+
+    patient_id = models.CharField(max_length=64)
+    code = models.CharField(max_length=64)
+    granularity = models.CharField(max_length=8)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    unit = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["patient_id", "code", "granularity", "bucket_start"], name="observation_rollup_unique"
+            ),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"ObservationRollup({self.patient_id}, {self.code}, {self.granularity}, {self.bucket_start})"
+
+
+class ObservationSeriesLock(models.Model):
+    """Row locked while writing the samples and rollups of one patient's series."""
+
+    patient_id = models.CharField(max_length=64)
+    code = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient_id", "code"], name="observation_series_lock_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"ObservationSeriesLock(patient={self.patient_id}, code={self.code})"
+
+
 class ObservationAlertConfig(TimestampedModel):
     patient_id = models.CharField(max_length=64)
     observation_code = models.CharField(max_length=64)
@@ -109,23 +261,83 @@ class AppointmentRecord(TimestampedModel):
     status = models.CharField(max_length=32)
     start = models.DateTimeField(null=True, blank=True)
     end = models.DateTimeField(null=True, blank=True)
-    patient_reference = models.CharField(max_length=128, blank=True)
+    patient_reference = models.CharField(max_length=128, blank=True, db_index=True)
     practitioner_reference = models.CharField(max_length=128, blank=True)
     service_category = models.CharField(max_length=128, blank=True)
     appointment_type = models.CharField(max_length=128, blank=True)
     data = models.JSONField(default=dict, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["practitioner_reference", "start"], name="appointment_practitioner_idx"),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover
         return f"AppointmentRecord(appointment_id={self.appointment_id})"
 
 
+class PractitionerSchedule(TimestampedModel):
+    """One weekly working window of a practitioner, in UTC.
+
+    ``weekday`` counts from Monday (0). An ``end_time`` of midnight means the
+    end of the day.
+    """
+
+    practitioner_id = models.CharField(max_length=64, db_index=True)
+    weekday = models.PositiveSmallIntegerField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"PractitionerSchedule(practitioner={self.practitioner_id}, weekday={self.weekday})"
+
+
+class AppointmentLock(models.Model):
+    """Row locked while booking a practitioner's appointments on one (UTC) day."""
+
+    practitioner_id = models.CharField(max_length=64)
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["practitioner_id", "day"], name="appointment_lock_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"AppointmentLock(practitioner={self.practitioner_id}, day={self.day})"
+
+
+class IdempotencyKey(TimestampedModel):
+    """The stored response of a request made with an ``Idempotency-Key`` header."""
+
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=128)
+    request_hash = models.CharField(max_length=64)
+    response = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_key_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"IdempotencyKey(scope={self.scope}, key={self.key})"
+
+
 class WaitlistEntry(TimestampedModel):
     appointment_id = models.CharField(max_length=64)
     patient_id = models.CharField(max_length=64)
+    practitioner_id = models.CharField(max_length=64, blank=True)
     preferred_dates = models.JSONField(default=list, blank=True)
     preferred_times = models.JSONField(default=list, blank=True)
     priority = models.CharField(max_length=32, blank=True)
     notification_preferences = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, default="waiting")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "practitioner_id"], name="waitlist_status_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"WaitlistEntry(appointment_id={self.appointment_id}, patient_id={self.patient_id})"
@@ -142,6 +354,27 @@ class AuthEvent(TimestampedModel):
         return f"AuthEvent(user_id={self.user_id}, event_type={self.event_type})"
 
 
+class IndexGeneration(models.Model):
+    """A counter bumped whenever the rows behind an in-process index change."""
+
+    name = models.CharField(max_length=64, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"IndexGeneration(name={self.name}, generation={self.generation})"
+
+
+class RevokedToken(models.Model):
+    """A bearer token id revoked before its expiry."""
+
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"RevokedToken(jti={self.jti})"
+
+
 class RoleAssignmentRecord(TimestampedModel):
     assignment_id = models.CharField(max_length=64, unique=True)
     user_id = models.CharField(max_length=64)
@@ -150,6 +383,14 @@ class RoleAssignmentRecord(TimestampedModel):
     effective_date = models.DateTimeField(null=True, blank=True)
     expiry_date = models.DateTimeField(null=True, blank=True)
     reason = models.TextField(blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id"], name="role_assignment_user_idx"),
+            # Unrevoked assignments by expiry, for the expiry sweeper.
+            models.Index(fields=["revoked_at", "expiry_date"], name="role_assignment_expiry_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"RoleAssignmentRecord(assignment_id={self.assignment_id})"
@@ -0,0 +1,179 @@
+"""Observation alert rules evaluated against new observation samples.
+
+Active :class:`~services.models.ObservationAlertConfig` rows are held in an
+in-memory index keyed by ``(patient_id, code)``, so evaluating a sample is
+a single dictionary lookup and two comparisons. Alerts are enqueued as
+``queued`` :class:`~services.models.NotificationMessage` rows with one bulk
+insert per write, in the same transaction as the observations.
+
+``thresholds`` holds ``low`` and/or ``high`` numbers. A value below ``low``
+or above ``high`` raises an alert.
+
+Changing a rule through :func:`configure` marks this process's index stale
+once the transaction commits. It also bumps the rules' generation (see
+:mod:`services.generations`). Other processes read the generation at most
+every ``settings.OBSERVATION_ALERT_RELOAD_SECONDS`` and reload when it has
+moved.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import generations
+from .models import NotificationMessage, ObservationAlertConfig, ObservationSample
+from .sample_utils import generate_identifier, isoformat
+
+GENERATION = "observation-alerts"
+TEMPLATE = "observation_alert"
+
+
+class AlertConfigError(ValueError):
+    """Raised for alert configurations that cannot be saved."""
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    patient_id: str
+    code: str
+    low: float | None
+    high: float | None
+    channels: tuple[str, ...]
+
+
+def parse_thresholds(thresholds: Any) -> tuple[float | None, float | None]:
+    if not isinstance(thresholds, dict):
+        raise AlertConfigError("thresholds must be an object")
+    bounds = []
+    for name in ("low", "high"):
+        value = thresholds.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise AlertConfigError(f"thresholds.{name} must be a number")
+        bounds.append(float(value) if value is not None else None)
+    low, high = bounds
+    if low is None and high is None:
+        raise AlertConfigError("thresholds must set low and/or high")
+    if low is not None and high is not None and low > high:
+        raise AlertConfigError("thresholds.low must not exceed thresholds.high")
+    return low, high
+
+
+class AlertIndex:
+    """The active alert rules of this process, keyed by ``(patient_id, code)``."""
+
+    def __init__(self) -> None:
+        self._rules: dict[tuple[str, str], AlertRule] = {}
+        self._generation: int | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        rules = {}
+        rows = ObservationAlertConfig.objects.filter(active=True).values_list(
+            "patient_id", "observation_code", "thresholds", "notification_channels"
+        )
+        for patient_id, code, thresholds, channels in rows.iterator():
+            try:
+                low, high = parse_thresholds(thresholds)
+            except AlertConfigError:
+                continue
+            rules[(patient_id, code)] = AlertRule(patient_id, code, low, high, tuple(channels or ()))
+        self._rules = rules
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def refresh(self) -> None:
+        """Reload when marked stale or when another process changed a rule."""
+
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < settings.OBSERVATION_ALERT_RELOAD_SECONDS:
+            return
+        with self._lock:
+            generation = generations.current(GENERATION)
+            if self._stale or generation != self._generation:
+                self._stale = False
+                self._generation = generation
+                self.load()
+            self._checked_at = now
+
+    def match(self, patient_id: str, code: str, value: float) -> AlertRule | None:
+        rule = self._rules.get((patient_id, code))
+        if rule is None:
+            return None
+        if (rule.low is not None and value < rule.low) or (rule.high is not None and value > rule.high):
+            return rule
+        return None
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+
+index = AlertIndex()
+
+
+def configure(
+    patient_id: str,
+    code: str,
+    *,
+    thresholds: Any,
+    channels: Iterable[str] = (),
+    active: bool = True,
+) -> ObservationAlertConfig:
+    """Create or replace the rule for ``(patient_id, code)``."""
+
+    if not patient_id or not code:
+        raise AlertConfigError("patientId and observationCode are required")
+    parse_thresholds(thresholds)
+    config, _ = ObservationAlertConfig.objects.update_or_create(
+        patient_id=patient_id,
+        observation_code=code,
+        defaults={"thresholds": thresholds, "notification_channels": list(channels), "active": active},
+    )
+    generations.bump(GENERATION)
+    transaction.on_commit(index.mark_stale)
+    return config
+
+
+def _notification(rule: AlertRule, sample: ObservationSample) -> NotificationMessage:
+    return NotificationMessage(
+        notification_id=generate_identifier("alert"),
+        recipient_id=rule.patient_id,
+        template=TEMPLATE,
+        channels=list(rule.channels),
+        status="queued",
+        scheduled_at=timezone.now(),
+        data={
+            "observationId": sample.observation_id,
+            "code": sample.code,
+            "value": sample.value,
+            "unit": sample.unit,
+            "effectiveDateTime": isoformat(sample.timestamp),
+            "thresholds": {"low": rule.low, "high": rule.high},
+        },
+    )
+
+
+def enqueue_alerts(samples: Iterable[ObservationSample]) -> list[NotificationMessage]:
+    """Evaluate new samples and enqueue a notification for each one out of range."""
+
+    index.refresh()
+    if not len(index):
+        return []
+    match = index.match
+    notifications = [
+        _notification(rule, sample)
+        for sample in samples
+        if (rule := match(sample.patient_id, sample.code, sample.value)) is not None
+    ]
+    if notifications:
+        NotificationMessage.objects.bulk_create(notifications)
+    return notifications
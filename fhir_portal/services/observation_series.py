@@ -0,0 +1,429 @@
+"""Numeric observation time series, rollups and downsampling.
+
+Every numeric value of an observation (``valueQuantity`` and each
+``component.valueQuantity``) is copied into :class:`~services.models.ObservationSample`,
+a narrow table indexed on ``(patient_id, code, timestamp)``. Hourly and
+daily :class:`~services.models.ObservationRollup` rows hold the count, sum,
+minimum and maximum of each bucket (UTC). Writes recompute only the buckets
+they touch, and the daily rollups are computed from the hourly ones.
+
+Writers to the same series run one after the other. Before changing any
+samples, a write locks the :class:`~services.models.ObservationSeriesLock`
+rows of the series it touches with ``SELECT ... FOR UPDATE``, in key order.
+The rollups are then recomputed with locking reads, which under MySQL's
+``REPEATABLE READ`` also see the samples that writers holding the lock
+earlier committed after this transaction's snapshot was taken. Concurrent
+gateways posting vitals for one patient therefore neither lose each other's
+samples nor collide on ``observation_rollup_unique``.
+
+A trend request never reads more than about ``points`` rollup rows, or at
+most ``settings.OBSERVATION_TREND_RAW_LIMIT`` samples:
+
+* ranges where each point spans a day or more are read from daily rollups;
+* ranges where each point spans an hour or more are read from hourly rollups;
+* shorter ranges are read from the samples and downsampled with
+  Largest-Triangle-Three-Buckets (``lttb``) or per-bucket min/max (``minmax``),
+  unless the hourly rollups show more samples than the limit.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Iterable, Sequence
+
+from django.conf import settings
+from django.db.models import Case, Count, Max, Min, Q, QuerySet, Sum, Value, When
+from django.db.models.functions import TruncDay, TruncHour
+
+from .fhir_utils import first_code
+from .models import ObservationRecord, ObservationRollup, ObservationSample, ObservationSeriesLock
+from .sample_utils import isoformat
+
+RAW = "raw"
+HOUR = "hour"
+DAY = "day"
+
+BUCKET_WIDTHS = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+
+LTTB = "lttb"
+MIN_MAX = "minmax"
+METHODS = (LTTB, MIN_MAX)
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+BULK_BATCH_SIZE = 1000
+
+# (patient_id, code) -> (first, last) timestamp touched by a write.
+Ranges = dict[tuple[str, str], tuple[datetime, datetime]]
+
+
+class SeriesError(ValueError):
+    """Raised for trend requests that cannot be answered."""
+
+
+@dataclass
+class Trend:
+    resolution: str
+    unit: str
+    points: list[dict[str, Any]]
+
+
+def patient_id_of(reference: str) -> str:
+    return reference.rpartition("/")[2]
+
+
+def samples_for(record: ObservationRecord) -> list[ObservationSample]:
+    """Return the numeric samples carried by one observation."""
+
+    if record.effective_datetime is None:
+        return []
+    data = record.data or {}
+    quantities = [(record.code, data.get("valueQuantity"))]
+    quantities.extend(
+        (first_code(component.get("code"))[:64], component.get("valueQuantity"))
+        for component in data.get("component") or []
+        if isinstance(component, dict)
+    )
+    samples = []
+    for code, quantity in quantities:
+        if not code or not isinstance(quantity, dict):
+            continue
+        value = quantity.get("value")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        samples.append(
+            ObservationSample(
+                observation_id=record.observation_id,
+                patient_id=patient_id_of(record.patient_reference),
+                code=code,
+                timestamp=record.effective_datetime,
+                value=float(value),
+                unit=str(quantity.get("unit") or quantity.get("code") or "")[:32],
+            )
+        )
+    return samples
+
+
+def _floor(moment: datetime, granularity: str) -> datetime:
+    moment = moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == DAY else moment
+
+
+def _extend(ranges: Ranges, key: tuple[str, str], first: datetime, last: datetime) -> None:
+    if key in ranges:
+        first, last = min(first, ranges[key][0]), max(last, ranges[key][1])
+    ranges[key] = (first, last)
+
+
+def _sample_ranges(queryset: QuerySet) -> Ranges:
+    rows = queryset.values("patient_id", "code").annotate(first=Min("timestamp"), last=Max("timestamp"))
+    return {(row["patient_id"], row["code"]): (row["first"], row["last"]) for row in rows}
+
+
+def _lock_series(keys: Iterable[tuple[str, str]]) -> None:
+    """Lock the ``(patient_id, code)`` series that are about to be written.
+
+    Call it inside the write's transaction, before any sample changes.
+    """
+
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    condition = Q()
+    for patient_id, code in keys:
+        condition |= Q(patient_id=patient_id, code=code)
+    locked = ObservationSeriesLock.objects.select_for_update().filter(condition).order_by("patient_id", "code")
+    missing = set(keys) - set(locked.values_list("patient_id", "code"))
+    if missing:
+        # A series' first writers wait for each other on the unique key, then lock the row.
+        ObservationSeriesLock.objects.bulk_create(
+            [ObservationSeriesLock(patient_id=patient_id, code=code) for patient_id, code in sorted(missing)],
+            ignore_conflicts=True,
+        )
+        list(locked.values_list("pk", flat=True))
+
+
+def _windows(ranges: Ranges, granularity: str, field_name: str) -> Q:
+    """Match the whole ``granularity`` buckets covering ``ranges``."""
+
+    condition = Q()
+    for (patient_id, code), (first, last) in ranges.items():
+        condition |= Q(
+            patient_id=patient_id,
+            code=code,
+            **{
+                f"{field_name}__gte": _floor(first, granularity),
+                f"{field_name}__lt": _floor(last, granularity) + BUCKET_WIDTHS[granularity],
+            },
+        )
+    return condition
+
+
+def _replace_rollups(granularity: str, ranges: Ranges, rows: Iterable[dict[str, Any]]) -> None:
+    stale = ObservationRollup.objects.filter(_windows(ranges, granularity, "bucket_start"), granularity=granularity)
+    stale.delete()
+    ObservationRollup.objects.bulk_create(
+        (
+            ObservationRollup(
+                patient_id=row["patient_id"],
+                code=row["code"],
+                granularity=granularity,
+                bucket_start=row["bucket"],
+                count=row["bucket_count"],
+                total=row["bucket_total"],
+                minimum=row["bucket_minimum"],
+                maximum=row["bucket_maximum"],
+                unit=row["bucket_unit"] or "",
+            )
+            for row in rows
+        ),
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+
+def refresh_rollups(ranges: Ranges) -> None:
+    """Recompute the hourly and daily rollups of the buckets covering ``ranges``.
+
+    The series of ``ranges`` must already be locked (see :func:`_lock_series`).
+    """
+
+    if not ranges:
+        return
+    hourly = (
+        ObservationSample.objects.select_for_update()
+        .filter(_windows(ranges, HOUR, "timestamp"))
+        .annotate(bucket=TruncHour("timestamp", tzinfo=dt_timezone.utc))
+        .values("patient_id", "code", "bucket")
+        .annotate(
+            bucket_count=Count("pk"),
+            bucket_total=Sum("value"),
+            bucket_minimum=Min("value"),
+            bucket_maximum=Max("value"),
+            bucket_unit=Max("unit"),
+        )
+    )
+    _replace_rollups(HOUR, ranges, list(hourly))
+    daily = (
+        ObservationRollup.objects.select_for_update()
+        .filter(_windows(ranges, DAY, "bucket_start"), granularity=HOUR)
+        .annotate(bucket=TruncDay("bucket_start", tzinfo=dt_timezone.utc))
+        .values("patient_id", "code", "bucket")
+        .annotate(
+            bucket_count=Sum("count"),
+            bucket_total=Sum("total"),
+            bucket_minimum=Min("minimum"),
+            bucket_maximum=Max("maximum"),
+            bucket_unit=Max("unit"),
+        )
+    )
+    _replace_rollups(DAY, ranges, list(daily))
+
+
+def _series(samples: Iterable[ObservationSample]) -> list[tuple[str, str]]:
+    return [(sample.patient_id, sample.code) for sample in samples]
+
+
+def _add_samples(samples: list[ObservationSample], ranges: Ranges) -> list[ObservationSample]:
+    ObservationSample.objects.bulk_create(samples, batch_size=BULK_BATCH_SIZE)
+    for sample in samples:
+        _extend(ranges, (sample.patient_id, sample.code), sample.timestamp, sample.timestamp)
+    refresh_rollups(ranges)
+    return samples
+
+
+def add_observations(records: Iterable[ObservationRecord]) -> list[ObservationSample]:
+    """Write the samples of newly created observations and refresh their rollups."""
+
+    samples = [sample for record in records for sample in samples_for(record)]
+    _lock_series(_series(samples))
+    return _add_samples(samples, {})
+
+
+def sync_observations(
+    records: Iterable[ObservationRecord] = (), deleted_ids: Iterable[str] = ()
+) -> list[ObservationSample]:
+    """Replace the samples of written or deleted observations and refresh their rollups.
+
+    Returns the samples written for ``records``.
+    """
+
+    records = list(records)
+    observation_ids = [record.observation_id for record in records] + list(deleted_ids)
+    if not observation_ids:
+        return []
+    samples = [sample for record in records for sample in samples_for(record)]
+    existing = ObservationSample.objects.filter(observation_id__in=observation_ids)
+    ranges = _sample_ranges(existing)
+    _lock_series([*ranges, *_series(samples)])
+    if ranges:
+        existing.delete()
+    return _add_samples(samples, ranges)
+
+
+def move_patients(mapping: dict[str, str]) -> None:
+    """Move the series of merged patients (``source -> target``) to the targets."""
+
+    if not mapping:
+        return
+    moved = ObservationSample.objects.filter(patient_id__in=list(mapping))
+    ranges = _sample_ranges(moved)
+    if not ranges:
+        return
+    _lock_series([*ranges, *((mapping[source], code) for source, code in ranges)])
+    whens = [When(patient_id=source, then=Value(target)) for source, target in mapping.items()]
+    moved.update(patient_id=Case(*whens, default="patient_id"))
+    for (source, code), (first, last) in list(ranges.items()):
+        _extend(ranges, (mapping[source], code), first, last)
+    refresh_rollups(ranges)
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> list[int]:
+    """Return the indices kept by Largest-Triangle-Three-Buckets downsampling."""
+
+    size = len(xs)
+    if threshold >= size or threshold < 3:
+        return list(range(size))
+    every = (size - 2) / (threshold - 2)
+    selected = [0]
+    anchor = 0
+    for bucket in range(threshold - 2):
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, size)
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        anchor_x, anchor_y = xs[anchor], ys[anchor]
+        best, best_area = next_start - 1, -1.0
+        for index in range(int(bucket * every) + 1, next_start):
+            area = abs(
+                (anchor_x - average_x) * (ys[index] - anchor_y) - (anchor_x - xs[index]) * (average_y - anchor_y)
+            )
+            if area > best_area:
+                best, best_area = index, area
+        selected.append(best)
+        anchor = best
+    selected.append(size - 1)
+    return selected
+
+
+def min_max(ys: Sequence[float], threshold: int) -> list[int]:
+    """Return the indices of the minimum and maximum of ``threshold // 2`` equal-count buckets."""
+
+    size = len(ys)
+    if threshold >= size:
+        return list(range(size))
+    buckets = max(threshold // 2, 1)
+    selected = []
+    for bucket in range(buckets):
+        indices = range(bucket * size // buckets, (bucket + 1) * size // buckets)
+        if indices:
+            low = min(indices, key=ys.__getitem__)
+            high = max(indices, key=ys.__getitem__)
+            selected.extend(sorted({low, high}))
+    return selected
+
+
+def resolution(start: datetime, end: datetime, points: int) -> str:
+    width = (end - start) / points
+    if width >= BUCKET_WIDTHS[DAY]:
+        return DAY
+    if width >= BUCKET_WIDTHS[HOUR]:
+        return HOUR
+    return RAW
+
+
+def _rollups(patient_id: str, code: str, granularity: str, start: datetime, end: datetime) -> QuerySet:
+    return ObservationRollup.objects.filter(
+        patient_id=patient_id,
+        code=code,
+        granularity=granularity,
+        bucket_start__gte=_floor(start, granularity),
+        bucket_start__lt=end,
+    )
+
+
+def _raw_trend(
+    patient_id: str, code: str, start: datetime, end: datetime, points: int, method: str
+) -> Trend:
+    rows = list(
+        ObservationSample.objects.filter(
+            patient_id=patient_id, code=code, timestamp__gte=start, timestamp__lt=end
+        )
+        .order_by("timestamp")
+        .values_list("timestamp", "value", "unit")
+    )
+    ys = [value for _, value, _ in rows]
+    if method == LTTB:
+        keep = lttb([timestamp.timestamp() for timestamp, _, _ in rows], ys, points)
+    else:
+        keep = min_max(ys, points)
+    return Trend(
+        resolution=RAW,
+        unit=rows[0][2] if rows else "",
+        points=[{"timestamp": isoformat(rows[index][0]), "value": rows[index][1]} for index in keep],
+    )
+
+
+def _rollup_trend(
+    patient_id: str, code: str, granularity: str, start: datetime, end: datetime, points: int
+) -> Trend:
+    rows = list(
+        _rollups(patient_id, code, granularity, start, end)
+        .order_by("bucket_start")
+        .values_list("bucket_start", "count", "total", "minimum", "maximum", "unit")
+    )
+    width = (end - start) / points
+    merged: list[list[Any]] = []
+    group = None
+    for bucket_start, count, total, minimum, maximum, _ in rows:
+        index = max(0, int((bucket_start - start) / width))
+        if merged and index == group:
+            point = merged[-1]
+            point[1] += count
+            point[2] += total
+            point[3] = min(point[3], minimum)
+            point[4] = max(point[4], maximum)
+        else:
+            merged.append([bucket_start, count, total, minimum, maximum])
+            group = index
+    return Trend(
+        resolution=granularity,
+        unit=rows[0][5] if rows else "",
+        points=[
+            {
+                "timestamp": isoformat(bucket_start),
+                "value": total / count,
+                "min": minimum,
+                "max": maximum,
+                "count": count,
+            }
+            for bucket_start, count, total, minimum, maximum in merged
+        ],
+    )
+
+
+def trend(
+    patient_id: str,
+    code: str,
+    *,
+    start: datetime,
+    end: datetime,
+    points: int = DEFAULT_POINTS,
+    method: str = LTTB,
+) -> Trend:
+    """Return at most about ``points`` points of one patient's series."""
+
+    if end <= start:
+        raise SeriesError("end must be after start")
+    if not 3 <= points <= MAX_POINTS:
+        raise SeriesError(f"points must be between 3 and {MAX_POINTS}")
+    if method not in METHODS:
+        raise SeriesError(f"Unsupported downsampling method: {method!r}")
+    granularity = resolution(start, end, points)
+    if granularity == RAW:
+        samples = _rollups(patient_id, code, HOUR, start, end).aggregate(total=Sum("count"))["total"] or 0
+        if samples <= settings.OBSERVATION_TREND_RAW_LIMIT:
+            return _raw_trend(patient_id, code, start, end, points, method)
+        granularity = HOUR
+    return _rollup_trend(patient_id, code, granularity, start, end, points)
@@ -0,0 +1,254 @@
+"""Background patient export jobs.
+
+An export streams one patient's resources (the Patient, their observations
+and their appointments) to a file under ``settings.EXPORT_ROOT`` either as
+NDJSON or as a FHIR ``collection`` Bundle. Observations and appointments are
+read in keyset pages of ``settings.EXPORT_CHUNK_SIZE`` rows (``pk > last``,
+ordered by ``pk``), since MySQL drivers buffer a whole result set client-side,
+and are written one at a time. Memory use therefore does not depend on the
+size of the export. The file is written under a temporary name and renamed
+into place once complete, so a download never sees a partial file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import AppointmentRecord, ObservationRecord, PatientExportJob, PatientRecord
+from .patient_records import patient_resource
+from .sample_utils import generate_identifier, isoformat
+
+logger = logging.getLogger(__name__)
+
+NDJSON = "ndjson"
+BUNDLE = "bundle"
+
+FORMATS = {
+    NDJSON: ("ndjson", "application/fhir+ndjson"),
+    BUNDLE: ("json", "application/fhir+json"),
+}
+
+PATIENT = "patient"
+OBSERVATIONS = "observations"
+APPOINTMENTS = "appointments"
+
+SECTIONS = (PATIENT, OBSERVATIONS, APPOINTMENTS)
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class ExportError(ValueError):
+    """Raised for export requests that cannot be carried out."""
+
+
+def _dumps(resource: dict[str, Any]) -> str:
+    return json.dumps(resource, separators=(",", ":"), default=str)
+
+
+def stored_resource(resource_type: str, resource_id: str, data: dict[str, Any]) -> dict[str, Any]:
+    """Return the FHIR resource stored in a record's ``data`` column."""
+
+    resource = dict(data or {})
+    resource.setdefault("resourceType", resource_type)
+    resource["id"] = resource_id
+    return resource
+
+
+def patient_references(patient_id: str) -> list[str]:
+    """Return the ``patient_reference`` values that point at ``patient_id``."""
+
+    return [f"Patient/{patient_id}", patient_id]
+
+
+def iter_stored(
+    queryset: QuerySet, resource_type: str, id_field: str, *, chunk_size: int
+) -> Iterator[dict[str, Any]]:
+    """Yield the stored resources of ``queryset`` in primary-key order, one keyset page at a time."""
+
+    last_pk = 0
+    while True:
+        page = queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", id_field, "data")
+        rows = list(page[:chunk_size])
+        for _, resource_id, data in rows:
+            yield stored_resource(resource_type, resource_id, data)
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def iter_patient_resources(
+    patient_id: str,
+    sections: Sequence[str] = SECTIONS,
+    *,
+    chunk_size: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Yield the resources exported for ``patient_id``, one at a time."""
+
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    references = patient_references(patient_id)
+    if PATIENT in sections:
+        record = PatientRecord.objects.filter(patient_id=patient_id).first()
+        if record is not None:
+            yield patient_resource(record)
+    if OBSERVATIONS in sections:
+        yield from iter_stored(
+            ObservationRecord.objects.filter(patient_reference__in=references),
+            "Observation",
+            "observation_id",
+            chunk_size=chunk_size,
+        )
+    if APPOINTMENTS in sections:
+        yield from iter_stored(
+            AppointmentRecord.objects.filter(patient_reference__in=references),
+            "Appointment",
+            "appointment_id",
+            chunk_size=chunk_size,
+        )
+
+
+def iter_ndjson(resources: Iterable[dict[str, Any]]) -> Iterator[str]:
+    for resource in resources:
+        yield _dumps(resource) + "\n"
+
+
+def iter_bundle(resources: Iterable[dict[str, Any]]) -> Iterator[str]:
+    """Yield a ``collection`` Bundle around ``resources`` piece by piece."""
+
+    yield '{"resourceType":"Bundle","type":"collection","timestamp":'
+    yield json.dumps(timezone.now().isoformat()) + ',"entry":['
+    separator = ""
+    for resource in resources:
+        url = f"{resource.get('resourceType')}/{resource.get('id')}"
+        yield separator + _dumps({"fullUrl": url, "resource": resource})
+        separator = ","
+    yield "]}\n"
+
+
+def write_file(path: Path, chunks: Iterable[str]) -> int:
+    """Write ``chunks`` to ``path`` atomically and return the size in bytes."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".part")
+    try:
+        with open(partial, "w", encoding="utf-8") as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+        os.replace(partial, path)
+    finally:
+        if partial.exists():
+            partial.unlink()
+    return path.stat().st_size
+
+
+def export_path(job: PatientExportJob) -> Path:
+    extension, _ = FORMATS[job.format]
+    return Path(settings.EXPORT_ROOT) / f"{job.export_id}.{extension}"
+
+
+def content_type(job: PatientExportJob) -> str:
+    return FORMATS[job.format][1]
+
+
+def create_export(
+    patient_id: str, *, export_format: str = NDJSON, sections: Sequence[str] = ()
+) -> PatientExportJob:
+    """Validate the request and record a queued :class:`PatientExportJob`."""
+
+    if not isinstance(export_format, str) or export_format not in FORMATS:
+        raise ExportError(f"Unsupported export format: {export_format!r}")
+    if not isinstance(sections, (list, tuple)) or not all(isinstance(section, str) for section in sections):
+        raise ExportError("include must be a list of section names")
+    unknown = sorted(set(sections) - set(SECTIONS))
+    if unknown:
+        raise ExportError(f"Unknown export sections: {', '.join(unknown)}")
+    if not PatientRecord.objects.filter(patient_id=patient_id).exists():
+        raise PatientRecord.DoesNotExist(f"Patient {patient_id} not found")
+    return PatientExportJob.objects.create(
+        export_id=generate_identifier("export"),
+        patient_id=patient_id,
+        status="queued",
+        format=export_format,
+        include_sections=[section for section in SECTIONS if section in sections] or list(SECTIONS),
+    )
+
+
+def run_export(job: PatientExportJob) -> PatientExportJob:
+    """Write the export file for ``job`` and record the outcome."""
+
+    PatientExportJob.objects.filter(pk=job.pk).update(status="in-progress", updated_at=timezone.now())
+    resources = iter_patient_resources(job.patient_id, job.include_sections)
+    writer = iter_bundle if job.format == BUNDLE else iter_ndjson
+    try:
+        write_file(export_path(job), writer(resources))
+    except Exception:
+        logger.exception("Patient export %s failed", job.export_id)
+        PatientExportJob.objects.filter(pk=job.pk).update(status="failed", updated_at=timezone.now())
+    else:
+        PatientExportJob.objects.filter(pk=job.pk).update(
+            status="completed",
+            download_url=f"/api/v1/exports/{job.export_id}/download",
+            expires_at=timezone.now() + timedelta(hours=settings.EXPORT_TTL_HOURS),
+            updated_at=timezone.now(),
+        )
+    job.refresh_from_db()
+    return job
+
+
+def start_export(job: PatientExportJob) -> threading.Thread:
+    """Run ``job`` on a background thread."""
+
+    def run() -> None:
+        try:
+            run_export(job)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name=f"patient-export-{job.export_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def sweep_expired(*, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Remove the files and rows of exports that have expired; return how many."""
+
+    swept = 0
+    while True:
+        jobs = list(
+            PatientExportJob.objects.filter(expires_at__lte=timezone.now()).only("pk", "export_id", "format")[
+                :batch_size
+            ]
+        )
+        for job in jobs:
+            export_path(job).unlink(missing_ok=True)
+        PatientExportJob.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+        swept += len(jobs)
+        if len(jobs) < batch_size:
+            return swept
+
+
+def serialize_export(job: PatientExportJob) -> dict[str, Any]:
+    """Render a job in the ``/patients/<id>/export`` response shape."""
+
+    path = export_path(job)
+    size = path.stat().st_size if job.status == "completed" and path.exists() else 0
+    return {
+        "exportId": job.export_id,
+        "patientId": job.patient_id,
+        "status": job.status,
+        "format": job.format,
+        "includeSections": job.include_sections,
+        "downloadUrl": job.download_url or None,
+        "size": size,
+        "expiresAt": isoformat(job.expires_at) if job.expires_at else None,
+    }
@@ -0,0 +1,189 @@
+"""Normalized and phonetic name index used for patient matching.
+
+Every name part (family and given names of all ``Patient.name`` entries) is
+stored in :class:`~services.models.PatientNameToken` twice over: as an
+accent-free lowercase token for prefix search and as a Soundex key for fuzzy
+search. Duplicate detection uses the phonetic keys as blocking keys, so only
+patients that share a family-name key and either a given-name key or a birth
+date are ever compared.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Value, When
+
+from .models import PatientNameToken, PatientRecord
+
+FAMILY = "family"
+GIVEN = "given"
+
+_NON_LETTERS = re.compile(r"[^a-z]+")
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+# Weights used to rank blocked candidates.
+FAMILY_WEIGHT = 0.4
+GIVEN_WEIGHT = 0.3
+BIRTH_DATE_WEIGHT = 0.2
+GENDER_WEIGHT = 0.1
+
+
+def normalize_tokens(value: str) -> list[str]:
+    """Split ``value`` into accent-free lowercase alphabetic tokens."""
+
+    decomposed = unicodedata.normalize("NFKD", value)
+    ascii_text = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+    return [token for token in _NON_LETTERS.split(ascii_text) if token]
+
+
+def soundex(token: str) -> str:
+    """Return the American Soundex key of an already normalized token."""
+
+    if not token:
+        return ""
+    key = token[0].upper()
+    previous = _SOUNDEX_CODES.get(token[0], "")
+    for ch in token[1:]:
+        if ch in "hw":
+            continue
+        code = _SOUNDEX_CODES.get(ch, "")
+        if code and code != previous:
+            key += code
+            if len(key) == 4:
+                break
+        previous = code
+    return key.ljust(4, "0")
+
+
+def name_tokens(resource: dict[str, Any]) -> set[tuple[str, str, str]]:
+    """Return ``(part, normalized, phonetic)`` triples for every name part."""
+
+    tokens = set()
+    for name in resource.get("name") or []:
+        if not isinstance(name, dict):
+            continue
+        parts = [(FAMILY, name.get("family") or "")]
+        parts += [(GIVEN, given or "") for given in name.get("given") or []]
+        if not name.get("family") and not name.get("given") and name.get("text"):
+            parts.append((GIVEN, name["text"]))
+        for part, text in parts:
+            for token in normalize_tokens(str(text)):
+                tokens.add((part, token[:128], soundex(token)))
+    return tokens
+
+
+def index_patient(record: PatientRecord) -> None:
+    """Replace the name tokens stored for ``record``.
+
+    Callers are expected to run this inside the transaction that wrote
+    ``record`` so the index never drifts from the resource.
+    """
+
+    PatientNameToken.objects.filter(patient=record).delete()
+    PatientNameToken.objects.bulk_create(
+        PatientNameToken(patient=record, part=part, normalized=normalized, phonetic=phonetic)
+        for part, normalized, phonetic in name_tokens(record.data)
+    )
+
+
+def name_prefix_q(value: str) -> Q:
+    """Match patients where every token of ``value`` prefixes some name part."""
+
+    tokens = normalize_tokens(value)
+    if not tokens:
+        # A value without letters names nobody; an empty Q would match everyone.
+        return Q(pk__in=[])
+    condition = Q()
+    for token in tokens:
+        condition &= Q(
+            pk__in=PatientNameToken.objects.filter(normalized__istartswith=token).values("patient")
+        )
+    return condition
+
+
+def name_phonetic_q(value: str) -> Q:
+    """Match patients where every token of ``value`` sounds like some name part."""
+
+    tokens = normalize_tokens(value)
+    if not tokens:
+        return Q(pk__in=[])
+    condition = Q()
+    for token in tokens:
+        condition &= Q(
+            pk__in=PatientNameToken.objects.filter(phonetic=soundex(token)).values("patient")
+        )
+    return condition
+
+
+@dataclass
+class Candidate:
+    record: PatientRecord
+    score: float = 0.0
+    matched_on: list[str] = field(default_factory=list)
+
+
+def _keys(tokens: Iterable[tuple[str, str, str]], part: str) -> set[str]:
+    return {phonetic for token_part, _, phonetic in tokens if token_part == part}
+
+
+def find_candidates(record: PatientRecord, *, limit: int = 20) -> list[Candidate]:
+    """Return likely duplicates of ``record`` ranked by score.
+
+    Blocking is done entirely through the phonetic index: candidates must
+    share a family-name key with ``record`` plus either a given-name key or
+    the birth date. The score is computed and ordered in SQL, so the best
+    ``limit`` blocked patients are returned however many share the keys.
+    """
+
+    tokens = name_tokens(record.data)
+    family_keys = _keys(tokens, FAMILY)
+    given_keys = _keys(tokens, GIVEN)
+    if not family_keys:
+        return []
+
+    family_match = PatientNameToken.objects.filter(part=FAMILY, phonetic__in=family_keys)
+    given_match = PatientNameToken.objects.filter(part=GIVEN, phonetic__in=given_keys)
+    second_key = Q(pk__in=given_match.values("patient"))
+    if record.birth_date:
+        second_key |= Q(birth_date=record.birth_date)
+    blocked = Q(pk__in=family_match.values("patient")) & second_key
+
+    # Every blocked patient matched on family name; the other signals add to it.
+    signals = {"given": (Exists(given_match.filter(patient=OuterRef("pk"))), GIVEN_WEIGHT)}
+    if record.birth_date:
+        signals["birthDate"] = (Q(birth_date=record.birth_date), BIRTH_DATE_WEIGHT)
+    if record.gender:
+        signals["gender"] = (Q(gender=record.gender), GENDER_WEIGHT)
+    matched = {
+        f"matched_{name}": Case(When(condition, then=Value(weight)), default=Value(0.0), output_field=FloatField())
+        for name, (condition, weight) in signals.items()
+    }
+    score = Value(FAMILY_WEIGHT, output_field=FloatField())
+    for name in matched:
+        score = score + F(name)
+    records = (
+        PatientRecord.objects.filter(blocked)
+        .exclude(pk=record.pk)
+        .annotate(**matched)
+        .annotate(match_score=score)
+        .order_by("-match_score", "pk")[:limit]
+    )
+
+    candidates = []
+    for other in records:
+        candidate = Candidate(other, other.match_score, ["family"])
+        candidate.matched_on += [name for name in signals if getattr(other, f"matched_{name}")]
+        candidates.append(candidate)
+    return candidates
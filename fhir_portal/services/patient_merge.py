@@ -0,0 +1,265 @@
+"""Patient merge engine.
+
+A merge folds the source patient's data into the target according to a
+strategy, marks the source inactive with a ``replaced-by`` link, repoints
+observations and appointments at the target and records a
+:class:`~services.models.PatientMergeEvent`.
+
+Pairs are processed in chunks. Each chunk costs a fixed number of set-based
+statements regardless of its size: one ``SELECT`` for the records, one
+``bulk_update`` for the merged resources, one ``UPDATE ... CASE`` per
+referencing table, and bulk writes for the name index and merge events.
+"""
+
+from __future__ import annotations
+
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Sequence
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from . import observation_series, resource_history
+from .models import (
+    AppointmentRecord,
+    ObservationRecord,
+    PatientMergeEvent,
+    PatientNameToken,
+    PatientRecord,
+)
+from .patient_matching import name_tokens
+from .patient_records import cache_on_commit, history_change, record_fields
+from .sample_utils import generate_identifier
+
+KEEP_TARGET = "keep_target"
+KEEP_SOURCE = "keep_source"
+KEEP_LATEST = "keep_latest"
+UNION = "union"
+
+MERGE_STRATEGIES = (KEEP_TARGET, KEEP_SOURCE, KEEP_LATEST, UNION)
+
+PROTECTED_FIELDS = {"resourceType", "id", "meta", "link", "active"}
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class MergeError(ValueError):
+    """Raised for merge requests that cannot be carried out."""
+
+
+@dataclass
+class MergeOutcome:
+    source_id: str
+    target_id: str
+    status: str
+    merged_fields: list[str] = field(default_factory=list)
+    event: PatientMergeEvent | None = None
+    error: str = ""
+
+
+def _is_empty(value: Any) -> bool:
+    return value in (None, "", [], {})
+
+
+def merge_resources(
+    source: dict[str, Any],
+    target: dict[str, Any],
+    *,
+    strategy: str = KEEP_TARGET,
+    fields: Iterable[str] | None = None,
+    source_is_newer: bool = False,
+) -> tuple[dict[str, Any], list[str]]:
+    """Return the merged target resource and the names of the fields it changed.
+
+    Gaps in the target are always filled from the source. Populated fields
+    are resolved by ``strategy``: ``keep_target`` leaves them alone,
+    ``keep_source`` takes the source value, ``keep_latest`` takes the value
+    of the more recently updated record and ``union`` appends source list
+    entries the target does not have yet.
+    """
+
+    if strategy not in MERGE_STRATEGIES:
+        raise MergeError(f"Unknown merge strategy: {strategy!r}")
+    candidates = set(fields) if fields else set(source) | set(target)
+    merged = deepcopy(target)
+    changed = []
+    for key in sorted(candidates - PROTECTED_FIELDS):
+        if key not in source:
+            continue
+        incoming = source[key]
+        current = target.get(key)
+        if _is_empty(current):
+            value = incoming
+        elif strategy == UNION and isinstance(current, list) and isinstance(incoming, list):
+            value = current + [item for item in incoming if item not in current]
+        elif strategy == KEEP_SOURCE or (strategy == KEEP_LATEST and source_is_newer):
+            value = incoming
+        else:
+            continue
+        if value != current:
+            merged[key] = deepcopy(value)
+            changed.append(key)
+    return merged, changed
+
+
+def _add_link(resource: dict[str, Any], other_id: str, link_type: str) -> None:
+    links = resource.setdefault("link", [])
+    entry = {"other": {"reference": f"Patient/{other_id}"}, "type": link_type}
+    if entry not in links:
+        links.append(entry)
+
+
+def _repoint(model, field_name: str, mapping: dict[str, str]) -> int:
+    if not mapping:
+        return 0
+    whens = [When(**{field_name: old}, then=Value(new)) for old, new in mapping.items()]
+    return model.objects.filter(**{f"{field_name}__in": list(mapping)}).update(
+        **{field_name: Case(*whens, default=field_name)}
+    )
+
+
+def _validate_pairs(pairs: Sequence[tuple[str, str]]) -> dict[int, str]:
+    """Return errors by pair index for pairs that conflict with each other."""
+
+    errors = {}
+    sources: set[str] = set()
+    targets = {target for _, target in pairs}
+    for index, (source, target) in enumerate(pairs):
+        if source == target:
+            errors[index] = "source and target are the same patient"
+        elif source in sources:
+            errors[index] = "source patient appears in more than one pair"
+        elif source in targets:
+            errors[index] = "source patient is also a merge target"
+        sources.add(source)
+    return errors
+
+
+def _merge_chunk(
+    pairs: Sequence[tuple[str, str]],
+    *,
+    strategy: str,
+    fields: Iterable[str] | None,
+    reason: str,
+    audit_reason: str,
+) -> list[MergeOutcome]:
+    outcomes: list[MergeOutcome] = []
+    with transaction.atomic():
+        ids = {patient_id for pair in pairs for patient_id in pair}
+        records = {
+            record.patient_id: record
+            for record in PatientRecord.objects.select_for_update().filter(patient_id__in=ids)
+        }
+        originals = {patient_id: record.data for patient_id, record in records.items()}
+        now = timezone.now()
+        changed_records: dict[str, PatientRecord] = {}
+        references: dict[str, str] = {}
+        events = []
+        for source_id, target_id in pairs:
+            source = records.get(source_id)
+            target = changed_records.get(target_id) or records.get(target_id)
+            if source is None or target is None:
+                missing = source_id if source is None else target_id
+                outcomes.append(
+                    MergeOutcome(source_id, target_id, "not-found", error=f"Patient {missing} not found")
+                )
+                continue
+            merged, merged_fields = merge_resources(
+                source.data,
+                target.data,
+                strategy=strategy,
+                fields=fields,
+                source_is_newer=source.updated_at > target.updated_at,
+            )
+            _add_link(merged, source_id, "replaces")
+            retired = deepcopy(source.data)
+            retired["active"] = False
+            _add_link(retired, target_id, "replaced-by")
+            for record, resource in ((target, merged), (source, retired)):
+                for name, value in record_fields(resource).items():
+                    setattr(record, name, value)
+                # bulk_update() does not apply auto_now.
+                record.updated_at = now
+                if record.patient_id not in changed_records:
+                    record.version_id += 1
+                changed_records[record.patient_id] = record
+            references[f"Patient/{source_id}"] = f"Patient/{target_id}"
+            references[source_id] = target_id
+            event = PatientMergeEvent(
+                event_id=generate_identifier("merge"),
+                source_patient_id=source_id,
+                target_patient_id=target_id,
+                reason=reason,
+                merge_strategy=strategy,
+                merged_fields=merged_fields,
+                audit_reason=audit_reason,
+            )
+            events.append(event)
+            outcomes.append(MergeOutcome(source_id, target_id, "merged", merged_fields, event))
+
+        if not events:
+            return outcomes
+        updated = list(changed_records.values())
+        PatientRecord.objects.bulk_update(
+            updated, ["identifier", "name", "birth_date", "gender", "data", "updated_at", "version_id"]
+        )
+        resource_history.record(history_change(record, originals[record.patient_id]) for record in updated)
+        cache_on_commit(updated)
+        _repoint(ObservationRecord, "patient_reference", references)
+        _repoint(AppointmentRecord, "patient_reference", references)
+        observation_series.move_patients({source: target for source, target in pairs if source in references})
+
+        # Retired sources drop out of the name index; targets are reindexed.
+        PatientNameToken.objects.filter(patient__in=updated).delete()
+        PatientNameToken.objects.bulk_create(
+            PatientNameToken(patient=record, part=part, normalized=normalized, phonetic=phonetic)
+            for record in updated
+            if record.data.get("active", True) is not False
+            for part, normalized, phonetic in name_tokens(record.data)
+        )
+        PatientMergeEvent.objects.bulk_create(events)
+    return outcomes
+
+
+def merge_patients(
+    pairs: Sequence[tuple[str, str]],
+    *,
+    strategy: str = KEEP_TARGET,
+    fields: Iterable[str] | None = None,
+    reason: str = "",
+    audit_reason: str = "",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> list[MergeOutcome]:
+    """Merge ``(source_id, target_id)`` pairs, one transaction per chunk.
+
+    Pairs that conflict with another pair in the same request (a patient
+    merged twice, or merged away and into at once) are skipped with an
+    ``invalid`` outcome rather than applied in an order-dependent way.
+    """
+
+    if strategy not in MERGE_STRATEGIES:
+        raise MergeError(f"Unknown merge strategy: {strategy!r}")
+    fields = list(fields) if fields else None
+    errors = _validate_pairs(pairs)
+    outcomes: list[MergeOutcome | None] = [None] * len(pairs)
+    valid = []
+    for index, (source_id, target_id) in enumerate(pairs):
+        if index in errors:
+            outcomes[index] = MergeOutcome(source_id, target_id, "invalid", error=errors[index])
+        else:
+            valid.append(index)
+
+    for start in range(0, len(valid), max(chunk_size, 1)):
+        indexes = valid[start:start + chunk_size]
+        chunk_outcomes = _merge_chunk(
+            [pairs[index] for index in indexes],
+            strategy=strategy,
+            fields=fields,
+            reason=reason,
+            audit_reason=audit_reason,
+        )
+        for index, outcome in zip(indexes, chunk_outcomes):
+            outcomes[index] = outcome
+    return outcomes
@@ -0,0 +1,161 @@
+"""Persistence helpers for FHIR Patient resources.
+
+The full resource lives in ``PatientRecord.data``. The searchable
+parameters (identifier, name, birth date, gender) are copied into indexed
+columns, and the name parts into the name token index, whenever a resource
+is written so that searches never have to look inside the JSON document.
+
+Every write bumps ``PatientRecord.version_id``, appends the new version to
+the resource history and writes it through the versioned read cache once
+the transaction commits.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from typing import Any
+
+from django.db import transaction
+
+from . import resource_cache, resource_history
+from .models import PatientRecord
+from .patient_matching import index_patient
+from .sample_utils import isoformat
+
+MRN_TYPE = "MR"
+
+RESOURCE_TYPE = "Patient"
+
+
+class VersionConflictError(Exception):
+    """Raised when ``If-Match`` names a version that is no longer current."""
+
+    def __init__(self, patient_id: str, current_version: int | None) -> None:
+        super().__init__(f"Patient {patient_id} is at version {current_version}")
+        self.current_version = current_version
+
+
+def primary_identifier(resource: dict[str, Any]) -> str:
+    """Return the medical record number, falling back to the first identifier."""
+
+    identifiers = [item for item in resource.get("identifier") or [] if isinstance(item, dict)]
+    for identifier in identifiers:
+        codings = (identifier.get("type") or {}).get("coding") or []
+        if any(coding.get("code") == MRN_TYPE for coding in codings if isinstance(coding, dict)):
+            return str(identifier.get("value") or "")
+    return str(identifiers[0].get("value") or "") if identifiers else ""
+
+
+def display_name(resource: dict[str, Any]) -> str:
+    """Return the first name formatted as ``"Family Given..."``."""
+
+    for name in resource.get("name") or []:
+        if not isinstance(name, dict):
+            continue
+        parts = [name.get("family") or "", *(name.get("given") or [])]
+        text = " ".join(part for part in parts if part)
+        return text or str(name.get("text") or "")
+    return ""
+
+
+def _birth_date(value: Any) -> date | None:
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def record_fields(resource: dict[str, Any]) -> dict[str, Any]:
+    """Return the denormalized column values for ``resource``."""
+
+    return {
+        "identifier": primary_identifier(resource)[:128],
+        "name": display_name(resource)[:256],
+        "birth_date": _birth_date(resource.get("birthDate")),
+        "gender": str(resource.get("gender") or "")[:32],
+        "data": resource,
+    }
+
+
+def save_patient(resource: dict[str, Any], *, expected_version: int | None = None) -> PatientRecord:
+    """Create or replace the record for ``resource['id']`` and reindex its names.
+
+    With ``expected_version`` the write only happens if that is still the
+    current version of the record.
+    """
+
+    patient_id = resource["id"]
+    with transaction.atomic():
+        record = PatientRecord.objects.select_for_update().filter(patient_id=patient_id).first()
+        current_version = record.version_id if record is not None else None
+        if expected_version is not None and current_version != expected_version:
+            raise VersionConflictError(patient_id, current_version)
+        previous = record.data if record is not None else None
+        if record is None:
+            record = PatientRecord.objects.create(
+                patient_id=patient_id,
+                version_id=resource_history.next_versions(RESOURCE_TYPE, [patient_id])[patient_id],
+                **record_fields(resource),
+            )
+        else:
+            for name, value in record_fields(resource).items():
+                setattr(record, name, value)
+            record.version_id += 1
+            record.save()
+        index_patient(record)
+        resource_history.record([history_change(record, previous)])
+        cache_on_commit([record])
+    return record
+
+
+def patient_resource(record: PatientRecord) -> dict[str, Any]:
+    """Return the stored FHIR resource for ``record``."""
+
+    resource = dict(record.data)
+    resource.setdefault("resourceType", "Patient")
+    resource["id"] = record.patient_id
+    resource["meta"] = {
+        **(resource.get("meta") or {}),
+        "versionId": str(record.version_id),
+        "lastUpdated": isoformat(record.updated_at),
+    }
+    return resource
+
+
+def history_change(record: PatientRecord, previous: dict[str, Any] | None) -> resource_history.Change:
+    return resource_history.Change(
+        RESOURCE_TYPE, record.patient_id, record.version_id, record.updated_at, record.data, previous
+    )
+
+
+def cached_patient(record: PatientRecord) -> resource_cache.CachedResource:
+    return resource_cache.CachedResource(
+        version=record.version_id,
+        last_modified=record.updated_at,
+        body=resource_cache.serialize(patient_resource(record)),
+    )
+
+
+def cache_on_commit(records: list[PatientRecord]) -> None:
+    """Write ``records`` through the read cache when the transaction commits."""
+
+    resource_cache.store_on_commit(
+        RESOURCE_TYPE, [(record.patient_id, cached_patient(record)) for record in records]
+    )
+
+
+def _current_version(patient_id: str) -> int | None:
+    return PatientRecord.objects.filter(patient_id=patient_id).values_list("version_id", flat=True).first()
+
+
+resource_cache.register_version_lookup(RESOURCE_TYPE, _current_version)
+
+
+def read_patient(patient_id: str) -> resource_cache.CachedResource | None:
+    """Return the current version of a patient, from the cache when possible."""
+
+    def load() -> resource_cache.CachedResource | None:
+        record = PatientRecord.objects.filter(patient_id=patient_id).first()
+        return cached_patient(record) if record is not None else None
+
+    return resource_cache.read(RESOURCE_TYPE, patient_id, load)
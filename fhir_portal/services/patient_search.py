@@ -0,0 +1,184 @@
+"""FHIR Patient search over :class:`~services.models.PatientRecord`.
+
+Every supported parameter maps onto an indexed column so that the database
+can answer the query from an index range scan:
+
+* ``name`` - every word must prefix some family or given name (accent and case
+  insensitive); with ``_fuzzy=true`` every word must sound like one (Soundex)
+* ``identifier`` - exact match on the primary identifier (``system|value`` or ``value``)
+* ``birthdate`` - date comparison with the FHIR prefixes ``eq ne lt gt le ge sa eb``
+  at year, month or day precision
+* ``gender`` - exact match
+* ``_id`` - exact match on the logical id
+
+Comma-separated values are OR-ed together and repeated parameters are
+AND-ed, as in the FHIR search specification. Results are paged with a keyset
+cursor on the primary key instead of ``OFFSET`` so that deep pages cost the
+same as the first one.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Iterable
+
+from django.db.models import Q, QuerySet
+
+from .models import PatientRecord
+from .patient_matching import name_phonetic_q, name_prefix_q
+
+DEFAULT_COUNT = 20
+MAX_COUNT = 100
+
+DATE_PREFIXES = ("eq", "ne", "lt", "gt", "le", "ge", "sa", "eb")
+
+
+class SearchParameterError(ValueError):
+    """Raised for search parameters that cannot be evaluated."""
+
+
+@dataclass
+class SearchResult:
+    records: list[PatientRecord]
+    count: int
+    next_cursor: str | None
+    total: int | None = None
+
+
+def encode_cursor(pk: int) -> str:
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> int:
+    padded = value + "=" * (-len(value) % 4)
+    try:
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise SearchParameterError(f"Invalid _page cursor: {value!r}") from None
+
+
+def _date_range(value: str) -> tuple[date, date]:
+    """Return the half-open ``[start, end)`` range covered by a partial date."""
+
+    try:
+        if len(value) == 4:
+            year = int(value)
+            return date(year, 1, 1), date(year + 1, 1, 1)
+        if len(value) == 7:
+            start = date(int(value[:4]), int(value[5:7]), 1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        start = date.fromisoformat(value[:10])
+    except ValueError:
+        raise SearchParameterError(f"Invalid birthdate value: {value!r}") from None
+    return start, start + timedelta(days=1)
+
+
+def birthdate_q(value: str) -> Q:
+    prefix = value[:2] if value[:2] in DATE_PREFIXES else "eq"
+    if value[:2] in DATE_PREFIXES:
+        value = value[2:]
+    start, end = _date_range(value)
+    if prefix == "eq":
+        return Q(birth_date__gte=start, birth_date__lt=end)
+    if prefix == "ne":
+        return Q(birth_date__lt=start) | Q(birth_date__gte=end)
+    if prefix in ("lt", "eb"):
+        return Q(birth_date__lt=start)
+    if prefix in ("gt", "sa"):
+        return Q(birth_date__gte=end)
+    if prefix == "le":
+        return Q(birth_date__lt=end)
+    return Q(birth_date__gte=start)
+
+
+def identifier_q(value: str) -> Q:
+    _, _, identifier = value.rpartition("|")
+    return Q(identifier=identifier)
+
+
+def gender_q(value: str) -> Q:
+    return Q(gender=value)
+
+
+def id_q(value: str) -> Q:
+    return Q(patient_id=value)
+
+
+PARAMETERS = {
+    "_id": id_q,
+    "name": name_prefix_q,
+    "identifier": identifier_q,
+    "birthdate": birthdate_q,
+    "gender": gender_q,
+}
+
+# FHIR search parameter types, advertised in the CapabilityStatement.
+PARAMETER_TYPES = {
+    "_id": "token",
+    "name": "string",
+    "identifier": "token",
+    "birthdate": "date",
+    "gender": "token",
+}
+
+
+def _any_of(builder, value: str) -> Q:
+    condition = Q()
+    for option in value.split(","):
+        if option:
+            condition |= builder(option)
+    return condition
+
+
+def build_queryset(
+    params: dict[str, Iterable[str]], *, fuzzy: bool = False
+) -> QuerySet[PatientRecord]:
+    """Translate FHIR search parameters into a filtered queryset."""
+
+    queryset = PatientRecord.objects.all()
+    builders = {**PARAMETERS, "name": name_phonetic_q} if fuzzy else PARAMETERS
+    for name, builder in builders.items():
+        for value in params.get(name, ()):
+            if value:
+                queryset = queryset.filter(_any_of(builder, value))
+    return queryset
+
+
+def page_size(value: str | None) -> int:
+    if value in (None, ""):
+        return DEFAULT_COUNT
+    try:
+        count = int(value)
+    except ValueError:
+        raise SearchParameterError(f"Invalid _count value: {value!r}") from None
+    return max(0, min(count, MAX_COUNT))
+
+
+def search_patients(
+    params: dict[str, Iterable[str]],
+    *,
+    count: int = DEFAULT_COUNT,
+    cursor: str | None = None,
+    include_total: bool = False,
+    fuzzy: bool = False,
+) -> SearchResult:
+    """Run a search and return one page of matches ordered by primary key.
+
+    One extra row is fetched to decide whether a next page exists, so paging
+    never needs a ``COUNT(*)``. The total is only computed on request.
+    """
+
+    queryset = build_queryset(params, fuzzy=fuzzy)
+    total = queryset.count() if include_total else None
+    page = queryset
+    if cursor:
+        page = page.filter(pk__gt=decode_cursor(cursor))
+    records = list(page.order_by("pk")[:count + 1])
+    next_cursor = None
+    if len(records) > count:
+        records = records[:count]
+        next_cursor = encode_cursor(records[-1].pk) if records else None
+    return SearchResult(records=records, count=count, next_cursor=next_cursor, total=total)
@@ -0,0 +1,223 @@
+"""Role-based permission checks.
+
+Roles are defined in ``settings.RBAC_ROLES`` as lists of permissions such as
+``read:patients`` or ``write:observations``. ``read:*`` and ``*`` are
+wildcards. When the catalogue is loaded, every permission gets one bit and
+every role becomes the bitmask of its permissions.
+
+A user's effective permissions are the OR of the masks of the roles and
+direct permissions on their :class:`~services.models.RoleAssignmentRecord`
+rows that are in effect, meaning ``effective_date`` has passed and
+``expiry_date`` has not. The mask is computed with one query and then cached
+in process for ``settings.RBAC_CACHE_SIZE`` users. Each cached mask records
+the next time one of the user's assignments starts or lapses, and it is
+recomputed after that. A permission check is then a single ``&`` of two
+integers.
+
+Any change to assignments bumps their generation (see
+:mod:`services.generations`). The writing process drops the affected users
+once the transaction commits. Every process clears its cache when it sees the
+generation move, which it checks at most every ``settings.RBAC_RELOAD_SECONDS``.
+Revoked assignments are ignored.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+from . import generations
+from .models import RoleAssignmentRecord
+from .resource_cache import LRUCache
+
+GENERATION = "role-assignments"
+WILDCARD = "*"
+
+
+@dataclass(frozen=True)
+class Grant:
+    """The permissions a user holds, valid until ``valid_until`` (epoch seconds)."""
+
+    mask: int
+    roles: tuple[str, ...]
+    valid_until: float
+
+
+def permission_name(action: str, resource: str) -> str:
+    """Return the permission for ``action`` on a resource such as ``Patient/123`` or ``patients``."""
+
+    name = resource.split("/", 1)[0].strip().lower()
+    if name and not name.endswith("s"):
+        name += "s"
+    return f"{action.strip().lower()}:{name}"
+
+
+class PermissionResolver:
+    """Compiled role catalogue plus a cache of per-user permission masks."""
+
+    def __init__(self) -> None:
+        self._bits: dict[str, int] = {}
+        self._roles: dict[str, int] = {}
+        self._required: dict[str, int] = {}
+        self._users = LRUCache(settings.RBAC_CACHE_SIZE)
+        self._generation: int | None = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.RLock()
+
+    def _bit(self, permission: str) -> int:
+        bit = self._bits.get(permission)
+        if bit is None:
+            # Direct permissions may name something no role grants.
+            with self._lock:
+                bit = self._bits.setdefault(permission, 1 << len(self._bits))
+                self._required = {}
+        return bit
+
+    def mask(self, roles: Iterable[str] = (), permissions: Iterable[str] = ()) -> int:
+        mask = 0
+        for role in roles:
+            mask |= self._roles.get(role, 0)
+        for permission in permissions:
+            mask |= self._bit(permission)
+        return mask
+
+    def load(self) -> None:
+        with self._lock:
+            self._bits, self._required = {}, {}
+            self._roles = {
+                role: self.mask(permissions=permissions) for role, permissions in settings.RBAC_ROLES.items()
+            }
+            self._users.clear()
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < settings.RBAC_RELOAD_SECONDS:
+            return
+        with self._lock:
+            generation = generations.current(GENERATION)
+            if self._stale or generation != self._generation:
+                self._stale = False
+                self._generation = generation
+                self.load()
+            self._checked_at = now
+
+    def forget(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self._users.discard(user_id)
+
+    def grant(self, user_id: str) -> Grant:
+        self.refresh()
+        grant = self._users.get(user_id)
+        if grant is not None and grant.valid_until > time.time():
+            return grant
+        now = timezone.now()
+        rows = RoleAssignmentRecord.objects.filter(user_id=user_id, revoked_at__isnull=True).filter(
+            Q(expiry_date__isnull=True) | Q(expiry_date__gt=now)
+        )
+        mask, roles, valid_until = 0, [], math.inf
+        for assigned_roles, permissions, effective, expiry in rows.values_list(
+            "roles", "permissions", "effective_date", "expiry_date"
+        ):
+            if effective is not None and effective > now:
+                valid_until = min(valid_until, effective.timestamp())
+                continue
+            if expiry is not None:
+                valid_until = min(valid_until, expiry.timestamp())
+            mask |= self.mask(assigned_roles or [], permissions or [])
+            roles.extend(role for role in assigned_roles or [] if role not in roles)
+        grant = Grant(mask, tuple(roles), valid_until)
+        self._users.set(user_id, grant)
+        return grant
+
+    def required(self, permission: str) -> int:
+        """Return the bits any one of which grants ``permission``."""
+
+        required = self._required.get(permission)
+        if required is None:
+            action = permission.split(":", 1)[0]
+            required = 0
+            for name in (permission, f"{action}:{WILDCARD}", WILDCARD):
+                required |= self._bits.get(name, 0)
+            self._required[permission] = required
+        return required
+
+    def permissions(self, mask: int) -> list[str]:
+        return [permission for permission, bit in self._bits.items() if mask & bit]
+
+    def allows(self, user_id: str, permission: str) -> bool:
+        return bool(self.grant(user_id).mask & self.required(permission))
+
+
+resolver = PermissionResolver()
+
+
+def invalidate_on_commit(user_ids: Iterable[str] | None = None) -> None:
+    """Record a change to the assignments of ``user_ids`` (every user if ``None``).
+
+    Call it inside the transaction that changes them. This process drops
+    those users once it commits; every process clears its cache when it sees
+    the new generation.
+    """
+
+    generations.bump(GENERATION)
+    if user_ids is None:
+        transaction.on_commit(resolver.mark_stale)
+    else:
+        affected = frozenset(user_ids)
+        transaction.on_commit(lambda: resolver.forget(affected))
+
+
+def request_permission(request) -> str:
+    """The permission a request needs: ``read`` or ``write`` on the API section it targets.
+
+    API sections are URL namespaces such as ``patients``. FHIR routes are named
+    after their resource type (``Patient`` becomes ``patients``). Anything else
+    needs ``*``.
+    """
+
+    match = request.resolver_match
+    if match is None:
+        return WILDCARD
+    action = "read" if request.method in SAFE_METHODS else "write"
+    if match.namespace:
+        return f"{action}:{match.namespace}"
+    parts = match.route.split("/")
+    if len(parts) > 2 and parts[2][:1].isalpha():
+        return permission_name(action, parts[2])
+    return WILDCARD
+
+
+class RolePermission(BasePermission):
+    """Allow authenticated users whose roles grant the permission the request needs.
+
+    The permission is ``permission`` when a subclass sets it (see :func:`requires`),
+    otherwise the one :func:`request_permission` derives from the URL.
+    """
+
+    permission: str = ""
+    message = "You do not have a role that grants this permission."
+
+    def has_permission(self, request, view) -> bool:
+        user = request.user
+        if not getattr(user, "is_authenticated", False):
+            return False
+        return resolver.allows(str(user.pk), self.permission or request_permission(request))
+
+
+def requires(permission: str) -> type[RolePermission]:
+    """Return a permission class that requires ``permission``."""
+
+    return type(f"Requires[{permission}]", (RolePermission,), {"permission": permission})
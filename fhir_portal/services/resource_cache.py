@@ -0,0 +1,199 @@
+"""Versioned read cache for FHIR resources.
+
+Serialized resources are cached under ``(type, id, versionId)``. A given
+version never changes, so those entries never need invalidating. They live
+in an in-process LRU in front of the shared ``settings.FHIR_READ_CACHE_ALIAS``
+cache (Redis, file-based or local memory, see ``settings.CACHES``).
+
+The only mutable entry is the pointer from ``(type, id)`` to the current
+version. It is kept in the shared cache only, so every process sees the
+same pointer:
+
+* writers overwrite the pointer with ``set`` once their transaction commits;
+* readers that had to go to the database only ``add`` it, so a slow reader
+  can never roll the pointer back over a newer committed write.
+
+With the default local-memory backend each process has its own pointers,
+which another process's writes never reach. Unless
+``settings.FHIR_READ_CACHE_SHARED`` says the backend is shared, the current
+version is therefore read from the database through the lookup registered
+with :func:`register_version_lookup` (one indexed single-column query), and
+only the serialized bodies are served from the cache.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+@dataclass(frozen=True)
+class CachedResource:
+    version: int
+    last_modified: datetime
+    body: bytes
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used mapping."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Any, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+local_cache = LRUCache(settings.FHIR_READ_CACHE_SIZE)
+
+_version_lookups: dict[str, Callable[[str], int | None]] = {}
+
+
+def shared_cache():
+    return caches[settings.FHIR_READ_CACHE_ALIAS]
+
+
+def _pointer_key(resource_type: str, resource_id: str) -> str:
+    return f"fhir:current:{resource_type}:{resource_id}"
+
+
+def _body_key(resource_type: str, resource_id: str, version: int) -> str:
+    return f"fhir:body:{resource_type}:{resource_id}:{version}"
+
+
+def etag(version: int) -> str:
+    return f'W/"{version}"'
+
+
+def parse_etags(header: str | None) -> set[int]:
+    """Return the versions named by an ``If-Match``/``If-None-Match`` header."""
+
+    versions = set()
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.isdigit():
+            versions.add(int(tag))
+    return versions
+
+
+def serialize(resource: dict[str, Any]) -> bytes:
+    return json.dumps(resource, separators=(",", ":"), default=str).encode()
+
+
+def register_version_lookup(resource_type: str, lookup: Callable[[str], int | None]) -> None:
+    """Read the current versions of ``resource_type`` with ``lookup`` while the cache is not shared."""
+
+    _version_lookups[resource_type] = lookup
+
+
+def current_version(resource_type: str, resource_id: str) -> int | None:
+    lookup = _version_lookups.get(resource_type)
+    if lookup is not None and not settings.FHIR_READ_CACHE_SHARED:
+        return lookup(resource_id)
+    return shared_cache().get(_pointer_key(resource_type, resource_id))
+
+
+def get(resource_type: str, resource_id: str, version: int) -> CachedResource | None:
+    key = (resource_type, resource_id, version)
+    cached = local_cache.get(key)
+    if cached is None:
+        cached = shared_cache().get(_body_key(*key))
+        if cached is not None:
+            local_cache.set(key, cached)
+    return cached
+
+
+def store(resource_type: str, resource_id: str, cached: CachedResource, *, current: bool = True) -> None:
+    """Cache ``cached`` and point ``(type, id)`` at it.
+
+    ``current=True`` is for committed writes and always moves the pointer;
+    otherwise the pointer is only set when none is cached.
+    """
+
+    local_cache.set((resource_type, resource_id, cached.version), cached)
+    cache = shared_cache()
+    cache.set(_body_key(resource_type, resource_id, cached.version), cached)
+    if current:
+        cache.set(_pointer_key(resource_type, resource_id), cached.version)
+    else:
+        cache.add(_pointer_key(resource_type, resource_id), cached.version)
+
+
+def read(
+    resource_type: str,
+    resource_id: str,
+    loader: Callable[[], CachedResource | None],
+) -> CachedResource | None:
+    """Return the current version, calling ``loader`` only on a cache miss."""
+
+    version = current_version(resource_type, resource_id)
+    if version is not None:
+        cached = get(resource_type, resource_id, version)
+        if cached is not None:
+            return cached
+    elif resource_type in _version_lookups and not settings.FHIR_READ_CACHE_SHARED:
+        # The database says the resource does not exist.
+        return None
+    cached = loader()
+    if cached is not None:
+        store(resource_type, resource_id, cached, current=False)
+    return cached
+
+
+def evict(resource_type: str, resource_ids: Iterable[str]) -> None:
+    """Forget the current version of deleted resources."""
+
+    shared_cache().delete_many([_pointer_key(resource_type, resource_id) for resource_id in resource_ids])
+
+
+def store_on_commit(resource_type: str, entries: Iterable[tuple[str, CachedResource]]) -> None:
+    """Write ``(resource_id, cached)`` pairs through once the transaction commits."""
+
+    entries = list(entries)
+
+    def write_through() -> None:
+        for resource_id, cached in entries:
+            store(resource_type, resource_id, cached)
+
+    transaction.on_commit(write_through)
+
+
+def evict_on_commit(resource_type: str, resource_ids: Iterable[str]) -> None:
+    resource_ids = list(resource_ids)
+    transaction.on_commit(lambda: evict(resource_type, resource_ids))
@@ -0,0 +1,217 @@
+"""Append-only, delta-encoded FHIR resource history.
+
+Every write appends a :class:`~services.models.ResourceVersion` row. Most
+rows store only the top-level elements that changed since the previous
+version (``{"set": {...}, "unset": [...]}``). Every ``SNAPSHOT_INTERVAL``-th
+version, and the first version after a create, stores the full resource, so
+any version can be rebuilt from at most ``SNAPSHOT_INTERVAL`` rows fetched
+in one query. Deletions are recorded as rows with neither.
+
+History is read newest first with a keyset cursor on the primary key, and
+``_since`` is answered from the ``(resource_type, last_updated)`` index.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import ResourceVersion
+from .patient_search import DEFAULT_COUNT, SearchParameterError, decode_cursor, encode_cursor
+from .sample_utils import isoformat
+
+SNAPSHOT_INTERVAL = 10
+
+CREATE = "POST"
+UPDATE = "PUT"
+DELETE = "DELETE"
+
+
+@dataclass
+class Change:
+    resource_type: str
+    resource_id: str
+    version: int
+    last_updated: datetime
+    resource: dict[str, Any] | None
+    previous: dict[str, Any] | None = None
+
+
+@dataclass
+class HistoryEntry:
+    row: ResourceVersion
+    resource: dict[str, Any] | None
+
+
+@dataclass
+class HistoryPage:
+    entries: list[HistoryEntry]
+    next_cursor: str | None
+
+
+def diff(previous: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+    """Return the top-level delta that turns ``previous`` into ``current``."""
+
+    delta: dict[str, Any] = {}
+    changed = {key: value for key, value in current.items() if previous.get(key, object()) != value}
+    removed = sorted(key for key in previous if key not in current)
+    if changed:
+        delta["set"] = changed
+    if removed:
+        delta["unset"] = removed
+    return delta
+
+
+def apply(base: dict[str, Any], delta: dict[str, Any]) -> dict[str, Any]:
+    resource = {key: value for key, value in base.items() if key not in set(delta.get("unset", ()))}
+    resource.update(delta.get("set", {}))
+    return resource
+
+
+def next_versions(resource_type: str, resource_ids: Iterable[str]) -> dict[str, int]:
+    """Return the version a newly created resource should start at.
+
+    Ids that were deleted and are being created again continue their
+    numbering instead of restarting at 1.
+    """
+
+    latest = dict(
+        ResourceVersion.objects.filter(resource_type=resource_type, resource_id__in=list(resource_ids))
+        .values("resource_id")
+        .annotate(latest=Max("version_id"))
+        .values_list("resource_id", "latest")
+    )
+    return {resource_id: latest.get(resource_id, 0) + 1 for resource_id in resource_ids}
+
+
+def _row(change: Change) -> ResourceVersion:
+    row = ResourceVersion(
+        resource_type=change.resource_type,
+        resource_id=change.resource_id,
+        version_id=change.version,
+        last_updated=change.last_updated,
+    )
+    if change.resource is None:
+        row.method = DELETE
+    elif change.previous is None or change.version % SNAPSHOT_INTERVAL == 1:
+        row.method = CREATE if change.previous is None else UPDATE
+        row.snapshot = change.resource
+    else:
+        row.method = UPDATE
+        row.delta = diff(change.previous, change.resource)
+    return row
+
+
+def record(changes: Iterable[Change]) -> None:
+    """Append one history row per change with a single bulk insert."""
+
+    ResourceVersion.objects.bulk_create([_row(change) for change in changes])
+
+
+def _rebuild(rows: list[ResourceVersion]) -> dict[tuple[str, int], dict[str, Any] | None]:
+    """Rebuild every version in ``rows`` (one resource, ascending versions)."""
+
+    resources: dict[tuple[str, int], dict[str, Any] | None] = {}
+    current: dict[str, Any] | None = None
+    for row in rows:
+        if row.snapshot is not None:
+            current = row.snapshot
+        elif row.delta is not None and current is not None:
+            current = apply(current, row.delta)
+        else:
+            current = None
+        resources[(row.resource_id, row.version_id)] = current
+    return resources
+
+
+def resolve(rows: list[ResourceVersion]) -> list[HistoryEntry]:
+    """Attach the full resource to each history row, in one extra query."""
+
+    wanted = [row for row in rows if row.method != DELETE and row.snapshot is None]
+    resources: dict[tuple[str, int], dict[str, Any] | None] = {}
+    if wanted:
+        window = Q()
+        for row in wanted:
+            window |= Q(
+                resource_id=row.resource_id,
+                version_id__gt=row.version_id - SNAPSHOT_INTERVAL,
+                version_id__lte=row.version_id,
+            )
+        chains: dict[str, list[ResourceVersion]] = {}
+        for chain_row in ResourceVersion.objects.filter(window, resource_type=rows[0].resource_type).order_by(
+            "resource_id", "version_id"
+        ):
+            chains.setdefault(chain_row.resource_id, []).append(chain_row)
+        for chain in chains.values():
+            resources.update(_rebuild(chain))
+    return [
+        HistoryEntry(
+            row,
+            row.snapshot if row.snapshot is not None else resources.get((row.resource_id, row.version_id)),
+        )
+        for row in rows
+    ]
+
+
+def read_version(resource_type: str, resource_id: str, version: int) -> HistoryEntry | None:
+    row = ResourceVersion.objects.filter(
+        resource_type=resource_type, resource_id=resource_id, version_id=version
+    ).first()
+    return resolve([row])[0] if row is not None else None
+
+
+def history_resource(entry: HistoryEntry) -> dict[str, Any] | None:
+    """Return the resource of ``entry`` with its ``meta`` filled in."""
+
+    if entry.resource is None:
+        return None
+    resource = dict(entry.resource)
+    resource["resourceType"] = entry.row.resource_type
+    resource["id"] = entry.row.resource_id
+    resource["meta"] = {
+        **(resource.get("meta") or {}),
+        "versionId": str(entry.row.version_id),
+        "lastUpdated": isoformat(entry.row.last_updated),
+    }
+    return resource
+
+
+def parse_since(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        since = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise SearchParameterError(f"Invalid _since value: {value!r}") from None
+    if timezone.is_naive(since):
+        raise SearchParameterError("_since must include a timezone offset")
+    return since
+
+
+def history(
+    resource_type: str,
+    resource_id: str | None = None,
+    *,
+    since: datetime | None = None,
+    count: int = DEFAULT_COUNT,
+    cursor: str | None = None,
+) -> HistoryPage:
+    """Return one page of the history of a type or one resource, newest first."""
+
+    queryset = ResourceVersion.objects.filter(resource_type=resource_type)
+    if resource_id is not None:
+        queryset = queryset.filter(resource_id=resource_id)
+    if since is not None:
+        queryset = queryset.filter(last_updated__gte=since)
+    if cursor:
+        queryset = queryset.filter(pk__lt=decode_cursor(cursor))
+    rows = list(queryset.order_by("-pk")[:count + 1])
+    next_cursor = None
+    if len(rows) > count:
+        rows = rows[:count]
+        next_cursor = encode_cursor(rows[-1].pk) if rows else None
+    return HistoryPage(resolve(rows) if rows else [], next_cursor)
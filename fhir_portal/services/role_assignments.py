@@ -0,0 +1,106 @@
+"""Creating role assignments and revoking them when they expire.
+
+:func:`assign` stores any number of assignments with ``bulk_create`` in one
+transaction, ``settings.ROLE_ASSIGNMENT_BATCH_SIZE`` rows per INSERT, so
+onboarding a whole department costs a handful of statements.
+
+:func:`sweep_expired` sets ``revoked_at`` on assignments whose
+``expiry_date`` has passed. It walks the ``(revoked_at, expiry_date)`` index
+in batches of ``settings.ROLE_ASSIGNMENT_SWEEP_BATCH_SIZE``, one transaction
+each. Every batch reads only unrevoked rows that have expired, never the rest
+of the table. The cached permissions of the affected users are dropped when
+each batch commits (see :func:`services.rbac.invalidate_on_commit`). Run it
+periodically with ``python manage.py sweep_role_assignments``.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import rbac
+from .fhir_utils import instant
+from .models import RoleAssignmentRecord
+from .sample_utils import generate_identifier
+
+
+class AssignmentError(ValueError):
+    """Raised for role assignments that cannot be stored."""
+
+
+def assignment_fields(payload: dict[str, Any]) -> dict[str, Any]:
+    """Validate a role assignment payload and return ``RoleAssignmentRecord`` fields."""
+
+    user_id = str(payload.get("userId") or "")
+    if not user_id:
+        raise AssignmentError("userId is required")
+    roles = payload.get("roles") or []
+    permissions = payload.get("permissions") or []
+    if not isinstance(roles, list) or not isinstance(permissions, list):
+        raise AssignmentError("roles and permissions must be lists")
+    unknown = [role for role in roles if role not in settings.RBAC_ROLES]
+    if unknown:
+        raise AssignmentError(f"Unknown roles: {', '.join(map(str, unknown))}")
+    dates = {}
+    for key in ("effectiveDate", "expiryDate"):
+        value = payload.get(key)
+        dates[key] = instant(value)
+        if value and dates[key] is None:
+            raise AssignmentError(f"{key} must be an ISO 8601 instant")
+    return {
+        "assignment_id": generate_identifier("assignment", override=payload.get("assignmentId")),
+        "user_id": user_id[:64],
+        "roles": [str(role) for role in roles],
+        "permissions": [str(permission) for permission in permissions],
+        "effective_date": dates["effectiveDate"] or timezone.now(),
+        "expiry_date": dates["expiryDate"],
+        "reason": str(payload.get("reason") or ""),
+    }
+
+
+def assign(payloads: Iterable[dict[str, Any]]) -> list[RoleAssignmentRecord]:
+    """Validate and store role assignments; nothing is stored if any of them is invalid.
+
+    Raises :class:`AssignmentError` naming the position of the first invalid
+    payload, and ``IntegrityError`` if an ``assignmentId`` already exists.
+    """
+
+    records = []
+    for position, payload in enumerate(payloads):
+        try:
+            records.append(RoleAssignmentRecord(**assignment_fields(payload)))
+        except AssignmentError as exc:
+            raise AssignmentError(f"assignments[{position}]: {exc}") from None
+    with transaction.atomic():
+        RoleAssignmentRecord.objects.bulk_create(records, batch_size=settings.ROLE_ASSIGNMENT_BATCH_SIZE)
+        rbac.invalidate_on_commit(record.user_id for record in records)
+    return records
+
+
+def sweep_expired(*, now: datetime | None = None, batch_size: int | None = None) -> int:
+    """Revoke every assignment that expired by ``now``; return how many were revoked."""
+
+    now = now or timezone.now()
+    batch_size = batch_size or settings.ROLE_ASSIGNMENT_SWEEP_BATCH_SIZE
+    revoked = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                RoleAssignmentRecord.objects.select_for_update(skip_locked=True)
+                .filter(revoked_at__isnull=True, expiry_date__lte=now)
+                .order_by("expiry_date")
+                .values_list("pk", "user_id")[:batch_size]
+            )
+            if not batch:
+                return revoked
+            RoleAssignmentRecord.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                revoked_at=now, updated_at=now
+            )
+            rbac.invalidate_on_commit(user_id for _, user_id in batch)
+        revoked += len(batch)
+        if len(batch) < batch_size:
+            return revoked
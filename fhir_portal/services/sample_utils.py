@@ -7,17 +7,24 @@ specification while avoiding brittle hard-coded identifiers or timestamps.
 from __future__ import annotations
 
 from copy import deepcopy
+from datetime import datetime
 from typing import Any, Mapping, MutableMapping
 from uuid import uuid4
 
 from django.utils import timezone
 
 
+def isoformat(value: datetime) -> str:
+    """Return ``value`` in ISO 8601 format, using a ``Z`` suffix for UTC."""
+
+    text = value.isoformat()
+    return text.replace("+00:00", "Z") if text.endswith("+00:00") else text
+
+
 def isoformat_now() -> str:
     """Return the current timestamp in ISO 8601 format with UTC suffix."""
 
-    value = timezone.now().isoformat()
-    return value.replace("+00:00", "Z") if value.endswith("+00:00") else value
+    return isoformat(timezone.now())
 
 
 def generate_identifier(prefix: str, *, override: str | None = None) -> str:
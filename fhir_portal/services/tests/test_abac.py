@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from services import abac
+from services.abac import PolicyError, PolicySet
+from services.models import AbacEvaluationRecord, RoleAssignmentRecord
+from services.rbac import resolver
+
+
+def chart_access(**overrides) -> dict:
+    request = {
+        "subject": {"userId": "u1", "roles": ["doctor"], "department": "cardiology", "facility": "f1"},
+        "resource": {"type": "Patient", "id": "p1", "attributes": {"department": "cardiology", "facility": "f1"}},
+        "action": "read",
+        "environment": {"time": "2023-09-01T14:30:00Z", "location": "clinic"},
+    }
+    for key, value in overrides.items():
+        request[key] = {**request[key], **value} if isinstance(value, dict) else value
+    return request
+
+
+class PolicySetTests(SimpleTestCase):
+    def test_default_policies(self) -> None:
+        policies = PolicySet(settings.ABAC_POLICIES)
+
+        def decide(**overrides) -> tuple[str, str]:
+            decision, _ = policies.decide(chart_access(**overrides))
+            return decision.decision, decision.policy_id
+
+        self.assertEqual(decide(), ("permit", "department-clinicians"))
+        self.assertEqual(decide(subject={"department": "oncology"}), ("deny", ""))
+        self.assertEqual(decide(subject={"facility": "f2"}), ("deny", "other-facility"))
+        self.assertEqual(
+            decide(subject={"facility": "f2"}, environment={"emergency": True}), ("permit", "emergency-access")
+        )
+        self.assertEqual(decide(action="delete"), ("deny", ""))
+        head = {"roles": ["department_head"], "department": "oncology"}
+        self.assertEqual(decide(subject=head), ("permit", "department-heads-office-hours"))
+        self.assertEqual(decide(subject=head, environment={"time": "2023-09-01T22:00:00Z"}), ("deny", ""))
+
+    def test_missing_attributes_never_match(self) -> None:
+        policies = PolicySet(settings.ABAC_POLICIES)
+        request = {
+            "subject": {"userId": "u1", "roles": ["doctor"]},
+            "resource": {"type": "Patient", "id": "p1"},
+            "action": "read",
+            "environment": {"time": "2023-09-01T14:30:00Z"},
+        }
+
+        self.assertEqual(policies.decide(request)[0], abac.NOT_APPLICABLE)
+        self.assertFalse(abac.OPERATORS["lt"](None, 3))
+        self.assertFalse(abac.OPERATORS["between"](None, (1, 2)))
+        self.assertFalse(abac.OPERATORS["not_in"](None, ("a",)))
+
+    def test_decisions_are_cached_by_the_attributes_policies_read(self) -> None:
+        policies = PolicySet(settings.ABAC_POLICIES)
+
+        self.assertFalse(policies.decide(chart_access())[1])
+        # resource.id and environment.location are not read by any policy.
+        self.assertTrue(policies.decide(chart_access(resource={"id": "p2"}, environment={"location": "home"}))[1])
+        self.assertFalse(policies.decide(chart_access(subject={"department": "oncology"}))[1])
+
+    @override_settings(ABAC_CACHE_TTL=0)
+    def test_expired_decisions_are_recomputed(self) -> None:
+        policies = PolicySet(settings.ABAC_POLICIES)
+        policies.decide(chart_access())
+
+        self.assertFalse(policies.decide(chart_access())[1])
+
+    def test_operators_and_combinators(self) -> None:
+        policies = PolicySet(
+            [
+                {
+                    "id": "p",
+                    "effect": "permit",
+                    "resourceTypes": ["Observation"],
+                    "condition": {
+                        "any": [
+                            {"attr": "subject.level", "op": "gte", "value": 3},
+                            {
+                                "all": [
+                                    {"attr": "subject.team", "op": "in", "value": ["a", "b"]},
+                                    {"not": {"attr": "resource.attributes.sensitive", "op": "exists", "value": True}},
+                                ]
+                            },
+                        ]
+                    },
+                }
+            ]
+        )
+
+        def allowed(subject: dict, attributes: dict | None = None) -> bool:
+            request = {"action": "read", "subject": subject, "resource": {"type": "Observation"}}
+            request["resource"]["attributes"] = attributes or {}
+            return policies.decide(request)[0].decision == "permit"
+
+        self.assertTrue(allowed({"level": 5}))
+        self.assertFalse(allowed({"level": "x"}))
+        self.assertTrue(allowed({"team": "a"}))
+        self.assertFalse(allowed({"team": "a"}, {"sensitive": True}))
+        self.assertFalse(allowed({"team": "c"}))
+
+    def test_invalid_policies(self) -> None:
+        for policy in (
+            {"id": "x", "effect": "maybe"},
+            {"id": "x", "effect": "permit", "condition": {"attr": "a", "op": "like", "value": 1}},
+            {"id": "x", "effect": "permit", "condition": {"op": "eq", "value": 1}},
+        ):
+            with self.assertRaises(PolicyError):
+                PolicySet([policy])
+
+
+@override_settings(ABAC_LOG_BUFFERED=False, ABAC_LOG_SAMPLE_RATE=0)
+class AbacEndpointTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resolver.mark_stale()
+        abac.policies().cache.clear()
+
+    def test_evaluate_and_log_denials(self) -> None:
+        RoleAssignmentRecord.objects.create(assignment_id="a1", user_id="u1", roles=["nurse"])
+        request = chart_access()
+        del request["subject"]["roles"]
+
+        permitted = self.client.post("/api/v1/roles/abac/evaluate", request, format="json")
+        denied = self.client.post(
+            "/api/v1/roles/abac/evaluate", chart_access(subject={"facility": "f9"}), format="json"
+        )
+
+        self.assertEqual(permitted.data["decision"], "permit")
+        self.assertEqual(permitted.data["obligations"], ["log_access", "session_timeout"])
+        self.assertEqual(denied.data["policyId"], "other-facility")
+        logged = AbacEvaluationRecord.objects.get()
+        self.assertEqual((logged.user_id, logged.resource_id, logged.decision), ("u1", "p1", "deny"))
+        self.assertEqual(logged.context["policy"], "other-facility")
+
+    @override_settings(ABAC_LOG_SAMPLE_RATE=1)
+    def test_sampled_permits_are_logged(self) -> None:
+        self.client.post("/api/v1/roles/abac/evaluate", chart_access(), format="json")
+
+        self.assertEqual(AbacEvaluationRecord.objects.get().decision, "permit")
+
+    def test_requires_action_and_resource_type(self) -> None:
+        response = self.client.post("/api/v1/roles/abac/evaluate", {"subject": {}}, format="json")
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import date, datetime, time, timezone
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from services.appointment_availability import booked_bits, merge_intervals, schedule_bits, slot_starts
+from services.fhir_bundle import process_bundle
+
+# A Monday.
+DAY = date(2024, 1, 1)
+
+
+def at(hour: int, minute: int = 0, day: int = 1) -> datetime:
+    return datetime(2024, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+def appointment(appointment_id: str, start: datetime, end: datetime, status: str = "booked") -> dict:
+    return {
+        "resource": {
+            "resourceType": "Appointment",
+            "id": appointment_id,
+            "status": status,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "participant": [{"actor": {"reference": "Practitioner/dr1"}}],
+        },
+        "request": {"method": "PUT", "url": f"Appointment/{appointment_id}"},
+    }
+
+
+def batch(*entries: dict) -> dict:
+    return {"resourceType": "Bundle", "type": "batch", "entry": list(entries)}
+
+
+class BitmapTests(SimpleTestCase):
+    def test_schedule_bits_cover_whole_units_only(self) -> None:
+        self.assertEqual(schedule_bits([(time(9, 0), time(10, 0))]), 0b1111 << 36)
+        self.assertEqual(schedule_bits([(time(9, 10), time(9, 50))]), 0b11 << 37)
+        self.assertEqual(schedule_bits([(time(0, 0), time(0, 0))]), (1 << 96) - 1)
+
+    def test_booked_bits_from_merged_intervals(self) -> None:
+        starts, ends = merge_intervals(
+            [(at(9, 20), at(9, 40)), (at(9, 0), at(9, 10)), (at(9, 5), at(9, 15)), (at(23), at(1, day=2))]
+        )
+
+        self.assertEqual(starts, [at(9, 0), at(9, 20), at(23)])
+        self.assertEqual(booked_bits(starts, ends, DAY), (0b111 << 36) | (0b1111 << 92))
+        self.assertEqual(booked_bits(starts, ends, date(2024, 1, 2)), 0b1111)
+
+    def test_slot_starts_need_consecutive_free_units(self) -> None:
+        self.assertEqual(slot_starts(0b1101110, 1), [1, 2, 3, 5, 6])
+        self.assertEqual(slot_starts(0b1101110, 2), [1, 2, 5])
+
+
+class AvailabilityViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        available_time = [
+            {"daysOfWeek": ["mon", "tue"], "availableStartTime": "09:00:00", "availableEndTime": "10:00:00"}
+        ]
+        response = self.client.put(
+            "/api/v1/appointments/schedules/dr1", {"availableTime": available_time}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["availableTime"]), 2)
+
+    def write(self, *entries: dict) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            process_bundle(batch(*entries))
+
+    def starts(self, **params) -> list[str]:
+        params = {"practitioner": "dr1", "date": "2024-01-01", **params}
+        response = self.client.get("/api/v1/appointments/availability", params)
+        self.assertEqual(response.status_code, 200)
+        return [slot["start"][11:16] for slot in response.data["availableSlots"]]
+
+    def test_booked_appointments_are_removed_and_evicted(self) -> None:
+        self.assertEqual(self.starts(), ["09:00", "09:15", "09:30", "09:45"])
+
+        self.write(appointment("a1", at(9, 15), at(9, 30)))
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.starts(), ["09:00", "09:30", "09:45"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.starts(duration=30), ["09:30"])
+
+    def test_cancelled_and_moved_appointments_free_their_slot(self) -> None:
+        self.write(appointment("a1", at(9), at(9, 30)))
+        self.assertEqual(self.starts(), ["09:30", "09:45"])
+
+        self.write(appointment("a1", at(9), at(9, 30), status="cancelled"))
+        self.assertEqual(self.starts(), ["09:00", "09:15", "09:30", "09:45"])
+
+        self.write(appointment("a1", at(9, 45), at(10, 0)))
+        self.assertEqual(self.starts(), ["09:00", "09:15", "09:30"])
+
+    def test_many_practitioners_and_days(self) -> None:
+        response = self.client.get(
+            "/api/v1/appointments/availability",
+            {"practitioner": "dr1,Practitioner/dr2", "date": "2024-01-01", "days": 7},
+        )
+
+        slots = response.data["availableSlots"]
+        self.assertEqual(len(slots), 8)
+        self.assertEqual({slot["practitioner"] for slot in slots}, {"Practitioner/dr1"})
+        self.assertEqual(slots[-1]["start"], "2024-01-02T09:45:00Z")
+        self.assertEqual(slots[-1]["end"], "2024-01-02T10:00:00Z")
+
+    def test_invalid_requests(self) -> None:
+        url = "/api/v1/appointments/availability"
+        self.assertEqual(self.client.get(url, {"date": "2024-01-01"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"practitioner": "dr1", "date": "Monday"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"practitioner": "dr1", "duration": 20}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"practitioner": "dr1", "days": 400}).status_code, 400)
+        body = {"availableTime": [{"daysOfWeek": ["monday"]}]}
+        response = self.client.put("/api/v1/appointments/schedules/dr1", body, format="json")
+        self.assertEqual(response.status_code, 400)
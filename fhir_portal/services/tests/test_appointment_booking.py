@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from services.models import AppointmentLock, AppointmentRecord, IdempotencyKey
+
+
+def appointment(start: str, end: str, practitioner: str = "dr1", **extra) -> dict:
+    return {
+        "start": f"2024-01-01T{start}:00Z",
+        "end": f"2024-01-01T{end}:00Z",
+        "participant": [
+            {"actor": {"reference": f"Practitioner/{practitioner}"}},
+            {"actor": {"reference": "Patient/p1"}},
+        ],
+        **extra,
+    }
+
+
+class BookingTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+
+    def book(self, body: dict, key: str = ""):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/v1/appointments/", body, format="json", **headers)
+
+    def test_overlapping_bookings_conflict(self) -> None:
+        first = self.book(appointment("09:00", "09:30"))
+        self.assertEqual(first.status_code, 201)
+        self.assertTrue(AppointmentRecord.objects.filter(appointment_id=first.data["id"]).exists())
+        self.assertEqual(AppointmentLock.objects.get().practitioner_id, "dr1")
+
+        overlapping = self.book(appointment("09:15", "09:45"))
+
+        self.assertEqual(overlapping.status_code, 409)
+        self.assertEqual(overlapping.data["issue"][0]["code"], "conflict")
+        self.assertEqual(self.book(appointment("09:30", "10:00")).status_code, 201)
+        self.assertEqual(self.book(appointment("09:15", "09:45", practitioner="dr2")).status_code, 201)
+
+    def test_released_appointments_do_not_block(self) -> None:
+        AppointmentRecord.objects.create(
+            appointment_id="old",
+            status="cancelled",
+            practitioner_reference="Practitioner/dr1",
+            start="2024-01-01T09:00:00Z",
+            end="2024-01-01T09:30:00Z",
+        )
+
+        self.assertEqual(self.book(appointment("09:00", "09:30")).status_code, 201)
+
+    def test_retries_with_the_same_key_replay_the_booking(self) -> None:
+        first = self.book(appointment("09:00", "09:30"), key="retry-1")
+
+        retry = self.book(appointment("09:00", "09:30"), key="retry-1")
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.data["id"], first.data["id"])
+        self.assertEqual(AppointmentRecord.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().key, "retry-1")
+
+        reused = self.book(appointment("10:00", "10:30"), key="retry-1")
+        self.assertEqual(reused.status_code, 422)
+
+    def test_booking_evicts_cached_availability(self) -> None:
+        hours = {"daysOfWeek": ["mon"], "availableStartTime": "09:00:00", "availableEndTime": "10:00:00"}
+        self.client.put("/api/v1/appointments/schedules/dr1", {"availableTime": [hours]}, format="json")
+
+        def free_slots() -> int:
+            params = {"practitioner": "dr1", "date": "2024-01-01"}
+            return len(self.client.get("/api/v1/appointments/availability", params).data["availableSlots"])
+
+        self.assertEqual(free_slots(), 4)
+
+        self.book(appointment("09:00", "09:30"))
+
+        self.assertEqual(free_slots(), 2)
+
+    def test_invalid_appointments(self) -> None:
+        no_practitioner = {"start": "2024-01-01T09:00:00Z", "end": "2024-01-01T09:30:00Z"}
+        self.assertEqual(self.book(no_practitioner).status_code, 400)
+        self.assertEqual(self.book(appointment("09:30", "09:00")).status_code, 400)
+        self.assertEqual(self.book(appointment("09:00", "09:30", status="cancelled")).status_code, 400)
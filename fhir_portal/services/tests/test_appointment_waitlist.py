@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from services import appointment_waitlist
+from services.appointment_waitlist import Interval, WaitlistIndex
+from services.fhir_bundle import process_bundle
+from services.models import AppointmentRecord, NotificationMessage, WaitlistEntry
+
+NINE = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def entry(pk: int, priority: str = "routine", dates=(), times=(), age: int = 0) -> WaitlistEntry:
+    return WaitlistEntry(
+        pk=pk,
+        patient_id=f"p{pk}",
+        practitioner_id="dr1",
+        priority=priority,
+        preferred_dates=list(dates),
+        preferred_times=list(times),
+        created_at=NINE - timedelta(days=age),
+    )
+
+
+class WaitlistIndexTests(SimpleTestCase):
+    def test_priority_then_age_then_preferences(self) -> None:
+        index = WaitlistIndex()
+        for item in (
+            entry(1, age=1),
+            entry(2, age=5),
+            entry(3, priority="urgent", times=["afternoon"]),
+            entry(4, priority="stat", dates=["2024-01-02"]),
+            entry(5, priority="urgent", dates=["2024-01-01", "2024-01-02"], times=["morning"]),
+        ):
+            index.push(item)
+        slot = Interval("dr1", NINE, NINE + timedelta(minutes=30))
+
+        self.assertEqual([index.pop(slot).pk for _ in range(3)], [5, 2, 1])
+        self.assertIsNone(index.pop(slot))
+        self.assertIsNone(index.pop(Interval("dr2", NINE, NINE + timedelta(minutes=30))))
+        # Entry 5 was taken from its 2024-01-01 heap; its 2024-01-02 copy is skipped.
+        tomorrow = Interval("dr1", NINE + timedelta(days=1), NINE + timedelta(days=1, minutes=30))
+        self.assertEqual([index.pop(tomorrow).pk, index.pop(tomorrow)], [4, None])
+
+
+class WaitlistFillTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        appointment_waitlist.index.mark_stale()
+        body = {
+            "start": "2024-01-01T09:00:00Z",
+            "end": "2024-01-01T09:30:00Z",
+            "participant": [{"actor": {"reference": "Practitioner/dr1"}}, {"actor": {"reference": "Patient/p0"}}],
+        }
+        self.booked = self.client.post("/api/v1/appointments/", body, format="json").data
+
+    def join(self, patient: str, **payload):
+        body = {"patientId": patient, "preferredTimes": ["morning"], **payload}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f"/api/v1/appointments/{self.booked['id']}/waitlist", body, format="json")
+
+    def cancel(self) -> None:
+        resource = {**self.booked, "status": "cancelled"}
+        bundle = {
+            "resourceType": "Bundle",
+            "type": "batch",
+            "entry": [{"resource": resource, "request": {"method": "PUT", "url": f"Appointment/{resource['id']}"}}],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            process_bundle(bundle)
+
+    def test_cancellation_books_the_most_urgent_waiting_patient(self) -> None:
+        response = self.join("p1")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["practitioner"], "Practitioner/dr1")
+        self.join("p2", priority="urgent", notificationPreferences={"sms": True})
+        self.join("p3", priority="stat", preferredTimes=["evening"])
+
+        self.cancel()
+
+        filled = AppointmentRecord.objects.get(status="booked")
+        self.assertEqual(filled.patient_reference, "Patient/p2")
+        self.assertEqual((filled.start, filled.end), (NINE, NINE + timedelta(minutes=30)))
+        statuses = dict(WaitlistEntry.objects.values_list("patient_id", "status"))
+        self.assertEqual(statuses, {"p1": "waiting", "p2": "booked", "p3": "waiting"})
+        notification = NotificationMessage.objects.get()
+        self.assertEqual((notification.recipient_id, notification.channels), ("p2", ["sms"]))
+        self.assertEqual(notification.data["appointmentId"], filled.appointment_id)
+
+    def test_entries_claimed_elsewhere_are_skipped(self) -> None:
+        self.join("p1", priority="urgent")
+        self.join("p2")
+        appointment_waitlist.index.refresh()
+        WaitlistEntry.objects.filter(patient_id="p1").update(status="booked")
+
+        self.cancel()
+
+        self.assertEqual(AppointmentRecord.objects.get(status="booked").patient_reference, "Patient/p2")
+
+    def test_failed_booking_returns_the_entry_to_the_waitlist(self) -> None:
+        self.join("p1")
+
+        with mock.patch.object(appointment_waitlist, "book", side_effect=DatabaseError("lock wait timeout")):
+            with self.assertLogs("services.appointment_waitlist", "ERROR"):
+                self.cancel()
+
+        self.assertEqual(WaitlistEntry.objects.get(patient_id="p1").status, "waiting")
+        self.assertFalse(AppointmentRecord.objects.filter(status="booked").exists())
+        slot = Interval("dr1", NINE, NINE + timedelta(minutes=30))
+        self.assertEqual(appointment_waitlist.index.pop(slot).patient_id, "p1")
+
+    def test_invalid_entries(self) -> None:
+        self.assertEqual(self.join("").status_code, 400)
+        self.assertEqual(self.join("p1", preferredTimes=["noon"]).status_code, 400)
+        self.assertEqual(self.join("p1", preferredDates=["soon"]).status_code, 400)
+        self.assertEqual(self.join("p1", priority="whenever").status_code, 400)
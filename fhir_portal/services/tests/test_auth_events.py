@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from django.test import TestCase, TransactionTestCase
+
+from services import auth_events
+from services.buffered_writer import BufferedWriter
+from services.models import AuthEvent
+
+
+def event(n: int) -> AuthEvent:
+    return AuthEvent(user_id=str(n), event_type=auth_events.LOGIN, username=f"user-{n}")
+
+
+class BufferedWriterTests(TestCase):
+    def test_full_queue_drops_and_counts(self) -> None:
+        writer = BufferedWriter(AuthEvent, max_size=2, batch_size=10, flush_seconds=1)
+
+        accepted = [writer.submit(event(n)) for n in range(3)]
+
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(writer.stats(), {"queued": 2, "written": 0, "dropped": 1, "failed": 0})
+
+    def test_flush_writes_in_batches(self) -> None:
+        writer = BufferedWriter(AuthEvent, max_size=10, batch_size=2, flush_seconds=1)
+        for n in range(5):
+            writer.submit(event(n))
+
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 5)
+
+        self.assertEqual(sorted(AuthEvent.objects.values_list("user_id", flat=True)), ["0", "1", "2", "3", "4"])
+        self.assertEqual(writer.stats(), {"queued": 0, "written": 5, "dropped": 0, "failed": 0})
+
+
+class AuthEventThreadTests(TransactionTestCase):
+    def test_background_thread_writes_and_stop_drains(self) -> None:
+        writer = BufferedWriter(AuthEvent, max_size=100, batch_size=10, flush_seconds=0.05)
+        writer.start()
+        for n in range(25):
+            writer.submit(event(n))
+
+        writer.stop(timeout=5)
+
+        self.assertEqual(AuthEvent.objects.count(), 25)
+        self.assertEqual(writer.stats()["written"], 25)
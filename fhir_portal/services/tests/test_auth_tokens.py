@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from contextlib import ExitStack
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from services import auth_tokens, rbac
+from services.auth_tokens import REFRESH, TokenError, issue, revoke, verify
+from services.authentication import TokenAuthentication
+from services.models import AuthEvent, RoleAssignmentRecord
+from services.views.auth import urlpatterns as auth_urlpatterns
+
+FAST_HASHER = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+class TokenTests(TestCase):
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        auth_tokens.verified.clear()
+        auth_tokens.revocations.mark_stale()
+
+    def test_round_trip_and_tampering(self) -> None:
+        token, claims = issue("42", "alice")
+
+        self.assertEqual(verify(token), claims)
+        header, payload, signature = token.split(".")
+        forged = issue("43", "mallory")[0].split(".")[1]
+        for bad in (f"{header}.{forged}.{signature}", token[:-2], "not-a-token"):
+            with self.assertRaises(TokenError):
+                verify(bad)
+
+    def test_expired_and_wrong_type(self) -> None:
+        with self.assertRaisesMessage(TokenError, "expired"):
+            verify(issue("42", ttl=-1)[0])
+        with self.assertRaisesMessage(TokenError, "access"):
+            verify(issue("42", token_type=REFRESH)[0])
+
+    def test_cached_verification_needs_no_queries(self) -> None:
+        token, _ = issue("42", "alice")
+        request = Request(RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}"))
+        verify(token)
+
+        with self.assertNumQueries(0):
+            user, claims = TokenAuthentication().authenticate(request)
+
+        self.assertEqual((user.id, user.username, user.is_authenticated), ("42", "alice", True))
+        self.assertEqual(claims.user_id, "42")
+
+    def test_revoked_tokens_are_rejected(self) -> None:
+        revoked, claims = issue("42")
+        other, _ = issue("42")
+        verify(revoked)
+
+        revoke(claims)
+
+        with self.assertRaisesMessage(TokenError, "revoked"):
+            verify(revoked)
+        self.assertEqual(verify(other).user_id, "42")
+
+    def test_revoked_tokens_stay_revoked_while_the_filter_reloads(self) -> None:
+        _, claims = issue("42")
+        revoke(claims)
+        seen_during_reload = []
+        fill = auth_tokens.RevocationFilter._set
+
+        def check_while_filling(bits, size, jti):
+            seen_during_reload.append(auth_tokens.revocations.might_contain(claims.jti))
+            fill(bits, size, jti)
+
+        with mock.patch.object(auth_tokens.RevocationFilter, "_set", side_effect=check_while_filling):
+            auth_tokens.revocations.load()
+
+        self.assertEqual(seen_during_reload, [True])
+        self.assertTrue(auth_tokens.revocations.might_contain(claims.jti))
+
+    @override_settings(AUTH_REVOCATION_BLOOM_BITS=1)
+    def test_bloom_false_positives_are_confirmed_in_the_database(self) -> None:
+        revoke(issue("42")[1])
+        token, _ = issue("42")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(verify(token).user_id, "42")
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHER, AUTH_EVENT_BUFFERED=False)
+class AuthViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        auth_tokens.verified.clear()
+        auth_tokens.revocations.mark_stale()
+        response = self.client.post(
+            "/api/v1/auth/register", {"email": "alice@example.com", "password": "s3cret!"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.user_id = response.data["userId"]
+
+    def login(self, password: str = "s3cret!"):
+        return self.client.post(
+            "/api/v1/auth/login", {"username": "alice@example.com", "password": password}, format="json"
+        )
+
+    def test_login_issues_tokens_and_records_events(self) -> None:
+        RoleAssignmentRecord.objects.create(
+            assignment_id="a1", user_id=self.user_id, roles=["nurse"], permissions=["read:vitals"]
+        )
+
+        self.assertEqual(self.login("wrong").status_code, 401)
+        response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["user"]["roles"], ["nurse"])
+        self.assertEqual(verify(response.data["accessToken"]).user_id, self.user_id)
+        events = list(AuthEvent.objects.order_by("pk").values_list("event_type", "user_id"))
+        self.assertEqual(events, [("register", self.user_id), ("login_failed", ""), ("login", self.user_id)])
+
+    def test_refresh_and_logout(self) -> None:
+        tokens = self.login().data
+        refreshed = self.client.post("/api/v1/auth/refresh", {"refreshToken": tokens["refreshToken"]}, format="json")
+        self.assertEqual(refreshed.status_code, 200)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['accessToken']}")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/v1/auth/logout", {"refreshToken": tokens["refreshToken"]}, format="json")
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get("/api/v1/appointments/availability")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+        self.client.credentials()
+        again = self.client.post("/api/v1/auth/refresh", {"refreshToken": tokens["refreshToken"]}, format="json")
+        self.assertEqual(again.status_code, 401)
+
+    def test_auth_routes_with_rbac_enforced(self) -> None:
+        # RBAC_ENFORCE makes RolePermission the default for views that choose no permission classes.
+        with ExitStack() as stack:
+            for pattern in auth_urlpatterns:
+                view = pattern.callback.cls
+                if view.permission_classes is APIView.permission_classes:
+                    stack.enter_context(mock.patch.object(view, "permission_classes", [rbac.RolePermission]))
+            RoleAssignmentRecord.objects.create(assignment_id="a1", user_id=self.user_id, roles=["nurse"])
+            rbac.resolver.mark_stale()
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login().data['accessToken']}")
+
+            self.assertEqual(self.client.post("/api/v1/auth/mfa/setup", {}, format="json").status_code, 200)
+            self.assertEqual(self.client.get("/api/v1/auth/events/stats").status_code, 403)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post("/api/v1/auth/logout").status_code, 204)
+            self.assertEqual(self.client.post("/api/v1/auth/mfa/setup", {}, format="json").status_code, 401)
+
+    def test_duplicate_registration(self) -> None:
+        response = self.client.post(
+            "/api/v1/auth/register", {"email": "alice@example.com", "password": "other"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 409)
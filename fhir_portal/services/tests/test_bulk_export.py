@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from services import bulk_export
+from services.bulk_export import delete_job, job_directory, kick_off, run_job, sweep_expired
+from services.models import AppointmentRecord, BulkExportJob, ObservationRecord
+from services.patient_records import save_patient
+
+
+class BulkExportTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=directory.name, EXPORT_CHUNK_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        for patient_id in ("p1", "p2", "p3"):
+            save_patient({"resourceType": "Patient", "id": patient_id})
+        for index, reference in enumerate(["Patient/p1", "Patient/p1", "p2", "Patient/p3", "Patient/p3"]):
+            ObservationRecord.objects.create(observation_id=f"o{index}", patient_reference=reference)
+        AppointmentRecord.objects.create(appointment_id="a1", status="booked", patient_reference="Patient/p3")
+
+    def _download(self, url: str) -> list[dict]:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/fhir+ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    def test_system_export_kick_off_status_and_download(self) -> None:
+        with mock.patch("services.views.fhir_gateway.start_job", side_effect=run_job):
+            response = self.client.get("/fhir/R4/$export", {"_type": "Patient,Observation"})
+
+        self.assertEqual(response.status_code, 202)
+        status_response = self.client.get(response["Content-Location"])
+        self.assertEqual(status_response.status_code, 200)
+        self.assertIn("Expires", status_response)
+        output = {item["type"]: item for item in status_response.data["output"]}
+        self.assertEqual({kind: item["count"] for kind, item in output.items()}, {"Patient": 3, "Observation": 5})
+
+        observations = self._download(output["Observation"]["url"])
+        self.assertEqual([item["id"] for item in observations], ["o0", "o1", "o2", "o3", "o4"])
+
+    def test_download_can_be_delegated_to_front_end_server(self) -> None:
+        job = run_job(kick_off(types="Patient"))
+
+        with override_settings(EXPORT_SENDFILE_HEADER="X-Accel-Redirect"):
+            response = self.client.get(f"/fhir/R4/bulk-files/{job.job_id}/Patient.ndjson")
+
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-exports/bulk/{job.job_id}/Patient.ndjson")
+
+    def test_group_export_is_limited_to_members(self) -> None:
+        response = self.client.put(
+            "/fhir/R4/Group/cohort",
+            {
+                "resourceType": "Group",
+                "member": [{"entity": {"reference": "Patient/p1"}}, {"entity": {"reference": "Patient/p2"}}],
+            },
+            format="json",
+        )
+        self.assertEqual(response.data["quantity"], 2)
+
+        job = run_job(kick_off(level="group", group_id="cohort"))
+
+        self.assertEqual(
+            job.output,
+            [{"type": "Patient", "count": 2}, {"type": "Observation", "count": 3}, {"type": "Appointment", "count": 0}],
+        )
+
+    def test_status_reports_progress_and_delete_cancels(self) -> None:
+        job = kick_off()
+
+        response = self.client.get(f"/fhir/R4/bulk-status/{job.job_id}")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["X-Progress"], "0/3 resource types")
+
+        self.assertEqual(self.client.delete(f"/fhir/R4/bulk-status/{job.job_id}").status_code, 202)
+        self.assertEqual(self.client.get(f"/fhir/R4/bulk-status/{job.job_id}").status_code, 404)
+
+        # The thread that picks the job up cleans up instead of running it.
+        self.assertEqual(run_job(job).status, "cancelled")
+        self.assertFalse(BulkExportJob.objects.exists())
+        self.assertFalse(job_directory(job).exists())
+
+    def test_running_job_stops_and_removes_its_files_when_cancelled(self) -> None:
+        job = kick_off(types="Patient,Observation")
+        write_file = bulk_export.write_file
+
+        def cancel_while_writing(path, chunks):
+            delete_job(job)
+            return write_file(path, chunks)
+
+        with mock.patch("services.bulk_export.write_file", side_effect=cancel_while_writing) as writer:
+            self.assertEqual(run_job(job, chunk_size=2).status, "cancelled")
+
+        self.assertEqual(writer.call_count, 1)
+        self.assertFalse(BulkExportJob.objects.exists())
+        self.assertFalse(job_directory(job).exists())
+
+    def test_expired_files_are_removed(self) -> None:
+        job = run_job(kick_off(types="Patient"))
+        BulkExportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        response = self.client.get(f"/fhir/R4/bulk-files/{job.job_id}/Patient.ndjson")
+
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(job_directory(job).exists())
+        self.assertEqual(sweep_expired(), 1)
+        self.assertFalse(BulkExportJob.objects.exists())
+
+    def test_invalid_kick_off_is_rejected(self) -> None:
+        self.assertEqual(self.client.get("/fhir/R4/$export", {"_type": "Encounter"}).status_code, 400)
+        self.assertEqual(self.client.get("/fhir/R4/$export", {"_since": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get("/fhir/R4/Group/missing/$export").status_code, 404)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import path
+from rest_framework.decorators import api_view
+
+from services.capability import build_statement, capability
+
+
+@api_view(["GET", "PUT", "DELETE"])
+def instance(request, resource_id: str):  # pragma: no cover
+    pass
+
+
+@api_view(["GET", "POST"])
+def collection(request):  # pragma: no cover
+    pass
+
+
+class BuildStatementTests(SimpleTestCase):
+    def test_interactions_follow_routes_and_methods(self) -> None:
+        statement = build_statement(
+            [
+                path("Observation/<str:resource_id>", instance),
+                path("Observation", collection),
+                path("Observation/<str:resource_id>/$lastn", collection),
+                path("bulk-status/<str:job_id>", instance),
+            ]
+        )
+
+        [resource] = statement["rest"][0]["resource"]
+        self.assertEqual(resource["type"], "Observation")
+        self.assertEqual(
+            [item["code"] for item in resource["interaction"]],
+            ["create", "delete", "read", "search-type", "update"],
+        )
+        self.assertEqual([operation["name"] for operation in resource["operation"]], ["lastn"])
+
+
+class MetadataViewTests(TestCase):
+    def test_metadata_lists_patient_search_and_revalidates(self) -> None:
+        with self.assertNumQueries(0):
+            response = self.client.get("/fhir/R4/metadata")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/fhir+json")
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertEqual(response.content, capability().body)
+        patient = next(item for item in response.json()["rest"][0]["resource"] if item["type"] == "Patient")
+        self.assertIn({"code": "search-type"}, patient["interaction"])
+        self.assertIn({"name": "birthdate", "type": "date"}, patient["searchParam"])
+
+        revalidated = self.client.get("/fhir/R4/metadata", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+
+    def test_fhir_patient_search_route(self) -> None:
+        response = self.client.get("/fhir/R4/Patient", {"name": "nobody"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["type"], "searchset")
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from services import observation_alerts
+from services.appointment_booking import book
+from services.models import (
+    AppointmentLock,
+    AppointmentRecord,
+    FhirGatewayRequest,
+    ObservationRecord,
+    PatientNameToken,
+    PatientRecord,
+)
+from services.patient_records import save_patient
+
+
+def observation_entry(index: int, subject: str) -> dict:
+    return {
+        "request": {"method": "POST", "url": "Observation"},
+        "resource": {
+            "resourceType": "Observation",
+            "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": "2345-7"}]},
+            "subject": {"reference": subject},
+            "effectiveDateTime": f"2024-01-01T00:{index:02d}:00Z",
+            "valueQuantity": {"value": 90 + index, "unit": "mg/dL"},
+        },
+    }
+
+
+def appointment_entry(method: str, url: str, start: str, end: str, **extra) -> dict:
+    return {
+        "request": {"method": method, "url": url},
+        "resource": {
+            "resourceType": "Appointment",
+            "status": "booked",
+            "start": start,
+            "end": end,
+            "participant": [{"actor": {"reference": "Practitioner/dr1"}}, {"actor": {"reference": "Patient/p1"}}],
+            **extra,
+        },
+    }
+
+
+class BundleProcessorTests(TestCase):
+    client_class = APIClient
+
+    def post(self, bundle: dict):
+        return self.client.post("/fhir/R4/", bundle, format="json")
+
+    def test_transaction_resolves_urn_references_and_bulk_writes(self) -> None:
+        patient = {
+            "fullUrl": "urn:uuid:61ebe359-bfdc-4613-8bf2-c5e300945f0a",
+            "request": {"method": "POST", "url": "Patient"},
+            "resource": {"resourceType": "Patient", "name": [{"family": "Chalmers", "given": ["Peter"]}]},
+        }
+        observations = [observation_entry(index, patient["fullUrl"]) for index in range(50)]
+
+        # A fixed number of statements per resource type, however many entries
+        # (including the observation samples, the lock of their new series and
+        # their hourly/daily rollups).
+        observation_alerts.index.mark_stale()
+        observation_alerts.index.refresh()
+        with self.assertNumQueries(23):
+            response = self.post({"resourceType": "Bundle", "type": "transaction", "entry": [patient, *observations]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["type"], "transaction-response")
+        location = response.data["entry"][0]["response"]["location"]
+        self.assertTrue(location.startswith("Patient/"))
+        self.assertEqual({entry["response"]["status"] for entry in response.data["entry"][1:]}, {"201 Created"})
+
+        patient_id = location.split("/")[1]
+        self.assertEqual(ObservationRecord.objects.filter(patient_reference=location, code="2345-7").count(), 50)
+        self.assertTrue(PatientNameToken.objects.filter(patient__patient_id=patient_id, normalized="chalmers").exists())
+        self.assertEqual(FhirGatewayRequest.objects.count(), 51)
+
+    def test_transaction_with_invalid_entry_applies_nothing(self) -> None:
+        response = self.post(
+            {
+                "resourceType": "Bundle",
+                "type": "transaction",
+                "entry": [observation_entry(0, "Patient/p1"), {"request": {"method": "POST", "url": "Encounter"}}],
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ObservationRecord.objects.exists())
+        self.assertEqual(
+            list(FhirGatewayRequest.objects.order_by("pk").values_list("status_code", flat=True)), [409, 400]
+        )
+
+    def test_batch_entries_are_independent(self) -> None:
+        save_patient({"resourceType": "Patient", "id": "p1", "name": [{"family": "Old"}]})
+
+        response = self.post(
+            {
+                "resourceType": "Bundle",
+                "type": "batch",
+                "entry": [
+                    {
+                        "request": {"method": "PUT", "url": "Patient/p1"},
+                        "resource": {"resourceType": "Patient", "name": [{"family": "New"}]},
+                    },
+                    {"request": {"method": "GET", "url": "Patient/missing"}},
+                    {"request": {"method": "GET", "url": "Patient/p1"}},
+                    {"request": {"method": "PUT", "url": "Observation"}},
+                ],
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [entry["response"]["status"] for entry in response.data["entry"]]
+        self.assertEqual(statuses, ["200 OK", "404 Not Found", "200 OK", "400 Bad Request"])
+        self.assertEqual(response.data["entry"][2]["resource"]["name"], [{"family": "New"}])
+        self.assertEqual(PatientRecord.objects.get(patient_id="p1").name, "New")
+
+    def test_malformed_entries_fail_on_their_own(self) -> None:
+        bad_subject = observation_entry(1, "Patient/p1")
+        bad_subject["resource"]["subject"] = "Patient/p1"
+        bad_identifier = {
+            "request": {"method": "POST", "url": "Patient"},
+            "resource": {"resourceType": "Patient", "identifier": [{"type": "MR", "value": "1"}]},
+        }
+
+        response = self.post(
+            {
+                "resourceType": "Bundle",
+                "type": "batch",
+                "entry": [observation_entry(0, "Patient/p1"), {"request": "POST Patient"}, bad_subject, bad_identifier],
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [entry["response"]["status"] for entry in response.data["entry"]]
+        self.assertEqual(statuses, ["201 Created", "400 Bad Request", "400 Bad Request", "400 Bad Request"])
+        self.assertEqual(ObservationRecord.objects.count(), 1)
+
+    def test_batch_isolates_unexpected_errors(self) -> None:
+        patients = [
+            {"request": {"method": "PUT", "url": f"Patient/{patient_id}"}, "resource": {"resourceType": "Patient"}}
+            for patient_id in ("p1", "p2")
+        ]
+        failure = RuntimeError("index unavailable")
+
+        with mock.patch("services.fhir_bundle._reindex_patients", side_effect=[failure, failure, None]):
+            response = self.post({"resourceType": "Bundle", "type": "batch", "entry": patients})
+
+        statuses = [entry["response"]["status"] for entry in response.data["entry"]]
+        self.assertEqual(statuses, ["500 Internal Server Error", "201 Created"])
+        self.assertEqual(list(PatientRecord.objects.values_list("patient_id", flat=True)), ["p2"])
+
+    def test_rejects_non_bundle_payloads(self) -> None:
+        self.assertEqual(self.post({"resourceType": "Bundle", "type": "collection"}).status_code, 400)
+
+    def test_appointments_are_checked_for_overlaps(self) -> None:
+        booked = appointment_entry("POST", "Appointment", "2024-03-01T09:00:00Z", "2024-03-01T09:30:00Z")
+        book({**booked["resource"], "id": "a1"})
+
+        response = self.post(
+            {
+                "resourceType": "Bundle",
+                "type": "batch",
+                "entry": [
+                    appointment_entry("POST", "Appointment", "2024-03-01T09:15:00Z", "2024-03-01T09:45:00Z"),
+                    appointment_entry("PUT", "Appointment/a2", "2024-03-01T10:00:00Z", "2024-03-01T10:30:00Z"),
+                    appointment_entry("POST", "Appointment", "2024-03-01T10:15:00Z", "2024-03-01T10:45:00Z"),
+                    appointment_entry("PUT", "Appointment/a1", "2024-03-01T09:00:00Z", "2024-03-01T09:20:00Z"),
+                ],
+            }
+        )
+
+        statuses = [entry["response"]["status"] for entry in response.data["entry"]]
+        self.assertEqual(statuses, ["409 Conflict", "201 Created", "409 Conflict", "200 OK"])
+        self.assertEqual(AppointmentRecord.objects.count(), 2)
+        self.assertTrue(AppointmentLock.objects.filter(practitioner_id="dr1").exists())
+
+        response = self.post(
+            {
+                "resourceType": "Bundle",
+                "type": "transaction",
+                "entry": [appointment_entry("POST", "Appointment", "2024-03-01T10:20:00Z", "2024-03-01T10:40:00Z")],
+            }
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Entry 0 failed", response.data["issue"][0]["diagnostics"])
+        self.assertEqual(AppointmentRecord.objects.count(), 2)
+
+    def test_malformed_appointment_actor_fails_the_entry(self) -> None:
+        entry = appointment_entry("POST", "Appointment", "2024-03-01T09:00:00Z", "2024-03-01T09:30:00Z")
+        entry["resource"]["participant"] = [{"actor": "Practitioner/dr1"}]
+
+        response = self.post({"resourceType": "Bundle", "type": "batch", "entry": [entry]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["entry"][0]["response"]["status"], "400 Bad Request")
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase
+
+from services.hl7_ack import ERROR, build_ack, iter_batch_ack
+
+MESSAGE = (
+    "MSH|^~\\&|LAB|HOSP|EHR|CLINIC|20230901123045||ORU^R01|CTRL42|P|2.5.1\r"
+    "PID|1||MRN1||Roe^Jane\r"
+)
+
+
+class BuildAckTests(SimpleTestCase):
+    def test_swaps_endpoints_and_echoes_control_id(self) -> None:
+        msh, msa = build_ack(MESSAGE, timestamp="20240101000000").rstrip("\r").split("\r")
+        fields = msh.split("|")
+
+        self.assertEqual(fields[2:6], ["EHR", "CLINIC", "LAB", "HOSP"])
+        self.assertEqual(fields[8], "ACK^R01^ACK")
+        self.assertLessEqual(len(fields[9]), 20)
+        self.assertEqual(msa, "MSA|AA|CTRL42|")
+
+    def test_error_text_cannot_break_segment(self) -> None:
+        ack = build_ack(MESSAGE, ERROR, "bad|value")
+
+        self.assertTrue(ack.endswith("MSA|AE|CTRL42|bad value\r"))
+
+
+class BatchAckTests(SimpleTestCase):
+    def test_wraps_acks_in_batch_header_and_trailer(self) -> None:
+        segments = "".join(
+            iter_batch_ack("batch-1", [(MESSAGE, "AA", ""), ("garbage", "AE", "no MSH")])
+        ).rstrip("\r").split("\r")
+
+        self.assertTrue(segments[0].startswith("BHS|"))
+        self.assertEqual(segments[0].split("|")[11], "batch-1")
+        self.assertEqual([s for s in segments if s.startswith("MSA")], ["MSA|AA|CTRL42|", "MSA|AE||no MSH"])
+        self.assertEqual(segments[-1], "BTS|2")
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from services.hl7_batch import process_batch
+from services.hl7_ingest import iter_correlated_acks
+from services.mllp import frame, iter_frames
+from services.models import HL7BatchRequest, HL7Message
+
+
+def adt_message(control_id: str) -> str:
+    return (
+        f"MSH|^~\\&|ADT|HOSP|EHR|HOSP|20230901123045||ADT^A01|{control_id}|P|2.5.1\r"
+        f"PID|1||MRN-{control_id}||Doe^John||19800115|M\r"
+    )
+
+
+class MllpFramingTests(SimpleTestCase):
+    def test_iter_frames_skips_noise_and_partial_frames(self) -> None:
+        data = "noise" + frame("A") + frame("B") + "\x0bpartial"
+
+        self.assertEqual(list(iter_frames(data)), ["A", "B"])
+
+
+@override_settings(HL7_BATCH_CHUNK_SIZE=3, HL7_BATCH_WORKERS=2)
+class ProcessBatchTests(TestCase):
+    def setUp(self) -> None:
+        self.messages = [("", adt_message(f"B{n}")) for n in range(7)]
+        self.messages.append(("BAD1", "not hl7"))
+
+    def test_inline_processing_records_outcomes_and_counters(self) -> None:
+        batch = HL7BatchRequest.objects.create(batch_id="batch-1", total_messages=8)
+
+        process_batch(batch, self.messages)
+
+        self.assertEqual((batch.processed, batch.failed, batch.status), (7, 1, "completed"))
+        self.assertEqual(HL7Message.objects.filter(correlation_id="batch-1").count(), 8)
+        self.assertEqual(HL7Message.objects.get(message_id="BAD1").status, "failed")
+
+    def test_process_pool_produces_same_result(self) -> None:
+        batch = HL7BatchRequest.objects.create(batch_id="batch-2", total_messages=8)
+        context = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+            process_batch(batch, self.messages, executor=executor)
+
+        self.assertEqual((batch.processed, batch.failed, batch.status), (7, 1, "completed"))
+        self.assertEqual(
+            len(HL7Message.objects.get(message_id="B6").fhir_resources), 1
+        )
+
+    def test_reprocessing_updates_existing_messages(self) -> None:
+        first = HL7BatchRequest.objects.create(batch_id="batch-3", total_messages=8)
+        second = HL7BatchRequest.objects.create(batch_id="batch-4", total_messages=8)
+
+        process_batch(first, self.messages)
+        process_batch(second, self.messages)
+
+        self.assertEqual(HL7Message.objects.count(), 8)
+        self.assertEqual(HL7Message.objects.get(message_id="B0").correlation_id, "batch-4")
+
+
+class BatchViewTests(TestCase):
+    client_class = APIClient
+
+    def test_json_batch_is_processed_and_reported_by_parse_status(self) -> None:
+        payload = {
+            "batchId": "batch-001",
+            "messages": [
+                {"messageId": "MSG001", "content": adt_message("MSG001")},
+                {"messageId": "MSG002", "content": "garbage"},
+            ],
+        }
+
+        response = self.client.post("/api/v1/hl7-parser/batch", payload, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["processed"], 1)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(response.data["status"], "completed")
+        batch_status = self.client.get("/api/v1/hl7-parser/parse-status/batch-001")
+        self.assertEqual(batch_status.data["totalMessages"], 2)
+        message_status = self.client.get("/api/v1/hl7-parser/parse-status/MSG002")
+        self.assertEqual(message_status.data["status"], "failed")
+
+    def test_mllp_framed_body_is_split_into_messages(self) -> None:
+        body = frame(adt_message("M1")) + frame(adt_message("M2"))
+
+        response = self.client.post(
+            "/api/v1/hl7-parser/batch?batchId=mllp-1", body, content_type="application/hl7-v2"
+        )
+
+        self.assertEqual(response.data["totalMessages"], 2)
+        self.assertEqual(response.data["processed"], 2)
+        self.assertTrue(HL7Message.objects.filter(message_id="M2").exists())
+
+    def test_batch_acknowledgement_is_streamed_by_correlation_id(self) -> None:
+        body = frame(adt_message("M1")) + frame("garbage")
+        self.client.post(
+            "/api/v1/hl7-parser/batch?batchId=ack-1", body, content_type="application/hl7-v2"
+        )
+
+        response = self.client.get("/api/v1/hl7-parser/acks/ack-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/hl7-v2")
+        segments = b"".join(response.streaming_content).decode().rstrip("\r").split("\r")
+        self.assertEqual([s[:6] for s in segments if s.startswith("MSA")], ["MSA|AA", "MSA|AE"])
+        self.assertEqual(segments[-1], "BTS|2")
+
+    def test_batch_acknowledgement_is_read_in_keyset_pages(self) -> None:
+        body = "".join(frame(adt_message(f"K{index}")) for index in range(3))
+        self.client.post("/api/v1/hl7-parser/batch?batchId=ack-2", body, content_type="application/hl7-v2")
+
+        # A full page of two, then a short page that ends the loop.
+        with mock.patch("services.hl7_ingest.ACK_PAGE_SIZE", 2), self.assertNumQueries(2):
+            segments = "".join(iter_correlated_acks("ack-2")).rstrip("\r").split("\r")
+
+        self.assertEqual([s.split("|")[2] for s in segments if s.startswith("MSA")], ["K0", "K1", "K2"])
+
+    def test_control_ids_are_scoped_to_the_sender(self) -> None:
+        lab = adt_message("0001").replace("|ADT|HOSP|", "|LAB|CLINIC|", 1)
+        for raw in (adt_message("0001"), lab, adt_message("0001")):
+            response = self.client.post("/api/v1/hl7-parser/ingest", {"message": raw}, format="json")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            sorted(HL7Message.objects.filter(message_id="0001").values_list("sender", flat=True)),
+            ["ADT|HOSP", "LAB|CLINIC"],
+        )
+        response = self.client.get("/api/v1/hl7-parser/parse-status/0001", {"sender": "LAB|CLINIC"})
+        self.assertEqual(response.data["messageId"], "0001")
+        self.assertEqual(response.data["status"], "completed")
+
+    def test_unknown_correlation_id_returns_404(self) -> None:
+        response = self.client.get("/api/v1/hl7-parser/acks/missing")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_duplicate_batch_id_is_rejected(self) -> None:
+        HL7BatchRequest.objects.create(batch_id="dup")
+
+        response = self.client.post("/api/v1/hl7-parser/batch", {"batchId": "dup"}, format="json")
+
+        self.assertEqual(response.status_code, 409)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase
+
+from services.hl7_parser import HL7ParseError, hl7_datetime, iter_segments, parse_message
+
+ORU_MESSAGE = (
+    "MSH|^~\\&|LAB|HOSP|EHR|HOSP|20230901123045-0500||ORU^R01|CTRL42|P|2.5.1\r"
+    "PID|1||MRN1^^^HOSP^MR~ALT9^^^X||Roe^Jane||19700101|F\r"
+    "ORC|RE|PL1|FL1||CM\r"
+    "OBR|1|PL1|FL1|24323-8^CMP^LN\r"
+    "OBX|1|NM|2345-7^Glucose^LN||182|mg/dL|70-99|H|||F|||20230901120000\r"
+    "OBX|2|ST|NOTE^Note||a\\S\\b\\F\\c||||||F\r"
+)
+
+
+class SegmentTests(SimpleTestCase):
+    def test_msh_fields_are_numbered_from_the_field_separator(self) -> None:
+        msh = next(iter_segments(ORU_MESSAGE))
+
+        self.assertEqual(msh.field(1), "|")
+        self.assertEqual(msh.field(2), "^~\\&")
+        self.assertEqual(msh.value(9, 2), "R01")
+        self.assertEqual(msh.value(10), "CTRL42")
+
+    def test_repetitions_components_and_missing_fields(self) -> None:
+        pid = list(iter_segments(ORU_MESSAGE))[1]
+
+        self.assertEqual(pid.repetition_count(3), 2)
+        self.assertEqual(pid.value(3, component=1, repetition=2), "ALT9")
+        self.assertEqual(pid.components(5, 3), ("Roe", "Jane", ""))
+        self.assertEqual(pid.value(40), "")
+
+    def test_accepts_newline_terminated_segments(self) -> None:
+        names = [segment.name for segment in iter_segments(ORU_MESSAGE.replace("\r", "\r\n"))]
+
+        self.assertEqual(names, ["MSH", "PID", "ORC", "OBR", "OBX", "OBX"])
+
+
+class ParseMessageTests(SimpleTestCase):
+    def test_maps_header_and_resources(self) -> None:
+        parsed = parse_message(ORU_MESSAGE)
+
+        self.assertEqual(parsed.control_id, "CTRL42")
+        self.assertEqual((parsed.message_type, parsed.trigger_event), ("ORU", "R01"))
+        self.assertEqual(
+            [resource["resourceType"] for resource in parsed.resources],
+            ["Patient", "ServiceRequest", "Observation", "Observation"],
+        )
+
+    def test_observation_links_to_patient_and_order(self) -> None:
+        patient, order, glucose, note = parse_message(ORU_MESSAGE).resources
+
+        self.assertEqual(glucose["subject"]["reference"], f"Patient/{patient['id']}")
+        self.assertEqual(glucose["basedOn"][0]["reference"], f"ServiceRequest/{order['id']}")
+        self.assertEqual(glucose["valueQuantity"]["value"], 182.0)
+        self.assertEqual(glucose["referenceRange"][0]["high"]["value"], 99.0)
+        self.assertEqual(glucose["code"]["coding"][0]["system"], "http://loinc.org")
+        self.assertEqual(note["valueString"], "a^b|c")
+
+    def test_rejects_messages_without_msh(self) -> None:
+        with self.assertRaises(HL7ParseError):
+            parse_message("PID|||MRN1")
+
+
+class HL7DatetimeTests(SimpleTestCase):
+    def test_converts_dates_and_offsets(self) -> None:
+        self.assertEqual(hl7_datetime("19800115"), "1980-01-15")
+        self.assertEqual(hl7_datetime("20230901123045"), "2023-09-01T12:30:45Z")
+        self.assertEqual(hl7_datetime("202309011230-0500"), "2023-09-01T12:30:00-05:00")
+        self.assertIsNone(hl7_datetime("garbage"))
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from services.lab_interpretation import evaluate, interpret_bundle, normalize_unit
+from services.models import ObservationRecord
+
+
+def quantity(value: float, unit: str) -> dict:
+    return {"value": value, "unit": unit}
+
+
+def lab(value: float | None, unit: str = "mg/dL", low=70, high=99, critical=None, range_unit=None) -> dict:
+    observation = {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": "2345-7"}]},
+        "referenceRange": [{"low": quantity(low, range_unit or unit), "high": quantity(high, range_unit or unit)}],
+    }
+    if value is not None:
+        observation["valueQuantity"] = quantity(value, unit)
+    if critical:
+        observation["referenceRange"].append(
+            {
+                "type": {"coding": [{"code": "critical"}]},
+                "low": quantity(critical[0], unit),
+                "high": quantity(critical[1], unit),
+            }
+        )
+    return observation
+
+
+class EvaluateTests(SimpleTestCase):
+    def test_codes_for_each_band(self) -> None:
+        observations = [
+            lab(85),
+            lab(60),
+            lab(120),
+            lab(30, critical=(40, 400)),
+            lab(450, critical=(40, 400)),
+            lab(None),
+        ]
+
+        self.assertEqual(evaluate(observations), ["N", "L", "H", "LL", "HH", ""])
+
+    def test_ranges_in_another_unit_of_the_same_dimension_are_converted(self) -> None:
+        # 1.2 g/L is 120 mg/dL: high against 70-99 mg/dL.
+        observations = [lab(1.2, unit="g/L", range_unit="mg/dL"), lab(5.0, unit="mmol/L", range_unit="mg/dL")]
+
+        self.assertEqual(evaluate(observations), ["H", ""])
+
+    def test_unknown_units_only_compare_with_the_same_spelling(self) -> None:
+        self.assertEqual(evaluate([lab(5, unit="widgets", low=1, high=3)]), ["H"])
+
+    def test_normalize_unit(self) -> None:
+        self.assertEqual(normalize_unit("MG/DL"), "mg/dL")
+        self.assertEqual(normalize_unit("x10^3/uL"), "10*3/uL")
+        self.assertIsNone(normalize_unit("furlongs"))
+
+    def test_interpret_bundle_keeps_lab_interpretation(self) -> None:
+        provided = lab(60)
+        provided["interpretation"] = [{"coding": [{"code": "N"}]}]
+        bundle = {"entry": [{"resource": lab(120, unit="mg/dl")}, {"resource": provided}]}
+
+        self.assertEqual(interpret_bundle(bundle), 1)
+        first = bundle["entry"][0]["resource"]
+        self.assertEqual(first["interpretation"][0]["coding"][0]["code"], "H")
+        self.assertEqual(first["valueQuantity"]["code"], "mg/dL")
+        self.assertEqual(first["valueQuantity"]["system"], "http://unitsofmeasure.org")
+        self.assertEqual(provided["interpretation"], [{"coding": [{"code": "N"}]}])
+
+
+class LabResultsViewTests(TestCase):
+    client_class = APIClient
+
+    def test_lab_results_are_interpreted_and_stored(self) -> None:
+        bundle = {
+            "resourceType": "Bundle",
+            "type": "transaction",
+            "entry": [
+                {"resource": lab(value), "request": {"method": "POST", "url": "Observation"}}
+                for value in (50, 85, 150)
+            ],
+        }
+
+        response = self.client.post("/api/v1/observations/lab-results", bundle, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["type"], "transaction-response")
+        self.assertTrue(all("Observation/" in entry["response"]["location"] for entry in response.data["entry"]))
+        codes = sorted(
+            record.data["interpretation"][0]["coding"][0]["code"] for record in ObservationRecord.objects.all()
+        )
+        self.assertEqual(codes, ["H", "L", "N"])
+
+    def test_lab_results_requires_a_bundle(self) -> None:
+        response = self.client.post("/api/v1/observations/lab-results", {}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["resourceType"], "OperationOutcome")
+
+    def test_malformed_bundles_are_rejected_not_crashed(self) -> None:
+        malformed = {**lab(150), "referenceRange": 5}
+        for bundle, expected in (
+            ({"resourceType": "Bundle", "type": "transaction", "entry": 5}, 400),
+            (
+                {
+                    "resourceType": "Bundle",
+                    "type": "batch",
+                    "entry": [{"resource": malformed, "request": {"method": "POST", "url": "Observation"}}],
+                },
+                200,
+            ),
+        ):
+            response = self.client.post("/api/v1/observations/lab-results", bundle, format="json")
+
+            self.assertEqual(response.status_code, expected)
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import asyncio
+
+from django.test import TransactionTestCase
+
+from services.hl7_ingest import ingest_with_ack
+from services.mllp import END_BYTES, MLLPServer, frame
+from services.models import HL7Message
+
+
+def adt_message(control_id: str) -> str:
+    return (
+        f"MSH|^~\\&|ADT|HOSP|EHR|HOSP|20230901123045||ADT^A01|{control_id}|P|2.5.1\r"
+        f"PID|1||MRN-{control_id}||Doe^John||19800115|M\r"
+    )
+
+
+async def exchange(server: MLLPServer, payload: bytes, expected: int) -> list[str]:
+    await server.start()
+    host, port = server.sockets[0].getsockname()[:2]
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(payload)
+        await writer.drain()
+        acks = []
+        for _ in range(expected):
+            data = await asyncio.wait_for(reader.readuntil(END_BYTES), timeout=10)
+            acks.append(data[1:-2].decode())
+        writer.close()
+        await writer.wait_closed()
+        return acks
+    finally:
+        await server.close()
+
+
+class MLLPServerTests(TransactionTestCase):
+    def test_acknowledges_pipelined_messages_in_order(self) -> None:
+        server = MLLPServer(ingest_with_ack, port=0, window=2, workers=1)
+        payload = "".join(frame(adt_message(f"M{n}")) for n in range(6)).encode()
+
+        acks = asyncio.run(exchange(server, payload, expected=6))
+
+        self.assertEqual(
+            [ack.split("\r")[1] for ack in acks],
+            [f"MSA|AA|M{n}|" for n in range(6)],
+        )
+        self.assertEqual(HL7Message.objects.count(), 6)
+
+    def test_unparseable_message_is_rejected_with_application_error(self) -> None:
+        server = MLLPServer(ingest_with_ack, port=0)
+
+        (ack,) = asyncio.run(exchange(server, frame("garbage").encode(), expected=1))
+
+        self.assertTrue(ack.startswith("MSH|^~\\&|"))
+        self.assertIn("\rMSA|AE||", ack)
+
+    def test_handler_failure_is_answered_with_a_reject(self) -> None:
+        def broken(raw: str) -> str:
+            raise RuntimeError("database is gone")
+
+        server = MLLPServer(broken, port=0)
+
+        with self.assertLogs("services.mllp", "ERROR"):
+            (ack,) = asyncio.run(exchange(server, frame(adt_message("M1")).encode(), expected=1))
+
+        self.assertTrue(ack.startswith("MSH|^~\\&|EHR|HOSP|ADT|HOSP|"))
+        self.assertIn("\rMSA|AR|M1|", ack)
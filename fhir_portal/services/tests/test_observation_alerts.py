@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from services import generations, observation_alerts
+from services.fhir_bundle import process_bundle
+from services.models import NotificationMessage, ObservationAlertConfig
+
+
+def heart_rate(observation_id: str, value: float, patient: str = "p1") -> dict:
+    return {
+        "resource": {
+            "resourceType": "Observation",
+            "id": observation_id,
+            "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+            "subject": {"reference": f"Patient/{patient}"},
+            "effectiveDateTime": "2024-01-01T00:00:00Z",
+            "valueQuantity": {"value": value, "unit": "/min"},
+        },
+        "request": {"method": "PUT", "url": f"Observation/{observation_id}"},
+    }
+
+
+def batch(*entries: dict) -> dict:
+    return {"resourceType": "Bundle", "type": "batch", "entry": list(entries)}
+
+
+class ObservationAlertTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        observation_alerts.index.mark_stale()
+
+    def configure(self, **payload):
+        body = {
+            "patientId": "p1",
+            "observationCode": "8867-4",
+            "thresholds": {"low": 50, "high": 120},
+            "notificationChannels": ["sms"],
+            **payload,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/v1/observations/alerts/configure", body, format="json")
+
+    def test_configure_persists_rule(self) -> None:
+        response = self.configure()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "configured")
+        config = ObservationAlertConfig.objects.get(patient_id="p1", observation_code="8867-4")
+        self.assertEqual(config.thresholds, {"low": 50, "high": 120})
+        self.assertEqual(config.notification_channels, ["sms"])
+
+    def test_configure_rejects_invalid_thresholds(self) -> None:
+        self.assertEqual(self.configure(thresholds={"low": "x"}).status_code, 400)
+        self.assertEqual(self.configure(thresholds={"low": 10, "high": 5}).status_code, 400)
+        self.assertEqual(self.configure(patientId="").status_code, 400)
+
+    def test_new_observations_out_of_range_enqueue_notifications(self) -> None:
+        self.configure()
+
+        process_bundle(batch(heart_rate("hr1", 130), heart_rate("hr2", 80), heart_rate("hr3", 40, patient="p2")))
+
+        notification = NotificationMessage.objects.get()
+        self.assertEqual(notification.status, "queued")
+        self.assertEqual(notification.recipient_id, "p1")
+        self.assertEqual(notification.channels, ["sms"])
+        self.assertEqual(notification.data["observationId"], "hr1")
+        self.assertEqual(notification.data["value"], 130.0)
+
+    def test_updates_do_not_alert_again(self) -> None:
+        self.configure()
+        process_bundle(batch(heart_rate("hr1", 130)))
+
+        process_bundle(batch(heart_rate("hr1", 140)))
+
+        self.assertEqual(NotificationMessage.objects.count(), 1)
+
+    def test_rule_changes_are_picked_up_without_restart(self) -> None:
+        self.configure()
+        process_bundle(batch(heart_rate("hr1", 130)))
+
+        self.configure(status="disabled")
+        process_bundle(batch(heart_rate("hr2", 130)))
+
+        self.assertEqual(NotificationMessage.objects.count(), 1)
+
+    def test_other_processes_reload_when_generation_moves(self) -> None:
+        self.configure()
+        observation_alerts.index.refresh()
+        ObservationAlertConfig.objects.update(active=False)
+
+        with self.settings(OBSERVATION_ALERT_RELOAD_SECONDS=0):
+            observation_alerts.index.refresh()
+            self.assertEqual(len(observation_alerts.index), 1)
+            generations.bump(observation_alerts.GENERATION)
+            observation_alerts.index.refresh()
+        self.assertEqual(len(observation_alerts.index), 0)
+
+    def test_evaluation_does_not_query_when_fresh(self) -> None:
+        self.configure()
+        observation_alerts.index.refresh()
+        sample = mock.Mock(patient_id="p1", code="8867-4", value=80.0)
+
+        with self.assertNumQueries(0):
+            notifications = observation_alerts.enqueue_alerts([sample] * 1000)
+
+        self.assertEqual(notifications, [])
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from services import observation_series
+from services.fhir_bundle import process_bundle
+from services.models import ObservationRollup, ObservationSample, ObservationSeriesLock
+from services.patient_merge import merge_patients
+from services.patient_records import save_patient
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def heart_rate(observation_id: str, minutes: int, value: float, patient: str = "p1") -> dict:
+    return {
+        "resource": {
+            "resourceType": "Observation",
+            "id": observation_id,
+            "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+            "subject": {"reference": f"Patient/{patient}"},
+            "effectiveDateTime": (START + timedelta(minutes=minutes)).isoformat(),
+            "valueQuantity": {"value": value, "unit": "/min"},
+        },
+        "request": {"method": "PUT", "url": f"Observation/{observation_id}"},
+    }
+
+
+def batch(*entries: dict) -> dict:
+    return {"resourceType": "Bundle", "type": "batch", "entry": list(entries)}
+
+
+class DownsamplingTests(SimpleTestCase):
+    def test_lttb_keeps_endpoints_and_spike(self) -> None:
+        ys = [0.0] * 100
+        ys[37] = 50.0
+
+        keep = observation_series.lttb(list(range(100)), ys, 10)
+
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertIn(37, keep)
+
+    def test_min_max_keeps_extremes_of_each_bucket(self) -> None:
+        ys = [1.0, 9.0, 5.0, 5.0, 0.0, 7.0, 3.0, 3.0]
+
+        self.assertEqual(observation_series.min_max(ys, 4), [0, 1, 4, 5])
+
+
+class ObservationSeriesTests(TestCase):
+    client_class = APIClient
+
+    def test_bundle_writes_samples_and_rollups(self) -> None:
+        process_bundle(batch(*(heart_rate(f"hr{minute}", minute, 60 + minute) for minute in range(0, 120, 10))))
+
+        self.assertEqual(ObservationSample.objects.count(), 12)
+        hourly = list(
+            ObservationRollup.objects.filter(granularity="hour")
+            .order_by("bucket_start")
+            .values_list("count", "minimum", "maximum")
+        )
+        self.assertEqual(hourly, [(6, 60.0, 110.0), (6, 120.0, 170.0)])
+        daily = ObservationRollup.objects.get(granularity="day")
+        self.assertEqual((daily.count, daily.total), (12, sum(60.0 + minute for minute in range(0, 120, 10))))
+
+    def test_update_and_delete_refresh_rollups(self) -> None:
+        process_bundle(batch(heart_rate("hr1", 0, 60), heart_rate("hr2", 5, 70)))
+        process_bundle(batch(heart_rate("hr1", 0, 90)))
+        process_bundle(batch({"request": {"method": "DELETE", "url": "Observation/hr2"}}))
+
+        rollup = ObservationRollup.objects.get(granularity="hour")
+        self.assertEqual((rollup.count, rollup.minimum, rollup.maximum), (1, 90.0, 90.0))
+
+    def test_writes_lock_every_series_they_touch(self) -> None:
+        process_bundle(batch(heart_rate("hr1", 0, 60, "p1")))
+
+        with mock.patch.object(observation_series, "_lock_series", wraps=observation_series._lock_series) as lock:
+            process_bundle(batch(heart_rate("hr1", 0, 70, "p2")))
+
+        # The series the sample leaves and the one it joins, before either changes.
+        self.assertEqual(set(lock.call_args.args[0]), {("p1", "8867-4"), ("p2", "8867-4")})
+        locks = ObservationSeriesLock.objects.order_by("patient_id").values_list("patient_id", "code")
+        self.assertEqual(list(locks), [("p1", "8867-4"), ("p2", "8867-4")])
+
+    def test_component_values_are_sampled_by_component_code(self) -> None:
+        entry = heart_rate("bp1", 0, 0)
+        resource = entry["resource"]
+        del resource["valueQuantity"]
+        resource["component"] = [
+            {"code": {"coding": [{"code": "8480-6"}]}, "valueQuantity": {"value": 120, "unit": "mm[Hg]"}},
+            {"code": {"coding": [{"code": "8462-4"}]}, "valueQuantity": {"value": 80, "unit": "mm[Hg]"}},
+        ]
+        process_bundle(batch(entry))
+
+        self.assertEqual(
+            sorted(ObservationSample.objects.values_list("code", "value")), [("8462-4", 80.0), ("8480-6", 120.0)]
+        )
+
+    def test_merge_moves_series_to_target(self) -> None:
+        save_patient({"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith"}]})
+        save_patient({"resourceType": "Patient", "id": "p2", "name": [{"family": "Smith"}]})
+        process_bundle(batch(heart_rate("hr1", 0, 60, "p1"), heart_rate("hr2", 5, 70, "p2")))
+
+        merge_patients([("p1", "p2")])
+
+        self.assertEqual(set(ObservationSample.objects.values_list("patient_id", flat=True)), {"p2"})
+        rollups = ObservationRollup.objects.values_list("patient_id", "count")
+        self.assertEqual(list(rollups), [("p2", 2), ("p2", 2)])
+
+    def test_trends_downsample_raw_samples(self) -> None:
+        process_bundle(batch(*(heart_rate(f"hr{minute}", minute, 60 + minute % 7) for minute in range(50))))
+
+        params = {"code": "8867-4", "start": START.isoformat(), "end": (START + timedelta(hours=1)).isoformat()}
+
+        response = self.client.get("/api/v1/observations/p1/trends", {**params, "points": 10, "high": 65})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["resolution"], "raw")
+        self.assertEqual(response.data["unit"], "/min")
+        self.assertEqual(len(response.data["dataPoints"]), 10)
+        first = response.data["dataPoints"][0]
+        self.assertEqual(first, {"timestamp": "2024-01-01T00:00:00Z", "value": 60.0, "status": "normal"})
+
+    def test_long_ranges_read_rollups(self) -> None:
+        process_bundle(batch(*(heart_rate(f"hr{day}", day * 24 * 60, 60 + day) for day in range(30))))
+        params = {"code": "8867-4", "start": START.isoformat(), "end": (START + timedelta(days=30)).isoformat()}
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/observations/p1/trends", {**params, "points": 10})
+
+        self.assertEqual(response.data["resolution"], "day")
+        self.assertEqual(len(response.data["dataPoints"]), 10)
+        self.assertEqual(response.data["dataPoints"][0]["count"], 3)
+        self.assertEqual(response.data["dataPoints"][0]["min"], 60.0)
+
+    @override_settings(OBSERVATION_TREND_RAW_LIMIT=5)
+    def test_dense_short_ranges_fall_back_to_hourly_rollups(self) -> None:
+        process_bundle(batch(*(heart_rate(f"hr{minute}", minute, 60) for minute in range(0, 180, 10))))
+        params = {"code": "8867-4", "start": START.isoformat(), "end": (START + timedelta(hours=3)).isoformat()}
+
+        response = self.client.get("/api/v1/observations/p1/trends", {**params, "points": 100})
+
+        self.assertEqual(response.data["resolution"], "hour")
+        self.assertEqual([point["count"] for point in response.data["dataPoints"]], [6, 6, 6])
+
+    def test_invalid_parameters(self) -> None:
+        self.assertEqual(self.client.get("/api/v1/observations/p1/trends").status_code, 400)
+        response = self.client.get("/api/v1/observations/p1/trends", {"code": "8867-4", "start": "yesterday"})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from services.models import AppointmentRecord, ObservationRecord, PatientExportJob
+from services.patient_export import (
+    BUNDLE,
+    create_export,
+    export_path,
+    iter_patient_resources,
+    run_export,
+    sweep_expired,
+)
+from services.patient_records import save_patient
+
+
+class PatientExportTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        save_patient({"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith"}]})
+        for index in range(3):
+            ObservationRecord.objects.create(
+                observation_id=f"o{index}",
+                patient_reference="Patient/p1",
+                data={"resourceType": "Observation", "status": "final"},
+            )
+        ObservationRecord.objects.create(observation_id="other", patient_reference="Patient/p2")
+        AppointmentRecord.objects.create(appointment_id="a1", status="booked", patient_reference="p1")
+
+    def test_export_endpoint_runs_job_and_serves_ndjson(self) -> None:
+        with mock.patch("services.views.patients.start_export", side_effect=run_export):
+            response = self.client.get("/api/v1/patients/p1/export")
+
+        self.assertEqual(response.status_code, 202)
+        export_id = response.data["exportId"]
+        self.assertEqual(response["Content-Location"], f"/api/v1/exports/{export_id}")
+
+        status_response = self.client.get(f"/api/v1/exports/{export_id}")
+        self.assertEqual(status_response.data["status"], "completed")
+        self.assertGreater(status_response.data["size"], 0)
+
+        download = self.client.get(status_response.data["downloadUrl"])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download["Content-Type"], "application/fhir+ndjson")
+        lines = b"".join(download.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [(item["resourceType"], item["id"]) for item in map(json.loads, lines)],
+            [("Patient", "p1"), ("Observation", "o0"), ("Observation", "o1"), ("Observation", "o2"), ("Appointment", "a1")],
+        )
+
+    def test_bundle_export_limited_to_sections(self) -> None:
+        job = run_export(create_export("p1", export_format=BUNDLE, sections=["observations"]))
+
+        bundle = json.loads(export_path(job).read_text())
+        self.assertEqual(bundle["type"], "collection")
+        self.assertEqual([entry["fullUrl"] for entry in bundle["entry"]], ["Observation/o0", "Observation/o1", "Observation/o2"])
+
+    def test_rows_are_read_in_keyset_pages(self) -> None:
+        # The patient, two pages of observations (the short one ends the loop) and one of appointments.
+        with self.assertNumQueries(4):
+            resources = list(iter_patient_resources("p1", chunk_size=2))
+
+        self.assertEqual([resource["id"] for resource in resources], ["p1", "o0", "o1", "o2", "a1"])
+
+    def test_invalid_requests_are_rejected(self) -> None:
+        self.assertEqual(self.client.get("/api/v1/patients/missing/export").status_code, 404)
+        self.assertEqual(self.client.get("/api/v1/patients/p1/export", {"_outputFormat": "pdf"}).status_code, 400)
+        for body in ({"format": ["ndjson"]}, {"include": {"observations": True}}, {"include": [1]}):
+            response = self.client.post("/api/v1/patients/p1/export", body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.data["resourceType"], "OperationOutcome")
+        self.assertFalse(PatientExportJob.objects.exists())
+
+    def test_expired_export_is_gone(self) -> None:
+        job = run_export(create_export("p1"))
+        PatientExportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        response = self.client.get(f"/api/v1/exports/{job.export_id}/download")
+
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(export_path(job).exists())
+        self.assertEqual(sweep_expired(), 1)
+        self.assertFalse(PatientExportJob.objects.exists())
+
+    @override_settings(EXPORT_SENDFILE_HEADER="X-Accel-Redirect")
+    def test_download_can_be_delegated_to_front_end_server(self) -> None:
+        job = run_export(create_export("p1"))
+
+        response = self.client.get(f"/api/v1/exports/{job.export_id}/download")
+
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-exports/{job.export_id}.ndjson")
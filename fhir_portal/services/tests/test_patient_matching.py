@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from services.models import PatientNameToken, PatientRecord
+from services.patient_matching import find_candidates, normalize_tokens, soundex
+from services.patient_records import save_patient
+
+
+def patient(patient_id: str, family: str, given: str, birth_date: str, gender: str = "male") -> dict:
+    return {
+        "resourceType": "Patient",
+        "id": patient_id,
+        "name": [{"family": family, "given": [given]}],
+        "birthDate": birth_date,
+        "gender": gender,
+    }
+
+
+class NormalizationTests(SimpleTestCase):
+    def test_soundex_reference_values(self) -> None:
+        for name, key in [
+            ("robert", "R163"),
+            ("rupert", "R163"),
+            ("ashcraft", "A261"),
+            ("tymczak", "T522"),
+            ("pfister", "P236"),
+            ("honeyman", "H555"),
+        ]:
+            self.assertEqual(soundex(name), key, name)
+
+    def test_normalize_strips_accents_and_splits_compound_names(self) -> None:
+        self.assertEqual(normalize_tokens("Müller-Lüdenscheidt  O'Brien"), ["muller", "ludenscheidt", "o", "brien"])
+
+
+class NameIndexTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        save_patient(patient("p1", "Smith", "John", "1980-01-15"))
+        save_patient(patient("p2", "Smyth", "Jon", "1980-01-15"))
+        save_patient(patient("p3", "Smith", "Mary", "1980-01-15", "female"))
+        save_patient(patient("p4", "Smithe", "Alice", "1975-05-05", "female"))
+        save_patient(patient("p5", "Jones", "John", "1980-01-15"))
+
+    def test_index_is_replaced_on_write(self) -> None:
+        save_patient(patient("p1", "Taylor", "John", "1980-01-15"))
+
+        self.assertEqual(
+            set(PatientNameToken.objects.filter(patient__patient_id="p1").values_list("normalized", flat=True)),
+            {"taylor", "john"},
+        )
+
+    def test_name_search_matches_any_name_part(self) -> None:
+        response = self.client.get("/api/v1/patients/search", {"name": "john"})
+
+        self.assertEqual([entry["resource"]["id"] for entry in response.data["entry"]], ["p1", "p5"])
+
+    def test_fuzzy_name_search_uses_phonetic_keys(self) -> None:
+        response = self.client.get("/api/v1/patients/search", {"name": "smith jon", "_fuzzy": "true"})
+
+        self.assertEqual([entry["resource"]["id"] for entry in response.data["entry"]], ["p1", "p2"])
+
+    def test_duplicates_are_blocked_and_ranked(self) -> None:
+        response = self.client.get("/api/v1/patients/p1/duplicates")
+
+        self.assertEqual(response.status_code, 200)
+        candidates = response.data["candidates"]
+        self.assertEqual([c["patientId"] for c in candidates], ["p2", "p3"])
+        self.assertEqual(candidates[0]["score"], 1.0)
+        self.assertEqual(candidates[1]["matchedOn"], ["family", "birthDate"])
+
+    def test_name_without_letters_matches_nobody(self) -> None:
+        for params in ({"name": "123"}, {"name": "--", "_fuzzy": "true"}):
+            response = self.client.get("/api/v1/patients/search", params)
+
+            self.assertEqual(response.data.get("entry", []), [], params)
+
+    def test_best_duplicates_survive_the_limit(self) -> None:
+        # Many weak matches (family name and birth date only) inserted before the strong one.
+        for n in range(30):
+            save_patient(patient(f"weak{n}", "Smith", "Zed", "1980-01-15", "female"))
+        save_patient(patient("strong", "Smith", "Johnny", "1980-01-15"))
+
+        candidates = find_candidates(PatientRecord.objects.get(patient_id="p1"), limit=2)
+
+        self.assertEqual([candidate.record.patient_id for candidate in candidates], ["p2", "strong"])
+        self.assertEqual(candidates[1].matched_on, ["family", "given", "birthDate", "gender"])
+
+    def test_rebuild_command_restores_missing_tokens(self) -> None:
+        PatientNameToken.objects.all().delete()
+
+        call_command("rebuild_patient_name_index", batch_size=2, stdout=StringIO())
+
+        self.assertEqual(PatientNameToken.objects.filter(patient__patient_id="p4").count(), 2)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from services.models import AppointmentRecord, ObservationRecord, PatientMergeEvent, PatientNameToken, PatientRecord
+from services.patient_merge import KEEP_SOURCE, UNION, MergeError, merge_patients, merge_resources
+from services.patient_records import save_patient
+
+
+def patient(patient_id: str, family: str, **extra) -> dict:
+    return {"resourceType": "Patient", "id": patient_id, "name": [{"family": family, "given": ["Ann"]}], **extra}
+
+
+class MergeResourcesTests(SimpleTestCase):
+    source = {"id": "a", "gender": "female", "telecom": [{"value": "1"}, {"value": "2"}], "address": [{"city": "X"}]}
+    target = {"id": "b", "gender": "unknown", "telecom": [{"value": "1"}]}
+
+    def test_keep_target_only_fills_gaps(self) -> None:
+        merged, fields = merge_resources(self.source, self.target)
+
+        self.assertEqual(fields, ["address"])
+        self.assertEqual(merged["gender"], "unknown")
+        self.assertEqual(merged["id"], "b")
+
+    def test_keep_source_overrides_selected_fields(self) -> None:
+        merged, fields = merge_resources(self.source, self.target, strategy=KEEP_SOURCE, fields=["gender"])
+
+        self.assertEqual(fields, ["gender"])
+        self.assertEqual(merged["gender"], "female")
+        self.assertNotIn("address", merged)
+
+    def test_union_appends_missing_list_entries(self) -> None:
+        merged, fields = merge_resources(self.source, self.target, strategy=UNION)
+
+        self.assertEqual(merged["telecom"], [{"value": "1"}, {"value": "2"}])
+        self.assertEqual(fields, ["address", "telecom"])
+
+    def test_unknown_strategy_is_rejected(self) -> None:
+        with self.assertRaises(MergeError):
+            merge_resources(self.source, self.target, strategy="newest")
+
+
+class MergePatientsTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        for index, family in enumerate(["Smith", "Smyth", "Jones", "Brown"]):
+            save_patient(patient(f"p{index}", family, telecom=[{"value": str(index)}]))
+        ObservationRecord.objects.create(observation_id="o1", patient_reference="Patient/p0")
+        ObservationRecord.objects.create(observation_id="o2", patient_reference="Patient/p2")
+        ObservationRecord.objects.create(observation_id="o3", patient_reference="Patient/p3")
+        AppointmentRecord.objects.create(appointment_id="a1", status="booked", patient_reference="p0")
+
+    def test_merge_endpoint_merges_and_repoints_references(self) -> None:
+        response = self.client.post(
+            "/api/v1/patients/p0/merge/p1",
+            {"mergeStrategy": "union", "reason": "duplicate", "auditReason": "MPI cleanup"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["mergedFields"], ["name", "telecom"])
+        event = PatientMergeEvent.objects.get()
+        self.assertEqual(response.data["auditId"], event.event_id)
+        self.assertEqual((event.source_patient_id, event.target_patient_id), ("p0", "p1"))
+        self.assertEqual(ObservationRecord.objects.get(observation_id="o1").patient_reference, "Patient/p1")
+        self.assertEqual(AppointmentRecord.objects.get(appointment_id="a1").patient_reference, "p1")
+
+        source = PatientRecord.objects.get(patient_id="p0").data
+        self.assertIs(source["active"], False)
+        self.assertEqual(source["link"], [{"other": {"reference": "Patient/p1"}, "type": "replaced-by"}])
+        self.assertFalse(PatientNameToken.objects.filter(patient__patient_id="p0").exists())
+        self.assertEqual(
+            set(PatientNameToken.objects.filter(patient__patient_id="p1").values_list("normalized", flat=True)),
+            {"smith", "smyth", "ann"},
+        )
+
+    def test_merge_endpoint_reports_missing_patient(self) -> None:
+        response = self.client.post("/api/v1/patients/p0/merge/missing", {}, format="json")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PatientMergeEvent.objects.exists())
+
+    def test_bulk_merge_uses_constant_queries_per_chunk(self) -> None:
+        # Savepoint, select, patient update, history insert, two repoints,
+        # observation series lookup, token delete and insert, event insert,
+        # release - independent of the number of pairs.
+        with self.assertNumQueries(11):
+            outcomes = merge_patients([("p0", "p1"), ("p2", "p3")], strategy=KEEP_SOURCE)
+
+        self.assertEqual([outcome.status for outcome in outcomes], ["merged", "merged"])
+        self.assertEqual(
+            list(ObservationRecord.objects.order_by("observation_id").values_list("patient_reference", flat=True)),
+            ["Patient/p1", "Patient/p3", "Patient/p3"],
+        )
+        self.assertEqual(PatientMergeEvent.objects.count(), 2)
+
+    def test_bulk_endpoint_skips_conflicting_pairs(self) -> None:
+        response = self.client.post(
+            "/api/v1/patients/merge",
+            {"pairs": [{"sourceId": "p0", "targetId": "p1"}, {"sourceId": "p1", "targetId": "p2"}], "chunkSize": 1},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["merged"], 1)
+        self.assertEqual([result["status"] for result in response.data["results"]], ["merged", "invalid"])
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from services.patient_records import save_patient
+
+
+def patient(patient_id: str, family: str, given: str, birth_date: str, gender: str, mrn: str) -> dict:
+    return {
+        "resourceType": "Patient",
+        "id": patient_id,
+        "identifier": [{"system": "urn:mrn", "value": mrn}],
+        "name": [{"family": family, "given": [given]}],
+        "birthDate": birth_date,
+        "gender": gender,
+    }
+
+
+class PatientSearchViewTests(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        save_patient(patient("p1", "Doe", "John", "1980-01-15", "male", "MRN1"))
+        save_patient(patient("p2", "Doe", "Jane", "1985-06-01", "female", "MRN2"))
+        save_patient(patient("p3", "Smith", "Anna", "1980-12-31", "female", "MRN3"))
+        save_patient(patient("p4", "Doering", "Max", "1990-03-03", "male", "MRN4"))
+
+    def search(self, **params):
+        response = self.client.get("/api/v1/patients/search", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def ids(self, bundle: dict) -> list[str]:
+        return [entry["resource"]["id"] for entry in bundle["entry"]]
+
+    def test_name_matches_case_insensitive_prefix(self) -> None:
+        self.assertEqual(self.ids(self.search(name="doe")), ["p1", "p2", "p4"])
+        self.assertEqual(self.ids(self.search(name="doe j")), ["p1", "p2"])
+
+    def test_identifier_accepts_system_and_value(self) -> None:
+        self.assertEqual(self.ids(self.search(identifier="urn:mrn|MRN3")), ["p3"])
+
+    def test_birthdate_prefixes_and_partial_dates(self) -> None:
+        self.assertEqual(self.ids(self.search(birthdate="1980")), ["p1", "p3"])
+        self.assertEqual(self.ids(self.search(birthdate="ge1985-06-01")), ["p2", "p4"])
+        self.assertEqual(self.ids(self.search(birthdate="lt1980-02")), ["p1"])
+
+    def test_parameters_are_combined(self) -> None:
+        bundle = self.search(gender="female", birthdate="1980", _total="accurate")
+
+        self.assertEqual(self.ids(bundle), ["p3"])
+        self.assertEqual(bundle["total"], 1)
+
+    def test_comma_separated_values_are_alternatives(self) -> None:
+        self.assertEqual(self.ids(self.search(identifier="MRN1,MRN4")), ["p1", "p4"])
+
+    def test_keyset_paging_follows_next_links(self) -> None:
+        first = self.search(_count=3)
+        next_link = next(link["url"] for link in first["link"] if link["relation"] == "next")
+
+        second = self.client.get(next_link).data
+
+        self.assertEqual(self.ids(first), ["p1", "p2", "p3"])
+        self.assertEqual(self.ids(second), ["p4"])
+        self.assertFalse(any(link["relation"] == "next" for link in second["link"]))
+
+    def test_invalid_parameters_return_operation_outcome(self) -> None:
+        response = self.client.get("/api/v1/patients/search", {"birthdate": "ge19xx"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["resourceType"], "OperationOutcome")
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from services import rbac
+from services.authentication import TokenUser
+from services.models import RoleAssignmentRecord
+from services.rbac import requires, resolver
+
+
+@api_view(["GET", "POST"])
+@permission_classes([requires("write:patients")])
+def protected(request):
+    return Response({"ok": True})
+
+
+class PermissionResolverTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resolver.mark_stale()
+
+    def assign(self, user_id: str, roles=(), permissions=(), **dates) -> RoleAssignmentRecord:
+        return RoleAssignmentRecord.objects.create(
+            assignment_id=f"a-{RoleAssignmentRecord.objects.count()}",
+            user_id=user_id,
+            roles=list(roles),
+            permissions=list(permissions),
+            **dates,
+        )
+
+    def test_roles_direct_permissions_and_wildcards(self) -> None:
+        self.assign("nurse-1", ["nurse"], ["read:audit"])
+        self.assign("doctor-1", ["doctor"])
+        self.assign("admin-1", ["admin"])
+
+        self.assertTrue(resolver.allows("nurse-1", "write:observations"))
+        self.assertTrue(resolver.allows("nurse-1", "read:audit"))
+        self.assertFalse(resolver.allows("nurse-1", "write:patients"))
+        self.assertTrue(resolver.allows("doctor-1", "read:kafka"))
+        self.assertFalse(resolver.allows("doctor-1", "write:roles"))
+        self.assertTrue(resolver.allows("admin-1", "write:anything"))
+        self.assertFalse(resolver.allows("nobody", "read:patients"))
+
+    def test_grants_are_cached_until_an_assignment_starts_or_lapses(self) -> None:
+        now = timezone.now()
+        self.assign("u1", ["nurse"], expiry_date=now + timedelta(hours=2))
+        self.assign("u1", ["doctor"], effective_date=now + timedelta(hours=1))
+        self.assign("u1", ["admin"], expiry_date=now - timedelta(hours=1))
+
+        grant = resolver.grant("u1")
+        with self.assertNumQueries(0):
+            self.assertTrue(resolver.allows("u1", "read:patients"))
+            self.assertFalse(resolver.allows("u1", "read:audit"))
+
+        self.assertEqual(grant.roles, ("nurse",))
+        self.assertAlmostEqual(grant.valid_until, (now + timedelta(hours=1)).timestamp())
+
+    def test_assign_and_validate_endpoints(self) -> None:
+        self.assign("head-1", ["department_head"])
+        self.client.force_authenticate(user=TokenUser("head-1", "head-1"))
+        check = {"userId": "u2", "resource": "Patient/p1", "action": "write"}
+        self.assertFalse(self.client.post("/api/v1/roles/validate", check, format="json").data["allowed"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/v1/roles/assign", {"userId": "u2", "roles": ["doctor"], "reason": "rotation"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post("/api/v1/roles/validate", check, format="json")
+        self.assertEqual(response.data["decision"], "permit")
+        self.assertEqual(response.data["permission"], "write:patients")
+        self.assertEqual(response.data["roles"], ["doctor"])
+
+    def test_assign_requires_write_roles(self) -> None:
+        self.assign("nurse-1", ["nurse"])
+        grant = {"userId": "intruder", "roles": ["admin"]}
+
+        bulk = {"assignments": [grant]}
+        self.assertEqual(self.client.post("/api/v1/roles/assign", grant, format="json").status_code, 401)
+        self.assertEqual(self.client.post("/api/v1/roles/assign/bulk", bulk, format="json").status_code, 401)
+        self.client.force_authenticate(user=TokenUser("nurse-1", "nurse-1"))
+        self.assertEqual(self.client.post("/api/v1/roles/assign", grant, format="json").status_code, 403)
+        self.assertFalse(RoleAssignmentRecord.objects.filter(user_id="intruder").exists())
+
+    def test_assign_rejects_unknown_roles(self) -> None:
+        self.assign("admin-1", ["admin"])
+        self.client.force_authenticate(user=TokenUser("admin-1", "admin-1"))
+        response = self.client.post("/api/v1/roles/assign", {"userId": "u3", "roles": ["wizard"]}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RoleAssignmentRecord.objects.filter(user_id="u3").exists())
+
+    def test_permission_class(self) -> None:
+        self.assign("doctor-1", ["doctor"])
+        self.assign("nurse-1", ["nurse"])
+        factory = APIRequestFactory()
+
+        self.assertEqual(protected(factory.get("/")).status_code, 401)
+        for user_id, expected in (("doctor-1", 200), ("nurse-1", 403)):
+            request = factory.post("/")
+            force_authenticate(request, user=TokenUser(user_id, user_id))
+            self.assertEqual(protected(request).status_code, expected)
+
+    def test_request_permission_follows_the_url(self) -> None:
+        factory = APIRequestFactory()
+        for method, url, expected in (
+            ("get", "/api/v1/patients/search", "read:patients"),
+            ("post", "/api/v1/observations/bulk", "write:observations"),
+            ("get", "/fhir/R4/Patient/p1", "read:patients"),
+            ("get", "/fhir/R4/$export", "*"),
+        ):
+            request = getattr(factory, method)(url)
+            request.resolver_match = resolve(url)
+            self.assertEqual(rbac.request_permission(request), expected, url)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from services import resource_cache
+from services.models import PatientRecord
+from services.patient_records import save_patient
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self) -> None:
+        cache = resource_cache.LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_parse_etags(self) -> None:
+        self.assertEqual(resource_cache.parse_etags('W/"3", "4", *'), {3, 4})
+
+
+@override_settings(FHIR_READ_CACHE_SHARED=True)
+class PatientReadCacheTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resource_cache.local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            save_patient({"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith"}]})
+
+    def test_read_is_served_from_cache_with_etag(self) -> None:
+        with self.assertNumQueries(0):
+            response = self.client.get("/fhir/R4/Patient/p1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], 'W/"1"')
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(response.json()["meta"]["versionId"], "1")
+
+    def test_if_none_match_returns_not_modified(self) -> None:
+        with self.assertNumQueries(0):
+            response = self.client.get("/fhir/R4/Patient/p1", HTTP_IF_NONE_MATCH='W/"1"')
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_cache_miss_loads_from_database_once(self) -> None:
+        caches["fhir"].clear()
+        resource_cache.local_cache.clear()
+
+        with self.assertNumQueries(1):
+            self.client.get("/fhir/R4/Patient/p1")
+        with self.assertNumQueries(0):
+            self.client.get("/fhir/R4/Patient/p1")
+
+    def test_update_bumps_version_and_refreshes_cache(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                "/api/v1/patients/p1", {"name": [{"family": "Jones"}]}, format="json", HTTP_IF_MATCH='W/"1"'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], 'W/"2"')
+
+        read = self.client.get("/fhir/R4/Patient/p1", HTTP_IF_NONE_MATCH='W/"1"')
+        self.assertEqual(read.status_code, 200)
+        self.assertEqual(read.json()["name"], [{"family": "Jones"}])
+
+    def test_stale_if_match_is_rejected(self) -> None:
+        response = self.client.put(
+            "/api/v1/patients/p1", {"name": [{"family": "Jones"}]}, format="json", HTTP_IF_MATCH='W/"7"'
+        )
+
+        self.assertEqual(response.status_code, 412)
+
+    def test_missing_patient_is_not_found(self) -> None:
+        self.assertEqual(self.client.get("/fhir/R4/Patient/missing").status_code, 404)
+
+
+@override_settings(FHIR_READ_CACHE_SHARED=False)
+class UnsharedPatientReadCacheTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resource_cache.local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            save_patient({"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith"}]})
+
+    def test_current_version_comes_from_the_database(self) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/fhir/R4/Patient/p1", HTTP_IF_NONE_MATCH='W/"1"').status_code, 304)
+
+        # Another process updates the record; this process's cache never hears of it.
+        record = PatientRecord.objects.get(patient_id="p1")
+        record.data = {**record.data, "name": [{"family": "Jones"}]}
+        record.version_id = 2
+        record.save()
+
+        response = self.client.get("/fhir/R4/Patient/p1", HTTP_IF_NONE_MATCH='W/"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], 'W/"2"')
+        self.assertEqual(response.json()["name"], [{"family": "Jones"}])
+
+        PatientRecord.objects.filter(patient_id="p1").delete()
+        self.assertEqual(self.client.get("/fhir/R4/Patient/p1").status_code, 404)
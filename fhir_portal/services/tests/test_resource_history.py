@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from importlib import import_module
+
+from django.apps import apps
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from services import resource_history
+from services.fhir_bundle import process_bundle
+from services.models import ResourceVersion
+from services.patient_records import save_patient
+
+
+def patient(patient_id: str, family: str, **extra) -> dict:
+    return {"resourceType": "Patient", "id": patient_id, "name": [{"family": family}], **extra}
+
+
+def batch(*entries: dict) -> dict:
+    return {"resourceType": "Bundle", "type": "batch", "entry": list(entries)}
+
+
+def delete_entry(patient_id: str) -> dict:
+    return {"request": {"method": "DELETE", "url": f"Patient/{patient_id}"}}
+
+
+class DeltaTests(SimpleTestCase):
+    def test_apply_reverses_diff(self) -> None:
+        previous = {"name": [{"family": "Smith"}], "gender": "female", "birthDate": "1980-01-01"}
+        current = {"name": [{"family": "Jones"}], "gender": "female", "active": True}
+
+        delta = resource_history.diff(previous, current)
+
+        self.assertEqual(delta["set"], {"name": [{"family": "Jones"}], "active": True})
+        self.assertEqual(delta["unset"], ["birthDate"])
+        self.assertEqual(resource_history.apply(previous, delta), current)
+
+
+class ResourceHistoryTests(TestCase):
+    def test_updates_store_deltas_between_snapshots(self) -> None:
+        for version in range(1, 13):
+            save_patient(patient("p1", f"Family{'abcdefghijkl'[version - 1]}"))
+
+        rows = list(ResourceVersion.objects.filter(resource_id="p1").order_by("version_id"))
+        snapshots = [row.version_id for row in rows if row.snapshot is not None]
+
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(snapshots, [1, 11])
+        self.assertEqual(rows[1].delta, {"set": {"name": [{"family": "Familyb"}]}})
+
+    def test_any_version_is_rebuilt_in_one_query(self) -> None:
+        for version in range(1, 10):
+            gender = "male" if version % 2 else "female"
+            save_patient(patient("p1", "Smith", gender=gender, multipleBirthInteger=version))
+
+        with self.assertNumQueries(2):
+            entry = resource_history.read_version("Patient", "p1", 8)
+
+        self.assertEqual(entry.resource["multipleBirthInteger"], 8)
+        self.assertEqual(entry.resource["gender"], "female")
+
+    def test_bundle_delete_and_recreate_continue_numbering(self) -> None:
+        save_patient(patient("p1", "Smith"))
+        process_bundle(batch(delete_entry("p1")))
+        put = {"resource": patient("p1", "Jones"), "request": {"method": "PUT", "url": "Patient/p1"}}
+        process_bundle(batch(put))
+
+        rows = ResourceVersion.objects.filter(resource_id="p1").order_by("version_id")
+        methods = list(rows.values_list("version_id", "method"))
+        self.assertEqual(methods, [(1, "POST"), (2, "DELETE"), (3, "POST")])
+
+
+class HistoryEndpointTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        save_patient(patient("p1", "Smith"))
+        save_patient(patient("p1", "Jones"))
+        save_patient(patient("p2", "Brown"))
+
+    def test_instance_history_is_newest_first(self) -> None:
+        response = self.client.get("/fhir/R4/Patient/p1/_history")
+
+        self.assertEqual(response.status_code, 200)
+        bundle = response.json()
+        self.assertEqual(bundle["type"], "history")
+        versions = [entry["resource"]["meta"]["versionId"] for entry in bundle["entry"]]
+        self.assertEqual(versions, ["2", "1"])
+        self.assertEqual(bundle["entry"][0]["request"], {"method": "PUT", "url": "Patient/p1"})
+        self.assertEqual(bundle["entry"][1]["response"]["status"], "201 Created")
+
+    def test_vread_returns_old_version(self) -> None:
+        response = self.client.get("/fhir/R4/Patient/p1/_history/1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], 'W/"1"')
+        self.assertEqual(response.json()["name"], [{"family": "Smith"}])
+        self.assertEqual(self.client.get("/fhir/R4/Patient/p1/_history/9").status_code, 404)
+
+    def test_vread_of_deleted_version_is_gone(self) -> None:
+        process_bundle(batch(delete_entry("p2")))
+
+        response = self.client.get("/fhir/R4/Patient/p2/_history/2")
+
+        self.assertEqual(response.status_code, 410)
+        history = self.client.get("/fhir/R4/Patient/p2/_history").json()
+        self.assertNotIn("resource", history["entry"][0])
+        self.assertEqual(history["entry"][0]["request"]["method"], "DELETE")
+
+    def test_vread_of_version_that_cannot_be_rebuilt_is_not_found(self) -> None:
+        # p1 as if it had been created before history was recorded.
+        ResourceVersion.objects.filter(resource_id="p1", version_id=1).delete()
+
+        self.assertEqual(self.client.get("/fhir/R4/Patient/p1/_history/2").status_code, 404)
+
+        migration = import_module("services.migrations.0019_patient_history_snapshots")
+        migration.snapshot_current_versions(apps, None)
+        save_patient(patient("p1", "Green"))
+
+        self.assertEqual(self.client.get("/fhir/R4/Patient/p1/_history/2").json()["name"], [{"family": "Jones"}])
+        self.assertEqual(self.client.get("/fhir/R4/Patient/p1/_history/3").json()["name"], [{"family": "Green"}])
+
+    def test_type_history_since_and_paging(self) -> None:
+        ResourceVersion.objects.filter(resource_id="p1", version_id=1).update(
+            last_updated=timezone.now() - timedelta(days=2)
+        )
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+
+        first = self.client.get("/fhir/R4/Patient/_history", {"_since": since, "_count": 1}).json()
+        second = self.client.get(first["link"][1]["url"]).json()
+
+        self.assertEqual([entry["fullUrl"] for entry in first["entry"]], ["Patient/p2"])
+        self.assertEqual([entry["fullUrl"] for entry in second["entry"]], ["Patient/p1"])
+        self.assertEqual(len(second["link"]), 1)
+
+    def test_unknown_patient_and_bad_since(self) -> None:
+        self.assertEqual(self.client.get("/fhir/R4/Patient/missing/_history").status_code, 404)
+        response = self.client.get("/fhir/R4/Patient/_history", {"_since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
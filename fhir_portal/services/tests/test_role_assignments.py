@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from services.authentication import TokenUser
+from services.models import RoleAssignmentRecord
+from services.rbac import resolver
+from services.role_assignments import sweep_expired
+
+
+class BulkAssignTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resolver.mark_stale()
+        RoleAssignmentRecord.objects.create(assignment_id="registrar", user_id="registrar", roles=["admin"])
+        self.client.force_authenticate(user=TokenUser("registrar", "registrar"))
+
+    def test_onboards_many_users_in_one_statement(self) -> None:
+        payload = {
+            "userIds": [f"resident-{n}" for n in range(90)],
+            "roles": ["nurse"],
+            "expiryDate": "2099-07-01T00:00:00Z",
+            "reason": "Residency intake",
+            "assignments": [{"userId": "chief", "roles": ["department_head"]}],
+        }
+        self.assertFalse(resolver.allows("resident-7", "write:observations"))
+        self.assertTrue(resolver.allows("registrar", "write:roles"))
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(4):
+            response = self.client.post("/api/v1/roles/assign/bulk", payload, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 91)
+        self.assertEqual(RoleAssignmentRecord.objects.filter(reason="Residency intake").count(), 90)
+        self.assertTrue(resolver.allows("resident-7", "write:observations"))
+        self.assertTrue(resolver.allows("chief", "write:roles"))
+
+    def test_rejects_the_whole_request_if_one_assignment_is_invalid(self) -> None:
+        payload = {"assignments": [{"userId": "a", "roles": ["nurse"]}, {"userId": "b", "roles": ["wizard"]}]}
+
+        response = self.client.post("/api/v1/roles/assign/bulk", payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("assignments[1]", response.data["issue"][0]["diagnostics"])
+        self.assertFalse(RoleAssignmentRecord.objects.exclude(user_id="registrar").exists())
+
+    def test_duplicate_assignment_ids_conflict(self) -> None:
+        RoleAssignmentRecord.objects.create(assignment_id="taken", user_id="a")
+        payload = {"assignments": [{"assignmentId": "taken", "userId": "b", "roles": ["nurse"]}]}
+
+        response = self.client.post("/api/v1/roles/assign/bulk", payload, format="json")
+
+        self.assertEqual(response.status_code, 409)
+
+
+class ExpirySweepTests(TestCase):
+    def setUp(self) -> None:
+        caches["fhir"].clear()
+        resolver.mark_stale()
+
+    def test_revokes_expired_assignments_in_batches(self) -> None:
+        now = timezone.now()
+        for n in range(5):
+            RoleAssignmentRecord.objects.create(
+                assignment_id=f"expired-{n}", user_id=f"u{n}", roles=["nurse"], expiry_date=now - timedelta(days=n)
+            )
+        RoleAssignmentRecord.objects.create(
+            assignment_id="current", user_id="u0", expiry_date=now + timedelta(days=1)
+        )
+        RoleAssignmentRecord.objects.create(assignment_id="open", user_id="u0")
+        RoleAssignmentRecord.objects.create(
+            assignment_id="done",
+            user_id="u9",
+            expiry_date=now - timedelta(days=9),
+            revoked_at=now - timedelta(days=8),
+        )
+
+        self.assertEqual(sweep_expired(now=now, batch_size=2), 5)
+
+        revoked = RoleAssignmentRecord.objects.filter(revoked_at=now).values_list("assignment_id", flat=True)
+        self.assertEqual(sorted(revoked), [f"expired-{n}" for n in range(5)])
+        self.assertEqual(sweep_expired(now=now), 0)
+
+    def test_drops_cached_permissions_of_affected_users(self) -> None:
+        later = timezone.now() + timedelta(hours=1)
+        RoleAssignmentRecord.objects.create(assignment_id="a1", user_id="u1", roles=["doctor"], expiry_date=later)
+        RoleAssignmentRecord.objects.create(assignment_id="a2", user_id="u2", roles=["doctor"])
+        self.assertTrue(resolver.allows("u1", "read:patients"))
+        self.assertTrue(resolver.allows("u2", "read:patients"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_expired(now=later), 1)
+
+        self.assertFalse(resolver.allows("u1", "read:patients"))
+        with self.assertNumQueries(0):
+            self.assertTrue(resolver.allows("u2", "read:patients"))
+        self.assertEqual(RoleAssignmentRecord.objects.get(assignment_id="a1").revoked_at, later)
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-from django.test import SimpleTestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 from rest_framework.test import APIClient
 
+from services.models import HL7Message, PatientRecord
+
 
 SQLITE_DATABASES = {
     "default": {
@@ -12,34 +14,72 @@ SQLITE_DATABASES = {
 }
 
 
-@override_settings(DATABASES=SQLITE_DATABASES)
-class HL7ParserViewTests(SimpleTestCase):
+class HL7ParserViewTests(TestCase):
     client_class = APIClient
 
-    def test_ingest_merges_payload_with_defaults(self) -> None:
-        payload = {
-            "status": "custom-status",
-            "fhirResources": [
-                {
-                    "identifier": [{"value": "MRN12345"}],
-                    "name": [{"family": "Doe", "given": ["John"]}],
-                }
-            ],
-        }
+    raw_message = (
+        "MSH|^~\\&|SENDING_APP|SENDING_FACILITY|RECEIVING_APP|RECEIVING_FACILITY|"
+        "20230901123045||ADT^A01|MSG001|P|2.5.1\r"
+        "PID|||MRN12345||Doe^John^M||19800115|M\r"
+    )
 
-        response = self.client.post("/api/v1/hl7-parser/ingest", payload, format="json")
+    def test_ingest_parses_raw_hl7_and_persists_resources(self) -> None:
+        response = self.client.post(
+            "/api/v1/hl7-parser/ingest", self.raw_message, content_type="application/hl7-v2"
+        )
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data["status"], "custom-status")
-        self.assertEqual(
-            response.data["fhirResources"][0]["identifier"], [{"value": "MRN12345"}]
+        self.assertEqual(response.data["messageId"], "MSG001")
+        self.assertEqual(response.data["correlationId"], "MSG001")
+        self.assertEqual(response.data["status"], "processed")
+        patient = response.data["fhirResources"][0]
+        self.assertEqual(patient["identifier"][0]["value"], "MRN12345")
+        self.assertEqual(patient["name"][0]["family"], "Doe")
+        stored = HL7Message.objects.get(message_id="MSG001")
+        self.assertEqual(stored.fhir_resources, response.data["fhirResources"])
+
+    def test_ingest_accepts_json_wrapped_message(self) -> None:
+        response = self.client.post(
+            "/api/v1/hl7-parser/ingest",
+            {"message": self.raw_message, "correlationId": "corr-1"},
+            format="json",
         )
-        self.assertIn("messageId", response.data)
-        self.assertIn("timestamp", response.data)
 
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["messageId"], "MSG001")
+        self.assertEqual(response.data["correlationId"], "corr-1")
 
-@override_settings(DATABASES=SQLITE_DATABASES)
-class PatientViewTests(SimpleTestCase):
+    def test_ingest_records_parse_failures(self) -> None:
+        response = self.client.post(
+            "/api/v1/hl7-parser/ingest", "PID|||MRN1", content_type="application/hl7-v2"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["status"], "failed")
+        status_response = self.client.get(
+            f"/api/v1/hl7-parser/parse-status/{response.data['messageId']}"
+        )
+        self.assertEqual(status_response.data["status"], "failed")
+        self.assertTrue(status_response.data["errors"])
+
+    def test_parse_status_reports_stored_message(self) -> None:
+        self.client.post(
+            "/api/v1/hl7-parser/ingest", self.raw_message, content_type="application/hl7-v2"
+        )
+
+        response = self.client.get("/api/v1/hl7-parser/parse-status/MSG001")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "completed")
+        self.assertEqual(response.data["resourcesCreated"], 1)
+
+    def test_parse_status_unknown_message_returns_404(self) -> None:
+        response = self.client.get("/api/v1/hl7-parser/parse-status/missing")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientViewTests(TestCase):
     client_class = APIClient
 
     def test_registration_populates_default_identifiers_and_names(self) -> None:
@@ -58,21 +98,9 @@ class PatientViewTests(SimpleTestCase):
         self.assertEqual(response.data["name"][0]["family"], "Sample")
         self.assertIn("meta", response.data)
         self.assertIn("lastUpdated", response.data["meta"])
-
-
-@override_settings(DATABASES=SQLITE_DATABASES)
-class ObservationViewTests(SimpleTestCase):
-    client_class = APIClient
-
-    def test_lab_results_default_entry_contains_location(self) -> None:
-        response = self.client.post("/api/v1/observations/lab-results", {}, format="json")
-
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data["resourceType"], "Bundle")
-        self.assertTrue(response.data["entry"])
-        entry = response.data["entry"][0]
-        self.assertIn("response", entry)
-        self.assertIn("Observation/", entry["response"]["location"])
+        record = PatientRecord.objects.get(patient_id=response.data["id"])
+        self.assertEqual(record.identifier, "MRN-SAMPLE")
+        self.assertEqual(record.name, "Sample Patient")
 
 
 @override_settings(DATABASES=SQLITE_DATABASES)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from services import observation_alerts
+from services.models import NotificationMessage, ObservationAlertConfig, ObservationRecord, ObservationSample
+from services.vitals_ingest import ingest_lines
+
+
+def heart_rate(value: float, second: int = 0, patient: str = "p1") -> str:
+    return json.dumps(
+        {
+            "resourceType": "Observation",
+            "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+            "subject": {"reference": f"Patient/{patient}"},
+            "effectiveDateTime": f"2024-01-01T00:00:{second:02d}Z",
+            "valueQuantity": {"value": value, "unit": "/min"},
+        }
+    )
+
+
+class VitalsIngestTests(TestCase):
+    client_class = APIClient
+
+    def post(self, *lines: str):
+        response = self.client.generic(
+            "POST", "/api/v1/observations/bulk", "\n".join(lines) + "\n", content_type="application/fhir+ndjson"
+        )
+        outcomes = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        return response, outcomes
+
+    def test_bulk_upload_reports_each_line(self) -> None:
+        response, outcomes = self.post(heart_rate(70, 1), "", "not json", heart_rate(72, 2))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            [(outcome["line"], outcome["status"]) for outcome in outcomes],
+            [(1, "created"), (3, "error"), (4, "created")],
+        )
+        self.assertIn("Invalid JSON", outcomes[1]["error"])
+        record = ObservationRecord.objects.get(observation_id=outcomes[0]["id"])
+        self.assertEqual(record.patient_reference, "Patient/p1")
+        self.assertEqual(record.category, "vital-signs")
+        self.assertEqual(record.data["id"], record.observation_id)
+        self.assertEqual(ObservationSample.objects.count(), 2)
+
+    def test_single_post_is_stored_and_evaluated(self) -> None:
+        ObservationAlertConfig.objects.create(
+            patient_id="p1", observation_code="8867-4", thresholds={"high": 100}, notification_channels=["sms"]
+        )
+        observation_alerts.index.mark_stale()
+
+        response = self.client.post("/api/v1/observations/", json.loads(heart_rate(130, 5)), format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["status"], "final")
+        self.assertEqual(response.data["meta"]["versionId"], "1")
+        record = ObservationRecord.objects.get(observation_id=response.data["id"])
+        self.assertEqual(record.category, "vital-signs")
+        self.assertEqual(ObservationSample.objects.get().value, 130.0)
+        self.assertEqual(NotificationMessage.objects.count(), 1)
+
+        missing_value = {**json.loads(heart_rate(70)), "valueQuantity": None}
+        response = self.client.post("/api/v1/observations/", missing_value, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ObservationRecord.objects.count(), 1)
+
+    def test_invalid_observations_are_rejected(self) -> None:
+        missing_subject = json.loads(heart_rate(70))
+        del missing_subject["subject"]
+        missing_value = json.loads(heart_rate(70))
+        del missing_value["valueQuantity"]
+
+        lines = [json.dumps(missing_subject), json.dumps(missing_value), '{"resourceType": "Patient"}']
+
+        outcomes = list(ingest_lines(lines))
+
+        self.assertEqual([outcome["status"] for outcome in outcomes], ["error"] * 3)
+        self.assertFalse(ObservationRecord.objects.exists())
+
+    def test_malformed_shapes_only_fail_their_line(self) -> None:
+        string_subject = {**json.loads(heart_rate(70)), "subject": "Patient/p1"}
+        component_object = {**json.loads(heart_rate(70)), "component": {"valueQuantity": {"value": 1}}}
+        del component_object["valueQuantity"]
+
+        outcomes = list(ingest_lines([json.dumps(string_subject), json.dumps(component_object), heart_rate(71)]))
+
+        self.assertEqual([outcome["status"] for outcome in outcomes], ["error", "error", "created"])
+        self.assertIn("subject", outcomes[0]["error"])
+        self.assertIn("component must be a list", outcomes[1]["error"])
+
+    def test_each_batch_is_one_insert(self) -> None:
+        lines = [heart_rate(60 + second, second) for second in range(6)]
+        observation_alerts.index.refresh()
+
+        # Eleven queries per batch whatever its size: one insert each for the
+        # records and samples, plus the series lock, the rollup refresh and the
+        # savepoint. Creating the lock row of a new series takes two more.
+        with self.assertNumQueries(2 * 11 + 2):
+            outcomes = list(ingest_lines(lines, batch_size=3))
+
+        self.assertEqual([outcome["line"] for outcome in outcomes], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(ObservationRecord.objects.count(), 6)
+
+    def test_out_of_range_values_enqueue_alerts(self) -> None:
+        ObservationAlertConfig.objects.create(
+            patient_id="p1", observation_code="8867-4", thresholds={"high": 100}, notification_channels=["sms"]
+        )
+        observation_alerts.index.mark_stale()
+
+        self.post(heart_rate(80, 1), heart_rate(130, 2))
+
+        alert = NotificationMessage.objects.get()
+        self.assertEqual(alert.data["value"], 130.0)
+
+    def test_requires_ndjson_body(self) -> None:
+        response = self.client.post("/api/v1/observations/bulk", {}, format="json")
+
+        self.assertEqual(response.status_code, 415)
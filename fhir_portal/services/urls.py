@@ -4,6 +4,7 @@ from .views import (
     audit,
     auth,
     appointments,
+    exports,
     hl7,
     kafka,
     notifications,
@@ -24,5 +25,6 @@ urlpatterns = [
     path('notifications/', include((notifications.urlpatterns, 'notifications'), namespace='notifications')),
     path('analytics/', include((analytics.urlpatterns, 'analytics'), namespace='analytics')),
     path('audit/', include((audit.urlpatterns, 'audit'), namespace='audit')),
+    path('exports/', include((exports.urlpatterns, 'exports'), namespace='exports')),
     path('kafka/', include((kafka.urlpatterns, 'kafka'), namespace='kafka')),
 ]
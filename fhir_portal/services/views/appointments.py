@@ -1,8 +1,29 @@
+from datetime import date
+
 from django.urls import path
+from django.utils import timezone
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from ..sample_utils import deep_merge, ensure_list, generate_identifier, isoformat_now
+from ..appointment_availability import (
+    PRACTITIONER_PREFIX,
+    AvailabilityError,
+    available_slots,
+    available_time,
+    set_schedule,
+)
+from ..appointment_booking import (
+    BookingError,
+    IdempotencyMismatch,
+    SlotUnavailable,
+    book as book_appointment,
+    request_hash,
+)
+from ..appointment_waitlist import WaitlistError, add_entry
+from ..fhir_utils import operation_outcome
+from ..models import AppointmentRecord
+from ..sample_utils import deep_merge, ensure_list, generate_identifier, isoformat, isoformat_now
 
 
 def _appointment_template(payload: dict | None = None) -> dict:
@@ -25,49 +46,117 @@ def _appointment_template(payload: dict | None = None) -> dict:
 @api_view(['POST'])
 def book(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    return Response(deep_merge(_appointment_template(payload), payload))
+    idempotency_key = request.headers.get('Idempotency-Key', '')
+    if len(idempotency_key) > 128:
+        return Response(
+            operation_outcome('Idempotency-Key must be at most 128 characters'), status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        result = book_appointment(
+            deep_merge(_appointment_template(payload), payload),
+            idempotency_key=idempotency_key,
+            digest=request_hash(payload),
+        )
+    except SlotUnavailable as exc:
+        return Response(operation_outcome(str(exc), code='conflict'), status=status.HTTP_409_CONFLICT)
+    except IdempotencyMismatch as exc:
+        return Response(operation_outcome(str(exc), code='conflict'), status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except BookingError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    response = Response(result.appointment, status=status.HTTP_201_CREATED)
+    if result.replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
 
 
 @api_view(['GET'])
 def availability(request):
-    slots = ensure_list(
-        None,
-        [
-            {
-                'start': isoformat_now(),
-                'end': isoformat_now(),
-                'type': 'available',
-            }
-        ],
-    )
+    params = request.query_params
+    practitioner = params.get('practitioner', '')
+    try:
+        start = date.fromisoformat(params['date']) if params.get('date') else timezone.now().date()
+        days = int(params.get('days', 1))
+        duration = int(params['duration']) if params.get('duration') else None
+    except ValueError:
+        return Response(
+            operation_outcome('date must be YYYY-MM-DD and days/duration integers'),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        slots = available_slots(
+            [value for value in practitioner.split(',') if value], start, days=days, duration=duration
+        )
+    except AvailabilityError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
     return Response(
         {
-            'date': request.query_params.get('date', isoformat_now().split('T')[0]),
-            'practitioner': request.query_params.get(
-                'practitioner', generate_identifier('practitioner')
-            ),
-            'availableSlots': slots,
+            'date': start.isoformat(),
+            'days': days,
+            'practitioner': practitioner,
+            'availableSlots': [
+                {
+                    'practitioner': PRACTITIONER_PREFIX + slot.practitioner_id,
+                    'start': isoformat(slot.start),
+                    'end': isoformat(slot.end),
+                    'type': 'available',
+                }
+                for slot in slots
+            ],
         }
     )
 
 
+@api_view(['PUT'])
+def schedule(request, practitioner_id: str):
+    payload = request.data if isinstance(request.data, dict) else {}
+    try:
+        rows = set_schedule(practitioner_id, payload.get('availableTime'))
+    except AvailabilityError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    return Response({'practitioner': PRACTITIONER_PREFIX + practitioner_id, 'availableTime': available_time(rows)})
+
+
 @api_view(['POST'])
 def waitlist(request, appointment_id: str):
     payload = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'appointmentId': appointment_id,
-        'status': payload.get('status', 'added'),
-        'priority': payload.get('priority', 'routine'),
-        'notificationPreferences': payload.get(
-            'notificationPreferences',
-            {'email': True, 'sms': True, 'advanceNotice': '24h'},
-        ),
-    }
-    return Response(template)
+    practitioner = payload.get('practitioner') or (
+        AppointmentRecord.objects.filter(appointment_id=appointment_id)
+        .values_list('practitioner_reference', flat=True)
+        .first()
+    )
+    try:
+        entry = add_entry(
+            appointment_id,
+            str(payload.get('patientId') or ''),
+            practitioner=str(practitioner or ''),
+            preferred_dates=payload.get('preferredDates', []),
+            preferred_times=payload.get('preferredTimes', []),
+            priority=payload.get('priority', 'routine'),
+            notification_preferences=payload.get(
+                'notificationPreferences',
+                {'email': True, 'sms': True, 'advanceNotice': '24h'},
+            ),
+        )
+    except WaitlistError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {
+            'appointmentId': appointment_id,
+            'patientId': entry.patient_id,
+            'practitioner': PRACTITIONER_PREFIX + entry.practitioner_id,
+            'status': 'added',
+            'priority': entry.priority,
+            'preferredDates': entry.preferred_dates,
+            'preferredTimes': entry.preferred_times,
+            'notificationPreferences': entry.notification_preferences,
+        },
+        status=status.HTTP_201_CREATED,
+    )
 
 
 urlpatterns = [
     path('', book, name='book'),
     path('availability', availability, name='availability'),
+    path('schedules/<str:practitioner_id>', schedule, name='schedule'),
     path('<str:appointment_id>/waitlist', waitlist, name='waitlist'),
 ]
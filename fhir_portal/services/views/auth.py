@@ -1,46 +1,148 @@
+from django.contrib.auth import authenticate, get_user_model
+from django.db import IntegrityError
 from django.urls import path
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from .. import auth_events, rbac
+from ..auth_tokens import REFRESH, TokenError, issue, revoke, verify
+from ..fhir_utils import operation_outcome
 from ..sample_utils import ensure_list, generate_identifier, isoformat_now
 
 
+def _client(request) -> dict:
+    return {'ip': request.META.get('REMOTE_ADDR', '')}
+
+
 @api_view(['POST'])
+@permission_classes([AllowAny])
 def login(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    response = {
-        'accessToken': payload.get('accessToken', generate_identifier('access-token')),
-        'refreshToken': payload.get('refreshToken', generate_identifier('refresh-token')),
-        'tokenType': payload.get('tokenType', 'Bearer'),
-        'expiresIn': int(payload.get('expiresIn', 3600)),
-        'user': {
-            'id': payload.get('user', {}).get('id', generate_identifier('user')),
-            'email': payload.get('username') or payload.get('email', 'user@example.com'),
-            'roles': ensure_list(payload.get('roles'), ['patient']),
-            'permissions': ensure_list(
-                payload.get('permissions'), ['read:own_records', 'write:own_profile']
-            ),
-        },
-        'issuedAt': isoformat_now(),
-    }
-    return Response(response)
+    username = str(payload.get('username') or payload.get('email') or '')
+    device = auth_events.device_info(request, payload)
+    user = authenticate(request, username=username, password=str(payload.get('password') or ''))
+    if user is None or not user.is_active:
+        auth_events.record(auth_events.LOGIN_FAILED, username=username, device=device, metadata=_client(request))
+        return Response(
+            operation_outcome('Invalid username or password', code='login'), status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    user_id = str(user.pk)
+    access_token, access = issue(user_id, user.get_username())
+    refresh_token, _ = issue(user_id, user.get_username(), token_type=REFRESH)
+    grant = rbac.resolver.grant(user_id)
+    auth_events.record(
+        auth_events.LOGIN,
+        user_id=user_id,
+        username=user.get_username(),
+        device=device,
+        metadata={**_client(request), 'jti': access.jti},
+    )
+    return Response(
+        {
+            'accessToken': access_token,
+            'refreshToken': refresh_token,
+            'tokenType': 'Bearer',
+            'expiresIn': access.expires_at - access.issued_at,
+            'user': {
+                'id': user_id,
+                'email': user.email or user.get_username(),
+                'roles': list(grant.roles),
+                'permissions': rbac.resolver.permissions(grant.mask),
+            },
+            'issuedAt': isoformat_now(),
+        }
+    )
 
 
 @api_view(['POST'])
+@permission_classes([AllowAny])
+def refresh(request):
+    payload = request.data if isinstance(request.data, dict) else {}
+    try:
+        claims = verify(str(payload.get('refreshToken') or ''), token_type=REFRESH)
+    except TokenError as exc:
+        return Response(operation_outcome(str(exc), code='login'), status=status.HTTP_401_UNAUTHORIZED)
+    access_token, access = issue(claims.user_id, claims.username)
+    auth_events.record(
+        auth_events.REFRESH, user_id=claims.user_id, username=claims.username, metadata={'jti': access.jti}
+    )
+    return Response(
+        {'accessToken': access_token, 'tokenType': 'Bearer', 'expiresIn': access.expires_at - access.issued_at}
+    )
+
+
+# Every signed-in user may end their session and set up MFA, whatever their
+# roles, so these routes do not follow RBAC_ENFORCE.
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    if request.auth is None:
+        return Response(
+            operation_outcome('A bearer token is required', code='login'), status=status.HTTP_401_UNAUTHORIZED
+        )
+    payload = request.data if isinstance(request.data, dict) else {}
+    revoke(request.auth)
+    if payload.get('refreshToken'):
+        try:
+            revoke(verify(str(payload['refreshToken']), token_type=REFRESH))
+        except TokenError:
+            pass
+    auth_events.record(
+        auth_events.LOGOUT,
+        user_id=request.auth.user_id,
+        username=request.auth.username,
+        metadata={**_client(request), 'jti': request.auth.jti},
+    )
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
 def register(request):
     payload = request.data if isinstance(request.data, dict) else {}
+    email = str(payload.get('email') or '')
+    username = str(payload.get('username') or email)
+    password = str(payload.get('password') or '')
+    if not username or not password:
+        return Response(
+            operation_outcome('username (or email) and password are required'), status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        user = get_user_model().objects.create_user(username=username, email=email, password=password)
+    except IntegrityError:
+        return Response(
+            operation_outcome(f'User {username!r} already exists', code='duplicate'), status=status.HTTP_409_CONFLICT
+        )
+    auth_events.record(
+        auth_events.REGISTER,
+        user_id=str(user.pk),
+        username=username,
+        device=auth_events.device_info(request, payload),
+        metadata=_client(request),
+    )
     return Response(
         {
-            'status': payload.get('status', 'registered'),
-            'userId': generate_identifier('user', override=payload.get('userId')),
+            'status': 'registered',
+            'userId': str(user.pk),
             'verificationMethod': payload.get('verificationMethod', 'email'),
-        }
+        },
+        status=status.HTTP_201_CREATED,
     )
 
 
 @api_view(['POST'])
+@permission_classes([AllowAny])
 def password_reset(request):
     payload = request.data if isinstance(request.data, dict) else {}
+    auth_events.record(
+        auth_events.PASSWORD_RESET,
+        username=str(payload.get('email') or payload.get('username') or ''),
+        device=auth_events.device_info(request, payload),
+        metadata=_client(request),
+    )
     return Response(
         {
             'status': payload.get('status', 'sent'),
@@ -54,6 +156,7 @@ def password_reset(request):
 
 
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def mfa_setup(request):
     payload = request.data if isinstance(request.data, dict) else {}
     template = {
@@ -64,9 +167,18 @@ def mfa_setup(request):
     return Response(template)
 
 
+@api_view(['GET'])
+@permission_classes([rbac.requires('read:audit')])
+def event_stats(request):
+    return Response(auth_events.stats())
+
+
 urlpatterns = [
     path('login', login, name='login'),
+    path('refresh', refresh, name='refresh'),
+    path('logout', logout, name='logout'),
     path('register', register, name='register'),
     path('password-reset', password_reset, name='password-reset'),
     path('mfa/setup', mfa_setup, name='mfa-setup'),
+    path('events/stats', event_stats, name='event-stats'),
 ]
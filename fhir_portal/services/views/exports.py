@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from ..fhir_utils import operation_outcome
+from ..models import PatientExportJob
+from ..patient_export import content_type, export_path, serialize_export
+
+
+def file_download(file_path: Path, media_type: str) -> HttpResponse:
+    """Serve an export file without reading it into the worker's memory.
+
+    With ``EXPORT_SENDFILE_HEADER`` configured the transfer is delegated to
+    the front-end server; otherwise the file is streamed in blocks.
+    """
+
+    if settings.EXPORT_SENDFILE_HEADER:
+        response = HttpResponse(content_type=media_type)
+        # Bulk exports live in per-job directories under EXPORT_ROOT.
+        location = Path(file_path).relative_to(settings.EXPORT_ROOT).as_posix()
+        response[settings.EXPORT_SENDFILE_HEADER] = f'{settings.EXPORT_SENDFILE_PREFIX}{location}'
+        response['Content-Disposition'] = f'attachment; filename="{file_path.name}"'
+        return response
+    return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=file_path.name, content_type=media_type)
+
+
+@api_view(['GET'])
+def export_status(request, export_id: str):
+    job = get_object_or_404(PatientExportJob, export_id=export_id)
+    return Response(serialize_export(job))
+
+
+@api_view(['GET'])
+def download(request, export_id: str):
+    job = get_object_or_404(PatientExportJob, export_id=export_id)
+    if job.status != 'completed':
+        return Response(serialize_export(job), status=status.HTTP_202_ACCEPTED)
+    file_path = export_path(job)
+    if (job.expires_at and job.expires_at <= timezone.now()) or not file_path.exists():
+        file_path.unlink(missing_ok=True)
+        return Response(
+            operation_outcome(f'Export {export_id} has expired', code='expired'), status=status.HTTP_410_GONE
+        )
+    return file_download(file_path, content_type(job))
+
+
+urlpatterns = [
+    path('<str:export_id>', export_status, name='status'),
+    path('<str:export_id>/download', download, name='download'),
+]
@@ -1,82 +1,305 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.urls import path
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from ..sample_utils import ensure_list, generate_identifier, isoformat_now
+from ..bulk_export import (
+    CANCELLED,
+    GROUP,
+    SYSTEM,
+    BulkExportError,
+    delete_job,
+    file_path,
+    kick_off,
+    manifest,
+    progress,
+    remove_files,
+    start_job,
+)
+from ..capability import capability
+from ..fhir_bundle import BundleError, process_bundle
+from ..fhir_utils import operation_outcome
+from ..models import BulkExportJob, PatientGroup, PatientRecord
+from ..patient_records import RESOURCE_TYPE, read_patient
+from ..patient_search import SearchParameterError, page_size
+from ..resource_cache import current_version, etag, parse_etags
+from ..resource_history import DELETE, HistoryEntry, history, history_resource, parse_since, read_version
+from ..sample_utils import isoformat
+from .exports import file_download
+
+
+def _not_modified(version: int) -> HttpResponse:
+    response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag(version)
+    return response
 
 
 @api_view(['GET'])
 def get_patient(request, patient_id: str):
-    response = {
-        'resourceType': 'Patient',
-        'id': patient_id,
-        'meta': {
-            'versionId': request.query_params.get('versionId', '1'),
-            'lastUpdated': isoformat_now(),
+    if_none_match = parse_etags(request.headers.get('If-None-Match'))
+    if if_none_match:
+        version = current_version(RESOURCE_TYPE, patient_id)
+        if version in if_none_match:
+            return _not_modified(version)
+    cached = read_patient(patient_id)
+    if cached is None:
+        return Response(
+            operation_outcome(f'Patient {patient_id} not found', code='not-found'),
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    if cached.version in if_none_match:
+        return _not_modified(cached.version)
+    response = HttpResponse(cached.body, content_type='application/fhir+json')
+    response['ETag'] = etag(cached.version)
+    response['Last-Modified'] = http_date(cached.last_modified.timestamp())
+    return response
+
+
+def _history_entry(entry: HistoryEntry) -> dict:
+    row = entry.row
+    url = f'{row.resource_type}/{row.resource_id}'
+    item = {
+        'fullUrl': url,
+        'request': {'method': row.method, 'url': url if row.method != 'POST' else row.resource_type},
+        'response': {
+            'status': {'POST': '201 Created', DELETE: '204 No Content'}.get(row.method, '200 OK'),
+            'etag': etag(row.version_id),
+            'lastModified': isoformat(row.last_updated),
         },
-        'identifier': ensure_list(
-            request.query_params.getlist('identifier') or None,
-            [{'use': 'usual', 'value': 'MRN-SAMPLE'}],
-        ),
     }
-    return Response(response)
+    resource = history_resource(entry)
+    if resource is not None:
+        item['resource'] = resource
+    return item
+
+
+def _history_page_url(request, cursor: str) -> str:
+    params = request.query_params.copy()
+    params['_page'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _history(request, patient_id: str | None = None):
+    query = request.query_params
+    try:
+        page = history(
+            RESOURCE_TYPE,
+            patient_id,
+            since=parse_since(query.get('_since')),
+            count=page_size(query.get('_count')),
+            cursor=query.get('_page'),
+        )
+    except SearchParameterError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    unfiltered = not (query.get('_since') or query.get('_page'))
+    if patient_id is not None and not page.entries and unfiltered and not PatientRecord.objects.filter(
+        patient_id=patient_id
+    ).exists():
+        return Response(
+            operation_outcome(f'Patient {patient_id} not found', code='not-found'),
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    links = [{'relation': 'self', 'url': request.build_absolute_uri()}]
+    if page.next_cursor:
+        links.append({'relation': 'next', 'url': _history_page_url(request, page.next_cursor)})
+    return Response({
+        'resourceType': 'Bundle',
+        'type': 'history',
+        'link': links,
+        'entry': [_history_entry(entry) for entry in page.entries],
+    })
 
 
 @api_view(['GET'])
+def patient_history(request, patient_id: str):
+    return _history(request, patient_id)
+
+
+@api_view(['GET'])
+def patient_type_history(request):
+    return _history(request)
+
+
+@api_view(['GET'])
+def get_patient_version(request, patient_id: str, version_id: int):
+    entry = read_version(RESOURCE_TYPE, patient_id, version_id)
+    if entry is None:
+        return Response(
+            operation_outcome(f'Patient {patient_id} has no version {version_id}', code='not-found'),
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    if entry.row.method == DELETE:
+        return Response(
+            operation_outcome(f'Patient {patient_id} was deleted in version {version_id}', code='deleted'),
+            status=status.HTTP_410_GONE,
+        )
+    resource = history_resource(entry)
+    if resource is None:
+        return Response(
+            operation_outcome(f'Version {version_id} of Patient {patient_id} cannot be rebuilt', code='not-found'),
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    response = HttpResponse(json.dumps(resource, separators=(',', ':')), content_type='application/fhir+json')
+    response['ETag'] = etag(version_id)
+    response['Last-Modified'] = http_date(entry.row.last_updated.timestamp())
+    return response
+
+
+@require_safe
 def get_capability_statement(request):
-    response = {
-        'resourceType': 'CapabilityStatement',
-        'status': request.query_params.get('status', 'active'),
-        'date': request.query_params.get('date', isoformat_now().split('T')[0]),
-        'publisher': request.query_params.get('publisher', 'Healthcare Organization'),
-        'kind': request.query_params.get('kind', 'instance'),
-        'software': {
-            'name': request.query_params.get('softwareName', 'FHIR Patient Portal'),
-            'version': request.query_params.get('softwareVersion', '1.0.0'),
-        },
-        'fhirVersion': request.query_params.get('fhirVersion', '4.0.1'),
-        'format': ensure_list(request.query_params.getlist('format'), ['json', 'xml']),
-        'rest': ensure_list(
-            None,
-            [
-                {
-                    'mode': 'server',
-                    'resource': [
-                        {
-                            'type': 'Patient',
-                            'interaction': [{'code': 'read'}, {'code': 'search-type'}],
-                        }
-                    ],
-                }
-            ],
-        ),
-    }
-    return Response(response)
+    # A plain Django view: /metadata skips DRF negotiation and rendering and
+    # only compares an ETag or copies prebuilt bytes.
+    statement = capability()
+    if statement.etag in {tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')}:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(statement.body, content_type='application/fhir+json')
+    response['ETag'] = statement.etag
+    response['Cache-Control'] = f'public, max-age={settings.FHIR_METADATA_MAX_AGE}'
+    return response
 
 
 @api_view(['POST'])
 def batch_operations(request):
-    payload = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'resourceType': 'Bundle',
-        'type': payload.get('type', 'batch-response'),
-        'entry': ensure_list(
-            payload.get('entry'),
-            [
-                {
-                    'response': {
-                        'status': '200',
-                        'location': f"Patient/{generate_identifier('patient')}",
-                    }
-                }
-            ],
-        ),
+    try:
+        result = process_bundle(request.data)
+    except BundleError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    if result.error:
+        return Response(operation_outcome(result.error, code='processing'), status=status.HTTP_400_BAD_REQUEST)
+    return Response(result.as_bundle())
+
+
+def _group_resource(group: PatientGroup) -> dict:
+    return {
+        'resourceType': 'Group',
+        'id': group.group_id,
+        'type': 'person',
+        'actual': True,
+        'name': group.name,
+        'quantity': group.members.count(),
+        'member': [
+            {'entity': {'reference': f'Patient/{patient_id}'}}
+            for patient_id in group.members.order_by('pk').values_list('patient_id', flat=True).iterator()
+        ],
     }
-    return Response(template)
+
+
+@api_view(['GET', 'PUT'])
+def group(request, group_id: str):
+    if request.method == 'GET':
+        return Response(_group_resource(get_object_or_404(PatientGroup, group_id=group_id)))
+
+    payload = request.data if isinstance(request.data, dict) else {}
+    references = [
+        str((member.get('entity') or {}).get('reference') or '')
+        for member in payload.get('member') or []
+        if isinstance(member, dict)
+    ]
+    patient_ids = {reference.rpartition('/')[2] for reference in references if reference}
+    members = list(PatientRecord.objects.filter(patient_id__in=patient_ids).values_list('pk', 'patient_id'))
+    missing = patient_ids - {patient_id for _, patient_id in members}
+    if missing:
+        return Response(
+            operation_outcome(f"Unknown group members: {', '.join(sorted(missing))}"),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    with transaction.atomic():
+        group_record, _ = PatientGroup.objects.update_or_create(
+            group_id=group_id, defaults={'name': str(payload.get('name') or '')}
+        )
+        group_record.members.set([pk for pk, _ in members])
+    return Response(_group_resource(group_record))
+
+
+def _kick_off(request, level: str, group_id: str = ''):
+    try:
+        job = kick_off(
+            level=level,
+            group_id=group_id,
+            types=request.query_params.get('_type'),
+            since=request.query_params.get('_since'),
+            output_format=request.query_params.get('_outputFormat'),
+            request_url=request.build_absolute_uri(),
+        )
+    except PatientGroup.DoesNotExist as exc:
+        return Response(operation_outcome(str(exc), code='not-found'), status=status.HTTP_404_NOT_FOUND)
+    except BulkExportError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    start_job(job)
+    response = Response(status=status.HTTP_202_ACCEPTED)
+    response['Content-Location'] = request.build_absolute_uri(f'/fhir/R4/bulk-status/{job.job_id}')
+    return response
+
+
+@api_view(['GET'])
+def system_export(request):
+    return _kick_off(request, SYSTEM)
+
+
+@api_view(['GET'])
+def group_export(request, group_id: str):
+    return _kick_off(request, GROUP, group_id)
+
+
+@api_view(['GET', 'DELETE'])
+def bulk_status(request, job_id: str):
+    job = get_object_or_404(BulkExportJob.objects.exclude(status=CANCELLED), job_id=job_id)
+    if request.method == 'DELETE':
+        delete_job(job)
+        return Response(status=status.HTTP_202_ACCEPTED)
+    if job.status == 'failed':
+        return Response(
+            operation_outcome('; '.join(job.errors) or 'Export failed', code='exception'),
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    if job.status != 'completed':
+        response = Response(status=status.HTTP_202_ACCEPTED)
+        response['X-Progress'] = progress(job)
+        response['Retry-After'] = '5'
+        return response
+    response = Response(manifest(job, request.build_absolute_uri(f'/fhir/R4/bulk-files/{job.job_id}')))
+    if job.expires_at:
+        response['Expires'] = http_date(job.expires_at.timestamp())
+    return response
+
+
+@api_view(['GET'])
+def bulk_file(request, job_id: str, resource_type: str):
+    job = get_object_or_404(BulkExportJob, job_id=job_id, status='completed')
+    if resource_type not in job.resource_types:
+        return Response(
+            operation_outcome(f'No {resource_type} file in export {job_id}', code='not-found'),
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    export_file = file_path(job, resource_type)
+    if (job.expires_at and job.expires_at <= timezone.now()) or not export_file.exists():
+        remove_files(job)
+        return Response(
+            operation_outcome(f'Export {job_id} has expired', code='expired'), status=status.HTTP_410_GONE
+        )
+    return file_download(export_file, 'application/fhir+ndjson')
 
 
 urlpatterns = [
+    path('Patient/_history', patient_type_history, name='fhir-patient-type-history'),
+    path('Patient/<str:patient_id>/_history', patient_history, name='fhir-patient-history'),
+    path('Patient/<str:patient_id>/_history/<int:version_id>', get_patient_version, name='fhir-patient-vread'),
     path('Patient/<str:patient_id>', get_patient, name='fhir-get-patient'),
     path('metadata', get_capability_statement, name='fhir-metadata'),
+    path('$export', system_export, name='fhir-system-export'),
+    path('Group/<str:group_id>/$export', group_export, name='fhir-group-export'),
+    path('Group/<str:group_id>', group, name='fhir-group'),
+    path('bulk-status/<str:job_id>', bulk_status, name='fhir-bulk-status'),
+    path('bulk-files/<str:job_id>/<str:resource_type>.ndjson', bulk_file, name='fhir-bulk-file'),
     path('', batch_operations, name='fhir-batch'),
 ]
@@ -1,62 +1,126 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
 from django.urls import path
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import BaseParser, JSONParser
 from rest_framework.response import Response
 
-from ..sample_utils import deep_merge, generate_identifier, isoformat_now
+from ..hl7_batch import process_batch, serialize_batch, start_batch
+from ..hl7_ack import ack_code
+from ..hl7_ingest import ingest_message, iter_correlated_acks, serialize_message
+from ..mllp import iter_frames
+from ..models import HL7BatchRequest, HL7Message
+from ..sample_utils import generate_identifier, isoformat
 
 
-def _ingest_template() -> dict:
-    return {
-        'messageId': generate_identifier('msg'),
-        'correlationId': generate_identifier('corr'),
-        'status': 'processed',
-        'timestamp': isoformat_now(),
-        'fhirResources': [
-            {
-                'resourceType': 'Patient',
-                'id': generate_identifier('patient'),
-                'identifier': [{'value': 'MRN-PLACEHOLDER'}],
-                'name': [{'family': 'Sample', 'given': ['Patient']}],
-            }
-        ],
-        'errors': [],
-    }
+class HL7V2Parser(BaseParser):
+    """Accept raw ER7-encoded HL7 v2 bodies (``Content-Type: application/hl7-v2``)."""
+
+    media_type = 'application/hl7-v2'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return stream.read().decode(encoding)
+
+
+def _raw_message(data) -> str:
+    if isinstance(data, str):
+        return data
+    if isinstance(data, dict):
+        return data.get('message') or data.get('content') or ''
+    return ''
 
 
 @api_view(['POST'])
+@parser_classes([HL7V2Parser, JSONParser])
 def ingest(request):
-    overrides = request.data if isinstance(request.data, dict) else {}
-    return Response(deep_merge(_ingest_template(), overrides))
+    payload = request.data if isinstance(request.data, dict) else {}
+    correlation_id = request.headers.get('X-Correlation-ID') or payload.get('correlationId') or ''
+    message = ingest_message(_raw_message(request.data), correlation_id=correlation_id)
+    response_status = status.HTTP_200_OK if message.status == 'processed' else status.HTTP_400_BAD_REQUEST
+    return Response(serialize_message(message), status=response_status)
 
 
 @api_view(['GET'])
 def parse_status(request, message_id: str):
-    template = {
-        'messageId': message_id,
-        'status': request.query_params.get('status', 'completed'),
-        'processedAt': isoformat_now(),
-        'resourcesCreated': int(request.query_params.get('resourcesCreated', 3)),
-        'errors': [],
-    }
-    return Response(template)
+    # Control ids are only unique per sender; ``sender`` (``MSH-3|MSH-4``)
+    # picks one, otherwise the latest message with that id is reported.
+    messages = HL7Message.objects.filter(message_id=message_id)
+    if request.query_params.get('sender'):
+        messages = messages.filter(sender=request.query_params['sender'])
+    message = messages.order_by('-pk').first()
+    if message is None:
+        batch_request = HL7BatchRequest.objects.filter(batch_id=message_id).first()
+        if batch_request is None:
+            raise Http404
+        return Response(serialize_batch(batch_request))
+    return Response(
+        {
+            'messageId': message.message_id,
+            'correlationId': message.correlation_id,
+            'ackCode': ack_code(message.status),
+            'status': 'completed' if message.status == 'processed' else message.status,
+            'processedAt': isoformat(message.processed_at) if message.processed_at else None,
+            'resourcesCreated': len(message.fhir_resources),
+            'errors': message.errors,
+        }
+    )
+
+
+def _batch_messages(data) -> list[tuple[str, str]]:
+    if isinstance(data, str):
+        return [('', raw) for raw in iter_frames(data)]
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list):
+        return []
+    return [
+        (str(item.get('messageId') or ''), item.get('content') or item.get('message') or '')
+        for item in messages
+        if isinstance(item, dict)
+    ]
 
 
 @api_view(['POST'])
+@parser_classes([HL7V2Parser, JSONParser])
 def batch(request):
-    overrides = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'batchId': overrides.get('batchId') or generate_identifier('batch'),
-        'totalMessages': overrides.get('totalMessages', 0),
-        'processed': overrides.get('processed', 0),
-        'failed': overrides.get('failed', 0),
-        'processingTime': overrides.get('processingTime', '0s'),
-        'status': overrides.get('status', 'pending'),
-    }
-    return Response(template)
+    payload = request.data if isinstance(request.data, dict) else {}
+    messages = _batch_messages(request.data)
+    batch_id = payload.get('batchId') or request.query_params.get('batchId') or generate_identifier('batch')
+    try:
+        with transaction.atomic():
+            batch_request = HL7BatchRequest.objects.create(
+                batch_id=batch_id,
+                total_messages=len(messages),
+                payload={key: value for key, value in payload.items() if key != 'messages'},
+            )
+    except IntegrityError:
+        return Response(
+            {'batchId': batch_id, 'status': 'rejected', 'errors': ['batchId already exists']},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    if len(messages) <= settings.HL7_BATCH_INLINE_LIMIT:
+        process_batch(batch_request, messages)
+        return Response(serialize_batch(batch_request))
+    start_batch(batch_request, messages)
+    return Response(serialize_batch(batch_request), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def acknowledgements(request, correlation_id: str):
+    if not HL7Message.objects.filter(correlation_id=correlation_id).exists():
+        raise Http404
+    return StreamingHttpResponse(
+        iter_correlated_acks(correlation_id), content_type=HL7V2Parser.media_type
+    )
 
 
 urlpatterns = [
     path('ingest', ingest, name='ingest'),
     path('parse-status/<str:message_id>', parse_status, name='parse-status'),
     path('batch', batch, name='batch'),
+    path('acks/<str:correlation_id>', acknowledgements, name='acks'),
 ]
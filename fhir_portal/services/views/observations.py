@@ -1,90 +1,119 @@
+from datetime import datetime, timedelta
+
+from django.http import StreamingHttpResponse
 from django.urls import path
-from rest_framework.decorators import api_view
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import BaseParser
 from rest_framework.response import Response
 
-from ..sample_utils import deep_merge, ensure_list, generate_identifier, isoformat_now
-
-
-def _observation_template(payload: dict | None = None) -> dict:
-    payload = payload or {}
-    return {
-        'resourceType': payload.get('resourceType', 'Observation'),
-        'id': generate_identifier('obs', override=payload.get('id')),
-        'meta': {
-            'versionId': payload.get('meta', {}).get('versionId', '1'),
-            'lastUpdated': isoformat_now(),
-        },
-        'status': payload.get('status', 'final'),
-        'category': ensure_list(
-            payload.get('category'),
-            [
-                {
-                    'coding': [
-                        {
-                            'system': 'http://terminology.hl7.org/CodeSystem/observation-category',
-                            'code': 'vital-signs',
-                        }
-                    ]
-                }
-            ],
-        ),
-    }
+from ..fhir_bundle import BundleError, process_bundle
+from ..fhir_utils import operation_outcome
+from ..lab_interpretation import interpret_bundle
+from ..observation_alerts import AlertConfigError, configure
+from ..observation_series import DEFAULT_POINTS, LTTB, SeriesError, trend
+from ..sample_utils import ensure_list, isoformat
+from ..vitals_ingest import IngestError, ingest_lines, ingest_observation, iter_ndjson
 
 
 @api_view(['POST'])
 def create_vital_sign(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    return Response(deep_merge(_observation_template(payload), payload))
+    try:
+        record = ingest_observation(payload)
+    except IngestError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    resource = {
+        **record.data,
+        'meta': {**(record.data.get('meta') or {}), 'versionId': '1', 'lastUpdated': isoformat(record.created_at)},
+    }
+    return Response(resource, status=status.HTTP_201_CREATED)
+
+
+class NDJSONParser(BaseParser):
+    """Hand NDJSON bodies to the view as the unread request stream."""
+
+    media_type = 'application/fhir+ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class PlainNDJSONParser(NDJSONParser):
+    media_type = 'application/x-ndjson'
+
+
+@api_view(['POST'])
+@parser_classes([NDJSONParser, PlainNDJSONParser])
+def bulk_vitals(request):
+    stream = request.data
+    if not hasattr(stream, 'readline'):
+        return Response(operation_outcome('Request body must be NDJSON'), status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse(
+        iter_ndjson(ingest_lines(iter(stream.readline, b''))), content_type='application/x-ndjson'
+    )
 
 
 @api_view(['POST'])
 def lab_results(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    bundle_template = {
-        'resourceType': 'Bundle',
-        'type': payload.get('type', 'transaction-response'),
-        'entry': ensure_list(
-            payload.get('entry'),
-            [
-                {
-                    'response': {
-                        'status': '201 Created',
-                        'location': f"Observation/{generate_identifier('obs')}",
-                    }
-                }
-            ],
-        ),
-    }
-    return Response(bundle_template)
+    interpret_bundle(payload)
+    try:
+        result = process_bundle(payload)
+    except BundleError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    if result.error:
+        return Response(operation_outcome(result.error, code='processing'), status=status.HTTP_400_BAD_REQUEST)
+    return Response(result.as_bundle())
+
+
+def _instant(value: str | None, default: datetime) -> datetime:
+    if not value:
+        return default
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise SeriesError(f'Invalid timestamp: {value!r}') from None
+    if timezone.is_naive(parsed):
+        raise SeriesError('Timestamps must include a timezone offset')
+    return parsed
+
+
+def _range_status(value: float, low: float | None, high: float | None) -> str:
+    if low is not None and value < low:
+        return 'low'
+    if high is not None and value > high:
+        return 'high'
+    return 'normal'
 
 
 @api_view(['GET'])
 def trends(request, patient_id: str):
     query = request.query_params
-    time_range = {
-        'start': query.get('start', isoformat_now()),
-        'end': query.get('end', isoformat_now()),
-    }
-    data_points = ensure_list(
-        None,
-        [
-            {
-                'timestamp': isoformat_now(),
-                'value': float(query.get('value', 0)),
-                'status': query.get('status', 'normal'),
-            }
-        ],
-    )
+    code = query.get('code') or query.get('observationType')
+    if not code:
+        return Response(operation_outcome('code is required'), status=status.HTTP_400_BAD_REQUEST)
+    try:
+        end = _instant(query.get('end'), timezone.now())
+        start = _instant(query.get('start'), end - timedelta(days=7))
+        points = int(query.get('points', DEFAULT_POINTS))
+        low = float(query['low']) if query.get('low') else None
+        high = float(query['high']) if query.get('high') else None
+        result = trend(patient_id, code, start=start, end=end, points=points, method=query.get('method', LTTB))
+    except ValueError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+
+    for point in result.points:
+        point['status'] = _range_status(point['value'], low, high)
     response = {
         'patientId': patient_id,
-        'observationType': query.get('observationType', 'glucose'),
-        'unit': query.get('unit', 'mg/dL'),
-        'timeRange': time_range,
-        'dataPoints': data_points,
-        'referenceRanges': {
-            'low': float(query.get('low', 0)),
-            'high': float(query.get('high', 0)),
-        },
+        'observationType': code,
+        'unit': result.unit or query.get('unit', ''),
+        'timeRange': {'start': isoformat(start), 'end': isoformat(end)},
+        'resolution': result.resolution,
+        'dataPoints': result.points,
+        'referenceRanges': {'low': low, 'high': high},
     }
     return Response(response)
 
@@ -92,19 +121,30 @@ def trends(request, patient_id: str):
 @api_view(['POST'])
 def configure_alert(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'patientId': payload.get('patientId', generate_identifier('patient')),
-        'observationCode': payload.get('observationCode', 'unknown'),
-        'status': payload.get('status', 'configured'),
-        'notificationChannels': ensure_list(
-            payload.get('notificationChannels'), ['email', 'sms']
-        ),
-    }
-    return Response(template)
+    try:
+        config = configure(
+            str(payload.get('patientId') or ''),
+            str(payload.get('observationCode') or ''),
+            thresholds=payload.get('thresholds'),
+            channels=ensure_list(payload.get('notificationChannels'), ['email', 'sms']),
+            active=payload.get('status', 'configured') != 'disabled',
+        )
+    except AlertConfigError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {
+            'patientId': config.patient_id,
+            'observationCode': config.observation_code,
+            'status': 'configured' if config.active else 'disabled',
+            'thresholds': config.thresholds,
+            'notificationChannels': config.notification_channels,
+        }
+    )
 
 
 urlpatterns = [
     path('', create_vital_sign, name='create'),
+    path('bulk', bulk_vitals, name='bulk'),
     path('lab-results', lab_results, name='lab-results'),
     path('<str:patient_id>/trends', trends, name='trends'),
     path('alerts/configure', configure_alert, name='configure-alert'),
@@ -1,7 +1,17 @@
+from django.shortcuts import get_object_or_404
 from django.urls import path
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from ..fhir_utils import operation_outcome
+from ..models import PatientRecord
+from ..patient_matching import find_candidates
+from ..patient_export import NDJSON, ExportError, create_export, serialize_export, start_export
+from ..patient_merge import DEFAULT_CHUNK_SIZE, KEEP_TARGET, MergeError, merge_patients
+from ..patient_records import VersionConflictError, patient_resource, save_patient
+from ..patient_search import PARAMETERS, SearchParameterError, page_size, search_patients
+from ..resource_cache import etag, parse_etags
 from ..sample_utils import deep_merge, ensure_list, generate_identifier, isoformat_now
 
 
@@ -48,75 +58,202 @@ def _patient_template(payload: dict | None = None) -> dict:
     }
 
 
+def _provided(payload: dict) -> dict:
+    """Drop empty values so they do not override the template defaults."""
+
+    return {key: value for key, value in payload.items() if value not in (None, '', [], {})}
+
+
+def _saved(record, status_code: int = status.HTTP_200_OK) -> Response:
+    response = Response(patient_resource(record), status=status_code)
+    response['ETag'] = etag(record.version_id)
+    return response
+
+
 @api_view(['POST'])
 def register(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    return Response(deep_merge(_patient_template(payload), payload))
+    resource = deep_merge(_patient_template(payload), _provided(payload))
+    return _saved(save_patient(resource))
 
 
 @api_view(['PUT'])
 def update(request, patient_id: str):
     payload = request.data if isinstance(request.data, dict) else {}
-    template = _patient_template({**payload, 'id': patient_id})
-    template['meta']['versionId'] = payload.get('meta', {}).get('versionId', '2')
-    return Response(deep_merge(template, payload))
+    if_match = request.headers.get('If-Match')
+    expected = parse_etags(if_match)
+    if if_match and len(expected) != 1:
+        return Response(
+            operation_outcome('If-Match must name a single version, e.g. W/"3"'),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    resource = deep_merge(_patient_template({**payload, 'id': patient_id}), {**_provided(payload), 'id': patient_id})
+    try:
+        record = save_patient(resource, expected_version=expected.pop() if expected else None)
+    except VersionConflictError as exc:
+        return Response(operation_outcome(str(exc), code='conflict'), status=status.HTTP_412_PRECONDITION_FAILED)
+    return _saved(record)
+
+
+def _page_url(request, cursor: str | None = None) -> str:
+    params = request.query_params.copy()
+    params.pop('_page', None)
+    if cursor:
+        params['_page'] = cursor
+    query = params.urlencode()
+    return request.build_absolute_uri(f"{request.path}?{query}" if query else request.path)
 
 
 @api_view(['GET'])
 def search(request):
-    name_query = request.query_params.getlist('name')
-    if name_query:
-        names = [{'text': value} for value in name_query]
-    else:
-        names = [{'family': 'Sample', 'given': ['Patient']}]
-    entries = [
-        {
-            'resource': {
-                'resourceType': 'Patient',
-                'id': request.query_params.get('id', generate_identifier('patient')),
-                'name': names,
-            }
-        }
-    ]
+    query = request.query_params
+    try:
+        result = search_patients(
+            {name: query.getlist(name) for name in PARAMETERS},
+            count=page_size(query.get('_count')),
+            cursor=query.get('_page'),
+            include_total=query.get('_total') == 'accurate',
+            fuzzy=query.get('_fuzzy') == 'true',
+        )
+    except SearchParameterError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+
+    links = [{'relation': 'self', 'url': request.build_absolute_uri()}]
+    if result.next_cursor:
+        links.append({'relation': 'next', 'url': _page_url(request, result.next_cursor)})
     response = {
         'resourceType': 'Bundle',
         'type': 'searchset',
-        'total': int(request.query_params.get('total', len(entries))),
-        'entry': entries,
+        'link': links,
+        'entry': [
+            {
+                'fullUrl': f'Patient/{record.patient_id}',
+                'resource': patient_resource(record),
+                'search': {'mode': 'match'},
+            }
+            for record in result.records
+        ],
     }
+    if result.total is not None:
+        response['total'] = result.total
     return Response(response)
 
 
+@api_view(['GET'])
+def duplicates(request, patient_id: str):
+    record = get_object_or_404(PatientRecord, patient_id=patient_id)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+    except ValueError:
+        return Response(operation_outcome('limit must be an integer'), status=status.HTTP_400_BAD_REQUEST)
+    candidates = find_candidates(record, limit=limit)
+    return Response(
+        {
+            'patientId': patient_id,
+            'candidates': [
+                {
+                    'patientId': candidate.record.patient_id,
+                    'name': candidate.record.name,
+                    'birthDate': candidate.record.birth_date,
+                    'score': round(candidate.score, 2),
+                    'matchedOn': candidate.matched_on,
+                }
+                for candidate in candidates
+            ],
+        }
+    )
+
+
+def _merge_options(payload: dict) -> dict:
+    fields = payload.get('fields')
+    return {
+        'strategy': payload.get('mergeStrategy') or KEEP_TARGET,
+        'fields': fields if isinstance(fields, list) else None,
+        'reason': str(payload.get('reason') or ''),
+        'audit_reason': str(payload.get('auditReason') or ''),
+    }
+
+
+def _merge_result(outcome) -> dict:
+    result = {
+        'sourcePatientId': outcome.source_id,
+        'resultPatientId': outcome.target_id,
+        'status': outcome.status,
+        'mergedFields': outcome.merged_fields,
+    }
+    if outcome.event is not None:
+        result['auditId'] = outcome.event.event_id
+    if outcome.error:
+        result['error'] = outcome.error
+    return result
+
+
 @api_view(['POST'])
 def merge(request, source_id: str, target_id: str):
     payload = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'status': payload.get('status', 'merged'),
-        'resultPatientId': target_id,
-        'mergedFields': payload.get('mergedFields', ['telecom', 'address']),
-        'auditId': generate_identifier('audit', override=payload.get('auditId')),
-    }
-    return Response(template)
+    try:
+        [outcome] = merge_patients([(source_id, target_id)], **_merge_options(payload))
+    except MergeError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    if outcome.status == 'not-found':
+        return Response(operation_outcome(outcome.error, code='not-found'), status=status.HTTP_404_NOT_FOUND)
+    if outcome.status != 'merged':
+        return Response(operation_outcome(outcome.error), status=status.HTTP_400_BAD_REQUEST)
+    return Response(_merge_result(outcome))
 
 
-@api_view(['GET'])
+@api_view(['POST'])
+def bulk_merge(request):
+    payload = request.data if isinstance(request.data, dict) else {}
+    pairs = [
+        (str(pair.get('sourceId') or ''), str(pair.get('targetId') or ''))
+        for pair in payload.get('pairs') or []
+        if isinstance(pair, dict)
+    ]
+    if not pairs or any(not source or not target for source, target in pairs):
+        return Response(
+            operation_outcome('pairs must be a non-empty list of {sourceId, targetId} objects'),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        chunk_size = max(1, int(payload.get('chunkSize', DEFAULT_CHUNK_SIZE)))
+        outcomes = merge_patients(pairs, chunk_size=chunk_size, **_merge_options(payload))
+    except (TypeError, ValueError) as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {
+            'total': len(outcomes),
+            'merged': sum(outcome.status == 'merged' for outcome in outcomes),
+            'results': [_merge_result(outcome) for outcome in outcomes],
+        }
+    )
+
+
+@api_view(['GET', 'POST'])
 def export(request, patient_id: str):
-    template = {
-        'exportId': generate_identifier('export'),
-        'status': request.query_params.get('status', 'completed'),
-        'downloadUrl': request.query_params.get(
-            'downloadUrl', f'/api/v1/exports/{generate_identifier("export")}/download'
-        ),
-        'format': request.query_params.get('format', 'pdf'),
-        'size': request.query_params.get('size', '0MB'),
-        'expiresAt': request.query_params.get('expiresAt', isoformat_now()),
-    }
-    return Response(template)
+    payload = request.data if isinstance(request.data, dict) else {}
+    # ``format`` is reserved by DRF's format suffix negotiation in query strings.
+    export_format = payload.get('format') or request.query_params.get('_outputFormat') or NDJSON
+    sections = payload.get('include') or request.query_params.get('include') or []
+    if isinstance(sections, str):
+        sections = [section for section in sections.split(',') if section]
+    try:
+        job = create_export(patient_id, export_format=export_format, sections=sections)
+    except PatientRecord.DoesNotExist as exc:
+        return Response(operation_outcome(str(exc), code='not-found'), status=status.HTTP_404_NOT_FOUND)
+    except ExportError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    start_export(job)
+    response = Response(serialize_export(job), status=status.HTTP_202_ACCEPTED)
+    response['Content-Location'] = f'/api/v1/exports/{job.export_id}'
+    return response
 
 
 urlpatterns = [
     path('', register, name='register'),
     path('search', search, name='search'),
+    path('merge', bulk_merge, name='bulk-merge'),
+    path('<str:patient_id>/duplicates', duplicates, name='duplicates'),
     path('<str:source_id>/merge/<str:target_id>', merge, name='merge'),
     path('<str:patient_id>/export', export, name='export'),
     path('<str:patient_id>', update, name='update'),
@@ -1,37 +1,120 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.urls import path
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
-from ..sample_utils import ensure_list, generate_identifier, isoformat_now
+from .. import abac as abac_policies, rbac, role_assignments
+from ..fhir_utils import operation_outcome
+from ..models import RoleAssignmentRecord
+from ..sample_utils import isoformat, isoformat_now
 
 
+def _assignment_body(record: RoleAssignmentRecord) -> dict:
+    return {
+        'assignmentId': record.assignment_id,
+        'userId': record.user_id,
+        'status': 'revoked' if record.revoked_at else 'active',
+        'roles': record.roles,
+        'permissions': record.permissions,
+        'effectiveDate': isoformat(record.effective_date),
+        'expiryDate': isoformat(record.expiry_date) if record.expiry_date else None,
+    }
+
+
+# Granting roles always needs an authenticated user holding write:roles,
+# whether or not RBAC_ENFORCE protects the rest of the API.
 @api_view(['POST'])
+@permission_classes([rbac.requires('write:roles')])
 def assign(request):
     payload = request.data if isinstance(request.data, dict) else {}
-    template = {
-        'assignmentId': generate_identifier('assignment', override=payload.get('assignmentId')),
-        'status': payload.get('status', 'active'),
-        'permissions': ensure_list(
-            payload.get('permissions'),
-            ['read:patient_records', 'write:observations', 'manage:department_users'],
-        ),
-        'effectiveDate': payload.get('effectiveDate', isoformat_now()),
-        'expiryDate': payload.get('expiryDate'),
+    try:
+        fields = role_assignments.assignment_fields(payload)
+    except role_assignments.AssignmentError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    try:
+        with transaction.atomic():
+            record = RoleAssignmentRecord.objects.create(**fields)
+            rbac.invalidate_on_commit([record.user_id])
+    except IntegrityError:
+        return Response(
+            operation_outcome(f"Assignment {fields['assignment_id']} already exists", code='duplicate'),
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(_assignment_body(record), status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([rbac.requires('write:roles')])
+def assign_bulk(request):
+    payload = request.data if isinstance(request.data, dict) else {}
+    assignments = payload.get('assignments') or []
+    user_ids = payload.get('userIds') or []
+    if not isinstance(assignments, list) or not isinstance(user_ids, list):
+        return Response(
+            operation_outcome('assignments and userIds must be lists'), status=status.HTTP_400_BAD_REQUEST
+        )
+    # ``userIds`` assigns the same roles, dates and reason to each listed user.
+    shared = {
+        key: value for key, value in payload.items() if key not in ('assignments', 'userIds', 'assignmentId')
     }
-    return Response(template)
+    assignments = [*assignments, *({**shared, 'userId': user_id} for user_id in user_ids)]
+    if not assignments:
+        return Response(
+            operation_outcome('assignments or userIds is required'), status=status.HTTP_400_BAD_REQUEST
+        )
+    limit = settings.ROLE_ASSIGNMENT_BULK_LIMIT
+    if len(assignments) > limit:
+        return Response(
+            operation_outcome(f'At most {limit} assignments per request', code='too-costly'),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not all(isinstance(assignment, dict) for assignment in assignments):
+        return Response(operation_outcome('assignments must be objects'), status=status.HTTP_400_BAD_REQUEST)
+    try:
+        records = role_assignments.assign(assignments)
+    except role_assignments.AssignmentError as exc:
+        return Response(operation_outcome(str(exc)), status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError:
+        return Response(
+            operation_outcome('One or more assignmentIds already exist', code='duplicate'),
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(
+        {'created': len(records), 'assignments': [_assignment_body(record) for record in records]},
+        status=status.HTTP_201_CREATED,
+    )
 
 
 @api_view(['POST'])
 def validate(request):
     payload = request.data if isinstance(request.data, dict) else {}
+    user_id = str(payload.get('userId') or '')
+    permission = str(payload.get('permission') or '')
+    if not permission and payload.get('action') and payload.get('resource'):
+        permission = rbac.permission_name(str(payload['action']), str(payload['resource']))
+    if not user_id or not permission:
+        return Response(
+            operation_outcome('userId and either permission or action and resource are required'),
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    grant = rbac.resolver.grant(user_id)
+    allowed = bool(grant.mask & rbac.resolver.required(permission))
+    if allowed:
+        reason = f"Granted {permission} by an active role assignment"
+    elif grant.roles or grant.mask:
+        reason = f"No active role assignment grants {permission}"
+    else:
+        reason = 'User has no active role assignments'
     return Response(
         {
-            'allowed': bool(payload.get('allowed', True)),
-            'decision': payload.get('decision', 'permit'),
-            'reason': payload.get(
-                'reason', 'User has appropriate role with required permission'
-            ),
-            'conditions': ensure_list(payload.get('conditions'), ['audit_required']),
+            'allowed': allowed,
+            'decision': 'permit' if allowed else 'deny',
+            'permission': permission,
+            'roles': list(grant.roles),
+            'reason': reason,
+            'conditions': [],
         }
     )
 
@@ -39,16 +122,21 @@ def validate(request):
 @api_view(['POST'])
 def abac(request):
     payload = request.data if isinstance(request.data, dict) else {}
+    subject = payload.get('subject') if isinstance(payload.get('subject'), dict) else {}
+    resource = payload.get('resource') if isinstance(payload.get('resource'), dict) else {}
+    if not payload.get('action') or not resource.get('type'):
+        return Response(
+            operation_outcome('action and resource.type are required'), status=status.HTTP_400_BAD_REQUEST
+        )
+    if 'roles' not in subject and subject.get('userId'):
+        subject = {**subject, 'roles': list(rbac.resolver.grant(str(subject['userId'])).roles)}
+    decision = abac_policies.evaluate({**payload, 'subject': subject, 'resource': resource})
     return Response(
         {
-            'decision': payload.get('decision', 'permit'),
-            'explanation': payload.get(
-                'explanation',
-                'Subject, resource, and environment attributes satisfy policy rules',
-            ),
-            'obligations': ensure_list(
-                payload.get('obligations'), ['log_access', 'session_timeout']
-            ),
+            'decision': decision.decision,
+            'policyId': decision.policy_id or None,
+            'explanation': decision.explanation,
+            'obligations': list(decision.obligations),
             'evaluatedAt': isoformat_now(),
         }
     )
@@ -56,6 +144,7 @@ def abac(request):
 
 urlpatterns = [
     path('assign', assign, name='assign'),
+    path('assign/bulk', assign_bulk, name='assign-bulk'),
     path('validate', validate, name='validate'),
     path('abac/evaluate', abac, name='abac'),
 ]
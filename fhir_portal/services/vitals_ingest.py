@@ -0,0 +1,153 @@
+"""Bulk NDJSON ingestion of vital-sign Observations.
+
+Device gateways post one Observation per line. Lines are read from the
+request stream one at a time and validated as they arrive. Valid ones are
+written ``settings.VITALS_INGEST_BATCH_SIZE`` at a time, each batch in its own
+transaction:
+
+* one multi-row ``INSERT`` per batch for the ``ObservationRecord`` rows;
+* the time-series samples and rollups (:mod:`services.observation_series`);
+* the alert rules (:mod:`services.observation_alerts`).
+
+One outcome is produced per non-blank line, in line order, as soon as the
+batch holding that line has been written. Memory use therefore depends on
+the batch size, not on the size of the upload.
+
+A single Observation posted to ``/observations/`` is stored the same way, as
+a batch of one (:func:`ingest_observation`).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Iterable, Iterator
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .fhir_bundle import observation_fields
+from .models import ObservationRecord
+from .observation_alerts import enqueue_alerts
+from .observation_series import add_observations
+
+logger = logging.getLogger(__name__)
+
+VITAL_SIGNS_CATEGORY = [
+    {
+        "coding": [
+            {
+                "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                "code": "vital-signs",
+            }
+        ]
+    }
+]
+
+CREATED = "created"
+ERROR = "error"
+
+
+class IngestError(ValueError):
+    """Raised for a line that is not a storable vital-sign Observation."""
+
+
+def parse_line(line: bytes | str) -> dict[str, Any]:
+    """Return the Observation on ``line`` with its defaults filled in."""
+
+    try:
+        resource = json.loads(line)
+    except ValueError as exc:
+        raise IngestError(f"Invalid JSON: {exc}") from None
+    if not isinstance(resource, dict) or resource.get("resourceType") != "Observation":
+        raise IngestError("Line must be an Observation resource")
+    return with_defaults(resource)
+
+
+def with_defaults(resource: dict[str, Any]) -> dict[str, Any]:
+    resource.setdefault("status", "final")
+    resource.setdefault("category", VITAL_SIGNS_CATEGORY)
+    return resource
+
+
+def record_for(resource: dict[str, Any]) -> ObservationRecord:
+    """Build the unsaved record for a parsed Observation."""
+
+    try:
+        fields = observation_fields(resource)
+    except ValueError as exc:
+        raise IngestError(str(exc)) from None
+    except (AttributeError, TypeError):
+        raise IngestError("Line is not a valid Observation") from None
+    if not fields["patient_reference"]:
+        raise IngestError("Observation.subject.reference is required")
+    if not fields["code"]:
+        raise IngestError("Observation.code is required")
+    if fields["effective_datetime"] is None:
+        raise IngestError("Observation.effectiveDateTime must be a valid dateTime")
+    component = resource.get("component")
+    if component is not None and not isinstance(component, list):
+        raise IngestError("Observation.component must be a list")
+    if not isinstance(resource.get("valueQuantity"), dict) and not component:
+        raise IngestError("Observation.valueQuantity or component is required")
+    observation_id = uuid4().hex
+    fields["data"] = {**resource, "id": observation_id}
+    return ObservationRecord(observation_id=observation_id, **fields)
+
+
+def _write(records: list[ObservationRecord]) -> None:
+    with transaction.atomic():
+        ObservationRecord.objects.bulk_create(records, batch_size=len(records))
+        enqueue_alerts(add_observations(records))
+
+
+def ingest_observation(resource: dict[str, Any]) -> ObservationRecord:
+    """Store one vital-sign Observation, with its samples and alerts, as a batch of one."""
+
+    if resource.get("resourceType", "Observation") != "Observation":
+        raise IngestError("Body must be an Observation resource")
+    record = record_for(with_defaults({**resource, "resourceType": "Observation"}))
+    _write([record])
+    return record
+
+
+def _flush(pending: list[tuple[int, ObservationRecord | str]]) -> Iterator[dict[str, Any]]:
+    records = [item for _, item in pending if isinstance(item, ObservationRecord)]
+    failure = ""
+    if records:
+        try:
+            _write(records)
+        except DatabaseError as exc:
+            logger.exception("Vitals batch of %s observations failed", len(records))
+            failure = f"Batch was not stored: {exc}"
+    for line_number, item in pending:
+        if isinstance(item, str):
+            yield {"line": line_number, "status": ERROR, "error": item}
+        elif failure:
+            yield {"line": line_number, "status": ERROR, "error": failure}
+        else:
+            yield {"line": line_number, "status": CREATED, "id": item.observation_id}
+
+
+def ingest_lines(lines: Iterable[bytes | str], *, batch_size: int | None = None) -> Iterator[dict[str, Any]]:
+    """Store the Observations in ``lines`` and yield one outcome per non-blank line."""
+
+    batch_size = batch_size or settings.VITALS_INGEST_BATCH_SIZE
+    pending: list[tuple[int, ObservationRecord | str]] = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            pending.append((line_number, record_for(parse_line(line))))
+        except IngestError as exc:
+            pending.append((line_number, str(exc)))
+        if len(pending) >= batch_size:
+            yield from _flush(pending)
+            pending = []
+    yield from _flush(pending)
+
+
+def iter_ndjson(outcomes: Iterable[dict[str, Any]]) -> Iterator[str]:
+    for outcome in outcomes:
+        yield json.dumps(outcome, separators=(",", ":")) + "\n"